@@ -0,0 +1,255 @@
+"""
+LLM调用准入控制 - 按提供商限制并发，超载时快速拒绝
+
+- 每个提供商一个并发上限（本地 Ollama/LM Studio 通常只能同时处理少量请求）
+- 达到上限的请求进入优先级队列：交互请求排在批量分析（工作流步骤）之前，同优先级先到先得
+- 队列已满时立即拒绝（429）；新请求优先级更高时改为拒绝排在最后的低优先级请求；
+  在队列中等待超过 LLM_QUEUE_TIMEOUT 也拒绝，
+  超载表现为有上限的等待时间，而不是请求堆积到模型超时后再层层重试
+- 统计每个提供商的排队时间（p50/p99）、准入、拒绝和超时次数
+
+优先级通过上下文变量传递：默认是交互请求，工作流步骤内的调用为批量请求（见 llm_priority）。
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.logging_config import logger
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# 同一个服务的不同叫法统一到一个准入控制器
+PROVIDER_ALIASES = {"chatgpt": "openai", "gpt_agent": "openai", "gemini_agent": "gemini"}
+
+# 统计排队时间时保留的最近样本数
+WAIT_SAMPLES = 1000
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+class LLMOverloadedError(HTTPException):
+    """提供商超载（队列已满或排队超时），以 429 返回给调用方"""
+
+    def __init__(self, provider: str, error_type: str, message: str, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail=json.dumps({
+                "error_type": error_type,
+                "error_message": message,
+                "provider": provider,
+                "retry_after": retry_after,
+            }, ensure_ascii=False),
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.provider = provider
+        self.error_type = error_type
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """在上下文中设置LLM调用的优先级（数值越小越优先）"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """最近秩百分位数"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(0, min(len(values), rank) - 1)]
+
+
+class AdmissionController:
+    """单个提供商的准入控制（并发上限 + 优先级队列）"""
+
+    def __init__(self, provider: str, max_concurrency: int, max_queue: int, queue_timeout: Optional[float]):
+        """
+        Args:
+            provider: 提供商名称
+            max_concurrency: 同时进行的调用数上限
+            max_queue: 排队的调用数上限，超过时立即拒绝
+            queue_timeout: 最长排队时间（秒），None 表示不限制
+        """
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        # (优先级, 序号, Future)；被取消/超时/让位的等待者留在堆中，出队时跳过
+        self._waiters: List[tuple] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._waits: deque = deque(maxlen=WAIT_SAMPLES)
+        self._max_wait = 0.0
+
+    def _retry_after(self) -> int:
+        """建议的重试间隔（秒）：按最近的排队时间估算"""
+        p50 = _percentile(list(self._waits), 50)
+        return max(1, int(round(p50 or 1)))
+
+    def _record_wait(self, waited: float):
+        self._waits.append(waited)
+        self._max_wait = max(self._max_wait, waited)
+
+    async def _acquire(self, priority: int):
+        if self.active < self.max_concurrency and self._queued == 0:
+            self.active += 1
+            self.admitted += 1
+            self._record_wait(0.0)
+            return
+
+        if self._queued >= self.max_queue and not self._shed(priority):
+            self.rejected += 1
+            logger.warning(f"LLM调用被拒绝: {self.provider} 队列已满（{self._queued}/{self.max_queue}）")
+            raise self._overloaded()
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        self._queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.CancelledError:
+            if self._granted(future):
+                # 已经被唤醒（占用了并发名额）但调用方被取消：转交名额
+                self._release()
+            elif not future.done():
+                future.cancel()
+                self._queued -= 1
+            raise
+        except asyncio.TimeoutError:
+            if not self._granted(future):
+                if not future.done():
+                    future.cancel()
+                    self._queued -= 1
+                self.timeouts += 1
+                logger.warning(f"LLM调用排队超时: {self.provider}（{self.queue_timeout}秒）")
+                raise LLMOverloadedError(
+                    self.provider, "QUEUE_TIMEOUT",
+                    f"{self.provider} 排队超过 {self.queue_timeout} 秒，请稍后重试", self._retry_after()
+                )
+            # 超时的同时已被唤醒：按准入处理
+        self.admitted += 1
+        self._record_wait(time.perf_counter() - started)
+
+    @staticmethod
+    def _granted(future: asyncio.Future) -> bool:
+        """等待者是否已经被分配了名额（未被取消或拒绝）"""
+        return future.done() and not future.cancelled() and future.exception() is None
+
+    def _overloaded(self) -> LLMOverloadedError:
+        return LLMOverloadedError(
+            self.provider, "QUEUE_FULL",
+            f"{self.provider} 当前请求过多，请稍后重试", self._retry_after()
+        )
+
+    def _shed(self, priority: int) -> bool:
+        """队列已满时，拒绝最后排队的一个更低优先级的等待者，为更高优先级的请求腾出位置"""
+        waiting = [entry for entry in self._waiters if not entry[2].done()]
+        if not waiting:
+            return False
+        victim = max(waiting, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= priority:
+            return False
+        victim[2].set_exception(self._overloaded())
+        self._queued -= 1
+        self.rejected += 1
+        logger.warning(f"LLM调用被拒绝: {self.provider} 队列已满，为更高优先级的请求让出位置")
+        return True
+
+    def _release(self):
+        """释放名额：直接转交给优先级最高的等待者"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._queued -= 1
+            future.set_result(None)
+            return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        """
+        占用一个并发名额
+
+        Args:
+            priority: 优先级，默认使用上下文中的优先级（见 llm_priority）
+
+        Raises:
+            LLMOverloadedError: 队列已满或排队超时
+        """
+        await self._acquire(_priority.get() if priority is None else priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """准入统计"""
+        waits = list(self._waits)
+        return {
+            "provider": self.provider,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queued": self._queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_p50_ms": round(_percentile(waits, 50) * 1000, 3) if waits else None,
+            "wait_p99_ms": round(_percentile(waits, 99) * 1000, 3) if waits else None,
+            "wait_max_ms": round(self._max_wait * 1000, 3),
+        }
+
+
+# 事件循环 -> {提供商: 准入控制器}（asyncio 的 Future 绑定在事件循环上）
+_controllers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AdmissionController]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_admission(provider: str) -> AdmissionController:
+    """获取提供商的准入控制器（需在事件循环中调用）"""
+    provider = PROVIDER_ALIASES.get(provider, provider)
+    controllers = _controllers.setdefault(asyncio.get_running_loop(), {})
+    controller = controllers.get(provider)
+    if controller is None:
+        controller = AdmissionController(
+            provider,
+            settings.LLM_PROVIDER_CONCURRENCY.get(provider, settings.LLM_MAX_CONCURRENCY),
+            settings.LLM_MAX_QUEUE,
+            settings.LLM_QUEUE_TIMEOUT or None,
+        )
+        controllers[provider] = controller
+    return controller
+
+
+def admission_stats() -> List[Dict[str, Any]]:
+    """当前事件循环中各提供商的准入统计"""
+    controllers = _controllers.get(asyncio.get_running_loop(), {})
+    return [controller.stats() for controller in controllers.values()]
@@ -0,0 +1,123 @@
+"""
+共享HTTP传输 - LLM/Agent 接口调用使用的连接池
+
+- 每个目标主机（scheme://host:port）一个长连接客户端，连接保持复用，不再每次请求重新建立 TCP/TLS 连接
+- 安装了 h2 且 LLM_HTTP2 开启时使用 HTTP/2（同一连接上多路复用并发请求）
+- 每个主机的连接数上限可通过 LLM_HTTP_MAX_CONNECTIONS 统一配置，或在 LLM_HTTP_HOST_LIMITS 中按主机单独配置
+- 异步客户端绑定在创建它的事件循环上，不同事件循环（如工作进程中的 asyncio.run）各自持有连接池
+"""
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from core.config import settings
+from core.logging_config import logger
+
+try:
+    import h2  # noqa: F401  HTTP/2 支持（可选依赖）
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# 未指定超时时的默认值（秒），与之前 requests 调用的超时一致
+DEFAULT_TIMEOUT = 120
+
+# 事件循环 -> {主机: 异步客户端}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+# 主机 -> 同步客户端（供同步调用方使用，如 LLMClient.chat）
+_sync_clients: Dict[str, httpx.Client] = {}
+_lock = threading.Lock()
+
+
+def host_key(url: str) -> str:
+    """URL 对应的连接池键：scheme://host:port"""
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.hostname:
+        raise ValueError(f"无效的请求URL: {url}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def _limits(key: str) -> httpx.Limits:
+    """主机的连接数限制（LLM_HTTP_HOST_LIMITS 可按主机名或 scheme://host:port 覆盖）"""
+    host = urlsplit(key).hostname
+    overrides = settings.LLM_HTTP_HOST_LIMITS or {}
+    max_connections = overrides.get(key, overrides.get(host, settings.LLM_HTTP_MAX_CONNECTIONS))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(settings.LLM_HTTP_MAX_KEEPALIVE, max_connections),
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _client_options(key: str) -> dict:
+    return {
+        "limits": _limits(key),
+        "timeout": httpx.Timeout(DEFAULT_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT),
+        "http2": settings.LLM_HTTP2 and HTTP2_AVAILABLE,
+        # 与之前的 requests 调用一致：跟随重定向（httpx 默认不跟随）
+        "follow_redirects": True,
+    }
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """
+    获取目标主机的共享异步客户端（需在事件循环中调用）
+
+    Args:
+        url: 请求URL（按其 scheme://host:port 选择连接池）
+
+    Returns:
+        httpx.AsyncClient，请求时传入完整URL；不要关闭它，应用退出时由 close_http_clients 统一关闭
+    """
+    key = host_key(url)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            options = _client_options(key)
+            client = httpx.AsyncClient(**options)
+            clients[key] = client
+            logger.debug(
+                f"创建HTTP连接池: {key}（最大连接数 {options['limits'].max_connections}，"
+                f"HTTP/2 {'开启' if options['http2'] else '关闭'}）"
+            )
+    return client
+
+
+def get_sync_http_client(url: str) -> httpx.Client:
+    """获取目标主机的共享同步客户端（供不在事件循环中的同步调用方使用）"""
+    key = host_key(url)
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.Client(**_client_options(key))
+            _sync_clients[key] = client
+    return client
+
+
+async def close_http_clients():
+    """关闭当前事件循环的异步客户端和全部同步客户端（应用退出时调用）"""
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _lock:
+        async_clients = list(_async_clients.pop(loop, {}).values()) if loop else []
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+
+    for client in async_clients:
+        await client.aclose()
+    for client in sync_clients:
+        client.close()
+    if async_clients or sync_clients:
+        logger.info(f"已关闭 {len(async_clients) + len(sync_clients)} 个HTTP连接池")
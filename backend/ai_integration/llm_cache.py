@@ -0,0 +1,529 @@
+"""
+LLM 响应缓存 - 各提供商（LLMClient、Chat Model、GPT Agent、Gemini Agent）共用
+
+- 缓存键由提供商、模型、参数和消息计算：
+  - 精确键：消息原样参与计算
+  - 规范化键：消息中的文本先做 NFKC 规范化并合并空白，只有空白/全半角差异的提示词也能命中
+- 两级存储：进程内 LRU（按字节预算）+ 磁盘 SQLite（带 TTL 和总大小上限，超出时按最近访问时间淘汰）
+- 异步调用方使用 aget/aput：进程内命中直接返回，磁盘读写在线程池中执行，不阻塞事件循环
+- 相同请求并发到达时只有一个请求调用模型，其余请求等待它的结果
+- 单次请求可以绕过缓存（不读取缓存，调用结果仍写入缓存以刷新旧结果）
+- 命中率统计见 stats()，同时计入工作流步骤的缓存指标（record_cache_event("llm")）
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from core.config import settings, PROJECT_ROOT
+from core.logging_config import logger
+from storage import codec
+from storage.sqlite_pool import get_sqlite_pool
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+# 超出大小上限时，淘汰到上限的这个比例以下（避免每次写入都触发淘汰）
+EVICT_TARGET_RATIO = 0.9
+
+# 按最近访问时间淘汰时每批读取和删除的条目数
+EVICT_BATCH = 500
+
+
+class CacheKey(NamedTuple):
+    """缓存键"""
+    exact: str
+    normalized: str
+    provider: str
+    model: str
+
+
+def normalize_text(text: str) -> str:
+    """规范化提示词文本：NFKC（全角转半角等）+ 合并连续空白 + 去掉首尾空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def normalize_messages(value: Any) -> Any:
+    """递归规范化消息中的全部文本"""
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        return {key: normalize_messages(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_messages(item) for item in value]
+    return value
+
+
+def _jsonable(value: Any) -> Any:
+    """pydantic 模型等转换为可序列化的数据"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def _digest(provider: str, model: str, params: Dict[str, Any], messages: Any) -> str:
+    text = json.dumps(
+        {"provider": provider, "model": model, "params": params, "messages": messages},
+        sort_keys=True, ensure_ascii=False, default=_jsonable
+    )
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_key(provider: str, model: Optional[str], params: Optional[Dict[str, Any]], messages: Any) -> CacheKey:
+    """
+    计算缓存键
+
+    Args:
+        provider: 提供商（如 ollama / chatgpt / gpt_agent）
+        model: 模型名称
+        params: 影响输出的参数（temperature、max_tokens、输出格式等，不要包含 API Key）
+        messages: 消息/提示词（任意可JSON序列化的结构）
+    """
+    model = model or ""
+    params = {key: value for key, value in (params or {}).items() if value is not None}
+    # 先转换为纯 JSON 数据，规范化时可以递归处理 pydantic 模型中的文本
+    messages = json.loads(json.dumps(messages, ensure_ascii=False, default=_jsonable))
+    return CacheKey(
+        exact=_digest(provider, model, params, messages),
+        normalized=_digest(provider, model, params, normalize_messages(messages)),
+        provider=provider,
+        model=model,
+    )
+
+
+class LLMCache:
+    """LLM 响应缓存（进程内 LRU + 磁盘 SQLite）"""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        memory_max_bytes: Optional[int] = None
+    ):
+        """
+        初始化缓存
+
+        Args:
+            db_path: 磁盘缓存数据库路径，默认 data/cache/llm_cache.db
+            ttl: 缓存有效期（秒），0 表示不过期
+            max_bytes: 磁盘缓存总大小上限（按压缩后的字节数计算）
+            memory_max_bytes: 进程内缓存的字节预算
+        """
+        if db_path is None:
+            db_path = settings.LLM_CACHE_PATH or PROJECT_ROOT / "data" / "cache" / "llm_cache.db"
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = settings.LLM_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = settings.LLM_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.memory_max_bytes = settings.LLM_CACHE_MEMORY_MAX_BYTES if memory_max_bytes is None else memory_max_bytes
+        self._codec = codec.configured_codec()
+        self._pool = get_sqlite_pool(self.db_path)
+
+        # 精确键 -> (过期时间, JSON序列化后的响应)；返回时反序列化，调用方修改结果不会影响缓存
+        self._memory: "OrderedDict[str, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # 同一时间只有一个线程执行淘汰
+        self._evict_lock = threading.Lock()
+        # (事件循环ID, 精确键) -> (调用完成事件, 正在调用模型的任务)
+        self._inflight: Dict[Tuple[int, str], Tuple[asyncio.Event, Optional[asyncio.Task]]] = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.normalized_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._init_database()
+        self._disk_bytes = self._total_size()
+
+    def _get_connection(self):
+        """获取数据库连接（线程本地长连接，close() 时归还连接池）"""
+        return self._pool.connection()
+
+    def _init_database(self):
+        """初始化数据库表"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    normalized_key TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    model TEXT,
+                    value BLOB NOT NULL,
+                    codec INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_normalized ON llm_cache(normalized_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache(expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_provider ON llm_cache(provider, created_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _total_size(self) -> int:
+        conn = self._get_connection()
+        try:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        finally:
+            conn.close()
+
+    # ========== 进程内缓存 ==========
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._memory_pop(key)
+                return None
+            self._memory.move_to_end(key)
+            return data
+
+    def _memory_put(self, key: str, data: bytes, expires_at: Optional[float]):
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            self._memory_pop(key)
+            self._memory[key] = (expires_at, data)
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _memory_pop(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    # ========== 读写 ==========
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """
+        读取缓存（先精确键，再规范化键；同步，异步代码请使用 aget）
+
+        Returns:
+            缓存的响应，未命中返回 None
+        """
+        value = self._memory_lookup(key)
+        if value is not None:
+            return value
+        return self._disk_get(key)
+
+    async def aget(self, key: CacheKey) -> Optional[Any]:
+        """读取缓存（异步，进程内未命中时在线程池中读取磁盘缓存）"""
+        value = self._memory_lookup(key)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self._disk_get, key)
+
+    def _memory_lookup(self, key: CacheKey) -> Optional[Any]:
+        data = self._memory_get(key.exact)
+        if data is None:
+            return None
+        self.memory_hits += 1
+        self._record(True)
+        return json.loads(data)
+
+    def _disk_get(self, key: CacheKey) -> Optional[Any]:
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            row = conn.execute("""
+                SELECT key, value, codec, expires_at FROM llm_cache
+                WHERE (key = ? OR normalized_key = ?) AND (expires_at IS NULL OR expires_at > ?)
+                ORDER BY key = ? DESC, last_access DESC LIMIT 1
+            """, (key.exact, key.normalized, now, key.exact)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                    (now, row["key"])
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            # 磁盘缓存不可用时按未命中处理，不影响模型调用
+            logger.warning(f"读取LLM缓存失败: {e}")
+            row = None
+        finally:
+            conn.close()
+
+        if row is None:
+            self.misses += 1
+            self._record(False)
+            return None
+
+        value = codec.decode(row["value"], row["codec"])
+        self.disk_hits += 1
+        if row["key"] != key.exact:
+            self.normalized_hits += 1
+        self._record(True)
+        self._memory_put(key.exact, json.dumps(value, ensure_ascii=False).encode("utf-8"), row["expires_at"])
+        return value
+
+    def put(self, key: CacheKey, value: Any, ttl: Optional[float] = None):
+        """
+        写入缓存（同步，异步代码请使用 aput）
+
+        Args:
+            key: 缓存键
+            value: 响应（可JSON序列化）
+            ttl: 有效期（秒），默认使用 LLM_CACHE_TTL，0 表示不过期
+        """
+        self._disk_put(key, *self._memory_store(key, value, ttl))
+
+    async def aput(self, key: CacheKey, value: Any, ttl: Optional[float] = None):
+        """写入缓存（异步，进程内缓存立即更新，磁盘写入和淘汰在线程池中执行）"""
+        await asyncio.to_thread(self._disk_put, key, *self._memory_store(key, value, ttl))
+
+    def _memory_store(self, key: CacheKey, value: Any, ttl: Optional[float]) -> Tuple[bytes, Optional[float]]:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        data = json.dumps(value, ensure_ascii=False, default=_jsonable).encode("utf-8")
+        self._memory_put(key.exact, data, expires_at)
+        return data, expires_at
+
+    def _disk_put(self, key: CacheKey, data: bytes, expires_at: Optional[float]):
+        now = time.time()
+        payload = codec.encode(json.loads(data), self._codec)
+        size = len(payload)
+        conn = self._get_connection()
+        try:
+            old = conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key.exact,)).fetchone()
+            conn.execute("""
+                INSERT INTO llm_cache
+                (key, normalized_key, provider, model, value, codec, size, created_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, codec = excluded.codec, size = excluded.size,
+                    created_at = excluded.created_at, expires_at = excluded.expires_at,
+                    last_access = excluded.last_access
+            """, (
+                key.exact, key.normalized, key.provider, key.model, payload, self._codec,
+                size, now, expires_at, now
+            ))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入LLM缓存失败: {e}")
+            return
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._disk_bytes += size - (old["size"] if old else 0)
+            self.stores += 1
+            over_budget = self._disk_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        删除过期条目；仍超出大小上限时按最近访问时间分批淘汰，返回删除的条目数
+
+        每批只读取 EVICT_BATCH 条最久未访问的键，淘汰到上限的 EVICT_TARGET_RATIO 以下为止。
+        """
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        removed = 0
+        with self._evict_lock:
+            conn = self._get_connection()
+            try:
+                removed += conn.execute(
+                    "DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+                ).rowcount
+                conn.commit()
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+                while total > target:
+                    rows = conn.execute(
+                        "SELECT key, size FROM llm_cache ORDER BY last_access LIMIT ?", (EVICT_BATCH,)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    victims = []
+                    for row in rows:
+                        if total <= target:
+                            break
+                        victims.append((row["key"],))
+                        total -= row["size"]
+                    conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+                    conn.commit()
+                    removed += len(victims)
+                    with self._lock:
+                        for (victim,) in victims:
+                            self._memory_pop(victim)
+            finally:
+                conn.close()
+
+            with self._lock:
+                self._disk_bytes = total
+                self.evictions += removed
+        if removed:
+            logger.info(f"LLM缓存已淘汰 {removed} 条，当前 {total // 1024} KB")
+        return removed
+
+    def clear(self, provider: Optional[str] = None) -> int:
+        """清空缓存（可只清空某个提供商），返回删除的条目数"""
+        conn = self._get_connection()
+        try:
+            if provider:
+                removed = conn.execute("DELETE FROM llm_cache WHERE provider = ?", (provider,)).rowcount
+            else:
+                removed = conn.execute("DELETE FROM llm_cache").rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        self._disk_bytes = self._total_size()
+        return removed
+
+    def latest(self, provider: str, model: Optional[str] = None, limit: int = 50) -> List[Any]:
+        """某个提供商最近写入的未过期响应（新的在前，用于调试和恢复前端结果）"""
+        sql = "SELECT value, codec FROM llm_cache WHERE provider = ? AND (expires_at IS NULL OR expires_at > ?)"
+        params: List[Any] = [provider, time.time()]
+        if model:
+            sql += " AND model = ?"
+            params.append(model)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [codec.decode(row["value"], row["codec"]) for row in rows]
+
+    # ========== 并发合并 ==========
+
+    async def acquire(self, key: CacheKey, bypass: bool = False) -> Optional[Any]:
+        """
+        读取缓存；未命中时登记为该键的调用方
+
+        相同的键已有请求在调用模型时，等待它完成后再读取缓存。
+        返回 None 时调用方负责调用模型，成功后 put()，最后（无论成功与否）必须 release()。
+
+        Args:
+            key: 缓存键
+            bypass: 绕过缓存（不读取、不等待；没有其他请求在调用时仍登记为调用方）
+        """
+        slot = (id(asyncio.get_running_loop()), key.exact)
+        while not bypass:
+            # 先等待进行中的相同请求，避免等待期间重复计入未命中
+            while slot in self._inflight:
+                await self._inflight[slot][0].wait()
+            value = await self.aget(key)
+            if value is not None:
+                return value
+            # 读取磁盘缓存期间没有其他请求登记为调用方时，由本请求调用模型
+            if slot not in self._inflight:
+                break
+        if slot not in self._inflight:
+            self._inflight[slot] = (asyncio.Event(), asyncio.current_task())
+        return None
+
+    def release(self, key: CacheKey):
+        """调用模型结束（成功或失败），唤醒等待相同键的请求（只有登记的调用方释放时生效）"""
+        try:
+            slot = (id(asyncio.get_running_loop()), key.exact)
+        except RuntimeError:
+            return
+        inflight = self._inflight.get(slot)
+        if inflight is not None and inflight[1] is asyncio.current_task():
+            del self._inflight[slot]
+            inflight[0].set()
+
+    async def get_or_compute(
+        self,
+        key: CacheKey,
+        compute: Callable[[], Awaitable[Any]],
+        bypass: bool = False
+    ) -> Tuple[Any, bool]:
+        """
+        读取缓存，未命中时调用 compute 并写入缓存
+
+        Returns:
+            (响应, 是否来自缓存)
+        """
+        value = await self.acquire(key, bypass)
+        if value is not None:
+            return value, True
+        try:
+            value = await compute()
+            await self.aput(key, value)
+            return value, False
+        finally:
+            self.release(key)
+
+    # ========== 统计 ==========
+
+    def _record(self, hit: bool):
+        """计入工作流步骤的缓存统计"""
+        from workflow.metrics import record_cache_event
+        record_cache_event("llm", hit)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        hits = self.memory_hits + self.disk_hits
+        conn = self._get_connection()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            by_provider = {
+                row["provider"]: {"entries": row["entries"], "bytes": row["bytes"], "hits": row["hits"]}
+                for row in conn.execute("""
+                    SELECT provider, COUNT(*) AS entries, SUM(size) AS bytes, SUM(hits) AS hits
+                    FROM llm_cache GROUP BY provider
+                """)
+            }
+        finally:
+            conn.close()
+        return {
+            "hits": hits,
+            "misses": self.misses,
+            "hit_rate": hits / (hits + self.misses) if hits + self.misses else None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "normalized_hits": self.normalized_hits,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_bytes": self.memory_max_bytes,
+            "entries": entries,
+            "bytes": self._disk_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "by_provider": by_provider,
+        }
+
+
+# 全局缓存实例
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """获取LLM缓存实例（未启用缓存时返回 None）"""
+    global _llm_cache
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        _llm_cache = LLMCache()
+        logger.info(f"LLM缓存: {_llm_cache.db_path}")
+    return _llm_cache
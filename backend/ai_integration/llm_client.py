@@ -1,14 +1,22 @@
 """
 LLM客户端 - 支持多种AI模型提供商
 """
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, AsyncIterator
 import json
 
+import httpx
+
+from ai_integration.admission import get_admission
+from ai_integration.http_client import get_http_client, get_sync_http_client
+from ai_integration.llm_cache import get_llm_cache, make_key
+from ai_integration.streaming import iter_sse_data, stream_with_cache
 from core.config import settings
 from core.logging_config import logger
 
 
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
 class LLMClient:
     """统一的LLM客户端接口"""
     
@@ -19,17 +27,55 @@ class LLMClient:
         self.temperature = settings.AI_TEMPERATURE
         self.max_tokens = settings.AI_MAX_TOKENS
     
-    def chat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+    def chat(self, messages: List[Dict[str, str]], use_cache: bool = True, **kwargs) -> Dict[str, Any]:
         """
-        发送聊天请求
+        发送聊天请求（同步，供不在事件循环中的调用方使用；异步代码请使用 achat）
         
         Args:
             messages: 消息列表，格式 [{"role": "user", "content": "..."}]
+            use_cache: 是否读取LLM缓存（False 时直接调用模型，结果仍写入缓存）
             **kwargs: 其他参数（temperature, max_tokens等）
             
         Returns:
             AI响应
         """
+        cache = get_llm_cache()
+        if cache is None:
+            return self._chat(messages, **kwargs)
+        key = self._cache_key(messages, **kwargs)
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        result = self._chat(messages, **kwargs)
+        cache.put(key, result)
+        return result
+    
+    async def achat(self, messages: List[Dict[str, str]], use_cache: bool = True, **kwargs) -> Dict[str, Any]:
+        """
+        发送聊天请求（异步，等待响应期间不阻塞事件循环）
+        
+        参数和返回值与 chat 相同；相同请求并发到达时只调用一次模型
+        """
+        cache = get_llm_cache()
+        if cache is None:
+            return await self._achat(messages, **kwargs)
+        result, _ = await cache.get_or_compute(
+            self._cache_key(messages, **kwargs),
+            lambda: self._achat(messages, **kwargs),
+            bypass=not use_cache
+        )
+        return result
+    
+    def _cache_key(self, messages: List[Dict[str, str]], **kwargs):
+        """LLM缓存键（提供商、模型、生成参数和消息）"""
+        params = {
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+        }
+        return make_key(self.provider, self.model_name, params, messages)
+    
+    def _chat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
         if self.provider == "ollama":
             return self._chat_ollama(messages, **kwargs)
         elif self.provider == "lmstudio":
@@ -39,85 +85,151 @@ class LLMClient:
         else:
             raise ValueError(f"不支持的AI提供商: {self.provider}")
     
+    async def _achat(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        if self.provider == "ollama":
+            return await self._achat_ollama(messages, **kwargs)
+        elif self.provider == "lmstudio":
+            return await self._achat_lmstudio(messages, **kwargs)
+        elif self.provider == "openai":
+            return await self._achat_openai(messages, **kwargs)
+        else:
+            raise ValueError(f"不支持的AI提供商: {self.provider}")
+    
+    # ========== Ollama ==========
+    
+    def _ollama_request(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        """Ollama 请求的 URL 和请求体"""
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            "options": {
+                "temperature": kwargs.get("temperature", self.temperature),
+                "num_predict": kwargs.get("max_tokens", self.max_tokens),
+            }
+        }
+        return f"{self.base_url}/api/chat", payload
+    
+    def _ollama_result(self, response: httpx.Response) -> Dict[str, Any]:
+        response.raise_for_status()
+        result = response.json()
+        return {
+            "content": result.get("message", {}).get("content", ""),
+            "model": result.get("model", self.model_name),
+            "usage": result.get("eval_count", 0)
+        }
+    
+    def _ollama_connection_error(self, e: Exception) -> ConnectionError:
+        error_msg = (
+            f"无法连接到 Ollama 服务 ({self.base_url})。\n"
+            f"请确保 Ollama 正在运行，或配置其他 AI 提供商（如 LM Studio）。\n"
+            f"错误详情: {str(e)}"
+        )
+        logger.error(error_msg)
+        return ConnectionError(error_msg)
+    
     def _chat_ollama(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
         """Ollama API调用"""
         try:
-            # 构建请求体
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": kwargs.get("temperature", self.temperature),
-                    "num_predict": kwargs.get("max_tokens", self.max_tokens),
-                }
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/api/chat",
-                json=payload,
-                timeout=120
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            return {
-                "content": result.get("message", {}).get("content", ""),
-                "model": result.get("model", self.model_name),
-                "usage": result.get("eval_count", 0)
-            }
-            
-        except requests.exceptions.ConnectionError as e:
-            error_msg = (
-                f"无法连接到 Ollama 服务 ({self.base_url})。\n"
-                f"请确保 Ollama 正在运行，或配置其他 AI 提供商（如 LM Studio）。\n"
-                f"错误详情: {str(e)}"
-            )
-            logger.error(error_msg)
-            raise ConnectionError(error_msg) from e
+            url, payload = self._ollama_request(messages, **kwargs)
+            response = get_sync_http_client(url).post(url, json=payload)
+            return self._ollama_result(response)
+        except httpx.ConnectError as e:
+            raise self._ollama_connection_error(e) from e
+        except Exception as e:
+            logger.error(f"Ollama API调用失败: {e}")
+            raise
+    
+    async def _achat_ollama(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """Ollama API调用（异步）"""
+        try:
+            url, payload = self._ollama_request(messages, **kwargs)
+            async with get_admission(self.provider).slot():
+                response = await get_http_client(url).post(url, json=payload)
+            return self._ollama_result(response)
+        except httpx.ConnectError as e:
+            raise self._ollama_connection_error(e) from e
         except Exception as e:
             logger.error(f"Ollama API调用失败: {e}")
             raise
     
+    # ========== LM Studio ==========
+    
+    def _lmstudio_request(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        """LM Studio 请求的 URL 和请求体（兼容OpenAI格式）"""
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+            "stream": stream
+        }
+        return f"{self.base_url}/v1/chat/completions", payload
+    
+    def _lmstudio_result(self, response: httpx.Response) -> Dict[str, Any]:
+        response.raise_for_status()
+        result = response.json()
+        message = result.get("choices", [{}])[0].get("message", {})
+        return {
+            "content": message.get("content", ""),
+            "model": result.get("model", self.model_name),
+            "usage": result.get("usage", {})
+        }
+    
+    def _lmstudio_connection_error(self, e: Exception) -> ConnectionError:
+        error_msg = (
+            f"无法连接到 LM Studio 服务 ({self.base_url})。\n"
+            f"请确保 LM Studio 正在运行并启用了本地服务器。\n"
+            f"错误详情: {str(e)}"
+        )
+        logger.error(error_msg)
+        return ConnectionError(error_msg)
+    
     def _chat_lmstudio(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
         """LM Studio API调用（兼容OpenAI格式）"""
         try:
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                "temperature": kwargs.get("temperature", self.temperature),
-                "max_tokens": kwargs.get("max_tokens", self.max_tokens),
-                "stream": False
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/v1/chat/completions",
-                json=payload,
-                timeout=120
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            message = result.get("choices", [{}])[0].get("message", {})
-            
-            return {
-                "content": message.get("content", ""),
-                "model": result.get("model", self.model_name),
-                "usage": result.get("usage", {})
-            }
-            
-        except requests.exceptions.ConnectionError as e:
-            error_msg = (
-                f"无法连接到 LM Studio 服务 ({self.base_url})。\n"
-                f"请确保 LM Studio 正在运行并启用了本地服务器。\n"
-                f"错误详情: {str(e)}"
-            )
-            logger.error(error_msg)
-            raise ConnectionError(error_msg) from e
+            url, payload = self._lmstudio_request(messages, **kwargs)
+            response = get_sync_http_client(url).post(url, json=payload)
+            return self._lmstudio_result(response)
+        except httpx.ConnectError as e:
+            raise self._lmstudio_connection_error(e) from e
         except Exception as e:
             logger.error(f"LM Studio API调用失败: {e}")
             raise
     
+    async def _achat_lmstudio(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """LM Studio API调用（异步）"""
+        try:
+            url, payload = self._lmstudio_request(messages, **kwargs)
+            async with get_admission(self.provider).slot():
+                response = await get_http_client(url).post(url, json=payload)
+            return self._lmstudio_result(response)
+        except httpx.ConnectError as e:
+            raise self._lmstudio_connection_error(e) from e
+        except Exception as e:
+            logger.error(f"LM Studio API调用失败: {e}")
+            raise
+    
+    # ========== OpenAI ==========
+    
+    def _openai_options(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+        }
+    
+    def _openai_result(self, response) -> Dict[str, Any]:
+        return {
+            "content": response.choices[0].message.content,
+            "model": response.model,
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens
+            }
+        }
+    
     def _chat_openai(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
         """OpenAI API调用"""
         try:
@@ -125,100 +237,195 @@ class LLMClient:
             
             client = openai.OpenAI(
                 api_key=kwargs.get("api_key"),
-                base_url=self.base_url if self.base_url else None
+                base_url=self.base_url if self.base_url else None,
+                http_client=get_sync_http_client(self.base_url or OPENAI_BASE_URL)
             )
+            response = client.chat.completions.create(**self._openai_options(messages, **kwargs))
+            return self._openai_result(response)
             
-            response = client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=kwargs.get("temperature", self.temperature),
-                max_tokens=kwargs.get("max_tokens", self.max_tokens)
-            )
+        except Exception as e:
+            logger.error(f"OpenAI API调用失败: {e}")
+            raise
+    
+    async def _achat_openai(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """OpenAI API调用（异步）"""
+        try:
+            import openai
             
-            return {
-                "content": response.choices[0].message.content,
-                "model": response.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens
-                }
-            }
+            client = openai.AsyncOpenAI(
+                api_key=kwargs.get("api_key"),
+                base_url=self.base_url if self.base_url else None,
+                http_client=get_http_client(self.base_url or OPENAI_BASE_URL)
+            )
+            async with get_admission(self.provider).slot():
+                response = await client.chat.completions.create(**self._openai_options(messages, **kwargs))
+            return self._openai_result(response)
             
         except Exception as e:
             logger.error(f"OpenAI API调用失败: {e}")
             raise
     
+    # ========== 流式输出 ==========
+    
     def stream_chat(self, messages: List[Dict[str, str]], **kwargs):
-        """流式聊天（生成器）"""
+        """流式聊天（同步生成器）"""
         if self.provider == "ollama":
-            return self._stream_ollama(messages, **kwargs)
+            yield from self._stream_ollama(messages, **kwargs)
         elif self.provider == "lmstudio":
-            return self._stream_lmstudio(messages, **kwargs)
+            yield from self._stream_lmstudio(messages, **kwargs)
         else:
             # 非流式作为后备
             result = self.chat(messages, **kwargs)
             yield result.get("content", "")
     
-    def _stream_ollama(self, messages: List[Dict[str, str]], **kwargs):
-        """Ollama流式响应"""
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "stream": True,
-            "options": {
-                "temperature": kwargs.get("temperature", self.temperature),
-            }
-        }
+    def astream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        use_cache: bool = True,
+        meta: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        流式聊天（异步生成器，模型每输出一段就产出一段文本）
         
-        response = requests.post(
-            f"{self.base_url}/api/chat",
-            json=payload,
-            stream=True,
-            timeout=120
-        )
-        response.raise_for_status()
+        与 achat 共用LLM缓存：命中时一次性产出缓存的完整内容，完整输出结束后写入缓存
         
-        for line in response.iter_lines():
-            if line:
-                try:
-                    data = json.loads(line)
-                    content = data.get("message", {}).get("content", "")
+        Args:
+            messages: 消息列表
+            use_cache: 是否读取LLM缓存
+            meta: 输出结束后更新为与 achat 返回值相同的字典（content、model、usage）
+            **kwargs: 其他参数（temperature, max_tokens等）
+        """
+        if self.provider == "ollama":
+            stream = self._astream_ollama
+        elif self.provider == "lmstudio":
+            stream = self._astream_lmstudio
+        elif self.provider == "openai":
+            stream = self._astream_openai
+        else:
+            raise ValueError(f"不支持的AI提供商: {self.provider}")
+        
+        meta = {} if meta is None else meta
+        meta.update({"model": self.model_name, "usage": None})
+        return stream_with_cache(
+            self._cache_key(messages, **kwargs),
+            stream(messages, meta, **kwargs),
+            meta,
+            bypass=not use_cache
+        )
+    
+    def _ollama_chunk(self, line: str, meta: Dict[str, Any]) -> str:
+        """解析 Ollama 流式响应的一行（NDJSON），最后一行带有模型和 token 统计"""
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return ""
+        if data.get("done", False):
+            meta["model"] = data.get("model", self.model_name)
+            meta["usage"] = data.get("eval_count", 0)
+        return data.get("message", {}).get("content", "")
+    
+    def _lmstudio_chunk(self, data_str: str, meta: Dict[str, Any]) -> str:
+        """解析 OpenAI 兼容流式响应的一条 data"""
+        if data_str.strip() == "[DONE]":
+            return ""
+        try:
+            data = json.loads(data_str)
+        except json.JSONDecodeError:
+            return ""
+        meta["model"] = data.get("model", meta.get("model"))
+        if data.get("usage"):
+            meta["usage"] = data["usage"]
+        choices = data.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or ""
+    
+    def _stream_ollama(self, messages: List[Dict[str, str]], **kwargs):
+        """Ollama流式响应"""
+        url, payload = self._ollama_request(messages, stream=True, **kwargs)
+        meta: Dict[str, Any] = {}
+        with get_sync_http_client(url).stream("POST", url, json=payload) as response:
+            response.raise_for_status()
+            
+            for line in response.iter_lines():
+                if line:
+                    content = self._ollama_chunk(line, meta)
                     if content:
                         yield content
-                    if data.get("done", False):
-                        break
-                except json.JSONDecodeError:
-                    continue
     
     def _stream_lmstudio(self, messages: List[Dict[str, str]], **kwargs):
         """LM Studio流式响应"""
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "temperature": kwargs.get("temperature", self.temperature),
-            "stream": True
-        }
-        
-        response = requests.post(
-            f"{self.base_url}/v1/chat/completions",
-            json=payload,
-            stream=True,
-            timeout=120
-        )
-        response.raise_for_status()
-        
-        for line in response.iter_lines():
-            if line:
-                line_str = line.decode('utf-8')
+        url, payload = self._lmstudio_request(messages, stream=True, **kwargs)
+        meta: Dict[str, Any] = {}
+        with get_sync_http_client(url).stream("POST", url, json=payload) as response:
+            response.raise_for_status()
+            
+            for line_str in response.iter_lines():
                 if line_str.startswith('data: '):
-                    try:
-                        data = json.loads(line_str[6:])
-                        choices = data.get("choices", [])
-                        if choices:
-                            delta = choices[0].get("delta", {})
-                            content = delta.get("content", "")
+                    content = self._lmstudio_chunk(line_str[6:], meta)
+                    if content:
+                        yield content
+    
+    async def _astream_ollama(self, messages: List[Dict[str, str]], meta: Dict[str, Any], **kwargs):
+        """Ollama流式响应（异步）"""
+        try:
+            url, payload = self._ollama_request(messages, stream=True, **kwargs)
+            async with get_admission(self.provider).slot():
+                async with get_http_client(url).stream("POST", url, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line:
+                            content = self._ollama_chunk(line, meta)
                             if content:
                                 yield content
-                    except json.JSONDecodeError:
-                        continue
-
+        except httpx.ConnectError as e:
+            raise self._ollama_connection_error(e) from e
+        except Exception as e:
+            logger.error(f"Ollama 流式调用失败: {e}")
+            raise
+    
+    async def _astream_lmstudio(self, messages: List[Dict[str, str]], meta: Dict[str, Any], **kwargs):
+        """LM Studio流式响应（异步）"""
+        try:
+            url, payload = self._lmstudio_request(messages, stream=True, **kwargs)
+            async with get_admission(self.provider).slot():
+                async with get_http_client(url).stream("POST", url, json=payload) as response:
+                    response.raise_for_status()
+                    async for data_str in iter_sse_data(response):
+                        content = self._lmstudio_chunk(data_str, meta)
+                        if content:
+                            yield content
+        except httpx.ConnectError as e:
+            raise self._lmstudio_connection_error(e) from e
+        except Exception as e:
+            logger.error(f"LM Studio 流式调用失败: {e}")
+            raise
+    
+    async def _astream_openai(self, messages: List[Dict[str, str]], meta: Dict[str, Any], **kwargs):
+        """OpenAI流式响应（异步，最后一段带有 token 统计）"""
+        try:
+            import openai
+            
+            client = openai.AsyncOpenAI(
+                api_key=kwargs.get("api_key"),
+                base_url=self.base_url if self.base_url else None,
+                http_client=get_http_client(self.base_url or OPENAI_BASE_URL)
+            )
+            async with get_admission(self.provider).slot():
+                response = await client.chat.completions.create(
+                    **self._openai_options(messages, **kwargs),
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for event in response:
+                    meta["model"] = event.model or meta.get("model")
+                    if event.usage:
+                        meta["usage"] = {
+                            "prompt_tokens": event.usage.prompt_tokens,
+                            "completion_tokens": event.usage.completion_tokens
+                        }
+                    if event.choices and event.choices[0].delta.content:
+                        yield event.choices[0].delta.content
+            
+        except Exception as e:
+            logger.error(f"OpenAI 流式调用失败: {e}")
+            raise
@@ -0,0 +1,162 @@
+"""
+分块分析（map-reduce）- 数据超过模型上下文时分块调用模型，再合并各块的结果
+
+- split_chunks: 按估算的Token数把记录依次装入若干块（顺序和边界只取决于数据，同样的数据总是得到同样的分块，
+  因此重复分析同一份数据时各块都能命中LLM缓存）
+- map_concurrent: 并发分析各块，并发数不超过提供商的准入并发上限，以批量优先级排队
+  （不会因为一次扇出占满准入队列，交互请求仍可优先）；任一块失败时取消其余块
+- merge_results: 按块的顺序确定性地合并各块返回的 JSON 结果
+"""
+import asyncio
+import copy
+import json
+from typing import Any, Awaitable, Callable, List, Optional
+
+from ai_integration.admission import PRIORITY_BATCH, get_admission, llm_priority
+
+
+# 列表中的对象以这些字段作为标识，同名对象合并为一个（如字段列表中的同一字段）
+IDENTITY_KEYS = ("name", "field", "field_name", "path")
+
+
+def estimate_tokens(value: Any) -> int:
+    """估算数据放入提示词后的Token数（JSON字符串长度 / 4）"""
+    return max(1, len(json.dumps(value, ensure_ascii=False)) // 4)
+
+
+def split_chunks(items: List[Any], max_tokens: int) -> List[List[Any]]:
+    """
+    按Token预算把记录依次分块
+
+    每块的估算Token数不超过 max_tokens（单条记录超过预算时单独成块），记录顺序不变。
+    """
+    chunks: List[List[Any]] = []
+    current: List[Any] = []
+    current_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def map_concurrent(
+    items: List[Any],
+    func: Callable[[int, Any], Awaitable[Any]],
+    provider: str
+) -> List[Any]:
+    """
+    并发执行 func(序号, 块)，按输入顺序返回结果
+
+    Args:
+        items: 各块数据
+        func: 分析一块的协程函数
+        provider: 调用的提供商（并发数取其准入并发上限）
+
+    Raises:
+        任一块的异常（其余块被取消）
+    """
+    semaphore = asyncio.Semaphore(get_admission(provider).max_concurrency)
+
+    async def run(index: int, item: Any):
+        async with semaphore:
+            return await func(index, item)
+
+    # 任务在创建时复制上下文，各块的调用都使用批量优先级
+    with llm_priority(PRIORITY_BATCH):
+        tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _identity(item: Any) -> Optional[str]:
+    if isinstance(item, dict):
+        for key in IDENTITY_KEYS:
+            if isinstance(item.get(key), str):
+                return f"{key}:{item[key]}"
+    return None
+
+
+def _merge_lists(base: List[Any], other: List[Any]) -> List[Any]:
+    """有序并集：同一标识的对象合并，其余按内容去重"""
+    merged = list(base)
+    identities = {}
+    seen = set()
+    for index, item in enumerate(merged):
+        identity = _identity(item)
+        if identity is not None:
+            identities.setdefault(identity, index)
+        seen.add(json.dumps(item, ensure_ascii=False, sort_keys=True))
+
+    for item in other:
+        identity = _identity(item)
+        if identity is not None and identity in identities:
+            index = identities[identity]
+            merged[index] = _merge_value(None, merged[index], item)
+            continue
+        key = json.dumps(item, ensure_ascii=False, sort_keys=True)
+        if key in seen:
+            continue
+        seen.add(key)
+        if identity is not None:
+            identities[identity] = len(merged)
+        merged.append(copy.deepcopy(item))
+    return merged
+
+
+def _merge_value(key: Optional[str], base: Any, other: Any) -> Any:
+    if _is_empty(base):
+        return copy.deepcopy(other)
+    if _is_empty(other):
+        return base
+    if isinstance(base, dict) and isinstance(other, dict):
+        for child_key, value in other.items():
+            base[child_key] = _merge_value(child_key, base[child_key], value) if child_key in base else copy.deepcopy(value)
+        return base
+    if isinstance(base, list) and isinstance(other, list):
+        return _merge_lists(base, other)
+    numbers = (int, float)
+    if key in ("min", "max") and isinstance(base, numbers) and isinstance(other, numbers) \
+            and not isinstance(base, bool) and not isinstance(other, bool):
+        return min(base, other) if key == "min" else max(base, other)
+    # 其他标量（描述、默认值等）以先出现的块为准
+    return base
+
+
+def merge_results(results: List[Any]) -> Any:
+    """
+    合并各块的分析结果（结果只取决于各块结果及其顺序）
+
+    - 对象按键合并，列表取有序并集（如枚举取值、字段列表），数值范围的 min/max 取最小/最大值
+    - 描述等标量以先出现的块为准
+    - required_fields 只保留每块都必填的字段，其余字段归入 optional_fields
+    """
+    merged: Any = None
+    for result in results:
+        merged = _merge_value(None, merged, result)
+
+    partials = [result for result in results if isinstance(result, dict)]
+    reported = [result["required_fields"] for result in partials if isinstance(result.get("required_fields"), list)]
+    if reported and isinstance(merged, dict) and isinstance(merged.get("required_fields"), list):
+        everywhere = set.intersection(*(set(map(str, fields)) for fields in reported))
+        required = [field for field in merged["required_fields"] if str(field) in everywhere]
+        optional = merged.get("optional_fields") if isinstance(merged.get("optional_fields"), list) else []
+        demoted = [field for field in merged["required_fields"] if str(field) not in everywhere]
+        merged["required_fields"] = required
+        merged["optional_fields"] = _merge_lists(optional, demoted)
+    return merged
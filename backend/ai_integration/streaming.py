@@ -0,0 +1,124 @@
+"""
+SSE流式响应 - 把模型的增量输出逐段转发给客户端
+
+事件格式（text/event-stream）：
+- event: token  data: {"content": "..."}  一段增量文本
+- event: done   data: {...}               输出结束，内容与对应的非流式接口的响应体相同
+- event: error  data: {"status_code": ..., "detail": ...}  开始输出之后发生的错误
+
+第一段输出之前发生的错误（排队被拒绝、连接失败、接口返回错误状态码等）仍以普通的HTTP错误返回，
+此时还没有发送响应头。
+"""
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from ai_integration.llm_cache import CacheKey, get_llm_cache
+from core.logging_config import logger
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # 关闭反向代理（nginx）的响应缓冲
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """编码一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """逐条读取上游 SSE 响应中的 data 字段（同一事件的多行 data 以换行连接）"""
+    data_lines: List[str] = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+        elif line.startswith("data:"):
+            value = line[5:]
+            data_lines.append(value[1:] if value.startswith(" ") else value)
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+async def stream_with_cache(
+    key: CacheKey,
+    chunks: AsyncIterator[str],
+    meta: Dict[str, Any],
+    bypass: bool = False
+) -> AsyncIterator[str]:
+    """
+    带LLM缓存的流式输出
+
+    命中缓存时一次性输出缓存的完整内容；未命中时边转发边拼接，完整结束后写入缓存
+    （中途断开的输出不写入）。缓存值是包含 content 的字典，与对应非流式接口缓存的结果相同，
+    因此流式和非流式调用共用缓存。
+
+    Args:
+        key: 缓存键
+        chunks: 调用模型的增量输出，结束时已把 content 以外的字段（model、usage 等）写入 meta
+        meta: 输出结束后更新为完整的结果字典
+        bypass: 为 True 时不读取缓存
+    """
+    cache = get_llm_cache()
+    if cache is not None and not bypass:
+        cached = await cache.aget(key)
+        if cached is not None:
+            meta.update(cached)
+            if cached.get("content"):
+                yield cached["content"]
+            return
+
+    parts: List[str] = []
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    finally:
+        # 客户端中途断开时立即结束上游请求并释放准入名额，不等垃圾回收
+        await chunks.aclose()
+    meta["content"] = "".join(parts)
+    if cache is not None:
+        await cache.aput(key, dict(meta))
+
+
+async def sse_response(chunks: AsyncIterator[str], finish: Callable[[], Any]) -> StreamingResponse:
+    """
+    把增量输出包装为 SSE 响应
+
+    先在当前请求中等待第一段输出，之前的异常直接抛给调用方（按普通HTTP错误返回）；
+    之后的异常以 error 事件发送。
+
+    Args:
+        chunks: 增量文本
+        finish: 输出结束后调用，返回值作为 done 事件的数据
+    """
+    try:
+        first: Optional[str] = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def events():
+        try:
+            if first:
+                yield format_sse("token", {"content": first})
+            if first is not None:
+                async for chunk in chunks:
+                    if chunk:
+                        yield format_sse("token", {"content": chunk})
+            yield format_sse("done", finish())
+        except HTTPException as e:
+            logger.error(f"流式输出中断: {e.detail}")
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"流式输出中断: {e}", exc_info=True)
+            yield format_sse("error", {"status_code": 500, "detail": str(e)})
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
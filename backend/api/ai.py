@@ -1,8 +1,10 @@
 """
 AI服务API
 """
+import asyncio
+
 from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from ai_integration.llm_client import LLMClient
 from core.logging_config import logger
@@ -12,16 +14,39 @@ llm_client = LLMClient()
 
 
 @router.post("/chat")
-async def chat(messages: List[Dict[str, str]]):
-    """AI聊天接口"""
+async def chat(messages: List[Dict[str, str]], use_cache: bool = True):
+    """AI聊天接口（use_cache=False 时不读取LLM缓存）"""
     try:
-        response = llm_client.chat(messages)
+        response = await llm_client.achat(messages, use_cache=use_cache)
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"AI聊天失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/chat/stream")
+async def chat_stream(messages: List[Dict[str, str]], use_cache: bool = True):
+    """
+    AI聊天接口（SSE流式）
+
+    模型每输出一段就发送一个 token 事件，结束时的 done 事件与 /chat 的响应体相同
+    （事件格式见 ai_integration.streaming）
+    """
+    from ai_integration.streaming import sse_response
+
+    try:
+        meta: Dict[str, Any] = {}
+        chunks = llm_client.astream_chat(messages, use_cache=use_cache, meta=meta)
+        return await sse_response(chunks, lambda: dict(meta))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"AI流式聊天失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/models")
 async def list_models():
     """列出可用模型"""
@@ -42,3 +67,41 @@ async def list_models():
         ]
     }
 
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """LLM缓存统计（命中率、各级命中数、条目数和占用空间）"""
+    from ai_integration.llm_cache import get_llm_cache
+
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    try:
+        # 统计需要查询缓存数据库，在线程中执行避免阻塞事件循环
+        return {"enabled": True, **(await asyncio.to_thread(cache.stats))}
+    except Exception as e:
+        logger.error(f"获取LLM缓存统计失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/cache")
+async def clear_cache(provider: Optional[str] = None):
+    """清空LLM缓存（可只清空某个提供商，如 gpt_agent）"""
+    from ai_integration.llm_cache import get_llm_cache
+
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False, "removed": 0}
+    try:
+        return {"enabled": True, "removed": await asyncio.to_thread(cache.clear, provider)}
+    except Exception as e:
+        logger.error(f"清空LLM缓存失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    """LLM调用准入统计（各提供商的并发、排队、拒绝次数和排队时间）"""
+    from ai_integration.admission import admission_stats
+
+    return {"providers": admission_stats()}
@@ -1,11 +1,14 @@
 """
 AI工作流节点API - 用于智能分析和生成工作流
 """
+import asyncio
+import json
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 from pydantic import BaseModel
 
 from api.base import AIWorkflowService
+from core.config import settings
 from core.logging_config import logger
 
 router = APIRouter()
@@ -14,10 +17,13 @@ ai_service = AIWorkflowService()
 
 class AnalyzeXMLStructureRequest(BaseModel):
     """分析XML结构请求"""
-    xml_data: Dict[str, Any]  # 解析后的XML数据
+    xml_data: Union[Dict[str, Any], List[Any]]  # 解析后的XML数据（表格数据为行列表）
     xml_schema: Optional[Dict[str, Any]] = None  # 可选的Schema
     sample_content: Optional[str] = None  # 可选的XML原始内容示例
     additional_context: Optional[str] = None  # 额外的上下文信息
+    map_reduce: bool = False  # 是否分块分析全部记录（数据超过模型上下文时），各块并发调用AI后合并结果
+    max_chunk_tokens: Optional[int] = None  # 分块分析时每块数据的Token限制，默认 MAP_REDUCE_CHUNK_TOKENS
+    use_cache: bool = True  # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
 
 
 class GenerateEditorConfigRequest(BaseModel):
@@ -25,6 +31,7 @@ class GenerateEditorConfigRequest(BaseModel):
     xml_structure: Dict[str, Any]  # XML结构分析结果
     editor_type: str = "form"  # 编辑器类型: form, table, tree等
     custom_fields: Optional[List[str]] = None  # 自定义需要关注的字段
+    use_cache: bool = True  # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
 
 
 class SmartEditRequest(BaseModel):
@@ -33,6 +40,7 @@ class SmartEditRequest(BaseModel):
     instruction: str  # 自然语言指令
     xml_structure: Optional[Dict[str, Any]] = None  # XML结构信息（用于理解字段）
     editor_config: Optional[Dict[str, Any]] = None  # 编辑器配置
+    use_cache: bool = True  # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
 
 
 class GenerateWorkflowRequest(BaseModel):
@@ -41,6 +49,7 @@ class GenerateWorkflowRequest(BaseModel):
     editor_config: Optional[Dict[str, Any]] = None  # 编辑器配置
     workflow_type: str = "edit"  # 工作流类型: edit, validate, export等
     target_format: Optional[str] = None  # 目标格式: xml, json, yaml等
+    use_cache: bool = True  # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
 
 
 class AIAgentRequest(BaseModel):
@@ -56,9 +65,9 @@ class AIAgentRequest(BaseModel):
     output_format: str = "json"  # 输出格式: json, text, structured, markdown
     
     # 数据处理配置（用于控制输入数据量，避免超过Token限制）
-    data_processing_mode: str = "smart"  # 数据处理模式: direct, smart, limit, summary
+    data_processing_mode: str = "smart"  # 数据处理模式: direct, smart, limit, summary, map_reduce（分块处理全部数据后合并）
     data_limit_count: Optional[int] = None  # 数据条数限制（limit模式）
-    max_data_tokens: Optional[int] = None  # 数据Token限制（smart模式）
+    max_data_tokens: Optional[int] = None  # 数据Token限制（smart模式；map_reduce模式为每块的Token限制）
     sample_strategy: str = "head_tail"  # 采样策略: head_tail, uniform, head, random
     
     # Chat Model 配置（从连接的节点获取）
@@ -74,38 +83,37 @@ class AIAgentRequest(BaseModel):
     # Memory 配置（可选）
     use_memory: bool = False
     memory_config: Optional[Dict[str, Any]] = None
+    
+    # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
+    use_cache: bool = True
 
 
-@router.post("/analyze-xml-structure")
-async def analyze_xml_structure(request: AnalyzeXMLStructureRequest):
-    """
-    使用AI分析XML文件的完整结构
-    
-    分析内容包括：
-    - 数据结构层次
-    - 字段类型和约束
-    - 业务逻辑关系
-    - 编辑建议
-    """
-    try:
-        # 构建AI提示词（增强版：业务逻辑理解）
-        prompt = f"""请深入分析以下XML数据结构，特别关注业务逻辑和字段含义。
+# 字段分析要求（提示词第 2-6 项）：有统计摘要时直接采用统计结果，否则要求AI从数据示例中提取
+PROFILE_FIELD_ANALYSIS = """2. **枚举字段**
+   - 统计摘要中类型为 enum 的字段已列出从全部数据中统计的所有取值及出现次数
+   - 直接采用这些取值，不要删减或补充；只需判断字段的业务含义
 
-XML数据示例：
-{request.xml_data}
+3. **布尔值字段**
+   - 统计摘要中类型为 boolean 的字段即布尔值字段（即使以 "true"/"false" 字符串形式存储）
 
-{"Schema信息：" + str(request.xml_schema) if request.xml_schema else ""}
-{"原始内容示例：" + request.sample_content[:2000] if request.sample_content else ""}
-{"额外上下文：" + request.additional_context if request.additional_context else ""}
+4. **数值范围**
+   - 统计摘要中已给出每个数值字段的最小值、最大值和百分位数（p50 为典型值）
+   - 为每个数值字段提供 default 建议
 
-请进行以下深度分析：
+5. **字段关联关系**
+   - 统计摘要中的"取值对应关系"和"条件字段"是从数据中精确统计的，说明它们的业务含义
+   - 补充摘要中没有体现的业务关联
 
-1. **业务领域识别**
-   - 这是什么类型的数据？（游戏装备、配置文件、数据表等）
-   - 主要用途是什么？
-   - 业务领域的关键特征
+6. **必填字段识别**
+   - 出现次数等于记录数的字段为必填字段，其余为可选字段（以统计摘要为准）
+"""
 
-2. **枚举字段识别（重要）**
+PROFILE_NOTES = """- 枚举取值、布尔值字段、数值范围和必填字段以统计摘要为准，不要猜测
+- 字段名使用统计摘要中的名称（如 Flags.Civilian）
+- 字段类型必须准确（enum, boolean, number, string）
+"""
+
+SAMPLE_FIELD_ANALYSIS = """2. **枚举字段识别（重要）**
    - 识别所有可能的枚举字段及其所有可能值
    - **关键**：某些字段看起来是字符串，但实际是枚举值，必须从数据中提取所有唯一值
    - 例如：Type 字段的所有可能值（如 ["HandArmor", "BodyArmor", "LegArmor"]）
@@ -143,44 +151,59 @@ XML数据示例：
    - 哪些字段是必需的？（如 id, name, Type）
    - 哪些字段是可选的？（如 is_merchandise, difficulty）
    - 基于数据示例推断
+"""
 
-7. **编辑建议**
-   - 为每个字段提供默认值建议
-   - 为每个字段提供验证规则建议
-   - 为每个字段提供编辑提示（tooltip）
-
-8. **数据路径建议**
-   - 可编辑的数据路径（如 "Items.Item" 表示 Item 列表）
-
-请以JSON格式返回分析结果，包含以下字段：
-- business_domain: 业务领域描述
-- enum_fields: {{字段名: [所有可能值列表]}}  # 必须包含所有枚举字段及其完整值列表
-- boolean_fields: [布尔值字段列表]  # 新增：识别为布尔值的字段（如 ["Civilian", "Stealth", "is_merchandise", "covers_hands"]）
-- numeric_ranges: {{字段名: {{min, max, default, typical}}}}  # 基于实际数据计算
-- field_relationships: [{{field1, field2, relation_type, relation_rules}}]
-- required_fields: [必填字段列表]
-- optional_fields: [可选字段列表]
-- validation_rules: {{字段名: {{规则类型, 规则值}}}}
-- edit_suggestions: {{字段名: {{default, validation, hint, tooltip}}}}
-- structure: 结构层次描述
-- fields: 字段列表及其类型、约束（类型必须准确：enum, boolean, number, string）
-- edit_paths: 可编辑的数据路径建议
-
-**特别注意**：
-- 枚举字段必须从数据中提取所有唯一值，不要遗漏
+SAMPLE_NOTES = """- 枚举字段必须从数据中提取所有唯一值，不要遗漏
 - 布尔值字段必须正确识别，即使以字符串形式存储（"true"/"false"）
 - 数值范围必须基于实际数据计算，不要猜测
 - 字段类型必须准确（enum, boolean, number, string）
 """
+
+
+@router.post("/analyze-xml-structure")
+async def analyze_xml_structure(request: AnalyzeXMLStructureRequest):
+    """
+    使用AI分析XML文件的完整结构
+    
+    分析内容包括：
+    - 数据结构层次
+    - 字段类型和约束
+    - 业务逻辑关系
+    - 编辑建议
+    
+    map_reduce=True 时把全部记录按Token限制分块，各块并发调用AI分析后合并结果（见 ai_integration.map_reduce）
+    """
+    try:
+        # 先从全部数据精确统计字段（枚举、布尔值、数值范围、必填、取值对应关系），
+        # 提示词中只放统计摘要和少量记录示例；无法统计时退回放入原始数据
+        profile = await asyncio.to_thread(_profile_data, request.xml_data)
         
-        system_role = "你是一个专业的XML数据结构分析专家，擅长分析XML文件的结构、字段类型、业务逻辑关系，并给出专业的编辑建议。"
+        chunks = None
+        if request.map_reduce:
+            max_chunk_tokens = request.max_chunk_tokens or settings.MAP_REDUCE_CHUNK_TOKENS
+            chunks = await asyncio.to_thread(_chunk_data, request.xml_data, max_chunk_tokens)
         
-        # 使用AI服务调用
-        analysis_result = await ai_service.call_ai(
-            system_role=system_role,
-            user_prompt=prompt,
-            operation_name="AI分析XML结构"
-        )
+        if chunks and len(chunks) > 1:
+            analysis_result = await _analyze_structure_chunks(request, chunks)
+        else:
+            if profile:
+                from schema_learner.profiler import DataProfiler
+                
+                data_section = "数据统计摘要（由全部数据计算，取值、出现次数和数值范围都是精确的）：\n" + DataProfiler().summarize(profile)
+                field_analysis = PROFILE_FIELD_ANALYSIS
+                notes = PROFILE_NOTES
+            else:
+                data_section = f"XML数据示例：\n{request.xml_data}"
+                field_analysis = SAMPLE_FIELD_ANALYSIS
+                notes = SAMPLE_NOTES
+            
+            # 使用AI服务调用
+            analysis_result = await ai_service.call_ai(
+                system_role=STRUCTURE_SYSTEM_ROLE,
+                user_prompt=_build_structure_prompt(request, data_section, field_analysis, notes),
+                operation_name="AI分析XML结构",
+                use_cache=request.use_cache
+            )
         
         # 如果解析结果为空，创建默认结构
         if not analysis_result:
@@ -194,9 +217,13 @@ XML数据示例：
                 "suggestions": []
             }
         
+        # 统计得到的字段信息是精确的，覆盖AI给出的对应结果
+        if profile:
+            _apply_profile(analysis_result, profile)
+        
         return ai_service.create_success_response(
             message="XML结构分析完成",
-            data={"analysis": analysis_result}
+            data={"analysis": analysis_result, "profile": profile}
         )
         
     except HTTPException:
@@ -206,6 +233,152 @@ XML数据示例：
         raise ai_service.create_error_response(f"分析失败: {str(e)}")
 
 
+STRUCTURE_SYSTEM_ROLE = "你是一个专业的XML数据结构分析专家，擅长分析XML文件的结构、字段类型、业务逻辑关系，并给出专业的编辑建议。"
+
+
+def _build_structure_prompt(
+    request: AnalyzeXMLStructureRequest,
+    data_section: str,
+    field_analysis: str,
+    notes: str
+) -> str:
+    """构建XML结构分析的提示词（增强版：业务逻辑理解）"""
+    return f"""请深入分析以下XML数据结构，特别关注业务逻辑和字段含义。
+
+{data_section}
+
+{"Schema信息：" + str(request.xml_schema) if request.xml_schema else ""}
+{"原始内容示例：" + request.sample_content[:2000] if request.sample_content else ""}
+{"额外上下文：" + request.additional_context if request.additional_context else ""}
+
+请进行以下深度分析：
+
+1. **业务领域识别**
+   - 这是什么类型的数据？（游戏装备、配置文件、数据表等）
+   - 主要用途是什么？
+   - 业务领域的关键特征
+
+{field_analysis}
+7. **编辑建议**
+   - 为每个字段提供默认值建议
+   - 为每个字段提供验证规则建议
+   - 为每个字段提供编辑提示（tooltip）
+
+8. **数据路径建议**
+   - 可编辑的数据路径（如 "Items.Item" 表示 Item 列表）
+
+请以JSON格式返回分析结果，包含以下字段：
+- business_domain: 业务领域描述
+- enum_fields: {{字段名: [所有可能值列表]}}  # 必须包含所有枚举字段及其完整值列表
+- boolean_fields: [布尔值字段列表]  # 新增：识别为布尔值的字段（如 ["Civilian", "Stealth", "is_merchandise", "covers_hands"]）
+- numeric_ranges: {{字段名: {{min, max, default, typical}}}}  # 基于实际数据计算
+- field_relationships: [{{field1, field2, relation_type, relation_rules}}]
+- required_fields: [必填字段列表]
+- optional_fields: [可选字段列表]
+- validation_rules: {{字段名: {{规则类型, 规则值}}}}
+- edit_suggestions: {{字段名: {{default, validation, hint, tooltip}}}}
+- structure: 结构层次描述
+- fields: 字段列表及其类型、约束（类型必须准确：enum, boolean, number, string）
+- edit_paths: 可编辑的数据路径建议
+
+**特别注意**：
+{notes}"""
+
+
+async def _analyze_structure_chunks(request: AnalyzeXMLStructureRequest, chunks: List[Any]) -> Dict[str, Any]:
+    """分块分析XML结构：每块放入该块的全部记录，各块并发调用AI后按块的顺序合并结果"""
+    from ai_integration.map_reduce import map_concurrent, merge_results
+    
+    async def analyze(index: int, chunk: Any):
+        data_section = (
+            f"XML数据（第 {index + 1}/{len(chunks)} 块；数据较大，分块分析后合并结果，只需分析本块数据）：\n"
+            f"{json.dumps(chunk, ensure_ascii=False)}"
+        )
+        return await ai_service.call_ai(
+            system_role=STRUCTURE_SYSTEM_ROLE,
+            user_prompt=_build_structure_prompt(request, data_section, SAMPLE_FIELD_ANALYSIS, SAMPLE_NOTES),
+            operation_name=f"AI分析XML结构（第 {index + 1}/{len(chunks)} 块）",
+            use_cache=request.use_cache
+        )
+    
+    logger.info(f"XML结构分块分析: {len(chunks)} 块")
+    results = await map_concurrent(chunks, analyze, ai_service.llm_client.provider)
+    return merge_results([result for result in results if isinstance(result, dict)]) or {}
+
+
+def _chunk_data(data: Any, max_tokens: int) -> Optional[List[Any]]:
+    """
+    按Token限制把数据中的记录列表分块，每块保持原数据的结构（表格为行列表，XML为替换了子节点列表的字典）
+    
+    Returns:
+        各块数据；没有记录列表时返回 None
+    
+    Raises:
+        HTTPException: 分块数超过 MAP_REDUCE_MAX_CHUNKS（400）
+    """
+    from ai_integration.map_reduce import split_chunks
+    
+    if isinstance(data, list):
+        chunks = split_chunks(data, max_tokens)
+    elif isinstance(data, dict):
+        child_list = _find_xml_child_list(data)
+        if child_list:
+            chunks = [{**data, child_list["key"]: items} for items in split_chunks(child_list["items"], max_tokens)]
+        else:
+            # 只有一个子节点的根节点（如 {"Items": {"Item": [...]}}）：在子节点中查找记录列表
+            children = [key for key, value in data.items() if isinstance(value, dict) and key != "@attributes"]
+            if len(children) != 1:
+                return None
+            nested = _chunk_data(data[children[0]], max_tokens)
+            if nested is None:
+                return None
+            chunks = [{**data, children[0]: chunk} for chunk in nested]
+    else:
+        return None
+    
+    if len(chunks) > settings.MAP_REDUCE_MAX_CHUNKS:
+        raise ai_service.create_error_response(
+            f"数据分块数（{len(chunks)}）超过上限 {settings.MAP_REDUCE_MAX_CHUNKS}，请增大每块的Token限制",
+            status_code=400
+        )
+    return chunks
+
+
+def _profile_data(data: Any) -> Optional[Dict[str, Any]]:
+    """统计数据字段；没有可统计的记录或统计失败时返回 None"""
+    from schema_learner.profiler import DataProfiler
+    
+    try:
+        profile = DataProfiler().profile(data)
+    except Exception as e:
+        logger.warning(f"数据统计失败，使用原始数据分析: {e}")
+        return None
+    return profile if profile["collections"] else None
+
+
+def _apply_profile(analysis: Dict[str, Any], profile: Dict[str, Any]):
+    """用主要记录集合（最外层、记录最多）的统计结果覆盖分析结果中的枚举、布尔值、数值范围和必填/可选字段"""
+    fields = profile["collections"][0]["fields"]
+    analysis["enum_fields"] = {
+        name: list(stats["values"]) for name, stats in fields.items() if stats["type"] == "enum"
+    }
+    analysis["boolean_fields"] = [name for name, stats in fields.items() if stats["type"] == "boolean"]
+    
+    # 保留AI给出的 default 等建议，范围和典型值使用统计值
+    numeric_ranges = analysis.get("numeric_ranges") if isinstance(analysis.get("numeric_ranges"), dict) else {}
+    analysis["numeric_ranges"] = {
+        name: {
+            **(numeric_ranges.get(name) if isinstance(numeric_ranges.get(name), dict) else {}),
+            "min": stats["min"],
+            "max": stats["max"],
+            "typical": stats["percentiles"]["p50"],
+        }
+        for name, stats in fields.items() if stats["type"] == "number"
+    }
+    analysis["required_fields"] = [name for name, stats in fields.items() if stats["required"]]
+    analysis["optional_fields"] = [name for name, stats in fields.items() if not stats["required"]]
+
+
 @router.post("/generate-editor-config")
 async def generate_editor_config(request: GenerateEditorConfigRequest):
     """
@@ -323,7 +496,8 @@ XML结构分析：
         editor_config = await ai_service.call_ai(
             system_role=system_role,
             user_prompt=prompt,
-            operation_name="生成编辑器配置"
+            operation_name="生成编辑器配置",
+            use_cache=request.use_cache
         )
         
         # 如果解析结果为空，创建默认配置
@@ -387,7 +561,8 @@ async def smart_edit(request: SmartEditRequest):
         edit_result = await ai_service.call_ai(
             system_role=system_role,
             user_prompt=prompt,
-            operation_name="智能编辑"
+            operation_name="智能编辑",
+            use_cache=request.use_cache
         )
         
         # 确保包含edited_data
@@ -417,112 +592,59 @@ async def execute_ai_agent(request: AIAgentRequest):
     前端只负责收集配置和数据，然后调用此端点
     """
     try:
-        from api.chat_model import chat_with_custom_model, ChatModelRequest
-        import json
-        
-        # 1. 处理输入数据（根据配置限制数据量）
-        processed_input_data = _process_input_data(
-            input_data=request.input_data,
-            mode=request.data_processing_mode,
-            limit_count=request.data_limit_count,
-            max_tokens=request.max_data_tokens,
-            sample_strategy=request.sample_strategy
-        )
+        from api.chat_model import chat_with_custom_model
         
-        # 2. 构建用户提示词（后端完成）
-        user_prompt = _build_user_prompt(
-            input_data=processed_input_data,
-            goal=request.goal,
-            output_format=request.output_format
-        )
-        
-        # 2. 检索记忆（如果启用）
-        memory_context = ""
-        if request.use_memory and request.memory_config:
-            # TODO: 实现记忆检索逻辑
-            pass
-        
-        # 3. 构建完整提示词（系统提示词 + 记忆上下文 + 用户提示词）
-        full_prompt = ""
-        if request.system_prompt and request.system_prompt.strip():
-            full_prompt += f"# 系统角色\n{request.system_prompt}\n\n---\n\n"
-        if memory_context:
-            full_prompt += f"## 相关记忆\n{memory_context}\n\n---\n\n"
-        full_prompt += user_prompt
+        if request.data_processing_mode == "map_reduce":
+            chat_response, user_prompt = await _run_agent_map_reduce(request)
+        else:
+            chat_model_request, user_prompt = _build_agent_chat_request(request)
+            chat_response = await chat_with_custom_model(chat_model_request)
         
-        # 4. 调用Chat Model（后端完成）
-        chat_model_request = ChatModelRequest(
-            model_type=request.chat_model_config.get("model_type", "chatgpt"),
-            api_key=request.chat_model_config.get("api_key", ""),
-            api_url=request.chat_model_config.get("api_url", ""),
-            request_headers=request.chat_model_config.get("request_headers", ""),
-            request_body=request.chat_model_config.get("request_body", "{}"),
-            prompt=full_prompt,
-            timeout=30,
-            max_retries=3
+        return ai_service.create_success_response(
+            message="AI Agent 执行成功",
+            data=_build_agent_result(request, chat_response, user_prompt)
         )
         
-        # 更新request_body中的temperature和max_tokens
-        try:
-            body_dict = json.loads(chat_model_request.request_body)
-            body_dict["temperature"] = request.temperature
-            body_dict["max_tokens"] = request.max_tokens
-            chat_model_request.request_body = json.dumps(body_dict)
-        except:
-            chat_model_request.request_body = json.dumps({
-                "temperature": request.temperature,
-                "max_tokens": request.max_tokens
-            })
-        
-        chat_response = await chat_with_custom_model(chat_model_request)
-        
-        # 5. 处理输出数据（后端完成）
-        processed_output = _process_output(chat_response.content, request.output_format)
-        
-        # 6. 存储记忆（如果启用）
-        if request.use_memory and request.memory_config:
-            # TODO: 实现记忆存储逻辑
-            pass
-        
-        # 7. 构建返回结果
-        # 如果输出格式是 JSON 且包含结构分析，将其提取为 analysis 字段
-        analysis = None
-        if request.output_format == "json" and isinstance(processed_output, dict):
-            # 检查是否包含结构分析结果
-            if "analysis" in processed_output:
-                analysis = processed_output["analysis"]
-            elif "structure" in processed_output:
-                # 如果 processed_output 本身就是结构分析结果
-                analysis = processed_output
-            elif all(key in processed_output for key in ["root_element", "structure"]):
-                # 如果 processed_output 符合结构分析格式
-                analysis = processed_output
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"AI Agent 执行失败: {e}", exc_info=True)
+        raise ai_service.create_error_response(f"AI Agent 执行失败: {str(e)}")
+
+
+@router.post("/ai-agent/stream")
+async def execute_ai_agent_stream(request: AIAgentRequest):
+    """
+    AI Agent 节点执行端点（SSE流式）
+    
+    模型每输出一段就发送一个 token 事件，结束时的 done 事件与 /ai-agent 的响应体相同
+    （事件格式见 ai_integration.streaming）；map_reduce 模式在各块完成并合并后一次性发送合并结果
+    """
+    try:
+        from api.chat_model import stream_custom_model, ChatModelResponse
+        from ai_integration.streaming import sse_response
         
-        result = {
-            "input_data": request.input_data,  # 保留输入数据
-            "hasData": True,
-            "chat_model_response": {
-                "model": chat_response.model,
-                "content": chat_response.content,
-                "usage": chat_response.usage,
-                "raw_response": chat_response.raw_response,
-                "prompt": user_prompt,  # 用户提示词（不包含系统提示词）
-                "system_prompt": request.system_prompt,  # 系统提示词
-                "model_type": request.chat_model_config.get("model_type", "chatgpt"),
-            },
-            "data": processed_output,  # 处理后的数据
-            "ai_agent_output": chat_response.content,  # 原始回答内容
-            "output_format": request.output_format,
-        }
+        meta: Dict[str, Any] = {}
+        if request.data_processing_mode == "map_reduce":
+            merged_response, user_prompt = await _run_agent_map_reduce(request)
+            meta.update(merged_response.model_dump())
+            
+            async def merged_chunks():
+                yield merged_response.content
+            
+            chunks = merged_chunks()
+        else:
+            chat_model_request, user_prompt = _build_agent_chat_request(request)
+            chunks = stream_custom_model(chat_model_request, meta)
         
-        # 如果提取到了 analysis，添加到结果中（兼容 Generate Editor Config 节点）
-        if analysis:
-            result["analysis"] = analysis
+        def finish():
+            chat_response = ChatModelResponse(**meta)
+            return ai_service.create_success_response(
+                message="AI Agent 执行成功",
+                data=_build_agent_result(request, chat_response, user_prompt)
+            )
         
-        return ai_service.create_success_response(
-            message="AI Agent 执行成功",
-            data=result
-        )
+        return await sse_response(chunks, finish)
         
     except HTTPException:
         raise
@@ -531,6 +653,211 @@ async def execute_ai_agent(request: AIAgentRequest):
         raise ai_service.create_error_response(f"AI Agent 执行失败: {str(e)}")
 
 
+def _build_agent_chat_request(request: AIAgentRequest, input_data: Optional[Dict[str, Any]] = None):
+    """
+    构建 AI Agent 的 Chat Model 请求
+    
+    Args:
+        request: AI Agent 请求
+        input_data: 已处理的输入数据（分块执行时为单块数据），None 时按请求的数据处理模式处理
+    
+    Returns:
+        (ChatModelRequest, 用户提示词)
+    """
+    from api.chat_model import ChatModelRequest
+    
+    # 1. 处理输入数据（根据配置限制数据量）
+    if input_data is not None:
+        processed_input_data = input_data
+    else:
+        processed_input_data = _process_input_data(
+            input_data=request.input_data,
+            mode=request.data_processing_mode,
+            limit_count=request.data_limit_count,
+            max_tokens=request.max_data_tokens,
+            sample_strategy=request.sample_strategy
+        )
+    
+    # 2. 构建用户提示词（后端完成）
+    user_prompt = _build_user_prompt(
+        input_data=processed_input_data,
+        goal=request.goal,
+        output_format=request.output_format
+    )
+    
+    # 2. 检索记忆（如果启用）
+    memory_context = ""
+    if request.use_memory and request.memory_config:
+        # TODO: 实现记忆检索逻辑
+        pass
+    
+    # 3. 构建完整提示词（系统提示词 + 记忆上下文 + 用户提示词）
+    full_prompt = ""
+    if request.system_prompt and request.system_prompt.strip():
+        full_prompt += f"# 系统角色\n{request.system_prompt}\n\n---\n\n"
+    if memory_context:
+        full_prompt += f"## 相关记忆\n{memory_context}\n\n---\n\n"
+    full_prompt += user_prompt
+    
+    # 4. 构建Chat Model请求（后端完成）
+    chat_model_request = ChatModelRequest(
+        model_type=request.chat_model_config.get("model_type", "chatgpt"),
+        api_key=request.chat_model_config.get("api_key", ""),
+        api_url=request.chat_model_config.get("api_url", ""),
+        request_headers=request.chat_model_config.get("request_headers", ""),
+        request_body=request.chat_model_config.get("request_body", "{}"),
+        prompt=full_prompt,
+        timeout=30,
+        max_retries=3,
+        use_cache=request.use_cache
+    )
+    
+    # 更新request_body中的temperature和max_tokens
+    try:
+        body_dict = json.loads(chat_model_request.request_body)
+        body_dict["temperature"] = request.temperature
+        body_dict["max_tokens"] = request.max_tokens
+        chat_model_request.request_body = json.dumps(body_dict)
+    except:
+        chat_model_request.request_body = json.dumps({
+            "temperature": request.temperature,
+            "max_tokens": request.max_tokens
+        })
+    
+    return chat_model_request, user_prompt
+
+
+async def _run_agent_map_reduce(request: AIAgentRequest):
+    """
+    分块执行 AI Agent（data_processing_mode="map_reduce"）
+    
+    输入数据中的记录按 max_data_tokens 分块，每块单独构建提示词并发调用 Chat Model，
+    再按块的顺序合并输出；数据不足两块时直接调用一次（不采样）。
+    
+    Returns:
+        (合并后的 ChatModelResponse, 第一块的用户提示词)
+    """
+    from api.chat_model import chat_with_custom_model, ChatModelResponse
+    from ai_integration.map_reduce import map_concurrent
+    
+    data = request.input_data.get("data")
+    chunks = None
+    if data:
+        max_chunk_tokens = request.max_data_tokens or settings.MAP_REDUCE_CHUNK_TOKENS
+        chunks = await asyncio.to_thread(_chunk_data, data, max_chunk_tokens)
+    if not chunks or len(chunks) == 1:
+        chat_model_request, user_prompt = _build_agent_chat_request(request, request.input_data)
+        return await chat_with_custom_model(chat_model_request), user_prompt
+    
+    prepared = [
+        _build_agent_chat_request(request, {
+            **request.input_data,
+            "data": chunk,
+            "_data_info": {"mode": "map_reduce", "chunk": index + 1, "chunks": len(chunks)},
+        })
+        for index, chunk in enumerate(chunks)
+    ]
+    
+    async def run(index: int, item):
+        return await chat_with_custom_model(item[0])
+    
+    logger.info(f"AI Agent 分块执行: {len(chunks)} 块")
+    responses = await map_concurrent(
+        prepared, run, request.chat_model_config.get("model_type", "chatgpt")
+    )
+    
+    merged_response = ChatModelResponse(
+        content=_merge_agent_outputs([response.content for response in responses], request.output_format),
+        model=responses[0].model,
+        usage=_sum_usage([response.usage for response in responses]),
+        raw_response={"map_reduce": {
+            "chunks": len(chunks),
+            "responses": [response.raw_response for response in responses],
+        }}
+    )
+    return merged_response, prepared[0][1]
+
+
+def _merge_agent_outputs(contents: List[str], output_format: str) -> str:
+    """
+    合并各块的输出
+    
+    - JSON：各块都是数组时按顺序拼接（逐条处理的结果），否则按 merge_results 合并（如结构分析）
+    - 其他格式或有块的输出不是有效JSON：按块的顺序拼接文本
+    """
+    from ai_integration.map_reduce import merge_results
+    
+    if output_format == "json":
+        outputs = [_process_output(content, "json") for content in contents]
+        # 提取不到JSON时 _process_output 返回 {"content": 原文}
+        if all(output != {"content": content} for output, content in zip(outputs, contents)):
+            if all(isinstance(output, list) for output in outputs):
+                merged = [item for output in outputs for item in output]
+            else:
+                merged = merge_results(outputs)
+            return json.dumps(merged, ensure_ascii=False, indent=2)
+    
+    return "\n\n".join(content.strip() for content in contents)
+
+
+def _sum_usage(usages: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """累加各块的Token用量（只累加数值字段）"""
+    total: Dict[str, Any] = {}
+    for usage in usages:
+        for key, value in (usage or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total or None
+
+
+def _build_agent_result(request: AIAgentRequest, chat_response, user_prompt: str) -> Dict[str, Any]:
+    """处理模型输出，构建 AI Agent 的返回数据"""
+    # 5. 处理输出数据（后端完成）
+    processed_output = _process_output(chat_response.content, request.output_format)
+    
+    # 6. 存储记忆（如果启用）
+    if request.use_memory and request.memory_config:
+        # TODO: 实现记忆存储逻辑
+        pass
+    
+    # 7. 构建返回结果
+    # 如果输出格式是 JSON 且包含结构分析，将其提取为 analysis 字段
+    analysis = None
+    if request.output_format == "json" and isinstance(processed_output, dict):
+        # 检查是否包含结构分析结果
+        if "analysis" in processed_output:
+            analysis = processed_output["analysis"]
+        elif "structure" in processed_output:
+            # 如果 processed_output 本身就是结构分析结果
+            analysis = processed_output
+        elif all(key in processed_output for key in ["root_element", "structure"]):
+            # 如果 processed_output 符合结构分析格式
+            analysis = processed_output
+    
+    result = {
+        "input_data": request.input_data,  # 保留输入数据
+        "hasData": True,
+        "chat_model_response": {
+            "model": chat_response.model,
+            "content": chat_response.content,
+            "usage": chat_response.usage,
+            "raw_response": chat_response.raw_response,
+            "prompt": user_prompt,  # 用户提示词（不包含系统提示词）
+            "system_prompt": request.system_prompt,  # 系统提示词
+            "model_type": request.chat_model_config.get("model_type", "chatgpt"),
+        },
+        "data": processed_output,  # 处理后的数据
+        "ai_agent_output": chat_response.content,  # 原始回答内容
+        "output_format": request.output_format,
+    }
+    
+    # 如果提取到了 analysis，添加到结果中（兼容 Generate Editor Config 节点）
+    if analysis:
+        result["analysis"] = analysis
+    
+    return result
+
+
 def _process_input_data(
     input_data: Dict[str, Any],
     mode: str = "smart",
@@ -939,6 +1266,8 @@ def _build_user_prompt(input_data: Dict[str, Any], goal: Optional[str], output_f
     构建用户提示词（后端完成）
     从解析文件的输出信息构建完整的用户提示词，包括任务目标、输入数据等
     """
+    import json
+    
     prompt = ""
     
     # 1. 任务目标（如果配置了）
@@ -957,6 +1286,13 @@ def _build_user_prompt(input_data: Dict[str, Any], goal: Optional[str], output_f
             prompt += f"**文件格式**：{input_format.upper()}\n"
         prompt += "\n"
     
+    data_info = input_data.get("_data_info") or {}
+    if data_info.get("mode") == "map_reduce":
+        prompt += (
+            f"**数据分块**：第 {data_info['chunk']}/{data_info['chunks']} 块"
+            "（数据超过Token限制，各块分别处理后合并结果，只需处理本块数据）\n\n"
+        )
+    
     # 处理不同格式的输入数据
     if input_data.get("data"):
         data = input_data["data"]
@@ -1092,7 +1428,8 @@ XML结构分析：
         workflow_def = await ai_service.call_ai(
             system_role=system_role,
             user_prompt=prompt,
-            operation_name="生成工作流定义"
+            operation_name="生成工作流定义",
+            use_cache=request.use_cache
         )
         
         # 如果解析结果为空，创建默认工作流结构
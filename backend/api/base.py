@@ -127,7 +127,8 @@ class AIWorkflowService(AIWorkflowNodeBase):
         self,
         system_role: str,
         user_prompt: str,
-        operation_name: str = "AI操作"
+        operation_name: str = "AI操作",
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         调用AI并解析响应
@@ -136,6 +137,7 @@ class AIWorkflowService(AIWorkflowNodeBase):
             system_role: 系统角色提示词
             user_prompt: 用户提示词
             operation_name: 操作名称（用于日志）
+            use_cache: 是否读取LLM缓存（相同提示词直接返回之前的响应）
             
         Returns:
             解析后的AI响应字典
@@ -146,10 +148,13 @@ class AIWorkflowService(AIWorkflowNodeBase):
         try:
             logger.info(f"开始{operation_name}...")
             messages = self.build_ai_messages(system_role, user_prompt)
-            response = self.llm_client.chat(messages)
+            response = await self.llm_client.achat(messages, use_cache=use_cache)
             result = self.parse_ai_response(response)
             logger.info(f"{operation_name}完成")
             return result
+        except HTTPException:
+            # 准入控制拒绝（429）等已经包含状态码和详情
+            raise
         except ConnectionError as e:
             # 连接错误（如 AI 服务未启动）提供更友好的错误信息
             error_msg = str(e)
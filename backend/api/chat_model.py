@@ -2,12 +2,17 @@
 Chat Model API - 支持自定义AI模型配置和调用
 """
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, AsyncIterator
 from pydantic import BaseModel, Field, ConfigDict
-import requests
 import json
 import re
 
+import httpx
+
+from ai_integration.admission import get_admission
+from ai_integration.http_client import get_http_client
+from ai_integration.llm_cache import get_llm_cache, make_key
+from ai_integration.streaming import iter_sse_data, sse_response, stream_with_cache
 from core.logging_config import logger
 
 router = APIRouter()
@@ -28,6 +33,7 @@ class ChatModelRequest(BaseModel):
     prompt: str  # 实际提示词
     timeout: int = 60
     max_retries: int = 3
+    use_cache: bool = True  # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
     
     @property
     def model_type(self) -> str:
@@ -62,6 +68,113 @@ def replace_variables(text: str, variables: Dict[str, str]) -> str:
     return result
 
 
+def _prepare_responses_request(request: ChatModelRequest):
+    """
+    构建 OpenAI Responses API 请求（变量替换、参数过滤、请求头）
+    
+    Returns:
+        (api_url, headers, request_body)
+    """
+    # 验证 API Key 是否有效
+    if not request.api_key or request.api_key.strip() == '':
+        raise HTTPException(
+            status_code=400,
+            detail="API Key 不能为空"
+        )
+    if '${API_KEY}' in request.api_key:
+        logger.warning(f"API Key 可能包含未替换的变量")
+    
+    # 解析请求体
+    body_raw = parse_json_safe(request.request_body)
+    
+    # 准备变量替换
+    variables = {
+        'API_KEY': request.api_key,
+        'PROMPT': request.prompt,
+    }
+    
+    # 替换变量
+    body_str = json.dumps(body_raw)
+    body_str = replace_variables(body_str, variables)
+    body = json.loads(body_str)
+    
+    # 检查是否还有未替换的变量
+    if '${API_KEY}' in body_str:
+        logger.warning("请求体中仍包含未替换的 ${API_KEY} 变量")
+    
+    # 提取参数
+    model = body.get('model', 'gpt-5-nano')
+    input_data = body.get('input')
+    instructions = body.get('instructions')
+    reasoning = body.get('reasoning')
+    prompt = body.get('prompt')  # 可重用提示词模板
+    temperature = body.get('temperature')
+    max_tokens = body.get('max_tokens')
+    
+    # 如果没有 input，使用 prompt 字段
+    if not input_data:
+        input_data = request.prompt
+    
+    # 构建请求体
+    request_body = {
+        'model': model,
+        'input': input_data,
+    }
+    
+    # 添加可选参数
+    if instructions:
+        request_body['instructions'] = instructions
+    if reasoning:
+        request_body['reasoning'] = reasoning
+    if prompt:
+        request_body['prompt'] = prompt
+    
+    # 某些模型（如 gpt-5-nano）不支持 temperature 参数
+    # 只在支持的模型上添加 temperature
+    if temperature is not None:
+        # gpt-5-nano 和其他某些模型不支持 temperature
+        unsupported_models = ['gpt-5-nano']
+        if model.lower() not in [m.lower() for m in unsupported_models]:
+            request_body['temperature'] = temperature
+        else:
+            logger.warning(f"模型 {model} 不支持 temperature 参数，已忽略该参数值: {temperature}")
+    
+    # OpenAI Responses API 不支持 max_tokens 参数
+    # 如果提供了 max_tokens，记录警告但不添加到请求中
+    if max_tokens is not None:
+        logger.warning(f"OpenAI Responses API 不支持 max_tokens 参数，已忽略该参数值: {max_tokens}")
+        # Responses API 可能使用其他参数名，但目前文档未明确说明
+        # 如果需要限制输出长度，可以在 instructions 中指定
+    
+    # 确定 API URL
+    api_url = request.api_url or 'https://api.openai.com/v1/responses'
+    
+    # 准备请求头
+    headers = {
+        'Authorization': f'Bearer {request.api_key}',
+        'Content-Type': 'application/json',
+    }
+    
+    # 解析自定义请求头（如果有），并进行变量替换
+    if request.request_headers:
+        try:
+            custom_headers_raw = parse_json_safe(request.request_headers)
+            # 将自定义请求头转换为 JSON 字符串，进行变量替换，再解析回来
+            custom_headers_str = json.dumps(custom_headers_raw)
+            custom_headers_str = replace_variables(custom_headers_str, variables)
+            custom_headers = json.loads(custom_headers_str)
+            # 更新请求头（自定义请求头会覆盖默认请求头）
+            headers.update(custom_headers)
+        except Exception as e:
+            logger.warning(f"解析自定义请求头失败: {e}")
+    
+    # 确保 Authorization 头正确设置（如果自定义请求头中没有设置）
+    if 'Authorization' not in headers or '${API_KEY}' in headers.get('Authorization', ''):
+        headers['Authorization'] = f'Bearer {request.api_key}'
+    
+    return api_url, headers, request_body
+
+
 async def _call_openai_responses_api(request: ChatModelRequest) -> ChatModelResponse:
     """
     使用 HTTP 请求直接调用 OpenAI Responses API
@@ -77,113 +190,20 @@ async def _call_openai_responses_api(request: ChatModelRequest) -> ChatModelResp
     因此直接使用 HTTP 请求调用。
     """
     try:
-        # 验证 API Key 是否有效
-        if not request.api_key or request.api_key.strip() == '':
-            raise HTTPException(
-                status_code=400,
-                detail="API Key 不能为空"
-            )
-        if '${API_KEY}' in request.api_key:
-            logger.warning(f"API Key 可能包含未替换的变量")
-        
-        # 解析请求体
-        body_raw = parse_json_safe(request.request_body)
-        
-        # 准备变量替换
-        variables = {
-            'API_KEY': request.api_key,
-            'PROMPT': request.prompt,
-        }
-        
-        # 替换变量
-        body_str = json.dumps(body_raw)
-        body_str = replace_variables(body_str, variables)
-        body = json.loads(body_str)
-        
-        # 检查是否还有未替换的变量
-        if '${API_KEY}' in body_str:
-            logger.warning("请求体中仍包含未替换的 ${API_KEY} 变量")
-        
-        # 提取参数
-        model = body.get('model', 'gpt-5-nano')
-        input_data = body.get('input')
-        instructions = body.get('instructions')
-        reasoning = body.get('reasoning')
-        prompt = body.get('prompt')  # 可重用提示词模板
-        temperature = body.get('temperature')
-        max_tokens = body.get('max_tokens')
-        
-        # 如果没有 input，使用 prompt 字段
-        if not input_data:
-            input_data = request.prompt
-        
-        # 构建请求体
-        request_body = {
-            'model': model,
-            'input': input_data,
-        }
-        
-        # 添加可选参数
-        if instructions:
-            request_body['instructions'] = instructions
-        if reasoning:
-            request_body['reasoning'] = reasoning
-        if prompt:
-            request_body['prompt'] = prompt
-        
-        # 某些模型（如 gpt-5-nano）不支持 temperature 参数
-        # 只在支持的模型上添加 temperature
-        if temperature is not None:
-            # gpt-5-nano 和其他某些模型不支持 temperature
-            unsupported_models = ['gpt-5-nano']
-            if model.lower() not in [m.lower() for m in unsupported_models]:
-                request_body['temperature'] = temperature
-            else:
-                logger.warning(f"模型 {model} 不支持 temperature 参数，已忽略该参数值: {temperature}")
-        
-        # OpenAI Responses API 不支持 max_tokens 参数
-        # 如果提供了 max_tokens，记录警告但不添加到请求中
-        if max_tokens is not None:
-            logger.warning(f"OpenAI Responses API 不支持 max_tokens 参数，已忽略该参数值: {max_tokens}")
-            # Responses API 可能使用其他参数名，但目前文档未明确说明
-            # 如果需要限制输出长度，可以在 instructions 中指定
-        
-        # 确定 API URL
-        api_url = request.api_url or 'https://api.openai.com/v1/responses'
-        
-        # 准备请求头
-        headers = {
-            'Authorization': f'Bearer {request.api_key}',
-            'Content-Type': 'application/json',
-        }
-        
-        # 解析自定义请求头（如果有），并进行变量替换
-        if request.request_headers:
-            try:
-                custom_headers_raw = parse_json_safe(request.request_headers)
-                # 将自定义请求头转换为 JSON 字符串，进行变量替换，再解析回来
-                custom_headers_str = json.dumps(custom_headers_raw)
-                custom_headers_str = replace_variables(custom_headers_str, variables)
-                custom_headers = json.loads(custom_headers_str)
-                # 更新请求头（自定义请求头会覆盖默认请求头）
-                headers.update(custom_headers)
-            except Exception as e:
-                logger.warning(f"解析自定义请求头失败: {e}")
-        
-        # 确保 Authorization 头正确设置（如果自定义请求头中没有设置）
-        if 'Authorization' not in headers or '${API_KEY}' in headers.get('Authorization', ''):
-            headers['Authorization'] = f'Bearer {request.api_key}'
+        api_url, headers, request_body = _prepare_responses_request(request)
+        model = request_body['model']
         
         logger.info(f"调用 OpenAI Responses API, 模型: {model}, URL: {api_url}")
         logger.debug(f"请求体: {json.dumps({k: v for k, v in request_body.items() if k != 'input' or isinstance(v, str)}, ensure_ascii=False)[:500]}")
         
-        # 发送 HTTP 请求
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=request_body,
-            timeout=request.timeout
-        )
+        # 发送 HTTP 请求（共享连接池，按提供商限制并发）
+        async with get_admission("openai").slot():
+            response = await get_http_client(api_url).post(
+                api_url,
+                headers=headers,
+                json=request_body,
+                timeout=request.timeout
+            )
         
         # 检查响应状态
         if response.status_code != 200:
@@ -331,7 +351,90 @@ async def chat_with_custom_model(request: ChatModelRequest):
     - ChatGPT (OpenAI)
     - Google Gemini
     - 自定义 API 格式
+    
+    相同的提供商、接口地址、请求体和提示词直接返回LLM缓存中的响应（use_cache=False 时重新调用）
     """
+    cache = get_llm_cache()
+    if cache is None:
+        return await _call_custom_model(request)
+    
+    async def compute():
+        return (await _call_custom_model(request)).model_dump()
+    
+    result, cached = await cache.get_or_compute(_chat_cache_key(request), compute, bypass=not request.use_cache)
+    if cached:
+        logger.info(f"Chat Model 使用缓存结果: {request.provider}")
+    return ChatModelResponse(**result)
+
+
+def _chat_cache_key(request: ChatModelRequest):
+    """Chat Model 请求的缓存键（不包含 API Key 和请求头；URL 去掉查询参数，Gemini 的 key 在查询参数中）"""
+    try:
+        model = json.loads(request.request_body).get("model")
+    except Exception:
+        model = None
+    return make_key(
+        request.provider,
+        model if isinstance(model, str) else None,
+        {"api_url": request.api_url.split("?")[0]},
+        {"prompt": request.prompt, "request_body": request.request_body}
+    )
+
+
+def _prepare_custom_request(request: ChatModelRequest):
+    """
+    构建自定义 Chat Model 请求（变量替换、Gemini 的 key 参数、默认请求头）
+    
+    Returns:
+        (api_url, headers, body)
+    """
+    model_type = request.provider
+    
+    # 准备变量替换
+    variables = {
+        'API_KEY': request.api_key,
+        'PROMPT': request.prompt,
+        'MODEL': model_type,
+    }
+    
+    # 处理 Gemini API URL（API Key 作为 query 参数）
+    api_url = request.api_url
+    if model_type == 'gemini' and '${API_KEY}' in api_url:
+        api_url = replace_variables(api_url, variables)
+    elif model_type == 'gemini' and 'key=' not in api_url:
+        # 如果没有 key 参数，添加它
+        separator = '&' if '?' in api_url else '?'
+        api_url = f"{api_url}{separator}key={request.api_key}"
+    
+    # 解析请求头
+    headers = {}
+    if request.request_headers:
+        headers_raw = parse_json_safe(request.request_headers)
+        # 替换变量
+        headers_str = json.dumps(headers_raw)
+        headers_str = replace_variables(headers_str, variables)
+        headers = json.loads(headers_str)
+    else:
+        # 默认请求头
+        headers = {
+            'Content-Type': 'application/json',
+        }
+        # 根据模型类型添加认证（Gemini 不使用 Authorization header）
+        if model_type in ['deepseek']:
+            headers['Authorization'] = f'Bearer {request.api_key}'
+    
+    # 解析请求体
+    body_raw = parse_json_safe(request.request_body)
+    # 替换变量
+    body_str = json.dumps(body_raw)
+    body_str = replace_variables(body_str, variables)
+    body = json.loads(body_str)
+    
+    return api_url, headers, body
+
+
+async def _call_custom_model(request: ChatModelRequest) -> ChatModelResponse:
+    """调用 Chat Model 接口（不经过缓存）"""
     try:
         # 使用 provider 字段（内部使用），但对外仍支持 model_type 别名
         model_type = request.provider
@@ -340,45 +443,7 @@ async def chat_with_custom_model(request: ChatModelRequest):
         if model_type == 'chatgpt':
             return await _call_openai_responses_api(request)
         
-        # 准备变量替换
-        variables = {
-            'API_KEY': request.api_key,
-            'PROMPT': request.prompt,
-            'MODEL': model_type,
-        }
-        
-        # 处理 Gemini API URL（API Key 作为 query 参数）
-        api_url = request.api_url
-        if model_type == 'gemini' and '${API_KEY}' in api_url:
-            api_url = replace_variables(api_url, variables)
-        elif model_type == 'gemini' and 'key=' not in api_url:
-            # 如果没有 key 参数，添加它
-            separator = '&' if '?' in api_url else '?'
-            api_url = f"{api_url}{separator}key={request.api_key}"
-        
-        # 解析请求头
-        headers = {}
-        if request.request_headers:
-            headers_raw = parse_json_safe(request.request_headers)
-            # 替换变量
-            headers_str = json.dumps(headers_raw)
-            headers_str = replace_variables(headers_str, variables)
-            headers = json.loads(headers_str)
-        else:
-            # 默认请求头
-            headers = {
-                'Content-Type': 'application/json',
-            }
-            # 根据模型类型添加认证（Gemini 不使用 Authorization header）
-            if model_type in ['deepseek']:
-                headers['Authorization'] = f'Bearer {request.api_key}'
-        
-        # 解析请求体
-        body_raw = parse_json_safe(request.request_body)
-        # 替换变量
-        body_str = json.dumps(body_raw)
-        body_str = replace_variables(body_str, variables)
-        body = json.loads(body_str)
+        api_url, headers, body = _prepare_custom_request(request)
         
         # 发送请求
         logger.info(f"调用 Chat Model: {model_type}, URL: {api_url}")
@@ -391,15 +456,16 @@ async def chat_with_custom_model(request: ChatModelRequest):
                 # 记录请求详情（用于调试）
                 logger.debug(f"发送请求到 {api_url}, 请求体: {json.dumps(body, ensure_ascii=False)[:500]}")
                 
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=body,
-                    timeout=request.timeout
-                )
+                async with get_admission(model_type).slot():
+                    response = await get_http_client(api_url).post(
+                        api_url,
+                        headers=headers,
+                        json=body,
+                        timeout=request.timeout
+                    )
                 
                 # 如果状态码不是 2xx，记录详细错误信息
-                if not response.ok:
+                if not response.is_success:
                     error_detail = response.text[:500] if response.text else "无错误详情"
                     logger.error(f"API 返回错误状态码 {response.status_code}: {error_detail}")
                     # 尝试解析错误响应
@@ -412,7 +478,7 @@ async def chat_with_custom_model(request: ChatModelRequest):
                 
                 response.raise_for_status()
                 break
-            except requests.exceptions.Timeout as e:
+            except httpx.TimeoutException as e:
                 last_error = e
                 logger.warning(f"请求超时，重试 {attempt + 1}/{request.max_retries}: {e}")
                 if attempt < request.max_retries - 1:
@@ -429,7 +495,7 @@ async def chat_with_custom_model(request: ChatModelRequest):
                         status_code=504,
                         detail=error_detail
                     )
-            except requests.exceptions.HTTPError as e:
+            except httpx.HTTPStatusError as e:
                 last_error = e
                 error_detail = str(e)
                 error_type = "HTTP_ERROR"
@@ -489,7 +555,7 @@ async def chat_with_custom_model(request: ChatModelRequest):
                         status_code=status_code,
                         detail=error_response
                     )
-            except requests.exceptions.RequestException as e:
+            except httpx.RequestError as e:
                 last_error = e
                 logger.warning(f"请求失败，重试 {attempt + 1}/{request.max_retries}: {e}")
                 if attempt < request.max_retries - 1:
@@ -497,10 +563,10 @@ async def chat_with_custom_model(request: ChatModelRequest):
                 else:
                     error_type = "NETWORK_ERROR"
                     error_message = "网络连接错误"
-                    if isinstance(e, requests.exceptions.ConnectionError):
+                    if isinstance(e, httpx.ConnectError):
                         error_type = "CONNECTION_ERROR"
                         error_message = "无法连接到服务器，请检查网络连接"
-                    elif isinstance(e, requests.exceptions.Timeout):
+                    elif isinstance(e, httpx.TimeoutException):
                         error_type = "TIMEOUT"
                         error_message = "请求超时"
                     
@@ -515,7 +581,7 @@ async def chat_with_custom_model(request: ChatModelRequest):
                         detail=error_response
                     )
         
-        if not response:
+        if response is None:
             raise Exception(f"请求失败: {last_error}")
         
         result = response.json()
@@ -587,7 +653,7 @@ async def chat_with_custom_model(request: ChatModelRequest):
     except ValueError as e:
         logger.error(f"Chat Model 配置错误: {e}")
         raise HTTPException(status_code=400, detail=str(e))
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Chat Model API 请求失败: {e}")
         error_message = str(e)
         # 提供更友好的错误信息
@@ -609,6 +675,245 @@ async def chat_with_custom_model(request: ChatModelRequest):
         )
 
 
+@router.post("/chat/stream")
+async def chat_with_custom_model_stream(request: ChatModelRequest):
+    """
+    使用自定义配置的 Chat Model 进行对话（SSE流式）
+    
+    模型每输出一段就发送一个 token 事件，结束时的 done 事件与 /chat 的响应体相同
+    （事件格式见 ai_integration.streaming）
+    """
+    try:
+        meta: Dict[str, Any] = {}
+        return await sse_response(
+            stream_custom_model(request, meta),
+            lambda: ChatModelResponse(**meta).model_dump()
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Chat Model 配置错误: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Chat Model 流式调用失败: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"调用失败: {str(e)}"
+        )
+
+
+def stream_custom_model(request: ChatModelRequest, meta: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    流式调用 Chat Model，逐段产出模型输出（与 /chat 共用LLM缓存）
+    
+    Args:
+        request: Chat Model 请求
+        meta: 输出结束后更新为与 /chat 响应体字段相同的字典（content、model、usage、raw_response）
+    """
+    return stream_with_cache(
+        _chat_cache_key(request),
+        _stream_custom_model(request, meta),
+        meta,
+        bypass=not request.use_cache
+    )
+
+
+async def _stream_custom_model(request: ChatModelRequest, meta: Dict[str, Any]):
+    """流式调用 Chat Model 接口（不经过缓存）；开始输出之前失败时按 max_retries 重试"""
+    model_type = request.provider
+    if model_type == 'chatgpt':
+        api_url, headers, body = _prepare_responses_request(request)
+        provider = 'openai'
+    else:
+        api_url, headers, body = _prepare_custom_request(request)
+        provider = model_type
+    
+    if model_type == 'gemini':
+        api_url = _gemini_stream_url(api_url)
+    else:
+        body['stream'] = True
+    
+    meta.update({'model': body.get('model') or model_type, 'usage': None, 'raw_response': None})
+    logger.info(f"流式调用 Chat Model: {model_type}, URL: {api_url}")
+    
+    for attempt in range(request.max_retries):
+        started = False
+        try:
+            async with get_admission(provider).slot():
+                async with get_http_client(api_url).stream(
+                    'POST',
+                    api_url,
+                    headers=headers,
+                    json=body,
+                    timeout=request.timeout
+                ) as response:
+                    if not response.is_success:
+                        await response.aread()
+                    response.raise_for_status()
+                    
+                    async for data in _iter_stream_data(response):
+                        content = _parse_stream_chunk(data, meta)
+                        if content:
+                            started = True
+                            yield content
+            return
+        except httpx.HTTPStatusError as e:
+            error = _stream_status_error(e.response)
+        except httpx.TimeoutException as e:
+            error = HTTPException(
+                status_code=504,
+                detail=json.dumps({
+                    "error_type": "TIMEOUT",
+                    "error_message": "请求超时",
+                    "error_detail": f"{request.timeout}秒内没有收到模型输出: {e}",
+                    "timeout": request.timeout
+                }, ensure_ascii=False)
+            )
+        except httpx.RequestError as e:
+            connect_error = isinstance(e, httpx.ConnectError)
+            error = HTTPException(
+                status_code=503,
+                detail=json.dumps({
+                    "error_type": "CONNECTION_ERROR" if connect_error else "NETWORK_ERROR",
+                    "error_message": "无法连接到服务器，请检查网络连接" if connect_error else "网络连接错误",
+                    "error_detail": str(e),
+                    "timeout": request.timeout
+                }, ensure_ascii=False)
+            )
+        
+        # 已经输出的内容无法撤回，只在开始输出之前重试
+        if started or attempt >= request.max_retries - 1:
+            raise error
+        logger.warning(f"流式请求失败，重试 {attempt + 1}/{request.max_retries}: {error.detail}")
+
+
+def _gemini_stream_url(api_url: str) -> str:
+    """Gemini 流式接口地址：generateContent 换成 streamGenerateContent，并要求以 SSE 格式返回"""
+    path, _, query = api_url.partition('?')
+    path = path.replace(':generateContent', ':streamGenerateContent')
+    params = [param for param in query.split('&') if param and not param.startswith('alt=')]
+    params.append('alt=sse')
+    return f"{path}?{'&'.join(params)}"
+
+
+async def _iter_stream_data(response: httpx.Response):
+    """
+    逐条读取流式响应中的 JSON 数据
+    
+    - text/event-stream：SSE（OpenAI、DeepSeek、Gemini 等）
+    - application/x-ndjson：每行一个 JSON（Ollama）
+    - 其他：接口不支持流式时返回的完整 JSON，整体作为一条（数组则逐个）
+    """
+    content_type = response.headers.get('content-type', '')
+    if 'text/event-stream' in content_type:
+        async for data_str in iter_sse_data(response):
+            if data_str.strip() == '[DONE]':
+                break
+            try:
+                yield json.loads(data_str)
+            except json.JSONDecodeError:
+                continue
+    elif 'ndjson' in content_type:
+        async for line in response.aiter_lines():
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    else:
+        await response.aread()
+        result = response.json()
+        for data in (result if isinstance(result, list) else [result]):
+            yield data
+
+
+def _parse_stream_chunk(data: Dict[str, Any], meta: Dict[str, Any]) -> str:
+    """
+    解析一条流式数据，返回其中的增量文本，并把模型名称、用量和原始响应记录到 meta
+    
+    支持 OpenAI Responses API 事件、Gemini、OpenAI 兼容格式（DeepSeek 等）和 Ollama 格式
+    """
+    if not isinstance(data, dict):
+        return ""
+    
+    event_type = data.get('type') or ''
+    if event_type == 'error' or event_type == 'response.failed':
+        error_obj = data.get('error') or (data.get('response') or {}).get('error') or data
+        if not isinstance(error_obj, dict):
+            error_obj = {'message': str(error_obj)}
+        raise HTTPException(
+            status_code=502,
+            detail=json.dumps({
+                "error_type": "API_ERROR",
+                "error_message": "OpenAI API 调用失败",
+                "error_detail": error_obj.get('message', str(error_obj)),
+            }, ensure_ascii=False)
+        )
+    if event_type.startswith('response.'):
+        # OpenAI Responses API：增量文本在 output_text.delta 事件中，completed 事件带有完整响应
+        if event_type == 'response.output_text.delta':
+            return data.get('delta') or ""
+        if event_type in ('response.completed', 'response.incomplete'):
+            response_data = data.get('response') or {}
+            meta['model'] = response_data.get('model', meta['model'])
+            meta['usage'] = response_data.get('usage')
+            meta['raw_response'] = response_data
+        return ""
+    
+    meta['raw_response'] = data
+    if 'candidates' in data:
+        # Gemini 格式
+        meta['model'] = data.get('modelVersion', meta['model'])
+        if data.get('usageMetadata'):
+            meta['usage'] = data['usageMetadata']
+        candidate = data['candidates'][0] if data['candidates'] else {}
+        parts = (candidate.get('content') or {}).get('parts') or []
+        return ''.join(part.get('text', '') for part in parts if isinstance(part, dict))
+    if 'choices' in data:
+        # OpenAI 兼容格式（流式为 delta，不支持流式的接口为完整的 message）
+        meta['model'] = data.get('model', meta['model'])
+        if data.get('usage'):
+            meta['usage'] = data['usage']
+        choice = data['choices'][0] if data['choices'] else {}
+        message = choice.get('delta') or choice.get('message') or {}
+        return message.get('content') or ""
+    if 'message' in data:
+        # Ollama 格式兼容
+        meta['model'] = data.get('model', meta['model'])
+        return data['message'].get('content', '')
+    return ""
+
+
+def _stream_status_error(response: httpx.Response) -> HTTPException:
+    """把流式请求的错误状态码转换为 HTTPException（detail 格式与非流式调用相同）"""
+    status_code = response.status_code
+    error_detail = response.text[:500] if response.text else "无错误详情"
+    try:
+        error_json = response.json()
+        error_obj = error_json.get('error', {}) if isinstance(error_json, dict) else {}
+        if isinstance(error_obj, dict):
+            error_detail = error_obj.get('message', error_detail)
+    except Exception:
+        pass
+    
+    error_type, error_message = {
+        429: ("RATE_LIMIT", "请求过于频繁，请稍后重试"),
+        401: ("AUTH_ERROR", "API Key 认证失败"),
+        400: ("BAD_REQUEST", "请求参数错误"),
+    }.get(status_code, ("HTTP_ERROR", "HTTP 请求错误"))
+    
+    logger.error(f"API 返回错误状态码 {status_code}: {error_detail}")
+    return HTTPException(
+        status_code=status_code,
+        detail=json.dumps({
+            "error_type": error_type,
+            "error_message": error_message,
+            "error_detail": error_detail,
+            "status_code": status_code
+        }, ensure_ascii=False)
+    )
+
+
 @router.post("/test-connection")
 async def test_connection(request: ChatModelRequest):
     """
@@ -626,7 +931,8 @@ async def test_connection(request: ChatModelRequest):
             request_body=request.request_body,
             prompt="Hello",  # 简单测试
             timeout=30,
-            max_retries=1
+            max_retries=1,
+            use_cache=False  # 测试连接必须实际调用接口
         )
         
         result = await chat_with_custom_model(test_request)
@@ -13,6 +13,7 @@ import os
 
 from core.config import settings
 from core.logging_config import logger
+from workflow.metrics import record_cache_event
 from data_parser.parser_factory import ParserFactory
 
 router = APIRouter()
@@ -290,6 +291,7 @@ async def get_parse_cache(
         
         # 尝试加载缓存
         cached_result = _load_cache(cache_key)
+        record_cache_event("file_parse", cached_result is not None)
         if cached_result is not None:
             logger.info(f"返回缓存结果，文件: {path}")
             return {"cached": True, "result": cached_result}
@@ -331,6 +333,7 @@ async def parse_file(request: ParseFileRequest):
         
         # 尝试加载缓存
         cached_result = _load_cache(cache_key)
+        record_cache_event("file_parse", cached_result is not None)
         if cached_result is not None:
             logger.info(f"使用缓存结果，文件: {path}")
             return cached_result
@@ -10,21 +10,22 @@ from fastapi import APIRouter, HTTPException
 from typing import Dict, Any, Optional, List, Union
 from pydantic import BaseModel, Field
 import json
-import requests
-from pathlib import Path
+import asyncio
+import httpx
 
+from ai_integration.admission import get_admission
+from ai_integration.http_client import get_http_client
+from ai_integration.llm_cache import CacheKey, get_llm_cache, make_key
 from core.logging_config import logger
 from api.base import AIWorkflowService
-from core.config import settings
-from datetime import datetime
-import hashlib
 
 router = APIRouter()
 ai_service = AIWorkflowService()
 
-# 缓存目录
-CACHE_DIR = Path(settings.UPLOAD_DIR).parent / "cache" / "gemini_agent"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# 不参与缓存键的字段（不影响模型输出）
+CACHE_KEY_EXCLUDE = {"api_key", "timeout", "max_retries", "use_cache"}
+# 作为消息参与缓存键的字段（规范化键中会规范化其中的文本）
+CACHE_MESSAGE_FIELDS = ("system_prompt", "instructions", "input", "input_content", "input_data")
 
 
 class InputContentItem(BaseModel):
@@ -67,73 +68,18 @@ class GeminiAgentRequest(BaseModel):
     # 请求配置
     timeout: int = 60
     max_retries: int = 3
-
-
-def _get_gemini_agent_cache_key(
-    input_data: Optional[Dict[str, Any]],
-    input_content: Optional[List[InputContentItem]],
-    system_prompt: Optional[str],
-    instructions: Optional[str],
-    model: str,
-    output_format: str,
-    data_processing_mode: str,
-    sample_strategy: str
-) -> str:
-    """生成缓存键"""
-    key_parts = []
-    
-    if input_data:
-        key_parts.append(f"input_data:{json.dumps(input_data, sort_keys=True)}")
-    
-    if input_content:
-        content_str = json.dumps([item.dict() for item in input_content], sort_keys=True)
-        key_parts.append(f"input_content:{content_str}")
-    
-    if system_prompt:
-        key_parts.append(f"system_prompt:{system_prompt}")
-    
-    if instructions:
-        key_parts.append(f"instructions:{instructions}")
     
-    key_parts.append(f"model:{model}")
-    key_parts.append(f"output_format:{output_format}")
-    key_parts.append(f"data_processing_mode:{data_processing_mode}")
-    key_parts.append(f"sample_strategy:{sample_strategy}")
-    
-    key_str = "|".join(key_parts)
-    return hashlib.md5(key_str.encode('utf-8')).hexdigest()
-
+    # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
+    use_cache: bool = True
 
-def _load_gemini_agent_cache(cache_key: str) -> Optional[Dict[str, Any]]:
-    """加载缓存"""
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    if cache_file.exists():
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
-                # 检查缓存是否过期（24小时）
-                cached_at = datetime.fromisoformat(cached_data.get('cached_at', ''))
-                if (datetime.now() - cached_at).total_seconds() < 86400:
-                    logger.info(f"加载 Gemini Agent 缓存: {cache_key}")
-                    return cached_data.get('result')
-        except Exception as e:
-            logger.warning(f"加载 Gemini Agent 缓存失败: {e}")
-    return None
 
-
-def _save_gemini_agent_cache(cache_key: str, result: Dict[str, Any]) -> None:
-    """保存缓存"""
-    try:
-        cache_file = CACHE_DIR / f"{cache_key}.json"
-        cache_data = {
-            'cached_at': datetime.now().isoformat(),
-            'result': result
-        }
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-        logger.info(f"保存 Gemini Agent 缓存: {cache_key}")
-    except Exception as e:
-        logger.warning(f"保存 Gemini Agent 缓存失败: {e}，继续执行")
+def _get_gemini_agent_cache_key(request: GeminiAgentRequest) -> CacheKey:
+    """生成 Gemini Agent 的LLM缓存键（API Key、超时等不参与；URL 去掉查询参数中的 key）"""
+    params = request.model_dump(exclude=CACHE_KEY_EXCLUDE)
+    messages = {name: params.pop(name) for name in CACHE_MESSAGE_FIELDS}
+    model = params.pop("model")
+    params["api_url"] = params["api_url"].split("?")[0]
+    return make_key("gemini_agent", model, params, messages)
 
 
 def build_input_content(
@@ -190,28 +136,21 @@ async def execute_gemini_agent(request: GeminiAgentRequest):
     - 数据处理和采样
     
     缓存机制：
-    - 如果输入数据和配置未变化，直接返回缓存结果
+    - 如果输入数据和配置未变化，直接返回LLM缓存中的结果（use_cache=False 时重新调用）
+    - 相同请求并发到达时只调用一次 API
     """
+    cache = get_llm_cache()
+    cache_key = _get_gemini_agent_cache_key(request) if cache is not None else None
     try:
-        # 0. 生成缓存键并检查缓存
-        cache_key = _get_gemini_agent_cache_key(
-            input_data=request.input_data,
-            input_content=request.input_content,
-            system_prompt=request.system_prompt,
-            instructions=request.instructions,
-            model=request.model,
-            output_format=request.output_format,
-            data_processing_mode=request.data_processing_mode,
-            sample_strategy=request.sample_strategy
-        )
-        
-        cached_result = _load_gemini_agent_cache(cache_key)
-        if cached_result is not None:
-            logger.info("使用 Gemini Agent 缓存结果，跳过 API 调用")
-            return ai_service.create_success_response(
-                message="Gemini Agent 执行成功（使用缓存）",
-                data=cached_result
-            )
+        # 0. 检查缓存
+        if cache is not None:
+            cached_result = await cache.acquire(cache_key, bypass=not request.use_cache)
+            if cached_result is not None:
+                logger.info("使用 Gemini Agent 缓存结果，跳过 API 调用")
+                return ai_service.create_success_response(
+                    message="Gemini Agent 执行成功（使用缓存）",
+                    data=cached_result
+                )
         
         # 1. 验证 API Key
         if not request.api_key or request.api_key.strip() == '':
@@ -322,12 +261,13 @@ async def execute_gemini_agent(request: GeminiAgentRequest):
         last_error = None
         for attempt in range(request.max_retries):
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=request_body,
-                    timeout=request.timeout
-                )
+                async with get_admission("gemini").slot():
+                    response = await get_http_client(api_url).post(
+                        api_url,
+                        headers=headers,
+                        json=request_body,
+                        timeout=request.timeout
+                    )
                 
                 if response.status_code != 200:
                     error_detail = response.text
@@ -367,8 +307,7 @@ async def execute_gemini_agent(request: GeminiAgentRequest):
                         if response.status_code in [429, 503]:
                             wait_time = min(2 ** attempt, 60)
                             logger.info(f"遇到速率限制或服务过载，等待 {wait_time} 秒后重试...")
-                            import time
-                            time.sleep(wait_time)
+                            await asyncio.sleep(wait_time)
                         continue
                     else:
                         raise HTTPException(
@@ -412,14 +351,15 @@ async def execute_gemini_agent(request: GeminiAgentRequest):
                         pass
                 
                 # 保存缓存
-                _save_gemini_agent_cache(cache_key, result)
+                if cache is not None:
+                    await cache.aput(cache_key, result)
                 
                 return ai_service.create_success_response(
                     message="Gemini Agent 执行成功",
                     data=result
                 )
                 
-            except requests.exceptions.Timeout as e:
+            except httpx.TimeoutException as e:
                 last_error = e
                 logger.warning(f"请求超时，重试 {attempt + 1}/{request.max_retries}: {e}")
                 if attempt < request.max_retries - 1:
@@ -429,7 +369,7 @@ async def execute_gemini_agent(request: GeminiAgentRequest):
                         status_code=504,
                         detail=f"请求超时（{request.timeout}秒）"
                     )
-            except requests.exceptions.RequestException as e:
+            except httpx.RequestError as e:
                 last_error = e
                 logger.warning(f"请求失败，重试 {attempt + 1}/{request.max_retries}: {e}")
                 if attempt < request.max_retries - 1:
@@ -451,4 +391,7 @@ async def execute_gemini_agent(request: GeminiAgentRequest):
     except Exception as e:
         logger.error(f"Gemini Agent 执行失败: {e}", exc_info=True)
         raise ai_service.create_error_response(f"Gemini Agent 执行失败: {str(e)}")
+    finally:
+        if cache is not None:
+            cache.release(cache_key)
 
@@ -10,21 +10,27 @@ from fastapi import APIRouter, HTTPException, UploadFile, File
 from typing import Dict, Any, Optional, List, Union
 from pydantic import BaseModel, Field
 import json
-import requests
+import asyncio
+import httpx
 from pathlib import Path
 
+from ai_integration.admission import get_admission
+from ai_integration.http_client import get_http_client
+from ai_integration.llm_cache import CacheKey, get_llm_cache, make_key
 from core.logging_config import logger
 from api.base import AIWorkflowService
 from core.config import settings
-from datetime import datetime
-import hashlib
 
 router = APIRouter()
 ai_service = AIWorkflowService()
 
-# 缓存目录（与 files.py 保持一致）
-CACHE_DIR = Path(settings.UPLOAD_DIR).parent / "cache" / "gpt_agent"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# OpenAI Files API
+OPENAI_FILES_URL = "https://api.openai.com/v1/files"
+
+# 不参与缓存键的字段（不影响模型输出）
+CACHE_KEY_EXCLUDE = {"api_key", "request_headers", "timeout", "max_retries", "use_cache"}
+# 作为消息参与缓存键的字段（规范化键中会规范化其中的文本）
+CACHE_MESSAGE_FIELDS = ("system_prompt", "instructions", "input", "input_content", "input_data", "agents")
 
 
 class InputContentItem(BaseModel):
@@ -107,6 +113,9 @@ class GPTAgentRequest(BaseModel):
     use_tool: Optional[bool] = False
     tool_connected: Optional[bool] = False
     tool_config: Optional[Dict[str, Any]] = None  # tool_type, tool_functions
+    
+    # 是否读取LLM缓存（False 时重新调用模型并刷新缓存）
+    use_cache: bool = True
 
 
 class GPTAgentResponse(BaseModel):
@@ -147,8 +156,8 @@ async def upload_file_to_openai(file_path: str, api_key: str, purpose: str = "us
                 "Authorization": f"Bearer {api_key}"
             }
             
-            response = requests.post(
-                "https://api.openai.com/v1/files",
+            response = await get_http_client(OPENAI_FILES_URL).post(
+                OPENAI_FILES_URL,
                 headers=headers,
                 files=files,
                 data=data,
@@ -306,127 +315,29 @@ def _process_input_data(
     return process_data(input_data, mode, limit_count, max_tokens, sample_strategy)
 
 
-def _get_gpt_agent_cache_key(
-    input_data: Optional[Dict[str, Any]],
-    input_content: Optional[List[InputContentItem]],
-    system_prompt: Optional[str],
-    instructions: Optional[str],
-    model: str,
-    output_format: str,
-    data_processing_mode: str,
-    sample_strategy: str
-) -> str:
+def _get_gpt_agent_cache_key(request: GPTAgentRequest) -> CacheKey:
     """
-    生成 GPT Agent 缓存键
-    
-    Args:
-        input_data: 输入数据
-        input_content: 输入内容项
-        system_prompt: 系统提示词
-        instructions: 高级指令
-        model: 模型名称
-        output_format: 输出格式
-        data_processing_mode: 数据处理模式
-        sample_strategy: 采样策略
-    
-    Returns:
-        缓存键（MD5哈希值）
-    """
-    # 构建缓存键字符串
-    key_parts = []
-    
-    # 输入数据（只使用关键信息，避免过大）
-    if input_data:
-        # 提取关键信息：文件路径、数据摘要
-        data_key = {
-            "file_path": input_data.get("file_path"),
-            "original_format": input_data.get("original_format"),
-            "output_format": input_data.get("output_format"),
-            "data_hash": hashlib.md5(
-                json.dumps(input_data.get("data"), sort_keys=True, ensure_ascii=False).encode()
-            ).hexdigest()[:16] if input_data.get("data") else None,
-        }
-        key_parts.append(json.dumps(data_key, sort_keys=True, ensure_ascii=False))
-    
-    # 输入内容（提取文本摘要）
-    if input_content:
-        text_parts = []
-        for item in input_content:
-            if hasattr(item, 'text') and item.text:
-                text_parts.append(item.text[:200])  # 只取前200字符
-            elif isinstance(item, dict) and item.get('text'):
-                text_parts.append(item['text'][:200])
-        if text_parts:
-            key_parts.append("|".join(text_parts))
-    
-    # 配置信息
-    config_key = {
-        "system_prompt": system_prompt[:500] if system_prompt else None,  # 只取前500字符
-        "instructions": instructions[:500] if instructions else None,
-        "model": model,
-        "output_format": output_format,
-        "data_processing_mode": data_processing_mode,
-        "sample_strategy": sample_strategy,
-    }
-    key_parts.append(json.dumps(config_key, sort_keys=True, ensure_ascii=False))
+    生成 GPT Agent 的LLM缓存键
     
-    # 生成MD5哈希
-    key_str = "||".join(key_parts)
-    return hashlib.md5(key_str.encode('utf-8')).hexdigest()
-
-
-def _load_gpt_agent_cache(cache_key: str) -> Optional[Dict[str, Any]]:
-    """
-    加载 GPT Agent 缓存
+    请求中影响输出的字段全部参与计算（API Key、请求头、超时等除外），
+    提示词和输入内容作为消息参与规范化；本地文件按修改时间和大小区分。
     
     Args:
-        cache_key: 缓存键
+        request: GPT Agent 请求
     
     Returns:
-        缓存的执行结果，如果不存在则返回 None
-    """
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    if not cache_file.exists():
-        return None
-    
-    try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
-        
-        logger.info(f"使用 GPT Agent 缓存结果，缓存键: {cache_key[:16]}...")
-        return cache_data.get("result")
-    
-    except Exception as e:
-        logger.warning(f"加载 GPT Agent 缓存失败: {e}")
-        # 缓存文件损坏，删除它
-        if cache_file.exists():
-            cache_file.unlink()
-        return None
-
-
-def _save_gpt_agent_cache(cache_key: str, result: Dict[str, Any]) -> None:
-    """
-    保存 GPT Agent 缓存
-    
-    Args:
-        cache_key: 缓存键
-        result: 执行结果
+        缓存键
     """
-    try:
-        cache_file = CACHE_DIR / f"{cache_key}.json"
-        
-        cache_data = {
-            "cached_at": datetime.now().isoformat(),
-            "result": result,
-        }
-        
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"GPT Agent 缓存已保存，缓存键: {cache_key[:16]}...")
-    
-    except Exception as e:
-        logger.warning(f"保存 GPT Agent 缓存失败: {e}，继续执行")
+    params = request.model_dump(exclude=CACHE_KEY_EXCLUDE)
+    messages = {name: params.pop(name) for name in CACHE_MESSAGE_FIELDS}
+    model = params.pop("model")
+    if request.file_path:
+        try:
+            stat = Path(request.file_path).stat()
+            params["file_signature"] = {"mtime": stat.st_mtime, "size": stat.st_size}
+        except OSError:
+            pass
+    return make_key("gpt_agent", model, params, messages)
 
 
 @router.post("/execute")
@@ -441,29 +352,22 @@ async def execute_gpt_agent(request: GPTAgentRequest):
     - Agent 作为服务（多 Agent 协作）
     
     缓存机制：
-    - 如果输入数据和配置未变化，直接返回缓存结果
+    - 如果输入数据和配置未变化，直接返回LLM缓存中的结果（use_cache=False 时重新调用）
     - 缓存键：基于输入数据、系统提示词、模型等生成
+    - 相同请求并发到达时只调用一次 API
     """
+    cache = get_llm_cache()
+    cache_key = _get_gpt_agent_cache_key(request) if cache is not None else None
     try:
-        # 0. 生成缓存键并检查缓存
-        cache_key = _get_gpt_agent_cache_key(
-            input_data=request.input_data,
-            input_content=request.input_content,
-            system_prompt=request.system_prompt,
-            instructions=request.instructions,
-            model=request.model,
-            output_format=request.output_format,
-            data_processing_mode=request.data_processing_mode,
-            sample_strategy=request.sample_strategy
-        )
-        
-        cached_result = _load_gpt_agent_cache(cache_key)
-        if cached_result is not None:
-            logger.info("使用 GPT Agent 缓存结果，跳过 API 调用")
-            return ai_service.create_success_response(
-                message="GPT Agent 执行成功（使用缓存）",
-                data=cached_result
-            )
+        # 0. 检查缓存
+        if cache is not None:
+            cached_result = await cache.acquire(cache_key, bypass=not request.use_cache)
+            if cached_result is not None:
+                logger.info("使用 GPT Agent 缓存结果，跳过 API 调用")
+                return ai_service.create_success_response(
+                    message="GPT Agent 执行成功（使用缓存）",
+                    data=cached_result
+                )
         
         # 1. 验证 API Key
         if not request.api_key or request.api_key.strip() == '':
@@ -679,12 +583,13 @@ async def execute_gpt_agent(request: GPTAgentRequest):
         
         for attempt in range(request.max_retries):
             try:
-                response = requests.post(
-                    request.api_url,
-                    headers=headers,
-                    json=request_body,
-                    timeout=request.timeout
-                )
+                async with get_admission("openai").slot():
+                    response = await get_http_client(request.api_url).post(
+                        request.api_url,
+                        headers=headers,
+                        json=request_body,
+                        timeout=request.timeout
+                    )
                 
                 if response.status_code != 200:
                     error_detail = response.text
@@ -796,8 +701,7 @@ async def execute_gpt_agent(request: GPTAgentRequest):
                         if response.status_code in [429, 503]:
                             wait_time = min(2 ** attempt, 60)  # 指数退避，最多等待60秒
                             logger.info(f"遇到速率限制或服务过载，等待 {wait_time} 秒后重试...")
-                            import time
-                            time.sleep(wait_time)
+                            await asyncio.sleep(wait_time)
                         continue
                     else:
                         raise HTTPException(
@@ -813,7 +717,7 @@ async def execute_gpt_agent(request: GPTAgentRequest):
                 
                 break
                 
-            except requests.exceptions.Timeout as e:
+            except httpx.TimeoutException as e:
                 last_error = e
                 logger.warning(f"请求超时，重试 {attempt + 1}/{request.max_retries}: {e}")
                 if attempt < request.max_retries - 1:
@@ -823,7 +727,7 @@ async def execute_gpt_agent(request: GPTAgentRequest):
                         status_code=504,
                         detail=f"请求超时（{request.timeout}秒）"
                     )
-            except requests.exceptions.RequestException as e:
+            except httpx.RequestError as e:
                 last_error = e
                 logger.warning(f"请求失败，重试 {attempt + 1}/{request.max_retries}: {e}")
                 if attempt < request.max_retries - 1:
@@ -834,7 +738,7 @@ async def execute_gpt_agent(request: GPTAgentRequest):
                         detail=f"API 请求失败: {str(e)}"
                     )
         
-        if not response:
+        if response is None:
             raise Exception(f"请求失败: {last_error}")
         
         # 8. 解析响应
@@ -919,7 +823,8 @@ async def execute_gpt_agent(request: GPTAgentRequest):
         }
         
         # 10. 保存缓存
-        _save_gpt_agent_cache(cache_key, result)
+        if cache is not None:
+            await cache.aput(cache_key, result)
         
         return ai_service.create_success_response(
             message="GPT Agent 执行成功",
@@ -931,6 +836,9 @@ async def execute_gpt_agent(request: GPTAgentRequest):
     except Exception as e:
         logger.error(f"GPT Agent 执行失败: {e}", exc_info=True)
         raise ai_service.create_error_response(f"GPT Agent 执行失败: {str(e)}")
+    finally:
+        if cache is not None:
+            cache.release(cache_key)
 
 
 @router.get("/cache")
@@ -959,23 +867,15 @@ async def get_gpt_agent_cache(
         # 前端应该通过 execute 接口自动使用缓存
         # 这里提供一个简单的查询接口，用于调试
         
-        # 如果提供了所有参数，尝试查找缓存
-        if input_data_hash and system_prompt_hash and model and output_format:
-            # 遍历缓存目录，查找匹配的缓存
-            for cache_file in CACHE_DIR.glob("*.json"):
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cache_data = json.load(f)
-                    result = cache_data.get("result", {})
-                    
-                    # 简单匹配（实际应该使用更精确的匹配逻辑）
-                    if (result.get("gpt_agent_response", {}).get("model") == model and
-                        result.get("output_format") == output_format):
-                        logger.info(f"找到匹配的缓存: {cache_file.name}")
-                        return {"cached": True, "result": result}
-                except Exception as e:
-                    logger.warning(f"读取缓存文件失败: {e}")
-                    continue
+        # 如果提供了所有参数，在LLM缓存中查找该模型最近的结果
+        cache = get_llm_cache()
+        if cache is not None and input_data_hash and system_prompt_hash and model and output_format:
+            results = await asyncio.to_thread(cache.latest, "gpt_agent", model)
+            for result in results:
+                # 简单匹配（实际应该使用更精确的匹配逻辑）
+                if result.get("output_format") == output_format:
+                    logger.info(f"找到匹配的缓存: {model}")
+                    return {"cached": True, "result": result}
         
         return {"cached": False, "result": None}
     
@@ -113,7 +113,7 @@ async def search_memory(request: SearchMemoryRequest):
     """
     搜索记忆
     
-    使用关键词搜索记忆（简单文本匹配）
+    使用关键词全文检索记忆（多个关键词以空格分隔），按相关度排序，结果包含命中片段（snippet）
     """
     try:
         results = memory_storage.search(
@@ -46,8 +46,8 @@ async def analyze_schema(request: SchemaAnalysisRequest):
         else:
             learner = RuleBasedSchemaLearner()
         
-        schema = learner.learn_schema(request.data, request.metadata)
-        relationships = learner.understand_relationships(schema)
+        schema = await learner.learn_schema(request.data, request.metadata)
+        relationships = await learner.understand_relationships(schema)
         
         return SchemaAnalysisResponse(
             schema_data=schema,  # 使用 schema_data 字段，但对外仍支持 schema 别名
@@ -67,7 +67,7 @@ async def infer_intent(request: IntentInferenceRequest):
         else:
             learner = RuleBasedSchemaLearner()
         
-        intent = learner.infer_intent(request.instruction, request.schema_data)
+        intent = await learner.infer_intent(request.instruction, request.schema_data)
         
         return IntentInferenceResponse(
             intent=intent,
@@ -1,9 +1,10 @@
 """
 工作流API
 """
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+import asyncio
 
 from core.logging_config import logger
 from storage import get_storage
@@ -41,27 +42,326 @@ def get_storage_backend():
     return _storage
 
 
+async def _compile_stored_workflow(workflow_id: str):
+    """加载并编译存储中的自定义工作流（节点/连线图）"""
+    from workflow.graph_compiler import compile_workflow
+    
+    storage = get_storage_backend()
+    workflow = await storage.load(workflow_id)
+    if not workflow:
+        raise HTTPException(status_code=404, detail=f"工作流不存在: {workflow_id}")
+    return compile_workflow(workflow)
+
+
+def _compact_result(result: Dict[str, Any], outputs: List[str]) -> Dict[str, Any]:
+    """只返回输出节点的结果，中间步骤的数据保留在服务端执行记录中"""
+    compact = {
+        key: value for key, value in result.items()
+        if not key.startswith("step_") and key != "steps"
+    }
+    compact["steps"] = [
+        {key: value for key, value in step.items() if key != "result"}
+        for step in result.get("steps", [])
+    ]
+    compact["outputs"] = {
+        node_id: result[f"step_{node_id}"]
+        for node_id in outputs
+        if f"step_{node_id}" in result
+    }
+    return compact
+
+
+async def _resolve_plan(workflow_id: str):
+    """
+    获取执行计划
+    
+    Returns:
+        (steps, outputs)：默认工作流返回 (None, None)，自定义工作流返回编译后的步骤和输出节点
+    """
+    workflow_engine = get_engine()
+    if workflow_id in workflow_engine.workflows:
+        return None, None
+    compiled = await _compile_stored_workflow(workflow_id)
+    return compiled.steps, compiled.outputs
+
+
+def _budget_from_query(memory_limit_mb: Optional[int], cpu_time_limit: Optional[int]) -> Optional[Dict[str, Any]]:
+    """从查询参数构建资源预算（未指定时使用配置的默认值）"""
+    if memory_limit_mb is None and cpu_time_limit is None:
+        return None
+    return {"memory_mb": memory_limit_mb, "cpu_seconds": cpu_time_limit}
+
+
 @router.post("/execute/{workflow_id}")
 async def execute_workflow(
     workflow_id: str,
-    context: Dict[str, Any]
+    context: Dict[str, Any],
+    include_intermediate: bool = False,
+    timeout: Optional[float] = None,
+    memory_limit_mb: Optional[int] = None,
+    cpu_time_limit: Optional[int] = None
 ):
-    """执行工作流"""
+    """
+    执行工作流
+    
+    - 默认工作流：直接执行已注册的步骤
+    - 自定义工作流：从存储加载节点/连线图，编译后在服务端执行整张图，
+      默认只返回输出节点（没有下游的节点）的结果；include_intermediate=true 时返回全部步骤结果
+    - timeout: 整个工作流的超时时间（秒）
+    - memory_limit_mb / cpu_time_limit: 工作进程资源预算
+    """
     try:
         workflow_engine = get_engine()
-        result = await workflow_engine.execute(workflow_id, context)
-        return result
+        steps, outputs = await _resolve_plan(workflow_id)
+        result = await workflow_engine.execute(
+            workflow_id,
+            context,
+            steps=steps,
+            timeout=timeout,
+            budget=_budget_from_query(memory_limit_mb, cpu_time_limit)
+        )
+        if outputs is None or include_intermediate:
+            return result
+        return _compact_result(result, outputs)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # 编译错误（不支持的节点、循环依赖等）
+        logger.error(f"工作流编译失败: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"工作流执行失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/start/{workflow_id}")
+async def start_workflow(
+    workflow_id: str,
+    context: Dict[str, Any],
+    timeout: Optional[float] = None,
+    memory_limit_mb: Optional[int] = None,
+    cpu_time_limit: Optional[int] = None
+):
+    """在后台启动工作流，立即返回 execution_id（通过 /status 查询进度，/cancel 取消）"""
+    try:
+        workflow_engine = get_engine()
+        steps, _ = await _resolve_plan(workflow_id)
+        execution = await workflow_engine.start(
+            workflow_id,
+            context,
+            steps=steps,
+            timeout=timeout,
+            budget=_budget_from_query(memory_limit_mb, cpu_time_limit)
+        )
+        return {
+            "execution_id": execution["execution_id"],
+            "status": execution["status"],
+            "started_at": execution["started_at"],
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"工作流启动失败: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"工作流启动失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/cancel/{execution_id}")
+async def cancel_workflow(execution_id: str):
+    """取消正在执行的工作流"""
+    try:
+        workflow_engine = get_engine()
+        if not workflow_engine.cancel(execution_id):
+            if await workflow_engine.get_workflow_status(execution_id) is None:
+                raise HTTPException(status_code=404, detail="执行记录不存在")
+            raise HTTPException(status_code=409, detail="工作流未在执行中")
+        return {"success": True, "execution_id": execution_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"取消工作流失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/enqueue/{workflow_id}")
+async def enqueue_workflow(
+    workflow_id: str,
+    context: Dict[str, Any],
+    priority: int = 0,
+    max_attempts: Optional[int] = None,
+    timeout: Optional[float] = None
+):
+    """
+    将工作流作业加入队列，由独立的工作进程执行（python -m workflow.worker）
+    
+    通过 /jobs/{job_id} 查询作业状态和结果
+    """
+    try:
+        from workflow.job_queue import get_job_queue
+        
+        workflow_engine = get_engine()
+        if workflow_id not in workflow_engine.workflows:
+            # 入队前检查自定义工作流能否编译，避免工作进程反复失败
+            await _compile_stored_workflow(workflow_id)
+        
+        return get_job_queue().enqueue(workflow_id, context, priority, max_attempts, timeout)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"工作流作业入队失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs")
+async def list_jobs(
+    status: Optional[str] = None,
+    workflow_id: Optional[str] = None,
+    limit: int = 50
+):
+    """列出工作流作业"""
+    try:
+        from workflow.job_queue import get_job_queue
+        return {"jobs": get_job_queue().list_jobs(status, workflow_id, limit)}
+    except Exception as e:
+        logger.error(f"获取作业列表失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取工作流作业状态和结果"""
+    try:
+        from workflow.job_queue import get_job_queue
+        job = get_job_queue().get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="作业不存在")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取作业失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消工作流作业（排队中的作业立即取消，运行中的作业由工作进程在下一次心跳时取消）"""
+    try:
+        from workflow.job_queue import get_job_queue
+        job = get_job_queue().request_cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="作业不存在")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"取消作业失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/resume/{execution_id}")
+async def resume_workflow(
+    execution_id: str,
+    wait: bool = False,
+    timeout: Optional[float] = None
+):
+    """
+    从检查点恢复中断的执行
+    
+    跳过已完成的步骤和步骤内已处理的项（如批量处理中已导出的文件）；
+    wait=false 时在后台运行并立即返回，通过 /status 查询进度。
+    """
+    try:
+        workflow_engine = get_engine()
+        if workflow_engine.checkpoints is None:
+            raise HTTPException(status_code=400, detail="未启用工作流检查点")
+        
+        record = await asyncio.to_thread(workflow_engine.checkpoints.load_execution, execution_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="检查点不存在")
+        
+        steps, _ = await _resolve_plan(record["workflow_id"])
+        execution = await workflow_engine.resume(execution_id, steps=steps, timeout=timeout)
+        if wait:
+            return await workflow_engine.wait(execution_id)
+        return {
+            "execution_id": execution_id,
+            "status": execution["status"],
+            "resumed_at": execution["resumed_at"],
+            "restored_steps": [step["step"] for step in execution["steps"] if step.get("restored")],
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"恢复工作流失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/checkpoints")
+async def list_checkpoints(
+    workflow_id: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 50
+):
+    """列出持久化的执行记录（可用于查找需要恢复的执行）"""
+    try:
+        workflow_engine = get_engine()
+        if workflow_engine.checkpoints is None:
+            return {"executions": []}
+        executions = await asyncio.to_thread(workflow_engine.checkpoints.list_executions, workflow_id, status, limit)
+        for execution in executions:
+            execution["is_running"] = workflow_engine.is_running(execution["execution_id"])
+        return {"executions": executions}
+    except Exception as e:
+        logger.error(f"获取检查点列表失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/metrics/executions/{execution_id}")
+async def get_execution_metrics(execution_id: str):
+    """获取单次执行的步骤指标（耗时、CPU时间、内存、数据量、缓存命中）"""
+    try:
+        workflow_engine = get_engine()
+        if workflow_engine.metrics is None:
+            raise HTTPException(status_code=400, detail="未启用工作流指标")
+        metrics = workflow_engine.metrics.get_execution_metrics(execution_id)
+        if metrics is None:
+            raise HTTPException(status_code=404, detail="指标记录不存在")
+        return metrics
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取执行指标失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/metrics/workflows/{workflow_id}")
+async def get_workflow_metrics_summary(workflow_id: str, limit: int = 100):
+    """按工作流聚合最近 limit 次执行的指标（p50/p95）"""
+    try:
+        workflow_engine = get_engine()
+        if workflow_engine.metrics is None:
+            raise HTTPException(status_code=400, detail="未启用工作流指标")
+        return workflow_engine.metrics.get_workflow_summary(workflow_id, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取工作流指标汇总失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/status/{execution_id}")
 async def get_workflow_status(execution_id: str):
     """获取工作流执行状态"""
     try:
         workflow_engine = get_engine()
-        status = workflow_engine.get_workflow_status(execution_id)
+        status = await workflow_engine.get_workflow_status(execution_id)
         if not status:
             raise HTTPException(status_code=404, detail="执行记录不存在")
         return status
@@ -88,19 +388,37 @@ async def get_workflow_history(
 
 
 @router.get("/list")
-async def list_workflows():
-    """列出所有可用工作流（返回详细信息）"""
+async def list_workflows(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    sort: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    workflow_type: Optional[str] = Query(None, alias="type"),
+    name: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    列出可用工作流（默认工作流在前，自定义工作流在后）
+    
+    支持分页（offset/limit）、排序（sort，如 -updated_at）、过滤（is_active/type/name）
+    和字段投影（fields，逗号分隔）；不传参数时返回全部工作流。
+    """
+    from storage.base import apply_list_options, parse_list_options
+    
     try:
         workflow_engine = get_engine()
         storage = get_storage_backend()
-        workflow_list = []
+        filters = {"is_active": is_active, "type": workflow_type, "name": name}
+        field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        parse_list_options(sort, filters, field_list)
         
-        # 添加默认工作流（排除被隐藏的）
+        # 默认工作流（排除被隐藏的）
+        default_workflows = []
         for workflow_id in workflow_engine.workflows.keys():
             # 检查存储后端是否支持隐藏功能（用于默认工作流的软删除）
-            if hasattr(storage, 'is_hidden') and storage.is_hidden(workflow_id):
+            if hasattr(storage, 'is_hidden') and await storage.is_hidden(workflow_id):
                 continue
-            workflow_list.append({
+            default_workflows.append({
                 "workflow_id": workflow_id,
                 "name": workflow_id.replace("_", " ").title(),
                 "description": f"默认工作流: {workflow_id}",
@@ -109,26 +427,77 @@ async def list_workflows():
                 "updated_at": datetime.now().isoformat(),
                 "type": "default",
             })
+        default_workflows = apply_list_options(default_workflows, filters=filters, fields=field_list)
         
-        # 添加自定义工作流（从存储后端获取）
-        custom_workflows = await storage.list_all()
-        workflow_list.extend(custom_workflows)
+        # 分页范围先覆盖默认工作流，剩余部分从存储后端查询
+        workflow_list = default_workflows[offset:None if limit is None else offset + limit]
+        remaining = None if limit is None else limit - len(workflow_list)
+        custom_total = await storage.count(filters)
+        if remaining is None or remaining > 0:
+            workflow_list.extend(await storage.list_all(
+                offset=max(0, offset - len(default_workflows)),
+                limit=remaining,
+                sort=sort,
+                filters=filters,
+                fields=field_list
+            ))
         
-        return {"workflows": workflow_list}
+        return {
+            "workflows": workflow_list,
+            "total": len(default_workflows) + custom_total,
+            "offset": offset,
+            "limit": limit,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取工作流列表失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _record_version(workflow_id: str, workflow_data: Dict[str, Any], message: Optional[str] = None) -> Optional[int]:
+    """
+    记录工作流版本（未启用版本历史时返回 None；内容未变化时返回当前最新版本号）
+    
+    在工作流保存成功之后调用，记录失败只记日志并返回 None，不影响已完成的保存。
+    """
+    from storage.versions import get_version_store
+    
+    versions = get_version_store()
+    if versions is None:
+        return None
+    try:
+        recorded = await asyncio.to_thread(versions.record, workflow_id, workflow_data, message)
+        if recorded is None:
+            return await asyncio.to_thread(versions.latest_version, workflow_id)
+        return recorded["version"]
+    except Exception as e:
+        logger.error(f"记录工作流版本失败（工作流已保存）: {workflow_id}: {e}", exc_info=True)
+        return None
+
+
+def _require_version_store():
+    from storage.versions import get_version_store
+    
+    versions = get_version_store()
+    if versions is None:
+        raise HTTPException(status_code=400, detail="未启用工作流版本历史")
+    return versions
+
+
 @router.post("/save/{workflow_id}")
 async def save_workflow(
     workflow_id: str,
-    workflow_data: Dict[str, Any]
+    workflow_data: Dict[str, Any],
+    message: Optional[str] = None
 ):
-    """保存自定义工作流定义"""
+    """保存自定义工作流定义（同时记录一个版本，message 为可选的版本说明）"""
     try:
         storage = get_storage_backend()
         result = await storage.save(workflow_id, workflow_data)
+        version = await _record_version(workflow_id, workflow_data, message)
+        if version is not None:
+            result["version"] = version
         logger.info(f"工作流已保存: {workflow_id}")
         return result
     except Exception as e:
@@ -136,30 +505,86 @@ async def save_workflow(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/versions/{workflow_id}")
+async def list_workflow_versions(
+    workflow_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1)
+):
+    """列出工作流的版本历史（新版本在前）"""
+    try:
+        versions = _require_version_store()
+        items = await asyncio.to_thread(versions.list_versions, workflow_id, offset, limit)
+        total = await asyncio.to_thread(versions.count_versions, workflow_id)
+        return {
+            "workflow_id": workflow_id,
+            "versions": items,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取工作流版本列表失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/versions/{workflow_id}/{version}")
+async def load_workflow_version(workflow_id: str, version: int):
+    """加载工作流的指定版本"""
+    try:
+        versions = _require_version_store()
+        content = await asyncio.to_thread(versions.load_version, workflow_id, version)
+        if content is None:
+            raise HTTPException(status_code=404, detail=f"版本不存在: {workflow_id} v{version}")
+        return {"workflow_id": workflow_id, "version": version, **content}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"加载工作流版本失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/versions/{workflow_id}/{version}/revert")
+async def revert_workflow_version(workflow_id: str, version: int):
+    """将工作流回滚到指定版本（作为新版本保存，激活状态保持不变）"""
+    try:
+        versions = _require_version_store()
+        content = await asyncio.to_thread(versions.load_version, workflow_id, version)
+        if content is None:
+            raise HTTPException(status_code=404, detail=f"版本不存在: {workflow_id} v{version}")
+        
+        storage = get_storage_backend()
+        current = await storage.load(workflow_id)
+        workflow_data = {**content, "is_active": bool(current and current.get("is_active"))}
+        await storage.save(workflow_id, workflow_data)
+        new_version = await _record_version(workflow_id, workflow_data, f"回滚到版本 {version}")
+        logger.info(f"工作流已回滚: {workflow_id} -> v{version}")
+        return {
+            "workflow_id": workflow_id,
+            "reverted_to": version,
+            "version": new_version,
+            "message": "工作流回滚成功"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"回滚工作流版本失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/load/{workflow_id}")
 async def load_workflow(workflow_id: str):
     """加载工作流定义（支持默认和自定义工作流）"""
     try:
         storage = get_storage_backend()
         
-        # 添加调试日志
-        logger.debug(f"尝试加载工作流: {workflow_id}")
-        
         # 先检查自定义工作流（从存储后端）
         workflow = await storage.load(workflow_id)
         if workflow:
-            logger.debug(f"从存储后端加载工作流成功: {workflow_id}")
             return workflow
         
-        # 检查存储中是否存在
-        exists = await storage.exists(workflow_id)
-        logger.debug(f"工作流存在性检查: {workflow_id} -> {exists}")
-        
-        # 列出所有工作流用于调试
-        all_workflows = await storage.list_all()
-        workflow_ids = [w["workflow_id"] for w in all_workflows]
-        logger.debug(f"存储中的所有工作流ID: {workflow_ids}")
-        
         # 检查默认工作流
         workflow_engine = get_engine()
         if workflow_id in workflow_engine.workflows:
@@ -175,7 +600,7 @@ async def load_workflow(workflow_id: str):
                 "is_default": True,
             }
         else:
-            logger.warning(f"工作流不存在: {workflow_id} (存储中: {workflow_ids}, 默认: {list(workflow_engine.workflows.keys())})")
+            logger.warning(f"工作流不存在: {workflow_id}")
             raise HTTPException(status_code=404, detail=f"工作流不存在: {workflow_id}")
     except HTTPException:
         raise
@@ -197,6 +622,10 @@ async def delete_workflow(workflow_id: str):
         if await storage.exists(workflow_id):
             success = await storage.delete(workflow_id)
             if success:
+                from storage.versions import get_version_store
+                versions = get_version_store()
+                if versions is not None:
+                    await asyncio.to_thread(versions.delete_workflow, workflow_id)
                 logger.info(f"自定义工作流已删除: {workflow_id}")
                 return {
                     "workflow_id": workflow_id,
@@ -211,7 +640,7 @@ async def delete_workflow(workflow_id: str):
             # 如果是默认工作流，使用隐藏功能（如果存储后端支持）
             if workflow_id in workflow_engine.workflows:
                 if hasattr(storage, 'hide_workflow'):
-                    storage.hide_workflow(workflow_id)
+                    await storage.hide_workflow(workflow_id)
                     logger.info(f"默认工作流已隐藏: {workflow_id}")
                     return {
                         "workflow_id": workflow_id,
@@ -221,10 +650,10 @@ async def delete_workflow(workflow_id: str):
             logger.error(f"获取工作流引擎失败: {engine_error}", exc_info=True)
             # 如果引擎初始化失败，但工作流可能是默认工作流，仍然尝试添加到隐藏列表
             # 默认工作流ID列表
-            default_workflow_ids = ["full_pipeline", "analyze_only", "batch_process"]
+            default_workflow_ids = ["full_pipeline", "analyze_only", "batch_process", "stream_pipeline"]
             if workflow_id in default_workflow_ids:
                 if hasattr(storage, 'hide_workflow'):
-                    storage.hide_workflow(workflow_id)
+                    await storage.hide_workflow(workflow_id)
                     logger.info(f"默认工作流已隐藏（引擎未初始化）: {workflow_id}")
                     return {
                         "workflow_id": workflow_id,
@@ -2,7 +2,7 @@
 应用配置
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 from pathlib import Path
 
 
@@ -39,6 +39,12 @@ class Settings(BaseSettings):
     # 数据库配置
     DATABASE_URL: str = f"sqlite:///{PROJECT_ROOT / 'data' / 'structforge.db'}"
     
+    # SQLite连接池配置（每个线程一个长连接，WAL模式）
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # WAL模式下NORMAL即可保证一致性
+    SQLITE_CACHE_SIZE_KB: int = 16384  # 每个连接的页缓存大小（KB）
+    SQLITE_MMAP_SIZE: int = 134217728  # 内存映射大小（字节），0表示禁用
+    SQLITE_CACHED_STATEMENTS: int = 256  # 每个连接缓存的预编译语句数
+    
     # AI模型配置
     AI_MODEL_PROVIDER: str = "ollama"  # ollama, openai, local
     AI_MODEL_NAME: str = "llama3"  # 或 qwen, mistral等
@@ -46,6 +52,35 @@ class Settings(BaseSettings):
     AI_TEMPERATURE: float = 0.7
     AI_MAX_TOKENS: int = 2048
     
+    # LLM/Agent 接口HTTP连接池配置（每个目标主机一个连接池）
+    LLM_HTTP_MAX_CONNECTIONS: int = 20  # 每个主机的最大连接数
+    LLM_HTTP_MAX_KEEPALIVE: int = 10  # 每个主机保持的空闲长连接数
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 60  # 空闲长连接的保持时间（秒）
+    LLM_HTTP_CONNECT_TIMEOUT: float = 10  # 建立连接的超时（秒）
+    LLM_HTTP2: bool = True  # 是否使用HTTP/2（需要安装 h2，未安装时使用HTTP/1.1）
+    LLM_HTTP_HOST_LIMITS: Dict[str, int] = {}  # 按主机覆盖最大连接数，如 {"api.openai.com": 50}
+    
+    # LLM调用准入控制（按提供商限制并发，超载时快速返回429）
+    LLM_MAX_CONCURRENCY: int = 8  # 每个提供商同时进行的调用数上限
+    LLM_PROVIDER_CONCURRENCY: Dict[str, int] = {"ollama": 2, "lmstudio": 2}  # 按提供商覆盖并发上限
+    LLM_MAX_QUEUE: int = 32  # 每个提供商排队的调用数上限，超过时立即拒绝
+    LLM_QUEUE_TIMEOUT: float = 60  # 最长排队时间（秒），超过时拒绝，0 表示不限制
+    
+    # LLM响应缓存配置（各提供商共用，进程内LRU + 磁盘SQLite）
+    LLM_CACHE_ENABLED: bool = True  # 是否缓存LLM响应（相同提示词不重复调用模型）
+    LLM_CACHE_PATH: str = ""  # 可选：磁盘缓存数据库路径，默认 data/cache/llm_cache.db
+    LLM_CACHE_TTL: float = 86400  # 缓存有效期（秒），0 表示不过期
+    LLM_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 磁盘缓存总大小上限（压缩后），超出时按最近访问时间淘汰
+    LLM_CACHE_MEMORY_MAX_BYTES: int = 32 * 1024 * 1024  # 进程内缓存的字节预算
+    
+    # 数据统计分析（分析结构前从全部数据计算枚举、布尔值、数值范围，代替原始数据放入提示词）
+    PROFILE_ENUM_MAX_VALUES: int = 50  # 不同取值不超过该数量的字段视为枚举
+    PROFILE_ENUM_MAX_RATIO: float = 0.5  # 且不同取值数不超过出现次数的该比例（排除名称、ID等字段）
+    
+    # 分块分析（map-reduce）：数据超过模型上下文时按Token预算分块，各块并发分析后合并结果
+    MAP_REDUCE_CHUNK_TOKENS: int = 4000  # 每块数据的Token上限（估算值）
+    MAP_REDUCE_MAX_CHUNKS: int = 64  # 最多分块数，超过时拒绝（限制调用次数和总耗时）
+    
     # 向量数据库配置
     VECTOR_DB_TYPE: str = "chromadb"  # faiss, chromadb (chromadb is more stable on Windows)
     VECTOR_DB_PATH: str = str(PROJECT_ROOT / "data" / "vector_db")
@@ -60,6 +95,40 @@ class Settings(BaseSettings):
     WORKFLOW_ENGINE: str = "prefect"  # prefect, custom
     WORKFLOW_STORAGE_TYPE: str = "json"  # memory, json, sqlite, postgresql, mysql
     WORKFLOW_STORAGE_PATH: str = ""  # 可选：指定存储路径（JSON文件或SQLite数据库路径）
+    WORKFLOW_JSON_WRITE_DELAY: float = 0.5  # JSON存储写缓冲的合并窗口（秒），0 表示每次修改立即写入
+    WORKFLOW_JSON_MAX_DIRTY: int = 64  # JSON存储写缓冲中最多积压的工作流数量，超过时立即写入
+    WORKFLOW_DB_POOL_SIZE: int = 5  # PostgreSQL/MySQL 连接池大小
+    WORKFLOW_DB_MAX_OVERFLOW: int = 10  # 连接池满时允许额外创建的连接数
+    WORKFLOW_STORAGE_CACHE: bool = False  # 是否为存储后端启用读缓存
+    WORKFLOW_STORAGE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 工作流缓存字节预算
+    WORKFLOW_STORAGE_CACHE_VERSION_FILE: str = ""  # 可选：多进程共享的版本文件，写入后通知其他进程清空缓存
+    WORKFLOW_STORAGE_CODEC: str = "zlib"  # 数据库中 nodes/edges 的编码: json / zlib / zstd（zstd 需要安装 zstandard）
+    WORKFLOW_STORAGE_CODEC_LEVEL: Optional[int] = None  # 压缩级别（None 使用编码默认值）
+    WORKFLOW_VERSIONS_ENABLED: bool = True  # 是否记录工作流版本历史（每次保存一个版本）
+    WORKFLOW_VERSIONS_PATH: str = ""  # 可选：版本历史数据库路径，默认 data/workflow_versions.db
+    WORKFLOW_VERSION_SNAPSHOT_INTERVAL: int = 20  # 每隔多少个版本保存一次完整快照（其余版本保存增量）
+    WORKFLOW_TIMEOUT: Optional[float] = None  # 单次工作流执行超时（秒），None 表示不限制
+    WORKFLOW_STEP_TIMEOUT: Optional[float] = None  # 单个步骤默认超时（秒），步骤可单独指定
+    WORKFLOW_MEMORY_LIMIT_MB: Optional[int] = None  # 工作进程内存预算（MB）
+    WORKFLOW_CPU_TIME_LIMIT: Optional[int] = None  # 工作进程CPU时间预算（秒）
+    WORKFLOW_MAP_CONCURRENCY: Optional[int] = None  # 扇出步骤默认并发数，None 表示CPU核数
+    WORKFLOW_PROCESS_POOL_SIZE: Optional[int] = None  # 共享进程池大小，None 表示CPU核数
+    WORKFLOW_CHECKPOINT_ENABLED: bool = True  # 是否持久化执行检查点（支持中断后恢复）
+    WORKFLOW_CHECKPOINT_PATH: str = ""  # 可选：检查点数据库路径，默认 data/workflow_checkpoints.db
+    WORKFLOW_CHECKPOINT_MAX_RESULT_BYTES: int = 16 * 1024 * 1024  # 单个步骤/逐项结果保存检查点的大小上限，超过时不保存（恢复时重新执行），0 表示不限制
+    WORKFLOW_CHECKPOINT_RETENTION_DAYS: float = 7  # 成功完成的执行记录保留天数（其步骤结果在完成时即删除），0 表示不清理
+    WORKFLOW_QUEUE_PATH: str = ""  # 可选：作业队列数据库路径，默认 data/workflow_jobs.db
+    WORKFLOW_JOB_MAX_ATTEMPTS: int = 3  # 作业最大尝试次数（含工作进程失联后的重新领取）
+    WORKFLOW_WORKER_LEASE_SECONDS: float = 30  # 作业租约时长（秒）
+    WORKFLOW_WORKER_PROCESSES: Optional[int] = None  # 工作进程数，None 表示CPU核数
+    WORKFLOW_METRICS_ENABLED: bool = True  # 是否持久化步骤指标（耗时、内存、数据量、缓存命中）
+    WORKFLOW_METRICS_PATH: str = ""  # 可选：指标数据库路径，默认 data/workflow_metrics.db
+    WORKFLOW_METRICS_PAYLOAD_SIZES: bool = False  # 是否精确统计步骤输入/输出数据量（在事件循环中完整序列化，大数据量时开销明显，仅调试时开启；关闭时按抽样估算）
+    WORKFLOW_METRICS_TRACEMALLOC: bool = False  # 是否使用 tracemalloc 统计峰值内存分配（有明显开销）
+    
+    # 记忆存储配置
+    MEMORY_SWEEP_INTERVAL: float = 60  # 过期记忆的后台清理间隔（秒），0 表示不启动后台清理
+    MEMORY_SWEEP_BATCH_SIZE: int = 500  # 每批删除的过期记忆数量（每批一个短事务）
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
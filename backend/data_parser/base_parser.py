@@ -2,7 +2,7 @@
 基础解析器抽象类
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator
 from pathlib import Path
 
 
@@ -60,5 +60,105 @@ class BaseParser(ABC):
             推断出的Schema
         """
         raise NotImplementedError("子类需要实现Schema检测")
+    
+    def iter_records(self, file_path: Path, metadata: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        逐条读取文件中的记录（流式解析）
+        
+        默认实现先整体解析，再逐条产出记录；支持增量读取的格式应重写此方法，
+        以保证大文件解析时内存占用恒定。
+        
+        Args:
+            file_path: 文件路径
+            metadata: 可选的元数据字典，解析器会写入导出时需要的信息（如表头、根标签）
+            
+        Returns:
+            记录迭代器
+        """
+        data = self.parse(file_path)
+        records = extract_records(data)
+        if metadata is not None and isinstance(data, dict) and records is not data:
+            metadata.update({k: v for k, v in data.items() if not isinstance(v, list)})
+        if isinstance(records, list):
+            yield from records
+        else:
+            yield records
+    
+    def open_writer(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None) -> "RecordWriter":
+        """
+        打开记录写入器（流式导出）
+        
+        默认实现在内存中收集记录，关闭时调用 export 一次性写出；
+        支持增量写入的格式应重写此方法。
+        
+        Args:
+            output_path: 输出路径
+            metadata: 流的元数据（来自 iter_records）
+            
+        Returns:
+            记录写入器
+        """
+        return BufferedRecordWriter(self, output_path, metadata)
+
+
+def extract_records(data: Any) -> Any:
+    """从整体解析结果中找出记录列表（列表本身、CSV的rows或最大的子节点列表）"""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if isinstance(data.get("rows"), list):
+            return data["rows"]
+        largest = None
+        for key, value in data.items():
+            if isinstance(value, list) and (largest is None or len(value) > len(largest)):
+                largest = value
+        if largest is not None:
+            return largest
+    return data
 
 
+class RecordWriter(ABC):
+    """记录写入器基类（支持 with 语句）"""
+    
+    def __init__(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None):
+        self.output_path = Path(output_path)
+        self.metadata = metadata or {}
+        self.count = 0
+    
+    @abstractmethod
+    def write(self, record: Any) -> None:
+        """写入一条记录"""
+        pass
+    
+    @abstractmethod
+    def close(self) -> bool:
+        """完成写入，返回是否成功"""
+        pass
+    
+    def __enter__(self) -> "RecordWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class BufferedRecordWriter(RecordWriter):
+    """缓冲写入器：收集全部记录后调用解析器的 export（用于不支持增量写入的格式）"""
+    
+    def __init__(self, parser: BaseParser, output_path: Path, metadata: Optional[Dict[str, Any]] = None):
+        super().__init__(output_path, metadata)
+        self.parser = parser
+        self.records: List[Any] = []
+        self._closed = False
+    
+    def write(self, record: Any) -> None:
+        self.records.append(record)
+        self.count += 1
+    
+    def close(self) -> bool:
+        if self._closed:
+            return True
+        self._closed = True
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        return self.parser.export(self.records, self.output_path)
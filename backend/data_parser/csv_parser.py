@@ -2,11 +2,11 @@
 CSV/TSV解析器
 """
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator
 import csv
 import io
 
-from data_parser.base_parser import BaseParser
+from data_parser.base_parser import BaseParser, RecordWriter
 from core.logging_config import logger
 
 
@@ -70,6 +70,27 @@ class CSVParser(BaseParser):
             logger.error(f"CSV解析失败: {e}")
             raise
     
+    def iter_records(self, file_path: Path, metadata: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """逐行读取CSV文件（流式解析，内存占用与文件大小无关）"""
+        with open(file_path, 'r', encoding=self.encoding, newline='') as f:
+            first_line = f.readline()
+            self.detected_delimiter = self._detect_delimiter(first_line)
+            f.seek(0)
+            
+            reader = csv.DictReader(f, delimiter=self.detected_delimiter)
+            if metadata is not None:
+                metadata.update({
+                    "format": "csv",
+                    "delimiter": self.detected_delimiter,
+                    "headers": list(reader.fieldnames or []),
+                })
+            for row in reader:
+                yield row
+    
+    def open_writer(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None) -> "CSVRecordWriter":
+        """打开CSV增量写入器"""
+        return CSVRecordWriter(output_path, metadata, encoding=self.encoding)
+    
     def _infer_field_types(self, rows: List[Dict]) -> Dict[str, str]:
         """推断字段类型"""
         if not rows:
@@ -149,6 +170,51 @@ class CSVParser(BaseParser):
         return schema
 
 
+class CSVRecordWriter(RecordWriter):
+    """CSV增量写入器（表头取自元数据或第一条记录）"""
+    
+    def __init__(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None, encoding: str = "utf-8"):
+        super().__init__(output_path, metadata)
+        self.encoding = encoding
+        self._file = None
+        self._writer = None
+        self._closed = False
+    
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._writer is None:
+            self.output_path.parent.mkdir(parents=True, exist_ok=True)
+            headers = self.metadata.get("headers") or list(record.keys())
+            self._file = open(self.output_path, 'w', encoding=self.encoding, newline='')
+            self._writer = csv.DictWriter(
+                self._file,
+                fieldnames=headers,
+                delimiter=self.metadata.get("delimiter", ","),
+                extrasaction="ignore"
+            )
+            self._writer.writeheader()
+        self._writer.writerow(record)
+        self.count += 1
+    
+    def close(self) -> bool:
+        if self._closed:
+            return True
+        self._closed = True
+        try:
+            if self._file is None:
+                # 没有任何记录时写出空文件（仅表头）
+                self.output_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.output_path, 'w', encoding=self.encoding, newline='') as f:
+                    headers = self.metadata.get("headers") or []
+                    if headers:
+                        csv.writer(f, delimiter=self.metadata.get("delimiter", ",")).writerow(headers)
+            else:
+                self._file.close()
+            return True
+        except Exception as e:
+            logger.error(f"CSV导出失败: {e}")
+            return False
+
+
 class TSVParser(CSVParser):
     """TSV解析器（继承CSV，固定分隔符为制表符）"""
     
@@ -2,10 +2,10 @@
 JSON解析器
 """
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import json
 
-from data_parser.base_parser import BaseParser
+from data_parser.base_parser import BaseParser, RecordWriter
 from core.logging_config import logger
 
 
@@ -40,6 +40,10 @@ class JSONParser(BaseParser):
             logger.error(f"JSON导出失败: {e}")
             return False
     
+    def open_writer(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None) -> "JSONRecordWriter":
+        """打开JSON数组增量写入器"""
+        return JSONRecordWriter(output_path, metadata)
+    
     def detect_schema(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """检测JSON结构Schema"""
         from jsonschema import Draft7Validator
@@ -67,3 +71,28 @@ class JSONParser(BaseParser):
         
         return infer_schema(data)
 
+
+class JSONRecordWriter(RecordWriter):
+    """JSON增量写入器：把记录逐条写成一个JSON数组"""
+    
+    def __init__(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None):
+        super().__init__(output_path, metadata)
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.output_path, 'w', encoding='utf-8')
+        self._file.write("[")
+    
+    def write(self, record: Any) -> None:
+        self._file.write(",\n  " if self.count else "\n  ")
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self.count += 1
+    
+    def close(self) -> bool:
+        if self._file.closed:
+            return True
+        try:
+            self._file.write("\n]\n" if self.count else "]\n")
+            self._file.close()
+            return True
+        except Exception as e:
+            logger.error(f"JSON导出失败: {e}")
+            return False
@@ -2,11 +2,11 @@
 XML解析器
 """
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator
 from lxml import etree
 import xml.etree.ElementTree as ET
 
-from data_parser.base_parser import BaseParser
+from data_parser.base_parser import BaseParser, RecordWriter
 from core.logging_config import logger
 
 
@@ -26,13 +26,46 @@ class XMLParser(BaseParser):
             logger.error(f"XML解析失败: {e}")
             raise
     
+    def iter_records(self, file_path: Path, metadata: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        逐条读取根节点下的子节点（流式解析）
+        
+        使用 iterparse 增量解析，每个子节点转换后立即释放，
+        内存占用只与单个子节点大小有关。
+        """
+        depth = 0
+        for event, element in etree.iterparse(str(file_path), events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1 and metadata is not None:
+                    metadata.update({
+                        "format": "xml",
+                        "root_tag": element.tag,
+                        "root_attributes": dict(element.attrib),
+                    })
+                continue
+            
+            depth -= 1
+            if depth == 1:
+                if metadata is not None:
+                    metadata.setdefault("item_tag", element.tag)
+                yield self._element_to_dict(element)
+                # 释放已处理的节点
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    
+    def open_writer(self, output_path: Path, metadata: Optional[Dict[str, Any]] = None) -> "XMLRecordWriter":
+        """打开XML增量写入器"""
+        return XMLRecordWriter(self, output_path, metadata)
+    
     def _element_to_dict(self, element: etree.Element) -> Dict[str, Any]:
         """将XML元素转换为字典"""
         result = {}
         
         # 添加属性
         if element.attrib:
-            result["@attributes"] = element.attrib
+            result["@attributes"] = dict(element.attrib)
         
         # 处理子元素
         children = {}
@@ -217,3 +250,47 @@ class XMLParser(BaseParser):
         
         return infer_schema(data)
 
+
+class XMLRecordWriter(RecordWriter):
+    """
+    XML增量写入器
+    
+    根标签和子节点标签取自元数据（root_tag / item_tag），
+    每条记录转换为一个子节点后立即写出。
+    """
+    
+    def __init__(self, parser: XMLParser, output_path: Path, metadata: Optional[Dict[str, Any]] = None):
+        super().__init__(output_path, metadata)
+        self.parser = parser
+        self.item_tag = self.metadata.get("item_tag", "item")
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._xmlfile = etree.xmlfile(str(self.output_path), encoding=parser.encoding)
+        self._writer = self._xmlfile.__enter__()
+        self._writer.write_declaration()
+        self._root = self._writer.element(
+            self.metadata.get("root_tag", "root"),
+            self.metadata.get("root_attributes") or {}
+        )
+        self._root.__enter__()
+        self._closed = False
+    
+    def write(self, record: Any) -> None:
+        element = self.parser._dict_to_element(record, self.item_tag)
+        etree.indent(element, space="\t", level=1)
+        self._writer.write("\n\t")
+        self._writer.write(element)
+        self.count += 1
+    
+    def close(self) -> bool:
+        if self._closed:
+            return True
+        self._closed = True
+        try:
+            self._writer.write("\n")
+            self._root.__exit__(None, None, None)
+            self._xmlfile.__exit__(None, None, None)
+            return True
+        except Exception as e:
+            logger.error(f"XML导出失败: {e}")
+            return False
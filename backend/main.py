@@ -38,6 +38,26 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.on_event("startup")
+async def startup():
+    """启动过期记忆的后台清理"""
+    from storage.memory_storage import get_memory_storage
+
+    get_memory_storage().start_sweeper()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """应用退出时释放存储连接、HTTP连接池和工作进程池，停止后台清理"""
+    from ai_integration.http_client import close_http_clients
+    from storage import close_storage
+    from storage.memory_storage import get_memory_storage
+    from workflow.process_runner import shutdown_process_pool
+
+    get_memory_storage().stop_sweeper()
+    await close_storage()
+    await close_http_clients()
+    shutdown_process_pool()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.HOST, port=settings.PORT)
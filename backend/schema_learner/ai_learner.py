@@ -23,7 +23,7 @@ class AISchemaLearner(BaseSchemaLearner):
 
 请始终以JSON格式返回结果。"""
     
-    def learn_schema(self, data: Dict[str, Any], metadata: Optional[Dict] = None) -> Dict[str, Any]:
+    async def learn_schema(self, data: Dict[str, Any], metadata: Optional[Dict] = None) -> Dict[str, Any]:
         """使用AI学习Schema"""
         try:
             prompt = f"""分析以下游戏配置数据结构，生成详细的Schema描述：
@@ -41,7 +41,7 @@ class AISchemaLearner(BaseSchemaLearner):
 4. 可能的枚举值或取值范围
 """
             
-            response = self.llm_client.chat(
+            response = await self.llm_client.achat(
                 messages=[
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": prompt}
@@ -67,7 +67,7 @@ class AISchemaLearner(BaseSchemaLearner):
             logger.error(f"AI Schema学习失败: {e}")
             return {}
     
-    def understand_relationships(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def understand_relationships(self, schema: Dict[str, Any]) -> Dict[str, Any]:
         """理解字段间的关系"""
         try:
             prompt = f"""分析以下Schema，识别字段间的逻辑关系：
@@ -82,7 +82,7 @@ Schema:
 4. 约束关系（如 weight 与 material 的关联）
 """
             
-            response = self.llm_client.chat(
+            response = await self.llm_client.achat(
                 messages=[
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": prompt}
@@ -101,7 +101,7 @@ Schema:
             logger.error(f"关系理解失败: {e}")
             return {}
     
-    def infer_intent(self, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def infer_intent(self, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
         """从自然语言推断操作意图"""
         try:
             prompt = f"""将以下自然语言指令转换为结构化操作：
@@ -126,7 +126,7 @@ Schema:
 }}
 """
             
-            response = self.llm_client.chat(
+            response = await self.llm_client.achat(
                 messages=[
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": prompt}
@@ -6,10 +6,10 @@ from typing import Dict, Any, List, Optional
 
 
 class BaseSchemaLearner(ABC):
-    """Schema学习器抽象基类"""
+    """Schema学习器抽象基类（接口为异步：AI学习器等待模型响应期间不阻塞事件循环）"""
     
     @abstractmethod
-    def learn_schema(self, data: Dict[str, Any], metadata: Optional[Dict] = None) -> Dict[str, Any]:
+    async def learn_schema(self, data: Dict[str, Any], metadata: Optional[Dict] = None) -> Dict[str, Any]:
         """
         学习数据结构Schema
         
@@ -23,7 +23,7 @@ class BaseSchemaLearner(ABC):
         pass
     
     @abstractmethod
-    def understand_relationships(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def understand_relationships(self, schema: Dict[str, Any]) -> Dict[str, Any]:
         """
         理解字段间的关系
         
@@ -36,7 +36,7 @@ class BaseSchemaLearner(ABC):
         pass
     
     @abstractmethod
-    def infer_intent(self, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def infer_intent(self, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
         """
         从自然语言推断操作意图
         
@@ -0,0 +1,343 @@
+"""
+数据统计分析器 - 在调用AI之前从全部数据中精确计算字段统计
+
+- 把解析后的 XML/CSV 数据展开为记录集合（重复出现的同名节点、表格的行），嵌套字段以 "." 连接，
+  XML 属性直接使用属性名（如 Flags.Civilian）
+- 按列用 pandas 计算：不同取值及出现次数、枚举/布尔/数值/字符串类型、数值范围和百分位数、
+  必填/可选、取值对应关系（如 modifier_group → material_type）、只在某些枚举值下出现的字段
+- summarize 输出紧凑的文本摘要，代替原始数据放入提示词
+
+结果是确定的：同样的数据总是得到同样的统计和摘要。
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from core.config import settings
+
+
+BOOLEAN_VALUE_SETS = [{"true", "false"}, {"yes", "no"}]
+
+# 数值字段的不同取值不超过该数量时同时列出取值（如难度等级）
+NUMERIC_VALUES_LIMIT = 10
+# 字符串字段在摘要中的示例数量和最大长度
+STRING_EXAMPLES = 3
+EXAMPLE_MAX_LENGTH = 40
+# 每个记录集合保留的原始记录示例数量
+SAMPLE_RECORDS = 2
+# 每个记录集合最多报告的取值对应关系数量
+MAX_MAPPINGS = 50
+
+PERCENTILES = {"p5": 0.05, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p95": 0.95}
+
+
+def _number(value: float) -> Any:
+    """统计结果中的数值：整数值输出为 int，其余保留4位小数"""
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+def _as_text(values: pd.Series) -> pd.Series:
+    """取值转为去掉首尾空白的文本（含缺失值的整数列被 pandas 转成了浮点数，先转回整数，不输出 "2.0"）"""
+    if pd.api.types.is_float_dtype(values):
+        present = values.dropna()
+        if not present.empty and bool((present % 1 == 0).all()):
+            values = values.map(lambda value: value if pd.isna(value) else int(value))
+    return values.astype(str).str.strip()
+
+
+def _join(prefix: str, key: str) -> str:
+    return f"{prefix}.{key}" if prefix else key
+
+
+def _is_scalar_list(value: list) -> bool:
+    return all(not isinstance(item, (dict, list)) for item in value)
+
+
+class DataProfiler:
+    """数据统计分析器（确定性计算，不调用AI）"""
+
+    def __init__(self, enum_max_values: Optional[int] = None, enum_max_ratio: Optional[float] = None):
+        """
+        Args:
+            enum_max_values: 不同取值不超过该数量的字段视为枚举
+            enum_max_ratio: 且不同取值数不超过出现次数的该比例（排除名称、ID 等几乎各不相同的字段）
+        """
+        self.enum_max_values = enum_max_values or settings.PROFILE_ENUM_MAX_VALUES
+        self.enum_max_ratio = enum_max_ratio or settings.PROFILE_ENUM_MAX_RATIO
+
+    # ========== 记录集合 ==========
+
+    def _collect(self, value: Any, path: str, collections: Dict[str, Dict[str, Any]], depth: int = 0):
+        """找出数据中的记录集合（对象列表），记录中嵌套的对象列表作为单独的集合（depth 加 1）"""
+        if isinstance(value, list):
+            if _is_scalar_list(value):
+                return
+            collection = collections.setdefault(path, {"depth": depth, "records": [], "samples": []})
+            for item in value:
+                record = item if isinstance(item, dict) else {"#text": item}
+                if len(collection["samples"]) < SAMPLE_RECORDS:
+                    collection["samples"].append(record)
+                collection["records"].append(self._flatten(record, "", path, collections, depth))
+        elif isinstance(value, dict):
+            for key, child in value.items():
+                if isinstance(child, (dict, list)):
+                    self._collect(child, _join(path, key), collections, depth)
+
+    def _flatten(
+        self,
+        record: Dict[str, Any],
+        prefix: str,
+        path: str,
+        collections: Dict[str, Dict[str, Any]],
+        depth: int = 0
+    ) -> Dict[str, Any]:
+        """把一条记录展开为 {字段路径: 值}；记录中的对象列表登记为嵌套集合"""
+        flat: Dict[str, Any] = {}
+        for key, child in record.items():
+            if key == "@attributes" and isinstance(child, dict):
+                for name, attribute in child.items():
+                    flat[prefix + name] = attribute
+            elif key == "#text":
+                flat[prefix[:-1] if prefix else key] = child
+            elif isinstance(child, dict):
+                flat.update(self._flatten(child, f"{prefix}{key}.", path, collections, depth))
+            elif isinstance(child, list):
+                if _is_scalar_list(child):
+                    flat[prefix + key] = child
+                else:
+                    self._collect(child, _join(path, prefix + key), collections, depth + 1)
+            else:
+                flat[prefix + key] = child
+        return flat
+
+    # ========== 字段统计 ==========
+
+    def _field_stats(self, column: pd.Series, record_count: int) -> Dict[str, Any]:
+        present = column.notna()
+        values = column[present]
+        multi_valued = bool(values.map(lambda value: isinstance(value, list)).any())
+        if multi_valued:
+            values = values.explode().dropna()
+        text = _as_text(values)
+        non_empty = text[text != ""]
+        counts = non_empty.value_counts()
+        count = int(present.sum())
+
+        stats: Dict[str, Any] = {
+            "count": count,
+            "required": count == record_count,
+            "distinct": int(len(counts)),
+        }
+        if multi_valued:
+            stats["multi_valued"] = True
+        empty = int(len(text) - len(non_empty))
+        if empty:
+            stats["empty"] = empty
+        if non_empty.empty:
+            stats["type"] = "empty"
+            return stats
+
+        value_counts = {str(value): int(n) for value, n in counts.items()}
+        lowered = {value.lower() for value in value_counts}
+        numbers = pd.to_numeric(non_empty, errors="coerce")
+
+        if any(lowered <= value_set for value_set in BOOLEAN_VALUE_SETS):
+            stats["type"] = "boolean"
+            stats["values"] = value_counts
+        elif numbers.notna().all():
+            stats["type"] = "number"
+            stats["integer"] = bool((numbers % 1 == 0).all())
+            stats["min"] = _number(numbers.min())
+            stats["max"] = _number(numbers.max())
+            stats["mean"] = _number(numbers.mean())
+            quantiles = numbers.quantile(list(PERCENTILES.values()))
+            stats["percentiles"] = {
+                name: _number(quantiles.iloc[i]) for i, name in enumerate(PERCENTILES)
+            }
+            if len(counts) <= NUMERIC_VALUES_LIMIT:
+                stats["values"] = value_counts
+        elif len(counts) <= self.enum_max_values and len(counts) <= max(2, self.enum_max_ratio * len(non_empty)):
+            stats["type"] = "enum"
+            stats["values"] = value_counts
+        else:
+            stats["type"] = "string"
+            stats["unique"] = len(counts) == len(non_empty)
+            lengths = non_empty.str.len()
+            stats["min_length"] = int(lengths.min())
+            stats["max_length"] = int(lengths.max())
+            stats["examples"] = [value[:EXAMPLE_MAX_LENGTH] for value in list(value_counts)[:STRING_EXAMPLES]]
+        return stats
+
+    # ========== 字段关系 ==========
+
+    def _relationships(self, frame: pd.DataFrame, fields: Dict[str, Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        字段间的关系（只考虑枚举和布尔字段作为条件）
+
+        - mappings: A 的每个取值只对应 B 的一个取值（A → B）
+        - conditional: 可选字段只在条件字段取某些值时出现
+        """
+        categorical = [
+            name for name, stats in fields.items()
+            if stats["type"] in ("enum", "boolean") and stats["distinct"] >= 2 and not stats.get("multi_valued")
+        ]
+        if not categorical:
+            return {"mappings": [], "conditional": []}
+
+        text = frame[categorical].apply(lambda column: column.where(column.isna(), _as_text(column)))
+        text = text.mask(text == "")
+
+        mappings: List[Dict[str, Any]] = []
+        seen = set()
+        for source in categorical:
+            # 每个 source 取值下其他字段的不同取值数，全部为 1 即为函数依赖
+            distinct = text.groupby(text[source]).nunique()
+            for target in categorical:
+                if target == source or len(mappings) >= MAX_MAPPINGS:
+                    continue
+                if distinct[target].max() != 1 or (target, source) in seen:
+                    continue
+                pairs = text[[source, target]].dropna().drop_duplicates()
+                if len(pairs) < 2:
+                    continue
+                seen.add((source, target))
+                mappings.append({
+                    "from": source,
+                    "to": target,
+                    "mapping": dict(zip(pairs[source], pairs[target])),
+                })
+
+        optional = [name for name, stats in fields.items() if not stats["required"]]
+        conditional: List[Dict[str, Any]] = []
+        if optional:
+            presence = frame[optional].notna()
+            determined = set()
+            # 取值较少的条件字段优先，条件更容易理解
+            for source in sorted(categorical, key=lambda name: fields[name]["distinct"]):
+                # 条件字段缺失的记录单独成组（dropna=False），字段在这些记录中出现时不是条件字段
+                rate = presence.groupby(text[source], dropna=False).mean()
+                groups: Dict[tuple, List[str]] = {}
+                for field in optional:
+                    if field == source or field in determined:
+                        continue
+                    field_rate = rate[field]
+                    present_values = tuple(value for value in field_rate[field_rate == 1].index if not pd.isna(value))
+                    # 字段必须在这些取值之外的所有记录（包括条件字段缺失的记录）中都不出现
+                    outside = field_rate[~field_rate.index.isin(present_values)]
+                    if present_values and len(outside) and bool((outside == 0).all()):
+                        groups.setdefault(present_values, []).append(field)
+                for values, group in groups.items():
+                    determined.update(group)
+                    conditional.append({"fields": group, "when": {"field": source, "values": list(values)}})
+
+        return {"mappings": mappings, "conditional": conditional}
+
+    # ========== 入口 ==========
+
+    def profile(self, data: Any) -> Dict[str, Any]:
+        """
+        统计解析后的数据
+
+        Args:
+            data: 解析后的数据（XML 转换的字典、表格的行列表等）
+
+        Returns:
+            {"collections": [...]}，外层集合在前，同一层按记录数从多到少排列；每个集合包含 path、depth、
+            record_count、fields（字段统计）、mappings、conditional 和 samples（前几条原始记录）
+        """
+        collections: Dict[str, Dict[str, Any]] = {}
+        self._collect(data, "", collections)
+        if not collections and isinstance(data, dict):
+            # 没有重复的记录（如只有一个子节点）：整个数据作为一条记录
+            collections[""] = {"depth": 0, "records": [self._flatten(data, "", "", collections)], "samples": [data]}
+
+        result = []
+        for path, collection in collections.items():
+            records = collection["records"]
+            # 展开后为空的记录（如只包含嵌套对象列表）也计入记录数和字段出现率
+            if not any(records):
+                continue
+            frame = pd.DataFrame.from_records(records)
+            fields = {
+                str(name): self._field_stats(frame[name], len(records))
+                for name in frame.columns
+            }
+            # 只起容器作用的空节点（如没有属性的 <Flags/>，有属性时展开为 Flags.xxx）不单独列出
+            fields = {
+                name: stats for name, stats in fields.items()
+                if stats["type"] != "empty" or not any(other.startswith(name + ".") for other in fields)
+            }
+            result.append({
+                "path": path,
+                "depth": collection["depth"],
+                "record_count": len(records),
+                "fields": fields,
+                **self._relationships(frame, fields),
+                "samples": collection["samples"],
+            })
+
+        result.sort(key=lambda collection: (collection["depth"], -collection["record_count"]))
+        return {"collections": result}
+
+    def summarize(self, profile: Dict[str, Any], max_sample_chars: int = 1500) -> str:
+        """
+        生成放入提示词的紧凑文本摘要
+
+        Args:
+            profile: profile 的返回值
+            max_sample_chars: 每个集合的记录示例的最大字符数（0 表示不附带示例）
+        """
+        lines: List[str] = []
+        for collection in profile["collections"]:
+            record_count = collection["record_count"]
+            lines.append(f"[{collection['path'] or '根节点'}] {record_count} 条记录")
+            lines.append("字段（名称: 类型 | 出现次数 | 取值）：")
+            for name, stats in collection["fields"].items():
+                lines.append(f"- {name}: {self._describe_field(stats, record_count)}")
+
+            if collection["mappings"]:
+                lines.append("取值对应关系：")
+                for relation in collection["mappings"]:
+                    pairs = ", ".join(f"{key}→{value}" for key, value in relation["mapping"].items())
+                    lines.append(f"- {relation['from']} → {relation['to']}: {pairs}")
+            if collection["conditional"]:
+                lines.append("条件字段（只在条件成立时出现）：")
+                for condition in collection["conditional"]:
+                    when = condition["when"]
+                    lines.append(f"- {', '.join(condition['fields'])}: 当 {when['field']} ∈ {{{', '.join(when['values'])}}}")
+
+            if max_sample_chars and collection["samples"]:
+                sample = json.dumps(collection["samples"], ensure_ascii=False)
+                if len(sample) > max_sample_chars:
+                    sample = sample[:max_sample_chars] + "...（已截断）"
+                lines.append(f"记录示例：{sample}")
+            lines.append("")
+        return "\n".join(lines).rstrip()
+
+    @staticmethod
+    def _describe_field(stats: Dict[str, Any], record_count: int) -> str:
+        field_type = stats["type"]
+        if field_type == "number" and stats["integer"]:
+            field_type = "integer"
+        if stats.get("unique"):
+            field_type += " 唯一"
+        if stats.get("multi_valued"):
+            field_type += " 多值"
+        parts = [field_type, f"{stats['count']}/{record_count}"]
+
+        values = stats.get("values") or {}
+        if stats["type"] == "number":
+            percentiles = stats["percentiles"]
+            detail = f"{stats['min']}~{stats['max']}, p50={percentiles['p50']}, p95={percentiles['p95']}"
+            if values:
+                detail += ", 取值: " + ", ".join(f"{value}({n})" for value, n in values.items())
+            parts.append(detail)
+        elif values:
+            parts.append(", ".join(f"{value}({n})" for value, n in values.items()))
+        elif stats["type"] == "string":
+            parts.append(f"长度 {stats['min_length']}~{stats['max_length']}, 例: {', '.join(stats['examples'])}")
+        if stats.get("empty"):
+            parts.append(f"空值 {stats['empty']}")
+        return " | ".join(parts)
@@ -11,7 +11,7 @@ from core.logging_config import logger
 class RuleBasedSchemaLearner(BaseSchemaLearner):
     """基于规则的Schema学习器（不使用AI，用于MVP）"""
     
-    def learn_schema(self, data: Dict[str, Any], metadata: Optional[Dict] = None) -> Dict[str, Any]:
+    async def learn_schema(self, data: Dict[str, Any], metadata: Optional[Dict] = None) -> Dict[str, Any]:
         """基于规则学习Schema"""
         schema = {
             "fields": {},
@@ -46,7 +46,7 @@ class RuleBasedSchemaLearner(BaseSchemaLearner):
         analyze_field("", data, schema)
         return schema
     
-    def understand_relationships(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def understand_relationships(self, schema: Dict[str, Any]) -> Dict[str, Any]:
         """理解关系（简单规则）"""
         relationships = {
             "references": [],
@@ -66,7 +66,7 @@ class RuleBasedSchemaLearner(BaseSchemaLearner):
         
         return relationships
     
-    def infer_intent(self, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    async def infer_intent(self, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
         """从自然语言推断意图（基于关键词匹配）"""
         intent = {
             "action": "update",
@@ -2,11 +2,12 @@
 工作流存储模块 - 支持多种存储后端
 """
 from storage.base import WorkflowStorage
-from storage.factory import get_storage, StorageType, reset_storage
+from storage.factory import get_storage, StorageType, reset_storage, close_storage
 
 __all__ = [
     "WorkflowStorage",
     "get_storage",
     "StorageType",
     "reset_storage",
+    "close_storage",
 ]
@@ -2,10 +2,89 @@
 工作流存储抽象基类
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
 from datetime import datetime
 
 
+# 列表摘要中可返回、可排序的字段（不含 nodes/edges 等大字段）
+LIST_FIELDS = ("workflow_id", "name", "description", "is_active", "created_at", "updated_at", "type")
+
+# 支持的过滤条件：is_active（布尔）、type（精确匹配）、name（名称包含，不区分大小写）
+LIST_FILTERS = ("is_active", "type", "name")
+
+# 默认排序（按创建时间升序，与之前的返回顺序一致）
+DEFAULT_LIST_SORT = "created_at"
+
+
+def parse_list_options(
+    sort: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    fields: Optional[List[str]] = None
+) -> Tuple[str, bool, Dict[str, Any], List[str]]:
+    """
+    校验并规范化列表参数
+
+    Args:
+        sort: 排序字段，前缀 "-" 表示降序（如 "-updated_at"）
+        filters: 过滤条件（值为 None 的条件忽略）
+        fields: 返回的字段（workflow_id 始终返回）
+
+    Returns:
+        (排序字段, 是否降序, 过滤条件, 返回字段)
+
+    Raises:
+        ValueError: 字段或过滤条件不支持
+    """
+    sort = sort or DEFAULT_LIST_SORT
+    descending = sort.startswith("-")
+    sort_field = sort.lstrip("-")
+    if sort_field not in LIST_FIELDS:
+        raise ValueError(f"不支持的排序字段: {sort_field}（可选: {', '.join(LIST_FIELDS)}）")
+
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - set(LIST_FILTERS)
+    if unknown:
+        raise ValueError(f"不支持的过滤条件: {', '.join(sorted(unknown))}（可选: {', '.join(LIST_FILTERS)}）")
+
+    if fields:
+        unknown = set(fields) - set(LIST_FIELDS)
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(sorted(unknown))}（可选: {', '.join(LIST_FIELDS)}）")
+        fields = ["workflow_id"] + [field for field in fields if field != "workflow_id"]
+    else:
+        fields = list(LIST_FIELDS)
+
+    return sort_field, descending, filters, fields
+
+
+def match_list_filters(summary: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """摘要是否满足过滤条件（filters 需已经过 parse_list_options 规范化）"""
+    if "is_active" in filters and bool(summary.get("is_active")) != bool(filters["is_active"]):
+        return False
+    if "type" in filters and summary.get("type") != filters["type"]:
+        return False
+    if "name" in filters and str(filters["name"]).lower() not in (summary.get("name") or "").lower():
+        return False
+    return True
+
+
+def apply_list_options(
+    summaries: List[Dict[str, Any]],
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """在内存中对摘要列表做过滤、排序、分页和字段投影（供文件/内存存储使用）"""
+    sort_field, descending, filters, fields = parse_list_options(sort, filters, fields)
+    matched = [summary for summary in summaries if match_list_filters(summary, filters)]
+    matched.sort(key=lambda summary: summary.get("workflow_id") or "")
+    matched.sort(key=lambda summary: (summary.get(sort_field) is None, summary.get(sort_field)), reverse=descending)
+    end = None if limit is None else offset + limit
+    return [{field: summary.get(field) for field in fields} for summary in matched[offset:end]]
+
+
 class WorkflowStorage(ABC):
     """工作流存储抽象基类"""
     
@@ -50,15 +129,41 @@ class WorkflowStorage(ABC):
         pass
     
     @abstractmethod
-    async def list_all(self) -> List[Dict[str, Any]]:
+    async def list_all(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
         """
-        列出所有工作流
+        列出工作流摘要（不含隐藏的工作流）
         
+        Args:
+            offset: 跳过的条数
+            limit: 最多返回的条数（None 表示不限制）
+            sort: 排序字段，前缀 "-" 表示降序，默认按创建时间升序
+            filters: 过滤条件，见 LIST_FILTERS
+            fields: 返回的字段，见 LIST_FIELDS（默认全部）
+            
         Returns:
-            工作流列表
+            工作流摘要列表
         """
         pass
     
+    async def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """
+        统计满足过滤条件的工作流数量（不含隐藏的工作流）
+        
+        Args:
+            filters: 过滤条件，见 LIST_FILTERS
+            
+        Returns:
+            工作流数量
+        """
+        return len(await self.list_all(filters=filters, fields=["workflow_id"]))
+    
     @abstractmethod
     async def exists(self, workflow_id: str) -> bool:
         """
@@ -85,4 +190,54 @@ class WorkflowStorage(ABC):
             是否更新成功
         """
         pass
-
+    
+    async def save_many(self, workflows: Dict[str, Dict[str, Any]]) -> int:
+        """
+        批量保存工作流（默认逐个保存，数据库后端在单个事务中批量写入）
+        
+        Args:
+            workflows: 工作流ID -> 工作流数据
+            
+        Returns:
+            保存的数量
+        """
+        for workflow_id, workflow_data in workflows.items():
+            await self.save(workflow_id, workflow_data)
+        return len(workflows)
+    
+    async def load_many(self, workflow_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量加载工作流（默认逐个加载，数据库后端使用单次查询）
+        
+        Args:
+            workflow_ids: 工作流ID列表
+            
+        Returns:
+            工作流ID -> 工作流数据（与 load 的返回格式相同，不存在的工作流不包含在内）
+        """
+        result = {}
+        for workflow_id in workflow_ids:
+            workflow = await self.load(workflow_id)
+            if workflow is not None:
+                result[workflow_id] = workflow
+        return result
+    
+    async def exists_many(self, workflow_ids: Iterable[str]) -> Set[str]:
+        """
+        批量检查工作流是否存在
+        
+        Args:
+            workflow_ids: 工作流ID列表
+            
+        Returns:
+            已存在的工作流ID集合
+        """
+        return {workflow_id for workflow_id in workflow_ids if await self.exists(workflow_id)}
+    
+    async def flush(self):
+        """将缓冲中尚未写入的修改持久化（默认直接写入，无需处理）"""
+        pass
+    
+    async def close(self):
+        """释放存储占用的连接等资源（默认无需处理）"""
+        pass
@@ -0,0 +1,300 @@
+"""
+带缓存的存储包装器 - 为任意存储后端增加读缓存
+
+- 工作流数据按 workflow_id 做 LRU 缓存，总大小受字节预算限制
+- 列表和计数结果按查询参数缓存
+- 通过包装器写入（save/delete/update_active 等）时同步失效
+- 可选：通过版本文件在多进程之间同步失效（任一进程写入后更新版本文件，其他进程检测到修改时间变化后清空缓存）
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from storage.base import WorkflowStorage
+from core.logging_config import logger
+
+
+# 列表缓存的最大条目数（不同的分页/排序/过滤组合）
+MAX_LIST_ENTRIES = 64
+
+
+def _record_cache_event(hit: bool):
+    """计入工作流步骤的缓存统计（在步骤中读取工作流时）"""
+    from workflow.metrics import record_cache_event
+    record_cache_event("workflow_storage", hit)
+
+
+class CachedStorage(WorkflowStorage):
+    """存储缓存包装器"""
+
+    def __init__(
+        self,
+        backend: WorkflowStorage,
+        max_bytes: int = 64 * 1024 * 1024,
+        version_file: Optional[Path] = None
+    ):
+        """
+        初始化缓存包装器
+
+        Args:
+            backend: 被包装的存储后端
+            max_bytes: 工作流缓存的字节预算（按JSON序列化后的大小计算）
+            version_file: 多进程共享的版本文件（None 表示只在本进程内失效）
+        """
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.version_file = Path(version_file) if version_file else None
+
+        # workflow_id -> JSON序列化后的工作流数据（返回时反序列化，调用方修改结果不会影响缓存）
+        self._workflows: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lists: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._counts: Dict[Tuple, int] = {}
+        self._hidden: Dict[str, bool] = {}
+        self._version_stat: Optional[tuple] = None
+        # 失效代数：每次失效/清空时加一，后端读取期间发生过失效则不缓存读到的（可能已过期的）结果
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.version_file is not None:
+            self.version_file.parent.mkdir(parents=True, exist_ok=True)
+            self._version_stat = self._stat_version()
+
+        logger.info(
+            f"已启用存储缓存: {type(backend).__name__}，预算 {max_bytes // 1024} KB"
+            + (f"，版本文件 {self.version_file}" if self.version_file else "")
+        )
+
+    # ---- 失效 ----
+
+    def _stat_version(self) -> Optional[tuple]:
+        try:
+            stat = self.version_file.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _check_version(self):
+        """其他进程写入过（版本文件变化）时清空缓存"""
+        if self.version_file is None:
+            return
+        stat = self._stat_version()
+        if stat != self._version_stat:
+            self._version_stat = stat
+            self.clear()
+            logger.debug("存储版本已变化，缓存已清空")
+
+    def _bump_version(self):
+        """写入后更新版本文件，通知其他进程（同步文件操作，在线程中执行）"""
+        fd, temp_path = tempfile.mkstemp(dir=str(self.version_file.parent), prefix=f".{self.version_file.name}.")
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{time.time_ns()} {os.getpid()}")
+        os.replace(temp_path, self.version_file)
+        self._version_stat = self._stat_version()
+
+    async def _invalidate(self, workflow_ids: Iterable[str] = ()):
+        """写入后失效：指定的工作流、全部列表和计数"""
+        self._generation += 1
+        for workflow_id in workflow_ids:
+            data = self._workflows.pop(workflow_id, None)
+            if data is not None:
+                self._bytes -= len(data)
+        self._lists.clear()
+        self._counts.clear()
+        if self.version_file is not None:
+            await asyncio.to_thread(self._bump_version)
+
+    def clear(self):
+        """清空缓存"""
+        self._generation += 1
+        self._workflows.clear()
+        self._bytes = 0
+        self._lists.clear()
+        self._counts.clear()
+        self._hidden.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        return {
+            "workflows": len(self._workflows),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "lists": len(self._lists),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    # ---- 工作流缓存 ----
+
+    def _get(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        data = self._workflows.get(workflow_id)
+        if data is None:
+            self.misses += 1
+            _record_cache_event(False)
+            return None
+        self._workflows.move_to_end(workflow_id)
+        self.hits += 1
+        _record_cache_event(True)
+        return json.loads(data)
+
+    def _put(self, workflow_id: str, workflow: Dict[str, Any]):
+        data = json.dumps(workflow, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        previous = self._workflows.pop(workflow_id, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._workflows[workflow_id] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._workflows.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    # ---- 读操作 ----
+
+    async def load(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """加载工作流（优先读缓存）"""
+        self._check_version()
+        workflow = self._get(workflow_id)
+        if workflow is not None:
+            return workflow
+        generation = self._generation
+        workflow = await self.backend.load(workflow_id)
+        if workflow is not None and generation == self._generation:
+            self._put(workflow_id, workflow)
+        return workflow
+
+    async def load_many(self, workflow_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量加载工作流（未命中的部分一次性从后端加载）"""
+        self._check_version()
+        result, missing = {}, []
+        for workflow_id in workflow_ids:
+            workflow = self._get(workflow_id)
+            if workflow is None:
+                missing.append(workflow_id)
+            else:
+                result[workflow_id] = workflow
+        if missing:
+            generation = self._generation
+            loaded = await self.backend.load_many(missing)
+            if generation == self._generation:
+                for workflow_id, workflow in loaded.items():
+                    self._put(workflow_id, workflow)
+            result.update(loaded)
+        return result
+
+    async def list_all(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """列出工作流摘要（按查询参数缓存）"""
+        self._check_version()
+        key = (offset, limit, sort, tuple(sorted((filters or {}).items())), tuple(fields or ()))
+        cached = self._lists.get(key)
+        if cached is None:
+            generation = self._generation
+            cached = await self.backend.list_all(offset=offset, limit=limit, sort=sort, filters=filters, fields=fields)
+            if generation == self._generation:
+                self._lists[key] = cached
+                while len(self._lists) > MAX_LIST_ENTRIES:
+                    self._lists.popitem(last=False)
+        else:
+            self._lists.move_to_end(key)
+        return [dict(summary) for summary in cached]
+
+    async def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """统计工作流数量（按过滤条件缓存）"""
+        self._check_version()
+        key = tuple(sorted((filters or {}).items()))
+        if key in self._counts:
+            return self._counts[key]
+        generation = self._generation
+        count = await self.backend.count(filters)
+        if generation == self._generation:
+            self._counts[key] = count
+        return count
+
+    async def exists(self, workflow_id: str) -> bool:
+        """检查工作流是否存在（缓存中有则直接返回）"""
+        self._check_version()
+        if workflow_id in self._workflows:
+            return True
+        return await self.backend.exists(workflow_id)
+
+    async def exists_many(self, workflow_ids: Iterable[str]) -> Set[str]:
+        """批量检查工作流是否存在"""
+        self._check_version()
+        workflow_ids = list(workflow_ids)
+        found = {workflow_id for workflow_id in workflow_ids if workflow_id in self._workflows}
+        missing = [workflow_id for workflow_id in workflow_ids if workflow_id not in found]
+        if missing:
+            found |= await self.backend.exists_many(missing)
+        return found
+
+    async def is_hidden(self, workflow_id: str) -> bool:
+        """检查工作流是否被隐藏"""
+        self._check_version()
+        if workflow_id in self._hidden:
+            return self._hidden[workflow_id]
+        generation = self._generation
+        hidden = await self.backend.is_hidden(workflow_id)
+        if generation == self._generation:
+            self._hidden[workflow_id] = hidden
+        return hidden
+
+    # ---- 写操作（写入后端后失效缓存） ----
+
+    async def save(self, workflow_id: str, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
+        """保存工作流"""
+        try:
+            return await self.backend.save(workflow_id, workflow_data)
+        finally:
+            await self._invalidate([workflow_id])
+
+    async def save_many(self, workflows: Dict[str, Dict[str, Any]]) -> int:
+        """批量保存工作流"""
+        try:
+            return await self.backend.save_many(workflows)
+        finally:
+            await self._invalidate(workflows.keys())
+
+    async def delete(self, workflow_id: str) -> bool:
+        """删除工作流"""
+        try:
+            return await self.backend.delete(workflow_id)
+        finally:
+            await self._invalidate([workflow_id])
+
+    async def update_active(self, workflow_id: str, is_active: bool) -> bool:
+        """更新工作流激活状态"""
+        try:
+            return await self.backend.update_active(workflow_id, is_active)
+        finally:
+            await self._invalidate([workflow_id])
+
+    async def hide_workflow(self, workflow_id: str):
+        """隐藏工作流（用于默认工作流的软删除）"""
+        try:
+            await self.backend.hide_workflow(workflow_id)
+        finally:
+            self._hidden.pop(workflow_id, None)
+            await self._invalidate()
+
+    async def flush(self):
+        """持久化被包装后端缓冲中的修改"""
+        await self.backend.flush()
+
+    async def close(self):
+        """关闭被包装的存储后端"""
+        self.clear()
+        await self.backend.close()
@@ -0,0 +1,88 @@
+"""
+工作流数据编码 - 数据库中 nodes/edges 的压缩存储
+
+每行记录编码版本（codec 列），读取时按版本解码：
+- 0 (json): 旧版 JSON 文本（未压缩）
+- 1 (zlib): 紧凑 JSON + zlib 压缩
+- 2 (zstd): 紧凑 JSON + zstd 压缩（需要安装 zstandard，未安装时回退到 zlib）
+
+旧数据不需要一次性迁移，读取到编码版本与当前配置不同的行时再重新编码写回。
+"""
+import json
+import zlib
+from typing import Any, Optional, Union
+
+from core.config import settings
+from core.logging_config import logger
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+
+CODEC_JSON = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+CODEC_NAMES = {"json": CODEC_JSON, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+_warned_zstd = False
+
+
+def configured_codec() -> int:
+    """当前配置的编码（WORKFLOW_STORAGE_CODEC）"""
+    global _warned_zstd
+    name = (settings.WORKFLOW_STORAGE_CODEC or "json").lower()
+    if name not in CODEC_NAMES:
+        raise ValueError(f"不支持的工作流数据编码: {name}（可选: {', '.join(CODEC_NAMES)}）")
+    codec = CODEC_NAMES[name]
+    if codec == CODEC_ZSTD and zstandard is None:
+        if not _warned_zstd:
+            logger.warning("未安装 zstandard，工作流数据改用 zlib 压缩")
+            _warned_zstd = True
+        return CODEC_ZLIB
+    return codec
+
+
+def encode(value: Any, codec: Optional[int] = None) -> Union[str, bytes]:
+    """
+    编码 nodes/edges
+
+    Args:
+        value: 任意可JSON序列化的数据
+        codec: 编码版本，默认使用配置
+
+    Returns:
+        CODEC_JSON 返回文本，压缩编码返回字节
+    """
+    if codec is None:
+        codec = configured_codec()
+    text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    if codec == CODEC_JSON:
+        return text
+    raw = text.encode("utf-8")
+    level = settings.WORKFLOW_STORAGE_CODEC_LEVEL
+    if codec == CODEC_ZLIB:
+        return zlib.compress(raw, -1 if level is None else level)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(raw)
+    raise ValueError(f"未知的工作流数据编码: {codec}")
+
+
+def decode(data: Union[str, bytes, None], codec: Optional[int]) -> Any:
+    """按编码版本解码 nodes/edges（codec 为空视为旧版 JSON 文本）"""
+    if data is None:
+        return []
+    if not codec:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+    data = bytes(data)
+    if codec == CODEC_ZLIB:
+        return json.loads(zlib.decompress(data))
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("该工作流使用 zstd 压缩存储，请安装 zstandard 后再读取")
+        return json.loads(zstandard.ZstdDecompressor().decompress(data))
+    raise ValueError(f"未知的工作流数据编码: {codec}")
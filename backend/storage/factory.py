@@ -93,6 +93,15 @@ def get_storage(storage_type: Optional[str] = None) -> WorkflowStorage:
         storage_path = PROJECT_ROOT / "data" / "workflows.json"
         _storage_instance = JSONStorage(storage_path)
     
+    # 读缓存（内存存储本身无需缓存）
+    if settings.WORKFLOW_STORAGE_CACHE and not isinstance(_storage_instance, MemoryStorage):
+        from storage.cached import CachedStorage
+        _storage_instance = CachedStorage(
+            _storage_instance,
+            max_bytes=settings.WORKFLOW_STORAGE_CACHE_MAX_BYTES,
+            version_file=settings.WORKFLOW_STORAGE_CACHE_VERSION_FILE or None
+        )
+    
     return _storage_instance
 
 
@@ -102,3 +111,12 @@ def reset_storage():
     _storage_instance = None
     logger.info("存储实例已重置")
 
+
+async def close_storage():
+    """关闭存储实例占用的连接（应用退出时调用）"""
+    global _storage_instance
+    if _storage_instance is None:
+        return
+    storage, _storage_instance = _storage_instance, None
+    await storage.close()
+    logger.info("存储实例已关闭")
@@ -1,184 +1,591 @@
 """
 JSON文件存储后端 - 适合小型项目和开发测试
+
+分片布局：
+- 索引文件（默认 data/workflows.json）：只保存工作流摘要和隐藏列表，常驻内存，按 mtime 校验是否需要重新加载
+- 工作流文件（默认 data/workflows/<workflow_id>.json）：每个工作流单独一个文件，读写只涉及该工作流
+
+写缓冲：save/delete/update_active/hide_workflow 的修改先保存在内存中，
+在 WORKFLOW_JSON_WRITE_DELAY 秒内合并为一次写入（工作流文件 + 一次索引写入）。
+积压超过 WORKFLOW_JSON_MAX_DIRTY 个时立即写入；需要确保落盘时调用 flush()，
+关闭存储和进程退出时也会自动写入。
+
+文件读写和索引锁（flock 会一直等待其他进程释放）都在工作线程中执行，不阻塞事件循环；
+内存索引和写缓冲由线程锁保护，同一时刻只有一个操作在读写。
+
+旧版单文件格式（所有工作流写在同一个文件中）会在首次加载时自动迁移。
 """
+import asyncio
+import atexit
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Set
 from datetime import datetime
+from urllib.parse import quote
 
-from storage.base import WorkflowStorage
+from storage.base import WorkflowStorage, apply_list_options
 from core.config import settings, PROJECT_ROOT
 from core.logging_config import logger
 
+try:
+    import fcntl
+except ImportError:  # Windows 不支持 fcntl，使用 msvcrt.locking
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # 非 Windows 系统
+    msvcrt = None
+
+
+# 索引文件格式版本
+INDEX_FORMAT = 2
+
+# Windows 上等待索引锁时的重试间隔（秒）
+LOCK_RETRY_INTERVAL = 0.05
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _write_json_atomic(path: Path, data: Any):
+    """先写入同目录下的临时文件，再重命名（原子操作）"""
+    _write_text_atomic(path, _dumps(data))
+
+
+def _write_text_atomic(path: Path, text: str):
+    """原子写入已序列化的JSON文本"""
+    fd, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class _IndexLock:
+    """
+    索引文件写锁（跨进程、可重入），防止并发的读-改-写互相覆盖
+    
+    获取锁会阻塞当前线程，只在持有 JSONStorage._mutex 的工作线程中使用。
+    """
+    
+    def __init__(self, lock_path: Path):
+        self.lock_path = lock_path
+        self._file = None
+        self._depth = 0
+    
+    def __enter__(self):
+        self._depth += 1
+        if self._depth == 1:
+            self._file = open(self.lock_path, 'a+b')
+            try:
+                self._acquire()
+            except BaseException:
+                self._depth -= 1
+                self._file.close()
+                self._file = None
+                raise
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            try:
+                self._release()
+            finally:
+                self._file.close()
+                self._file = None
+    
+    def _acquire(self):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            # 锁定锁文件的第一个字节；LK_NBLCK 失败时立即返回，自行重试直到获得锁
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    time.sleep(LOCK_RETRY_INTERVAL)
+    
+    def _release(self):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _flush_at_exit(storage_ref: "weakref.ref[JSONStorage]"):
+    """进程退出时写入缓冲中的修改（只在创建存储的进程中执行）"""
+    storage = storage_ref()
+    if storage is None or storage._pid != os.getpid():
+        return
+    try:
+        storage._flush_sync()
+    except Exception as e:
+        logger.error(f"退出时写入JSON存储失败: {e}", exc_info=True)
+
 
 class JSONStorage(WorkflowStorage):
     """JSON文件存储实现"""
     
-    def __init__(self, storage_path: Optional[Path] = None):
+    def __init__(
+        self,
+        storage_path: Optional[Path] = None,
+        write_delay: Optional[float] = None,
+        max_dirty: Optional[int] = None
+    ):
         """
         初始化JSON存储
         
         Args:
-            storage_path: 存储文件路径，默认使用 data/workflows.json
+            storage_path: 索引文件路径，默认使用 data/workflows.json（工作流文件保存在同名目录下）
+            write_delay: 写缓冲的合并窗口（秒），0 表示每次修改立即写入，默认使用配置
+            max_dirty: 写缓冲中最多积压的工作流数量，默认使用配置
         """
         if storage_path is None:
             storage_path = PROJECT_ROOT / "data" / "workflows.json"
         
         self.storage_path = Path(storage_path)
         self.storage_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workflows_dir = self.storage_path.parent / self.storage_path.stem
+        self.workflows_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = _IndexLock(self.storage_path.parent / f".{self.storage_path.name}.lock")
+        
+        # 内存中的索引及其对应的文件状态
+        self._workflows: Dict[str, Dict[str, Any]] = {}
         self._hidden_workflows: set[str] = set()
+        self._index_stat: Optional[tuple] = None
+        
+        # 写缓冲：尚未写入的工作流文件（序列化后的文本，None 表示删除）、索引摘要和隐藏标记
+        self.write_delay = settings.WORKFLOW_JSON_WRITE_DELAY if write_delay is None else write_delay
+        self.max_dirty = max(1, settings.WORKFLOW_JSON_MAX_DIRTY if max_dirty is None else max_dirty)
+        self._pending_files: Dict[str, Optional[str]] = {}
+        self._pending_summaries: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._pending_hidden: set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # 保护内存索引和写缓冲（各操作在工作线程中执行，同一时刻只允许一个）
+        self._mutex = threading.RLock()
+        self._pid = os.getpid()
+        atexit.register(_flush_at_exit, weakref.ref(self))
         
         # 加载现有数据
-        self._workflows: Dict[str, Dict[str, Any]] = self._load_from_file()
+        self._refresh_index()
         
-        logger.info(f"使用JSON文件存储后端: {self.storage_path}")
+        logger.info(f"使用JSON文件存储后端: {self.storage_path}（{len(self._workflows)} 个工作流）")
+    
+    async def _call(self, func, *args):
+        """在工作线程中持锁执行同步操作，文件读写和等待索引锁时不阻塞事件循环"""
+        def run():
+            with self._mutex:
+                return func(*args)
+        return await asyncio.to_thread(run)
+    
+    def _workflow_path(self, workflow_id: str) -> Path:
+        """工作流文件路径（工作流ID转义为安全的文件名）"""
+        return self.workflows_dir / f"{quote(workflow_id, safe='')}.json"
     
-    def _load_from_file(self) -> Dict[str, Dict[str, Any]]:
-        """从文件加载数据"""
-        if not self.storage_path.exists():
-            logger.debug(f"JSON存储文件不存在，将创建新文件: {self.storage_path}")
-            return {}
+    def _stat_index(self) -> Optional[tuple]:
+        try:
+            stat = self.storage_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _refresh_index(self):
+        """
+        索引文件被修改（如其他进程写入）时重新加载，否则直接使用内存中的索引
+        
+        重新加载后，写缓冲中尚未写入的修改覆盖在读取结果之上。
+        """
+        stat = self._stat_index()
+        if stat is not None and stat == self._index_stat:
+            return
+        self._load_index(stat)
+        self._apply_pending()
+    
+    def _load_index(self, stat: Optional[tuple]):
+        """从索引文件加载摘要和隐藏列表"""
+        if stat is None:
+            if self._index_stat is not None:
+                logger.debug(f"JSON存储索引文件不存在，将创建新文件: {self.storage_path}")
+            self._workflows, self._hidden_workflows, self._index_stat = {}, set(), None
+            return
         
         try:
             with open(self.storage_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                workflows = data.get("workflows", {})
-                hidden_workflows = data.get("hidden_workflows", [])
-                self._hidden_workflows = set(hidden_workflows)
-                logger.debug(f"从JSON文件加载了 {len(workflows)} 个工作流")
-                return workflows
         except json.JSONDecodeError as e:
-            logger.error(f"JSON存储文件格式错误: {e}，将使用空数据")
-            return {}
+            logger.error(f"JSON存储索引文件格式错误: {e}，将使用空数据")
+            self._workflows, self._hidden_workflows, self._index_stat = {}, set(), stat
+            return
         except Exception as e:
-            logger.error(f"加载JSON存储文件失败: {e}", exc_info=True)
-            return {}
+            logger.error(f"加载JSON存储索引文件失败: {e}", exc_info=True)
+            return
+        
+        if data.get("format") != INDEX_FORMAT:
+            self._migrate_legacy()
+            return
+        
+        self._workflows = data.get("workflows", {})
+        self._hidden_workflows = set(data.get("hidden_workflows", []))
+        self._index_stat = stat
+        logger.debug(f"从JSON索引加载了 {len(self._workflows)} 个工作流")
+    
+    def _migrate_legacy(self):
+        """将旧版单文件格式迁移为分片布局（原文件备份为 .legacy.json）"""
+        with self._lock:
+            # 持锁后重新读取，其他进程可能已完成迁移
+            with open(self.storage_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("format") == INDEX_FORMAT:
+                self._workflows = data.get("workflows", {})
+                self._hidden_workflows = set(data.get("hidden_workflows", []))
+                self._index_stat = self._stat_index()
+                return
+            
+            workflows = data.get("workflows", {})
+            for workflow_id, workflow in workflows.items():
+                _write_json_atomic(self._workflow_path(workflow_id), {**workflow, "workflow_id": workflow_id})
+            
+            backup_path = self.storage_path.with_suffix(".legacy.json")
+            shutil.copy2(self.storage_path, backup_path)
+            
+            self._workflows = {
+                workflow_id: self._summary(workflow_id, workflow)
+                for workflow_id, workflow in workflows.items()
+            }
+            self._hidden_workflows = set(data.get("hidden_workflows", []))
+            self._write_index()
+        logger.info(f"JSON存储已迁移为分片布局: {len(workflows)} 个工作流，原文件备份为 {backup_path}")
     
-    def _save_to_file(self):
-        """保存数据到文件"""
+    @staticmethod
+    def _summary(workflow_id: str, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        """索引中的工作流摘要（list_all 直接返回）"""
+        created_at = workflow.get("created_at", datetime.now().isoformat())
+        return {
+            "workflow_id": workflow_id,
+            "name": workflow.get("name", workflow_id),
+            "description": workflow.get("description", ""),
+            "is_active": workflow.get("is_active", False),
+            "created_at": created_at,
+            "updated_at": workflow.get("updated_at", created_at),
+            "type": workflow.get("type", "custom"),
+        }
+    
+    def _write_index(self):
+        """写入索引文件（调用方需持有写锁）"""
         try:
-            data = {
+            _write_json_atomic(self.storage_path, {
+                "format": INDEX_FORMAT,
                 "workflows": self._workflows,
-                "hidden_workflows": list(self._hidden_workflows),
+                "hidden_workflows": sorted(self._hidden_workflows),
                 "updated_at": datetime.now().isoformat()
-            }
-            
-            # 先写入临时文件，然后重命名（原子操作）
-            temp_path = self.storage_path.with_suffix('.tmp')
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            temp_path.replace(self.storage_path)
-            logger.debug(f"JSON存储文件已更新: {self.storage_path}")
+            })
+            self._index_stat = self._stat_index()
+            logger.debug(f"JSON存储索引已更新: {self.storage_path}")
         except Exception as e:
-            logger.error(f"保存JSON存储文件失败: {e}", exc_info=True)
+            logger.error(f"保存JSON存储索引失败: {e}", exc_info=True)
             raise
     
-    async def save(self, workflow_id: str, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
-        """保存工作流"""
-        nodes = workflow_data.get("nodes", [])
-        edges = workflow_data.get("edges", [])
-        name = workflow_data.get("name", workflow_id)
-        description = workflow_data.get("description", "")
-        is_active = workflow_data.get("is_active", False)
-        
-        # 检查是否已存在，如果是更新，保留created_at
+    def _apply_pending(self):
+        """将写缓冲中的修改应用到内存索引"""
+        for workflow_id, summary in self._pending_summaries.items():
+            if summary is None:
+                self._workflows.pop(workflow_id, None)
+            else:
+                self._workflows[workflow_id] = summary
+        self._hidden_workflows |= self._pending_hidden
+    
+    def _read_workflow(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """读取工作流文件（写缓冲中有未写入的版本时以缓冲为准）"""
+        if workflow_id in self._pending_files:
+            text = self._pending_files[workflow_id]
+            return json.loads(text) if text is not None else None
+        try:
+            with open(self._workflow_path(workflow_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            logger.error(f"工作流文件格式错误: {workflow_id}: {e}")
+            return None
+    
+    def _build_workflow(self, workflow_id: str, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
+        """构建工作流记录（更新时保留created_at）"""
+        now = datetime.now().isoformat()
         existing = self._workflows.get(workflow_id)
-        created_at = existing.get("created_at", datetime.now().isoformat()) if existing else datetime.now().isoformat()
-        
-        self._workflows[workflow_id] = {
+        return {
             "workflow_id": workflow_id,
-            "name": name,
-            "description": description,
-            "nodes": nodes,
-            "edges": edges,
-            "is_active": is_active,
-            "created_at": created_at,
-            "updated_at": datetime.now().isoformat(),
+            "name": workflow_data.get("name", workflow_id),
+            "description": workflow_data.get("description", ""),
+            "nodes": workflow_data.get("nodes", []),
+            "edges": workflow_data.get("edges", []),
+            "is_active": workflow_data.get("is_active", False),
+            "created_at": existing.get("created_at", now) if existing else now,
+            "updated_at": now,
             "type": "custom",
         }
+    
+    # ---- 写缓冲 ----
+    
+    def _buffer_workflow(self, workflow_id: str, workflow: Optional[Dict[str, Any]]):
+        """将工作流（None 表示删除）放入写缓冲并更新内存索引（立即序列化，调用方之后修改数据不影响写入内容）"""
+        summary = self._summary(workflow_id, workflow) if workflow is not None else None
+        self._pending_files[workflow_id] = _dumps(workflow) if workflow is not None else None
+        self._pending_summaries[workflow_id] = summary
+        if summary is None:
+            self._workflows.pop(workflow_id, None)
+        else:
+            self._workflows[workflow_id] = summary
+    
+    def _pending_count(self) -> int:
+        return len(self._pending_summaries) + len(self._pending_hidden)
+    
+    async def _schedule_flush(self):
+        """合并窗口开始时安排一次写入；未启用缓冲或积压过多时立即写入"""
+        if self.write_delay <= 0 or self._pending_count() >= self.max_dirty:
+            await self.flush()
+            return
+        if self._flush_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(self.write_delay, self._flush_due)
+    
+    def _flush_due(self):
+        """合并窗口结束时在后台任务中写入"""
+        self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self._flush_in_background())
+    
+    async def _flush_in_background(self):
+        """后台写入（失败时保留缓冲，下次修改或关闭时重试）"""
+        try:
+            await self._call(self._flush_sync)
+        except Exception as e:
+            logger.error(f"JSON存储写入失败，修改保留在缓冲中: {e}", exc_info=True)
+    
+    def _flush_sync(self):
+        """将写缓冲中的修改写入文件：工作流文件逐个写入，索引只写一次（阻塞，在工作线程或退出时调用）"""
+        with self._mutex:
+            if not self._pending_count():
+                return
+            
+            with self._lock:
+                # 持锁后重新读取索引（其他进程可能已写入），再应用缓冲中的修改
+                stat = self._stat_index()
+                if stat != self._index_stat:
+                    self._load_index(stat)
+                self._apply_pending()
+                
+                for workflow_id, text in self._pending_files.items():
+                    if text is not None:
+                        _write_text_atomic(self._workflow_path(workflow_id), text)
+                self._write_index()
+                for workflow_id, text in self._pending_files.items():
+                    if text is None:
+                        self._workflow_path(workflow_id).unlink(missing_ok=True)
+            
+            logger.debug(f"JSON存储已写入 {self._pending_count()} 项缓冲的修改")
+            self._pending_files.clear()
+            self._pending_summaries.clear()
+            self._pending_hidden.clear()
+    
+    async def flush(self):
+        """立即写入缓冲中的修改（需要确保数据落盘时调用）"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self._call(self._flush_sync)
+    
+    async def close(self):
+        """写入缓冲中的修改"""
+        await self.flush()
+    
+    # ---- 读写操作 ----
+    
+    async def save(self, workflow_id: str, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
+        """保存工作流（写入缓冲，合并窗口结束时写入文件）"""
+        def buffer():
+            self._refresh_index()
+            self._buffer_workflow(workflow_id, self._build_workflow(workflow_id, workflow_data))
+        
+        await self._call(buffer)
+        await self._schedule_flush()
         
-        self._save_to_file()
         logger.info(f"工作流已保存到JSON文件: {workflow_id}")
         return {
             "workflow_id": workflow_id,
             "message": "工作流保存成功"
         }
     
+    async def save_many(self, workflows: Dict[str, Dict[str, Any]]) -> int:
+        """批量保存工作流（逐个写入工作流文件，索引只写一次，返回时已写入文件）"""
+        if not workflows:
+            return 0
+        
+        def buffer():
+            self._refresh_index()
+            for workflow_id, workflow_data in workflows.items():
+                self._buffer_workflow(workflow_id, self._build_workflow(workflow_id, workflow_data))
+        
+        await self._call(buffer)
+        await self.flush()
+        
+        logger.info(f"已批量保存 {len(workflows)} 个工作流到JSON文件")
+        return len(workflows)
+    
+    def _load_with_summary(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """读取工作流文件，元数据以索引为准"""
+        summary = self._workflows.get(workflow_id)
+        if summary is None:
+            return None
+        
+        workflow = self._read_workflow(workflow_id)
+        if workflow is None:
+            logger.warning(f"索引中存在但工作流文件缺失: {workflow_id}")
+            return None
+        
+        return {
+            "nodes": workflow.get("nodes", []),
+            "edges": workflow.get("edges", []),
+            "name": summary.get("name", workflow_id),
+            "description": summary.get("description", ""),
+            "is_active": summary.get("is_active", False),
+        }
+    
     async def load(self, workflow_id: str) -> Optional[Dict[str, Any]]:
-        """加载工作流"""
-        # 重新加载文件（支持多进程/多实例场景）
-        self._workflows = self._load_from_file()
-        
-        logger.debug(f"JSON存储中查找工作流: {workflow_id}, 当前工作流数量: {len(self._workflows)}")
-        
-        workflow = self._workflows.get(workflow_id)
-        if workflow:
-            logger.debug(f"找到工作流: {workflow_id}")
-            return {
-                "nodes": workflow.get("nodes", []),
-                "edges": workflow.get("edges", []),
-                "name": workflow.get("name", workflow_id),
-                "description": workflow.get("description", ""),
-                "is_active": workflow.get("is_active", False),
-            }
+        """加载工作流（只读取该工作流的文件）"""
+        def read():
+            self._refresh_index()
+            return self._load_with_summary(workflow_id)
+        
+        workflow = await self._call(read)
+        if workflow is None:
+            logger.debug(f"工作流不存在: {workflow_id}")
+        return workflow
+    
+    async def load_many(self, workflow_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量加载工作流（索引只校验一次）"""
+        def read():
+            self._refresh_index()
+            result = {}
+            for workflow_id in workflow_ids:
+                workflow = self._load_with_summary(workflow_id)
+                if workflow is not None:
+                    result[workflow_id] = workflow
+            return result
+        
+        return await self._call(read)
+    
+    async def exists_many(self, workflow_ids: Iterable[str]) -> Set[str]:
+        """批量检查工作流是否存在（只查询索引）"""
+        def check():
+            self._refresh_index()
+            return {workflow_id for workflow_id in workflow_ids if workflow_id in self._workflows}
         
-        logger.debug(f"工作流不存在: {workflow_id}, 可用的工作流ID: {list(self._workflows.keys())}")
-        return None
+        return await self._call(check)
     
     async def delete(self, workflow_id: str) -> bool:
-        """删除工作流"""
-        if workflow_id in self._workflows:
-            del self._workflows[workflow_id]
-            self._save_to_file()
-            logger.info(f"工作流已从JSON文件删除: {workflow_id}")
+        """删除工作流（写入缓冲）"""
+        def buffer():
+            self._refresh_index()
+            if workflow_id not in self._workflows:
+                return False
+            self._buffer_workflow(workflow_id, None)
             return True
-        return False
-    
-    async def list_all(self) -> List[Dict[str, Any]]:
-        """列出所有工作流"""
-        # 重新加载文件（支持多进程/多实例场景）
-        self._workflows = self._load_from_file()
-        
-        return [
-            {
-                "workflow_id": workflow_id,
-                "name": workflow.get("name", workflow_id),
-                "description": workflow.get("description", ""),
-                "is_active": workflow.get("is_active", False),
-                "created_at": workflow.get("created_at", datetime.now().isoformat()),
-                "updated_at": workflow.get("updated_at", workflow.get("created_at", datetime.now().isoformat())),
-                "type": workflow.get("type", "custom"),
-            }
-            for workflow_id, workflow in self._workflows.items()
-            if workflow_id not in self._hidden_workflows
-        ]
+        
+        if not await self._call(buffer):
+            return False
+        await self._schedule_flush()
+        
+        logger.info(f"工作流已从JSON文件删除: {workflow_id}")
+        return True
+    
+    async def list_all(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """列出工作流摘要（只读取索引）"""
+        def collect():
+            self._refresh_index()
+            return [
+                summary
+                for workflow_id, summary in self._workflows.items()
+                if workflow_id not in self._hidden_workflows
+            ]
+        
+        summaries = await self._call(collect)
+        return apply_list_options(summaries, offset, limit, sort, filters, fields)
     
     async def exists(self, workflow_id: str) -> bool:
         """检查工作流是否存在"""
-        self._workflows = self._load_from_file()
-        exists = workflow_id in self._workflows
-        logger.debug(f"检查工作流存在性: {workflow_id} -> {exists}")
-        return exists
+        def check():
+            self._refresh_index()
+            return workflow_id in self._workflows
+        
+        return await self._call(check)
     
     async def update_active(self, workflow_id: str, is_active: bool) -> bool:
-        """更新工作流激活状态"""
-        self._workflows = self._load_from_file()
-        
-        if workflow_id in self._workflows:
-            self._workflows[workflow_id]["is_active"] = is_active
-            self._workflows[workflow_id]["updated_at"] = datetime.now().isoformat()
-            self._save_to_file()
-            logger.info(f"工作流状态已更新: {workflow_id} -> {'激活' if is_active else '未激活'}")
+        """更新工作流激活状态（写入缓冲）"""
+        def buffer():
+            self._refresh_index()
+            if workflow_id not in self._workflows:
+                return False
+            
+            updated_at = datetime.now().isoformat()
+            workflow = self._read_workflow(workflow_id)
+            if workflow is not None:
+                workflow["is_active"] = is_active
+                workflow["updated_at"] = updated_at
+                self._buffer_workflow(workflow_id, workflow)
+            else:
+                summary = {**self._workflows[workflow_id], "is_active": is_active, "updated_at": updated_at}
+                self._pending_summaries[workflow_id] = summary
+                self._workflows[workflow_id] = summary
             return True
-        return False
+        
+        if not await self._call(buffer):
+            return False
+        await self._schedule_flush()
+        
+        logger.info(f"工作流状态已更新: {workflow_id} -> {'激活' if is_active else '未激活'}")
+        return True
     
-    def hide_workflow(self, workflow_id: str):
-        """隐藏工作流（用于默认工作流的软删除）"""
-        self._hidden_workflows.add(workflow_id)
-        self._save_to_file()
+    async def hide_workflow(self, workflow_id: str):
+        """隐藏工作流（用于默认工作流的软删除，写入缓冲）"""
+        def buffer():
+            self._refresh_index()
+            self._pending_hidden.add(workflow_id)
+            self._hidden_workflows.add(workflow_id)
+        
+        await self._call(buffer)
+        await self._schedule_flush()
     
-    def is_hidden(self, workflow_id: str) -> bool:
+    async def is_hidden(self, workflow_id: str) -> bool:
         """检查工作流是否被隐藏"""
-        return workflow_id in self._hidden_workflows
-
+        def check():
+            self._refresh_index()
+            return workflow_id in self._hidden_workflows
+        
+        return await self._call(check)
@@ -4,7 +4,7 @@
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
-from storage.base import WorkflowStorage
+from storage.base import WorkflowStorage, apply_list_options
 from core.logging_config import logger
 
 
@@ -67,9 +67,16 @@ class MemoryStorage(WorkflowStorage):
             return True
         return False
     
-    async def list_all(self) -> List[Dict[str, Any]]:
-        """列出所有工作流"""
-        return [
+    async def list_all(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """列出工作流摘要"""
+        summaries = [
             {
                 "workflow_id": workflow_id,
                 "name": workflow.get("name", workflow_id),
@@ -82,6 +89,7 @@ class MemoryStorage(WorkflowStorage):
             for workflow_id, workflow in self._workflows.items()
             if workflow_id not in self._hidden_workflows
         ]
+        return apply_list_options(summaries, offset, limit, sort, filters, fields)
     
     async def exists(self, workflow_id: str) -> bool:
         """检查工作流是否存在"""
@@ -96,11 +104,11 @@ class MemoryStorage(WorkflowStorage):
             return True
         return False
     
-    def hide_workflow(self, workflow_id: str):
+    async def hide_workflow(self, workflow_id: str):
         """隐藏工作流（用于默认工作流的软删除）"""
         self._hidden_workflows.add(workflow_id)
     
-    def is_hidden(self, workflow_id: str) -> bool:
+    async def is_hidden(self, workflow_id: str) -> bool:
         """检查工作流是否被隐藏"""
         return workflow_id in self._hidden_workflows
 
@@ -1,15 +1,35 @@
 """
 Memory 存储模块 - 基于 SQLite 的键值存储
 用于存储工作流记忆、会话记忆等
+
+搜索使用 FTS5 全文索引（memory_fts，由触发器与 memory 表同步），按 BM25 排序并返回摘要片段。
+索引内容为键名和值中的文本/数字（不含JSON语法和字段名）；分词器优先使用 trigram，支持中文子串匹配。
+SQLite 未编译 FTS5 时退化为 LIKE 匹配。
+
+过期时间以整数时间戳保存在带索引的 expires_at 列中；后台清理线程定期分批删除过期记录。
 """
 import json
+import math
+import threading
+import time
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
-import sqlite3
 
 from core.config import settings, PROJECT_ROOT
 from core.logging_config import logger
+from storage.sqlite_pool import get_sqlite_pool
+
+
+# 值中参与全文索引的文本：JSON 中的字符串和数字（非 JSON 的值直接使用原文）
+FTS_TEXT_SQL = """
+    CASE WHEN json_valid({value}) THEN COALESCE(
+        (SELECT group_concat(atom, ' ') FROM json_tree({value}) WHERE type IN ('text', 'integer', 'real')), ''
+    ) ELSE {value} END
+"""
+
+# trigram 分词器的最小查询长度（更短的关键词无法使用索引，退化为对索引内容的 LIKE 匹配）
+TRIGRAM_MIN_LENGTH = 3
 
 
 class MemoryStorage:
@@ -27,6 +47,10 @@ class MemoryStorage:
         
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path)
+        self._fts_tokenizer: Optional[str] = None  # None 表示 FTS5 不可用
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweep_stop = threading.Event()
         
         # 初始化数据库表
         self._init_database()
@@ -34,10 +58,8 @@ class MemoryStorage:
         logger.info(f"Memory 存储已初始化: {self.db_path}")
     
     def _get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """获取数据库连接（线程本地长连接，close() 时归还连接池）"""
+        return self._pool.connection()
     
     def _init_database(self):
         """初始化数据库表"""
@@ -58,10 +80,26 @@ class MemoryStorage:
                     ttl INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at INTEGER,
                     UNIQUE(memory_type, workflow_id, session_id, key)
                 )
             """)
             
+            # 旧版数据库：补充 expires_at 列，并由 ttl 中的过期时间（ISO字符串）换算
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(memory)")}
+            if "expires_at" not in columns:
+                cursor.execute("ALTER TABLE memory ADD COLUMN expires_at INTEGER")
+                rows = cursor.execute("SELECT id, ttl FROM memory WHERE ttl IS NOT NULL").fetchall()
+                updates = []
+                for row in rows:
+                    try:
+                        updates.append((int(datetime.fromisoformat(str(row["ttl"])).timestamp()), row["id"]))
+                    except ValueError:
+                        logger.warning(f"无法解析记忆的过期时间，视为已过期: id={row['id']}, ttl={row['ttl']}")
+                        updates.append((0, row["id"]))
+                cursor.executemany("UPDATE memory SET expires_at = ? WHERE id = ?", updates)
+                logger.info(f"已为 {len(updates)} 条记忆换算过期时间")
+            
             # 创建索引
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_memory_type_workflow 
@@ -83,6 +121,13 @@ class MemoryStorage:
                 ON memory(created_at)
             """)
             
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_memory_expires_at 
+                ON memory(expires_at)
+            """)
+            
+            self._init_fts(cursor)
+            
             conn.commit()
             logger.debug("Memory 数据库表初始化完成")
         except Exception as e:
@@ -91,6 +136,54 @@ class MemoryStorage:
         finally:
             conn.close()
     
+    def _init_fts(self, cursor):
+        """创建全文索引表和同步触发器（首次创建时为已有记录建立索引）"""
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_fts'"
+        ).fetchone()
+        if exists:
+            sql = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'memory_fts'").fetchone()[0]
+            self._fts_tokenizer = "trigram" if "trigram" in sql else "unicode61"
+        else:
+            for tokenizer in ("trigram", "unicode61"):
+                try:
+                    cursor.execute(f"CREATE VIRTUAL TABLE memory_fts USING fts5(key, text, tokenize='{tokenizer}')")
+                except Exception as e:
+                    logger.debug(f"FTS5 分词器 {tokenizer} 不可用: {e}")
+                    continue
+                self._fts_tokenizer = tokenizer
+                break
+            if self._fts_tokenizer is None:
+                logger.warning("SQLite 不支持 FTS5，记忆搜索将使用 LIKE 匹配")
+                return
+            # 键名的权重高于值
+            cursor.execute("INSERT INTO memory_fts(memory_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+        
+        new_text = FTS_TEXT_SQL.format(value="new.value")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS memory_fts_insert AFTER INSERT ON memory BEGIN
+                INSERT INTO memory_fts(rowid, key, text) VALUES (new.id, new.key, {new_text});
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memory_fts_delete AFTER DELETE ON memory BEGIN
+                DELETE FROM memory_fts WHERE rowid = old.id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS memory_fts_update AFTER UPDATE OF key, value ON memory BEGIN
+                DELETE FROM memory_fts WHERE rowid = old.id;
+                INSERT INTO memory_fts(rowid, key, text) VALUES (new.id, new.key, {new_text});
+            END
+        """)
+        
+        if not exists:
+            cursor.execute(f"""
+                INSERT INTO memory_fts(rowid, key, text)
+                SELECT id, key, {FTS_TEXT_SQL.format(value="memory.value")} FROM memory
+            """)
+            logger.info(f"已为 {cursor.rowcount} 条记忆建立全文索引（分词器: {self._fts_tokenizer}）")
+    
     def store(
         self,
         memory_type: str,
@@ -124,17 +217,27 @@ class MemoryStorage:
             value_str = json.dumps(value, ensure_ascii=False)
             metadata_str = json.dumps(metadata, ensure_ascii=False) if metadata else None
             
-            # 计算过期时间
+            # 计算过期时间（ttl 列保存可读的过期时间，expires_at 列保存时间戳用于过滤和清理）
             expires_at = None
             if ttl:
                 expires_at = datetime.now() + timedelta(seconds=ttl)
+            expires_ts = math.ceil(expires_at.timestamp()) if expires_at else None
             
-            # 插入或更新
+            # 插入或更新（不使用 INSERT OR REPLACE：冲突时的隐式删除不触发全文索引的同步触发器）
             cursor.execute("""
-                INSERT OR REPLACE INTO memory 
-                (memory_type, workflow_id, session_id, key, value, metadata, ttl, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (memory_type, workflow_id, session_id, key, value_str, metadata_str, expires_at.isoformat() if expires_at else None))
+                INSERT INTO memory 
+                (memory_type, workflow_id, session_id, key, value, metadata, ttl, expires_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(memory_type, workflow_id, session_id, key) DO UPDATE SET
+                    value = excluded.value,
+                    metadata = excluded.metadata,
+                    ttl = excluded.ttl,
+                    expires_at = excluded.expires_at,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (
+                memory_type, workflow_id, session_id, key, value_str, metadata_str,
+                expires_at.isoformat() if expires_at else None, expires_ts
+            ))
             
             conn.commit()
             
@@ -199,7 +302,8 @@ class MemoryStorage:
                 params.append(session_id)
             
             # 过滤过期记录
-            conditions.append("(ttl IS NULL OR datetime(ttl) > datetime('now'))")
+            conditions.append("(expires_at IS NULL OR expires_at > ?)")
+            params.append(int(time.time()))
             
             where_clause = " AND ".join(conditions) if conditions else "1=1"
             
@@ -254,6 +358,29 @@ class MemoryStorage:
         finally:
             conn.close()
     
+    @staticmethod
+    def _fts_terms(query: str) -> List[str]:
+        """将搜索词按空白拆分为关键词"""
+        return [term for term in query.split() if term]
+    
+    def _fts_condition(self, terms: List[str]):
+        """
+        构建全文检索条件
+        
+        Returns:
+            (条件, 参数, 是否使用 MATCH)；关键词之间为 AND 关系，每个关键词按短语匹配
+        """
+        if self._fts_tokenizer == "trigram" and any(len(term) < TRIGRAM_MIN_LENGTH for term in terms):
+            # trigram 索引无法匹配过短的关键词：对索引内容做 LIKE 匹配（仍不会匹配JSON语法）
+            conditions, params = [], []
+            for term in terms:
+                pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                conditions.append("(memory_fts.key LIKE ? ESCAPE '\\' OR memory_fts.text LIKE ? ESCAPE '\\')")
+                params.extend([pattern, pattern])
+            return " AND ".join(conditions), params, False
+        expression = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        return "memory_fts MATCH ?", [expression], True
+    
     def search(
         self,
         query: str,
@@ -262,42 +389,63 @@ class MemoryStorage:
         limit: int = 10
     ) -> List[Dict[str, Any]]:
         """
-        搜索记忆（简单文本匹配）
+        搜索记忆（全文检索，按相关度排序）
         
         Args:
-            query: 搜索关键词
+            query: 搜索关键词（多个关键词以空白分隔，需全部匹配）
             memory_type: 记忆类型（可选）
             workflow_id: 工作流ID（可选）
             limit: 返回结果数量限制
             
         Returns:
-            匹配的记忆列表
+            匹配的记忆列表（相关度高的在前），每条包含 score（BM25，越小越相关）和 snippet（命中片段）
         """
+        terms = self._fts_terms(query)
+        if not terms:
+            return []
+        
         conn = self._get_connection()
         try:
             cursor = conn.cursor()
             
-            conditions = ["(key LIKE ? OR value LIKE ?)"]
-            params = [f"%{query}%", f"%{query}%"]
+            if self._fts_tokenizer is not None:
+                condition, params, ranked = self._fts_condition(terms)
+                conditions = [condition]
+                columns = """m.id, m.memory_type, m.workflow_id, m.session_id, m.key, m.value, m.metadata,
+                       m.created_at, m.updated_at,
+                       """
+                if ranked:
+                    columns += "snippet(memory_fts, -1, '[', ']', '...', 16) AS snippet, bm25(memory_fts, 2.0, 1.0) AS score"
+                else:
+                    columns += "NULL AS snippet, NULL AS score"
+                source = "memory_fts JOIN memory m ON m.id = memory_fts.rowid"
+                order_by = "memory_fts.rank" if ranked else "m.created_at DESC"
+            else:
+                conditions = ["(m.key LIKE ? OR m.value LIKE ?)"]
+                params = [f"%{query}%", f"%{query}%"]
+                columns = """m.id, m.memory_type, m.workflow_id, m.session_id, m.key, m.value, m.metadata,
+                       m.created_at, m.updated_at, NULL AS snippet, NULL AS score"""
+                source = "memory m"
+                order_by = "m.created_at DESC"
             
             if memory_type:
-                conditions.append("memory_type = ?")
+                conditions.append("m.memory_type = ?")
                 params.append(memory_type)
             
             if workflow_id:
-                conditions.append("workflow_id = ?")
+                conditions.append("m.workflow_id = ?")
                 params.append(workflow_id)
             
-            conditions.append("(ttl IS NULL OR datetime(ttl) > datetime('now'))")
+            conditions.append("(m.expires_at IS NULL OR m.expires_at > ?)")
+            params.append(int(time.time()))
             
             where_clause = " AND ".join(conditions)
             
             sql = f"""
-                SELECT id, memory_type, workflow_id, session_id, key, value, metadata,
-                       created_at, updated_at
-                FROM memory
+                SELECT {columns}
+                FROM {source}
                 WHERE {where_clause}
-                ORDER BY created_at DESC
+                ORDER BY {order_by}
                 LIMIT ?
             """
             
@@ -330,6 +478,8 @@ class MemoryStorage:
                     "metadata": metadata,
                     "created_at": row['created_at'],
                     "updated_at": row['updated_at'],
+                    "score": row['score'],
+                    "snippet": row['snippet'],
                 })
             
             return results
@@ -401,33 +551,84 @@ class MemoryStorage:
         finally:
             conn.close()
     
-    def clear_expired(self) -> int:
+    def clear_expired(self, batch_size: Optional[int] = None) -> int:
         """
-        清理过期记录
+        清理过期记录（分批删除，每批一个短事务，避免长时间锁表）
+        
+        Args:
+            batch_size: 每批删除的记录数，默认使用配置 MEMORY_SWEEP_BATCH_SIZE
         
         Returns:
             清理的记录数
         """
-        conn = self._get_connection()
+        batch_size = max(1, batch_size or settings.MEMORY_SWEEP_BATCH_SIZE)
+        now = int(time.time())
+        deleted_count = 0
         try:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                DELETE FROM memory 
-                WHERE ttl IS NOT NULL AND datetime(ttl) <= datetime('now')
-            """)
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            
-            logger.info(f"已清理 {deleted_count} 条过期记忆")
-            return deleted_count
-            
+            while True:
+                conn = self._get_connection()
+                try:
+                    cursor = conn.execute("""
+                        DELETE FROM memory WHERE id IN (
+                            SELECT id FROM memory WHERE expires_at <= ? LIMIT ?
+                        )
+                    """, (now, batch_size))
+                    deleted = cursor.rowcount
+                    conn.commit()
+                finally:
+                    conn.close()
+                
+                deleted_count += deleted
+                if deleted < batch_size:
+                    break
+                # 批次之间让出锁，其他写入可以插入执行
+                time.sleep(0.01)
         except Exception as e:
             logger.error(f"清理过期记录失败: {e}", exc_info=True)
             raise
-        finally:
-            conn.close()
+        
+        if deleted_count:
+            logger.info(f"已清理 {deleted_count} 条过期记忆")
+        else:
+            logger.debug("没有过期记忆需要清理")
+        return deleted_count
+    
+    def _sweep_loop(self, interval: float, batch_size: int):
+        """后台清理线程：每隔 interval 秒清理一次过期记录"""
+        while not self._sweep_stop.wait(interval):
+            try:
+                self.clear_expired(batch_size)
+            except Exception:
+                pass  # clear_expired 已记录错误，下个周期重试
+    
+    def start_sweeper(self, interval: Optional[float] = None, batch_size: Optional[int] = None):
+        """
+        启动后台清理线程（已启动或 interval <= 0 时不处理）
+        
+        Args:
+            interval: 清理间隔（秒），默认使用配置 MEMORY_SWEEP_INTERVAL
+            batch_size: 每批删除的记录数，默认使用配置 MEMORY_SWEEP_BATCH_SIZE
+        """
+        interval = settings.MEMORY_SWEEP_INTERVAL if interval is None else interval
+        if interval <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+            return
+        self._sweep_stop.clear()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop,
+            args=(interval, batch_size or settings.MEMORY_SWEEP_BATCH_SIZE),
+            name="memory-sweeper",
+            daemon=True
+        )
+        self._sweeper.start()
+        logger.info(f"记忆过期清理已启动: 每 {interval} 秒")
+    
+    def stop_sweeper(self, timeout: float = 5):
+        """停止后台清理线程"""
+        if self._sweeper is None:
+            return
+        self._sweep_stop.set()
+        self._sweeper.join(timeout)
+        self._sweeper = None
 
 
 # 全局 Memory 存储实例
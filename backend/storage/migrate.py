@@ -4,7 +4,7 @@
 """
 import asyncio
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Awaitable, Callable, Optional, List, Dict, Any
 from datetime import datetime
 
 from storage.base import WorkflowStorage
@@ -16,19 +16,68 @@ from storage.factory import StorageType
 from core.logging_config import logger
 
 
+# 默认批大小和并发批次数
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
 class StorageMigrator:
-    """存储迁移工具"""
+    """存储迁移工具（按批次读写，多个批次并发执行）"""
     
-    def __init__(self, source: WorkflowStorage, target: WorkflowStorage):
+    def __init__(
+        self,
+        source: WorkflowStorage,
+        target: WorkflowStorage,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        progress: Optional[ProgressCallback] = None
+    ):
         """
         初始化迁移工具
         
         Args:
             source: 源存储后端
             target: 目标存储后端
+            batch_size: 每批迁移的工作流数量
+            concurrency: 同时处理的批次数
+            progress: 进度回调 progress(阶段, 已处理数量, 总数)
         """
         self.source = source
         self.target = target
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.progress = progress
+    
+    async def _source_ids(self) -> List[str]:
+        """分页获取源存储中的全部工作流ID（只查询ID字段）"""
+        workflow_ids = []
+        offset = 0
+        while True:
+            page = await self.source.list_all(offset=offset, limit=self.batch_size, fields=["workflow_id"])
+            workflow_ids.extend(w["workflow_id"] for w in page)
+            if len(page) < self.batch_size:
+                return workflow_ids
+            offset += len(page)
+    
+    async def _run_batches(self, stage: str, workflow_ids: List[str], handler: Callable[[List[str]], Awaitable[None]]):
+        """按批次并发执行 handler，每完成一批报告一次进度"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        total = len(workflow_ids)
+        done = 0
+        
+        async def run(batch: List[str]):
+            nonlocal done
+            async with semaphore:
+                await handler(batch)
+            done += len(batch)
+            logger.info(f"{stage}进度: {done}/{total}")
+            if self.progress is not None:
+                self.progress(stage, done, total)
+        
+        batches = [workflow_ids[i:i + self.batch_size] for i in range(0, total, self.batch_size)]
+        await asyncio.gather(*(run(batch) for batch in batches))
     
     async def migrate(self, workflow_ids: Optional[List[str]] = None) -> Dict[str, Any]:
         """
@@ -40,64 +89,61 @@ class StorageMigrator:
         Returns:
             迁移结果统计
         """
-        logger.info(f"开始迁移工作流数据...")
+        logger.info(f"开始迁移工作流数据（批大小 {self.batch_size}，并发 {self.concurrency}）...")
         
         # 获取要迁移的工作流列表
         if workflow_ids is None:
-            source_workflows = await self.source.list_all()
-            workflow_ids = [w["workflow_id"] for w in source_workflows]
+            workflow_ids = await self._source_ids()
         
-        migrated_count = 0
-        failed_count = 0
-        skipped_count = 0
+        stats = {"migrated": 0, "failed": 0, "skipped": 0}
         errors = []
         
-        for workflow_id in workflow_ids:
+        async def migrate_batch(batch: List[str]):
+            # 跳过目标存储中已存在的工作流
+            existing = await self.target.exists_many(batch)
+            for workflow_id in existing:
+                logger.warning(f"工作流 {workflow_id} 在目标存储中已存在，跳过")
+            pending = [workflow_id for workflow_id in batch if workflow_id not in existing]
+            stats["skipped"] += len(existing)
+            if not pending:
+                return
+            
+            # 从源存储批量加载（load 已包含名称、描述、激活状态等元数据）
             try:
-                # 检查目标存储中是否已存在
-                if await self.target.exists(workflow_id):
-                    logger.warning(f"工作流 {workflow_id} 在目标存储中已存在，跳过")
-                    skipped_count += 1
-                    continue
-                
-                # 从源存储加载
-                workflow_data = await self.source.load(workflow_id)
-                if workflow_data is None:
-                    logger.warning(f"工作流 {workflow_id} 在源存储中不存在，跳过")
-                    skipped_count += 1
-                    continue
-                
-                # 获取完整的工作流信息（包括元数据）
-                source_workflows = await self.source.list_all()
-                workflow_info = next(
-                    (w for w in source_workflows if w["workflow_id"] == workflow_id),
-                    None
-                )
-                
-                if workflow_info:
-                    # 合并元数据
-                    workflow_data.update({
-                        "name": workflow_info.get("name", workflow_id),
-                        "description": workflow_info.get("description", ""),
-                        "is_active": workflow_info.get("is_active", False),
-                    })
-                
-                # 保存到目标存储
-                await self.target.save(workflow_id, workflow_data)
-                migrated_count += 1
-                logger.info(f"已迁移工作流: {workflow_id}")
-                
+                workflows = await self.source.load_many(pending)
             except Exception as e:
-                failed_count += 1
-                error_msg = f"迁移工作流 {workflow_id} 失败: {str(e)}"
+                stats["failed"] += len(pending)
+                error_msg = f"从源存储加载失败（{len(pending)} 个工作流）: {str(e)}"
                 logger.error(error_msg, exc_info=True)
                 errors.append(error_msg)
+                return
+            
+            for workflow_id in pending:
+                if workflow_id not in workflows:
+                    logger.warning(f"工作流 {workflow_id} 在源存储中不存在，跳过")
+                    stats["skipped"] += 1
+            
+            # 批量写入目标存储，失败时逐个重试以定位出错的工作流
+            try:
+                saved = await self.target.save_many(workflows)
+                stats["migrated"] += saved
+            except Exception as e:
+                logger.warning(f"批量写入失败，逐个重试: {e}")
+                for workflow_id, workflow_data in workflows.items():
+                    try:
+                        await self.target.save(workflow_id, workflow_data)
+                        stats["migrated"] += 1
+                    except Exception as item_error:
+                        stats["failed"] += 1
+                        error_msg = f"迁移工作流 {workflow_id} 失败: {str(item_error)}"
+                        logger.error(error_msg, exc_info=True)
+                        errors.append(error_msg)
+        
+        await self._run_batches("迁移", workflow_ids, migrate_batch)
         
         result = {
             "total": len(workflow_ids),
-            "migrated": migrated_count,
-            "failed": failed_count,
-            "skipped": skipped_count,
+            **stats,
             "errors": errors,
             "timestamp": datetime.now().isoformat()
         }
@@ -120,23 +166,28 @@ class StorageMigrator:
         logger.info("开始验证迁移结果...")
         
         if workflow_ids is None:
-            source_workflows = await self.source.list_all()
-            workflow_ids = [w["workflow_id"] for w in source_workflows]
+            workflow_ids = await self._source_ids()
         
-        verified_count = 0
-        failed_count = 0
+        stats = {"verified": 0, "failed": 0}
         errors = []
         
-        for workflow_id in workflow_ids:
+        async def verify_batch(batch: List[str]):
             try:
-                source_data = await self.source.load(workflow_id)
-                target_data = await self.target.load(workflow_id)
-                
-                if source_data is None:
-                    continue  # 跳过不存在的
-                
+                source_workflows, target_workflows = await asyncio.gather(
+                    self.source.load_many(batch),
+                    self.target.load_many(batch)
+                )
+            except Exception as e:
+                stats["failed"] += len(batch)
+                error_msg = f"验证失败（{len(batch)} 个工作流）: {str(e)}"
+                logger.error(error_msg, exc_info=True)
+                errors.append(error_msg)
+                return
+            
+            for workflow_id, source_data in source_workflows.items():
+                target_data = target_workflows.get(workflow_id)
                 if target_data is None:
-                    failed_count += 1
+                    stats["failed"] += 1
                     errors.append(f"工作流 {workflow_id} 在目标存储中不存在")
                     continue
                 
@@ -144,21 +195,16 @@ class StorageMigrator:
                 if (source_data.get("nodes") == target_data.get("nodes") and
                     source_data.get("edges") == target_data.get("edges") and
                     source_data.get("name") == target_data.get("name")):
-                    verified_count += 1
+                    stats["verified"] += 1
                 else:
-                    failed_count += 1
+                    stats["failed"] += 1
                     errors.append(f"工作流 {workflow_id} 数据不匹配")
-                    
-            except Exception as e:
-                failed_count += 1
-                error_msg = f"验证工作流 {workflow_id} 失败: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                errors.append(error_msg)
+        
+        await self._run_batches("验证", workflow_ids, verify_batch)
         
         result = {
             "total": len(workflow_ids),
-            "verified": verified_count,
-            "failed": failed_count,
+            **stats,
             "errors": errors,
             "timestamp": datetime.now().isoformat()
         }
@@ -169,9 +215,33 @@ class StorageMigrator:
         return result
 
 
+async def _run_migration(
+    source: WorkflowStorage,
+    target: WorkflowStorage,
+    batch_size: int,
+    concurrency: int,
+    progress: Optional[ProgressCallback],
+    workflow_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """迁移并验证，结束后关闭源和目标存储（释放数据库连接及其后台线程）"""
+    try:
+        migrator = StorageMigrator(source, target, batch_size, concurrency, progress)
+        result = await migrator.migrate(workflow_ids)
+        
+        # 验证迁移结果
+        result["verification"] = await migrator.verify(workflow_ids)
+        return result
+    finally:
+        await source.close()
+        await target.close()
+
+
 async def migrate_from_json_to_sqlite(
     json_path: Optional[Path] = None,
-    sqlite_path: Optional[Path] = None
+    sqlite_path: Optional[Path] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    progress: Optional[ProgressCallback] = None
 ) -> Dict[str, Any]:
     """
     从JSON文件迁移到SQLite数据库
@@ -179,6 +249,9 @@ async def migrate_from_json_to_sqlite(
     Args:
         json_path: JSON文件路径
         sqlite_path: SQLite数据库路径
+        batch_size: 每批迁移的工作流数量
+        concurrency: 同时处理的批次数
+        progress: 进度回调 progress(阶段, 已处理数量, 总数)
         
     Returns:
         迁移结果
@@ -198,19 +271,15 @@ async def migrate_from_json_to_sqlite(
     source = JSONStorage(json_path)
     target = SQLiteStorage(sqlite_path)
     
-    migrator = StorageMigrator(source, target)
-    result = await migrator.migrate()
-    
-    # 验证迁移结果
-    verify_result = await migrator.verify()
-    result["verification"] = verify_result
-    
-    return result
+    return await _run_migration(source, target, batch_size, concurrency, progress)
 
 
 async def migrate_from_json_to_sql(
     json_path: Optional[Path] = None,
-    database_url: Optional[str] = None
+    database_url: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    progress: Optional[ProgressCallback] = None
 ) -> Dict[str, Any]:
     """
     从JSON文件迁移到PostgreSQL/MySQL数据库
@@ -218,6 +287,9 @@ async def migrate_from_json_to_sql(
     Args:
         json_path: JSON文件路径
         database_url: 数据库连接URL
+        batch_size: 每批迁移的工作流数量
+        concurrency: 同时处理的批次数
+        progress: 进度回调 progress(阶段, 已处理数量, 总数)
         
     Returns:
         迁移结果
@@ -233,19 +305,15 @@ async def migrate_from_json_to_sql(
     source = JSONStorage(json_path)
     target = SQLStorage(database_url)
     
-    migrator = StorageMigrator(source, target)
-    result = await migrator.migrate()
-    
-    # 验证迁移结果
-    verify_result = await migrator.verify()
-    result["verification"] = verify_result
-    
-    return result
+    return await _run_migration(source, target, batch_size, concurrency, progress)
 
 
 async def migrate_from_sqlite_to_sql(
     sqlite_path: Optional[Path] = None,
-    database_url: Optional[str] = None
+    database_url: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    progress: Optional[ProgressCallback] = None
 ) -> Dict[str, Any]:
     """
     从SQLite数据库迁移到PostgreSQL/MySQL数据库
@@ -253,6 +321,9 @@ async def migrate_from_sqlite_to_sql(
     Args:
         sqlite_path: SQLite数据库路径
         database_url: 数据库连接URL
+        batch_size: 每批迁移的工作流数量
+        concurrency: 同时处理的批次数
+        progress: 进度回调 progress(阶段, 已处理数量, 总数)
         
     Returns:
         迁移结果
@@ -272,14 +343,13 @@ async def migrate_from_sqlite_to_sql(
     source = SQLiteStorage(sqlite_path)
     target = SQLStorage(database_url)
     
-    migrator = StorageMigrator(source, target)
-    result = await migrator.migrate()
-    
-    # 验证迁移结果
-    verify_result = await migrator.verify()
-    result["verification"] = verify_result
-    
-    return result
+    return await _run_migration(source, target, batch_size, concurrency, progress)
+
+
+def print_progress(stage: str, done: int, total: int):
+    """在终端输出进度（同一行刷新）"""
+    percent = done / total * 100 if total else 100.0
+    print(f"\r{stage}进度: {done}/{total} ({percent:.1f}%)", end="\n" if done >= total else "", flush=True)
 
 
 # CLI工具入口
@@ -304,12 +374,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--source-path",
         type=str,
-        help="源存储路径（JSON文件或SQLite数据库）"
+        help="源存储路径（JSON文件、SQLite数据库或数据库连接URL，数据库默认使用 DATABASE_URL）"
     )
     parser.add_argument(
         "--target-path",
         type=str,
-        help="目标存储路径（JSON文件、SQLite数据库或数据库连接URL）"
+        help="目标存储路径（JSON文件、SQLite数据库或数据库连接URL，数据库默认使用 DATABASE_URL）"
     )
     parser.add_argument(
         "--workflow-ids",
@@ -317,6 +387,18 @@ if __name__ == "__main__":
         nargs="+",
         help="要迁移的工作流ID列表（可选，默认迁移所有）"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"每批迁移的工作流数量（默认 {DEFAULT_BATCH_SIZE}）"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"同时处理的批次数（默认 {DEFAULT_CONCURRENCY}）"
+    )
     
     args = parser.parse_args()
     
@@ -329,7 +411,7 @@ if __name__ == "__main__":
             source_path = Path(args.source_path) if args.source_path else None
             source = SQLiteStorage(source_path)
         elif args.source_type in ("postgresql", "mysql"):
-            source = SQLStorage(args.source_path or args.target_path)
+            source = SQLStorage(args.source_path)
         else:
             raise ValueError(f"不支持的源存储类型: {args.source_type}")
         
@@ -341,17 +423,15 @@ if __name__ == "__main__":
             target_path = Path(args.target_path) if args.target_path else None
             target = SQLiteStorage(target_path)
         elif args.target_type in ("postgresql", "mysql"):
-            target = SQLStorage(args.target_path or args.target_path)
+            target = SQLStorage(args.target_path)
         else:
             raise ValueError(f"不支持的目标存储类型: {args.target_type}")
         
-        # 执行迁移
-        migrator = StorageMigrator(source, target)
-        result = await migrator.migrate(args.workflow_ids)
-        
-        # 验证迁移结果
-        verify_result = await migrator.verify(args.workflow_ids)
-        result["verification"] = verify_result
+        # 执行迁移并验证
+        result = await _run_migration(
+            source, target, args.batch_size, args.concurrency, print_progress, args.workflow_ids
+        )
+        verify_result = result["verification"]
         
         # 打印结果
         print(f"\n迁移完成:")
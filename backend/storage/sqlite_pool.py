@@ -0,0 +1,160 @@
+"""
+SQLite 连接池 - 供各个基于 SQLite 的存储共享
+
+- 每个线程复用一个长连接（线程本地），避免每次操作都重新建立连接
+- 启用 WAL 日志模式，读操作不再阻塞写操作
+- 统一设置 synchronous / cache_size / mmap_size 等 PRAGMA
+- 长连接上的预编译语句缓存（cached_statements）可以跨操作复用
+
+用法与普通连接相同：`conn = pool.connection()` 取出连接，用完后 `conn.close()` 归还。
+归还时如果还有未提交的事务会自动回滚，连接本身保持打开。
+"""
+import atexit
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from core.config import settings
+from core.logging_config import logger
+
+
+def connection_pragmas(timeout: float = 30.0) -> List[str]:
+    """新连接需要执行的 PRAGMA（同步连接池和 aiosqlite 连接共用）"""
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+        "PRAGMA temp_store=MEMORY",
+        f"PRAGMA busy_timeout={int(timeout * 1000)}",
+    ]
+
+
+class PooledConnection:
+    """
+    池化连接代理
+
+    close() 不会真正关闭连接，而是归还给连接池；
+    同一线程嵌套取出时共享同一个连接，最外层归还时才回滚未提交的事务。
+    """
+
+    def __init__(self, pool: "SQLitePool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+        self._depth = 0
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        """归还连接"""
+        self._depth = max(0, self._depth - 1)
+        if self._depth == 0 and self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class SQLitePool:
+    """SQLite 线程本地连接池"""
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        isolation_level: Optional[str] = "",
+        timeout: float = 30.0
+    ):
+        """
+        初始化连接池
+
+        Args:
+            db_path: 数据库文件路径
+            isolation_level: 事务隔离级别（None 表示自动提交，由调用方手动管理事务）
+            timeout: 等待数据库锁的超时时间（秒）
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.isolation_level = isolation_level
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建新连接并设置 PRAGMA"""
+        conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=self.timeout,
+            isolation_level=self.isolation_level,
+            check_same_thread=False,
+            cached_statements=settings.SQLITE_CACHED_STATEMENTS
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in connection_pragmas(self.timeout):
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self) -> PooledConnection:
+        """取出当前线程的连接（用完后调用 close() 归还）"""
+        pooled = getattr(self._local, "connection", None)
+        if pooled is None:
+            pooled = PooledConnection(self, self._connect())
+            self._local.connection = pooled
+        pooled._depth += 1
+        return pooled
+
+    def close_all(self):
+        """关闭连接池中的所有连接"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+# 按（数据库文件, 隔离级别）共享的连接池
+_pools: Dict[Tuple[str, Optional[str]], SQLitePool] = {}
+_pools_pid: Optional[int] = None
+_pools_lock = threading.Lock()
+
+
+def get_sqlite_pool(db_path: Union[str, Path], isolation_level: Optional[str] = "") -> SQLitePool:
+    """
+    获取数据库文件对应的连接池（同一文件、同一隔离级别共享一个连接池）
+
+    隔离级别不同的调用方使用各自的连接池（事务管理方式不同，不能共用连接）。
+    连接不能跨进程使用，子进程中会重新创建连接池。
+    """
+    global _pools_pid
+    key = (str(Path(db_path).resolve()), isolation_level)
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SQLitePool(db_path, isolation_level=isolation_level)
+            _pools[key] = pool
+            logger.debug(f"创建SQLite连接池: {key[0]}（isolation_level={isolation_level!r}）")
+        return pool
+
+
+@atexit.register
+def close_all_pools():
+    """关闭所有连接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
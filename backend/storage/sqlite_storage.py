@@ -1,15 +1,41 @@
 """
 SQLite数据库存储后端 - 适合中小型项目
+
+读写通过 aiosqlite 在后台线程执行，不阻塞事件循环；
+建表等初始化操作在构造时通过同步连接池完成。
 """
-import json
+import asyncio
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Set
 from datetime import datetime
-import sqlite3
 
-from storage.base import WorkflowStorage
+import aiosqlite
+
+from storage.base import WorkflowStorage, parse_list_options
 from core.config import settings, PROJECT_ROOT
 from core.logging_config import logger
+from storage.sqlite_pool import get_sqlite_pool, connection_pragmas
+from storage import codec
+
+
+# 插入或更新（已存在时保留创建时间）
+UPSERT_SQL = """
+    INSERT INTO workflows 
+    (workflow_id, name, description, nodes, edges, is_active, created_at, updated_at, type, codec)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(workflow_id) DO UPDATE SET
+        name = excluded.name,
+        description = excluded.description,
+        nodes = excluded.nodes,
+        edges = excluded.edges,
+        codec = excluded.codec,
+        is_active = excluded.is_active,
+        updated_at = excluded.updated_at,
+        type = excluded.type
+"""
+
+# IN 查询每批的参数个数
+IN_QUERY_CHUNK = 500
 
 
 class SQLiteStorage(WorkflowStorage):
@@ -32,6 +58,9 @@ class SQLiteStorage(WorkflowStorage):
         
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path)
+        self._async_connection: Optional[asyncio.Future] = None
+        self._codec = codec.configured_codec()
         
         # 初始化数据库表
         self._init_database()
@@ -39,11 +68,38 @@ class SQLiteStorage(WorkflowStorage):
         logger.info(f"使用SQLite数据库存储后端: {self.db_path}")
     
     def _get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        """获取同步数据库连接（线程本地长连接，close() 时归还连接池）"""
+        return self._pool.connection()
+    
+    async def _open_async_connection(self) -> aiosqlite.Connection:
+        """打开异步连接（自动提交模式，每条语句独立成事务）"""
+        conn = await aiosqlite.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = aiosqlite.Row
+        for pragma in connection_pragmas(30):
+            await conn.execute(pragma)
         return conn
     
+    async def _get_async_connection(self) -> aiosqlite.Connection:
+        """获取共享的异步连接（首次调用时打开）"""
+        if self._async_connection is None:
+            self._async_connection = asyncio.ensure_future(self._open_async_connection())
+        try:
+            return await self._async_connection
+        except Exception:
+            self._async_connection = None
+            raise
+    
+    async def close(self):
+        """关闭异步连接（应用退出时由 close_storage() 调用，否则连接的后台线程会阻止进程退出）"""
+        if self._async_connection is None:
+            return
+        future, self._async_connection = self._async_connection, None
+        try:
+            conn = await future
+        except Exception:
+            return
+        await conn.close()
+    
     def _init_database(self):
         """初始化数据库表"""
         conn = self._get_connection()
@@ -59,10 +115,16 @@ class SQLiteStorage(WorkflowStorage):
                     is_active INTEGER DEFAULT 0,
                     created_at TEXT NOT NULL,
                     updated_at TEXT NOT NULL,
-                    type TEXT DEFAULT 'custom'
+                    type TEXT DEFAULT 'custom',
+                    codec INTEGER NOT NULL DEFAULT 0
                 )
             """)
             
+            # 旧版数据库没有 codec 列：补充后旧数据的编码版本为 0（JSON文本），读取时再重新编码
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(workflows)")}
+            if "codec" not in columns:
+                cursor.execute("ALTER TABLE workflows ADD COLUMN codec INTEGER NOT NULL DEFAULT 0")
+            
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS hidden_workflows (
                     workflow_id TEXT PRIMARY KEY,
@@ -70,168 +132,240 @@ class SQLiteStorage(WorkflowStorage):
                 )
             """)
             
+            # 列表排序和过滤使用的索引
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_workflows_updated_at ON workflows(updated_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_workflows_created_at ON workflows(created_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_workflows_active ON workflows(is_active, updated_at)")
+            
             conn.commit()
         finally:
             conn.close()
     
+    def _workflow_row(self, workflow_id: str, workflow_data: Dict[str, Any], now: str) -> tuple:
+        """工作流数据 -> UPSERT_SQL 的参数（nodes/edges 按配置的编码压缩）"""
+        return (
+            workflow_id,
+            workflow_data.get("name", workflow_id),
+            workflow_data.get("description", ""),
+            codec.encode(workflow_data.get("nodes", []), self._codec),
+            codec.encode(workflow_data.get("edges", []), self._codec),
+            1 if workflow_data.get("is_active", False) else 0,
+            now,
+            now,
+            "custom",
+            self._codec
+        )
+    
+    @staticmethod
+    def _row_to_workflow(row) -> Dict[str, Any]:
+        return {
+            "nodes": codec.decode(row["nodes"], row["codec"]),
+            "edges": codec.decode(row["edges"], row["codec"]),
+            "name": row["name"],
+            "description": row["description"] or "",
+            "is_active": bool(row["is_active"]),
+        }
+    
+    async def _reencode(self, rows: List[Any], workflows: Dict[str, Dict[str, Any]]):
+        """
+        惰性迁移：把编码版本与当前配置不同的行按当前编码写回
+        
+        只更新 nodes/edges/codec，不修改 updated_at；条件中带上原编码版本，避免覆盖并发写入的新数据。
+        """
+        stale = [row for row in rows if row["codec"] != self._codec]
+        if not stale:
+            return
+        params = []
+        for row in stale:
+            workflow = workflows[row["workflow_id"]]
+            params.append((
+                codec.encode(workflow["nodes"], self._codec),
+                codec.encode(workflow["edges"], self._codec),
+                self._codec,
+                row["workflow_id"],
+                row["codec"],
+            ))
+        try:
+            conn = await self._get_async_connection()
+            await conn.executemany(
+                "UPDATE workflows SET nodes = ?, edges = ?, codec = ? WHERE workflow_id = ? AND codec = ?",
+                params
+            )
+            logger.debug(f"已将 {len(params)} 个工作流重新编码为 codec={self._codec}")
+        except Exception as e:
+            # 迁移失败不影响读取，下次读取时再试
+            logger.warning(f"工作流重新编码失败: {e}")
+    
     async def save(self, workflow_id: str, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
         """保存工作流"""
-        nodes = workflow_data.get("nodes", [])
-        edges = workflow_data.get("edges", [])
-        name = workflow_data.get("name", workflow_id)
-        description = workflow_data.get("description", "")
-        is_active = workflow_data.get("is_active", False)
+        conn = await self._get_async_connection()
+        await conn.execute(UPSERT_SQL, self._workflow_row(workflow_id, workflow_data, datetime.now().isoformat()))
         
+        logger.info(f"工作流已保存到SQLite: {workflow_id}")
+        return {
+            "workflow_id": workflow_id,
+            "message": "工作流保存成功"
+        }
+    
+    def _save_many_sync(self, rows: List[tuple]):
+        """在单个事务中批量写入（在线程池中调用）"""
         conn = self._get_connection()
         try:
-            cursor = conn.cursor()
-            
-            # 检查是否已存在
-            cursor.execute("SELECT created_at FROM workflows WHERE workflow_id = ?", (workflow_id,))
-            existing = cursor.fetchone()
-            created_at = existing["created_at"] if existing else datetime.now().isoformat()
-            
-            # 插入或更新
-            cursor.execute("""
-                INSERT OR REPLACE INTO workflows 
-                (workflow_id, name, description, nodes, edges, is_active, created_at, updated_at, type)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                workflow_id,
-                name,
-                description,
-                json.dumps(nodes, ensure_ascii=False),
-                json.dumps(edges, ensure_ascii=False),
-                1 if is_active else 0,
-                created_at,
-                datetime.now().isoformat(),
-                "custom"
-            ))
-            
+            conn.executemany(UPSERT_SQL, rows)
             conn.commit()
-            logger.info(f"工作流已保存到SQLite: {workflow_id}")
-            return {
-                "workflow_id": workflow_id,
-                "message": "工作流保存成功"
-            }
         finally:
             conn.close()
     
+    async def save_many(self, workflows: Dict[str, Dict[str, Any]]) -> int:
+        """批量保存工作流（单个事务，executemany）"""
+        if not workflows:
+            return 0
+        now = datetime.now().isoformat()
+        rows = [self._workflow_row(workflow_id, data, now) for workflow_id, data in workflows.items()]
+        await asyncio.to_thread(self._save_many_sync, rows)
+        logger.info(f"已批量保存 {len(rows)} 个工作流到SQLite")
+        return len(rows)
+    
     async def load(self, workflow_id: str) -> Optional[Dict[str, Any]]:
         """加载工作流"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM workflows WHERE workflow_id = ?", (workflow_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return {
-                    "nodes": json.loads(row["nodes"]),
-                    "edges": json.loads(row["edges"]),
-                    "name": row["name"],
-                    "description": row["description"] or "",
-                    "is_active": bool(row["is_active"]),
-                }
+        conn = await self._get_async_connection()
+        async with conn.execute("SELECT * FROM workflows WHERE workflow_id = ?", (workflow_id,)) as cursor:
+            row = await cursor.fetchone()
+        if not row:
             return None
-        finally:
-            conn.close()
+        workflow = self._row_to_workflow(row)
+        await self._reencode([row], {workflow_id: workflow})
+        return workflow
+    
+    async def _select_in(self, columns: str, workflow_ids: List[str]) -> List[Any]:
+        """按ID分批执行 IN 查询（避免超出SQLite参数个数限制）"""
+        conn = await self._get_async_connection()
+        rows = []
+        for start in range(0, len(workflow_ids), IN_QUERY_CHUNK):
+            chunk = workflow_ids[start:start + IN_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            async with conn.execute(
+                f"SELECT {columns} FROM workflows WHERE workflow_id IN ({placeholders})", chunk
+            ) as cursor:
+                rows.extend(await cursor.fetchall())
+        return rows
+    
+    async def load_many(self, workflow_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量加载工作流（单次 IN 查询）"""
+        rows = await self._select_in("*", list(workflow_ids))
+        workflows = {row["workflow_id"]: self._row_to_workflow(row) for row in rows}
+        await self._reencode(rows, workflows)
+        return workflows
+    
+    async def exists_many(self, workflow_ids: Iterable[str]) -> Set[str]:
+        """批量检查工作流是否存在（只查询主键）"""
+        rows = await self._select_in("workflow_id", list(workflow_ids))
+        return {row["workflow_id"] for row in rows}
     
     async def delete(self, workflow_id: str) -> bool:
         """删除工作流"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM workflows WHERE workflow_id = ?", (workflow_id,))
-            conn.commit()
-            
-            deleted = cursor.rowcount > 0
-            if deleted:
-                logger.info(f"工作流已从SQLite删除: {workflow_id}")
-            return deleted
-        finally:
-            conn.close()
+        conn = await self._get_async_connection()
+        cursor = await conn.execute("DELETE FROM workflows WHERE workflow_id = ?", (workflow_id,))
+        deleted = cursor.rowcount > 0
+        await cursor.close()
+        
+        if deleted:
+            logger.info(f"工作流已从SQLite删除: {workflow_id}")
+        return deleted
     
-    async def list_all(self) -> List[Dict[str, Any]]:
-        """列出所有工作流"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            
-            # 获取隐藏的工作流ID列表
-            cursor.execute("SELECT workflow_id FROM hidden_workflows")
-            hidden_ids = {row["workflow_id"] for row in cursor.fetchall()}
-            
-            # 获取所有工作流（排除隐藏的）
-            cursor.execute("SELECT * FROM workflows")
-            workflows = []
-            
-            for row in cursor.fetchall():
-                workflow_id = row["workflow_id"]
-                if workflow_id not in hidden_ids:
-                    workflows.append({
-                        "workflow_id": workflow_id,
-                        "name": row["name"],
-                        "description": row["description"] or "",
-                        "is_active": bool(row["is_active"]),
-                        "created_at": row["created_at"],
-                        "updated_at": row["updated_at"],
-                        "type": row["type"] or "custom",
-                    })
-            
-            return workflows
-        finally:
-            conn.close()
+    @staticmethod
+    def _list_conditions(filters: Dict[str, Any]):
+        """构建列表查询的 WHERE 子句（排除隐藏的工作流）"""
+        conditions = ["workflow_id NOT IN (SELECT workflow_id FROM hidden_workflows)"]
+        params: List[Any] = []
+        if "is_active" in filters:
+            conditions.append("is_active = ?")
+            params.append(1 if filters["is_active"] else 0)
+        if "type" in filters:
+            conditions.append("COALESCE(type, 'custom') = ?")
+            params.append(filters["type"])
+        if "name" in filters:
+            pattern = str(filters["name"]).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append(f"%{pattern}%")
+        return " AND ".join(conditions), params
+    
+    async def list_all(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """列出工作流摘要（只查询摘要字段，排序和分页在数据库中完成）"""
+        sort_field, descending, filters, fields = parse_list_options(sort, filters, fields)
+        where, params = self._list_conditions(filters)
+        direction = "DESC" if descending else "ASC"
+        query = f"""
+            SELECT {", ".join(fields)} FROM workflows
+            WHERE {where}
+            ORDER BY {sort_field} {direction}, workflow_id {direction}
+            LIMIT ? OFFSET ?
+        """
+        params.extend([-1 if limit is None else limit, offset])
+        
+        conn = await self._get_async_connection()
+        async with conn.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+        
+        workflows = []
+        for row in rows:
+            workflow = dict(row)
+            if "description" in workflow:
+                workflow["description"] = workflow["description"] or ""
+            if "is_active" in workflow:
+                workflow["is_active"] = bool(workflow["is_active"])
+            if "type" in workflow:
+                workflow["type"] = workflow["type"] or "custom"
+            workflows.append(workflow)
+        return workflows
+    
+    async def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """统计满足过滤条件的工作流数量"""
+        _, _, filters, _ = parse_list_options(filters=filters)
+        where, params = self._list_conditions(filters)
+        conn = await self._get_async_connection()
+        async with conn.execute(f"SELECT COUNT(*) FROM workflows WHERE {where}", params) as cursor:
+            row = await cursor.fetchone()
+        return row[0]
     
     async def exists(self, workflow_id: str) -> bool:
         """检查工作流是否存在"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM workflows WHERE workflow_id = ?", (workflow_id,))
-            return cursor.fetchone() is not None
-        finally:
-            conn.close()
+        conn = await self._get_async_connection()
+        async with conn.execute("SELECT 1 FROM workflows WHERE workflow_id = ?", (workflow_id,)) as cursor:
+            return await cursor.fetchone() is not None
     
     async def update_active(self, workflow_id: str, is_active: bool) -> bool:
         """更新工作流激活状态"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE workflows 
-                SET is_active = ?, updated_at = ?
-                WHERE workflow_id = ?
-            """, (1 if is_active else 0, datetime.now().isoformat(), workflow_id))
-            
-            conn.commit()
-            updated = cursor.rowcount > 0
-            if updated:
-                logger.info(f"工作流状态已更新: {workflow_id} -> {'激活' if is_active else '未激活'}")
-            return updated
-        finally:
-            conn.close()
+        conn = await self._get_async_connection()
+        cursor = await conn.execute("""
+            UPDATE workflows 
+            SET is_active = ?, updated_at = ?
+            WHERE workflow_id = ?
+        """, (1 if is_active else 0, datetime.now().isoformat(), workflow_id))
+        updated = cursor.rowcount > 0
+        await cursor.close()
+        
+        if updated:
+            logger.info(f"工作流状态已更新: {workflow_id} -> {'激活' if is_active else '未激活'}")
+        return updated
     
-    def hide_workflow(self, workflow_id: str):
+    async def hide_workflow(self, workflow_id: str):
         """隐藏工作流（用于默认工作流的软删除）"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO hidden_workflows (workflow_id, hidden_at)
-                VALUES (?, ?)
-            """, (workflow_id, datetime.now().isoformat()))
-            conn.commit()
-        finally:
-            conn.close()
+        conn = await self._get_async_connection()
+        await conn.execute("""
+            INSERT OR REPLACE INTO hidden_workflows (workflow_id, hidden_at)
+            VALUES (?, ?)
+        """, (workflow_id, datetime.now().isoformat()))
     
-    def is_hidden(self, workflow_id: str) -> bool:
+    async def is_hidden(self, workflow_id: str) -> bool:
         """检查工作流是否被隐藏"""
-        conn = self._get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM hidden_workflows WHERE workflow_id = ?", (workflow_id,))
-            return cursor.fetchone() is not None
-        finally:
-            conn.close()
-
+        conn = await self._get_async_connection()
+        async with conn.execute("SELECT 1 FROM hidden_workflows WHERE workflow_id = ?", (workflow_id,)) as cursor:
+            return await cursor.fetchone() is not None
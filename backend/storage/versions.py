@@ -0,0 +1,327 @@
+"""
+工作流版本历史 - 每次保存记录一个版本
+
+- 版本内容为 name/description/nodes/edges（激活状态不属于编辑内容，不记录）
+- 每个版本保存与上一版本的结构化增量（按节点/连线ID的新增、修改、删除和顺序变化）
+- 每隔 WORKFLOW_VERSION_SNAPSHOT_INTERVAL 个版本保存一次完整快照，
+  加载任意版本最多读取一个快照和 interval-1 个增量
+- 版本数据按 storage.codec 的配置压缩存储
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import settings, PROJECT_ROOT
+from core.logging_config import logger
+from storage import codec
+from storage.sqlite_pool import get_sqlite_pool
+
+
+# 记录到版本中的字段
+VERSIONED_FIELDS = ("name", "description")
+VERSIONED_LISTS = ("nodes", "edges")
+
+# 内存中缓存的最新版本内容数量（保存时据此计算增量，避免每次从快照重建）
+LATEST_CACHE_SIZE = 128
+
+
+def _item_key(item: Any) -> str:
+    """节点/连线的标识：有 id 时用 id，否则用内容本身"""
+    if isinstance(item, dict) and "id" in item:
+        return str(item["id"])
+    return json.dumps(item, ensure_ascii=False, sort_keys=True)
+
+
+def diff_items(old: List[Any], new: List[Any]) -> Dict[str, Any]:
+    """
+    计算节点/连线列表的增量
+
+    Returns:
+        {"remove": [key], "upsert": [item], "order": [key]}，只包含有变化的部分；
+        列表中有重复标识时无法按标识对比，返回 {"replace": new}
+    """
+    old_keys = [_item_key(item) for item in old]
+    new_keys = [_item_key(item) for item in new]
+    if len(set(old_keys)) != len(old_keys) or len(set(new_keys)) != len(new_keys):
+        return {} if old == new else {"replace": new}
+
+    old_map = dict(zip(old_keys, old))
+    new_map = dict(zip(new_keys, new))
+    patch: Dict[str, Any] = {}
+
+    remove = [key for key in old_keys if key not in new_map]
+    if remove:
+        patch["remove"] = remove
+    upsert = [item for key, item in zip(new_keys, new) if key not in old_map or old_map[key] != item]
+    if upsert:
+        patch["upsert"] = upsert
+    # 应用删除和新增后的默认顺序：保留的项按原顺序，新增的项追加在末尾
+    if [key for key in old_keys if key in new_map] + [key for key in new_keys if key not in old_map] != new_keys:
+        patch["order"] = new_keys
+    return patch
+
+
+def apply_items(old: List[Any], patch: Dict[str, Any]) -> List[Any]:
+    """将 diff_items 的增量应用到列表"""
+    if "replace" in patch:
+        return patch["replace"]
+    items = OrderedDict((_item_key(item), item) for item in old)
+    for key in patch.get("remove", []):
+        items.pop(key, None)
+    for item in patch.get("upsert", []):
+        items[_item_key(item)] = item
+    if "order" in patch:
+        return [items[key] for key in patch["order"]]
+    return list(items.values())
+
+
+def diff_workflow(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """计算两个版本内容之间的增量（无变化时返回空字典）"""
+    delta: Dict[str, Any] = {}
+    fields = {field: new.get(field) for field in VERSIONED_FIELDS if old.get(field) != new.get(field)}
+    if fields:
+        delta["fields"] = fields
+    for name in VERSIONED_LISTS:
+        patch = diff_items(old.get(name) or [], new.get(name) or [])
+        if patch:
+            delta[name] = patch
+    return delta
+
+
+def apply_delta(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """将 diff_workflow 的增量应用到版本内容"""
+    result = {**base, **delta.get("fields", {})}
+    for name in VERSIONED_LISTS:
+        if name in delta:
+            result[name] = apply_items(base.get(name) or [], delta[name])
+    return result
+
+
+def version_content(workflow_data: Dict[str, Any], workflow_id: str) -> Dict[str, Any]:
+    """从保存的工作流数据中提取版本内容"""
+    return {
+        "name": workflow_data.get("name", workflow_id),
+        "description": workflow_data.get("description", ""),
+        "nodes": workflow_data.get("nodes", []),
+        "edges": workflow_data.get("edges", []),
+    }
+
+
+class WorkflowVersionStore:
+    """工作流版本存储（SQLite）"""
+
+    def __init__(self, db_path: Optional[Path] = None, snapshot_interval: Optional[int] = None):
+        """
+        初始化版本存储
+
+        Args:
+            db_path: 数据库文件路径，默认使用 data/workflow_versions.db
+            snapshot_interval: 每隔多少个版本保存一次完整快照
+        """
+        if db_path is None:
+            db_path = settings.WORKFLOW_VERSIONS_PATH or PROJECT_ROOT / "data" / "workflow_versions.db"
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.snapshot_interval = max(1, snapshot_interval or settings.WORKFLOW_VERSION_SNAPSHOT_INTERVAL)
+        self._codec = codec.configured_codec()
+        self._pool = get_sqlite_pool(self.db_path)
+        # workflow_id -> (最新版本号, 最新版本内容)
+        self._latest: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        # record/delete_workflow 在线程池中并发执行，访问 _latest 时加锁
+        self._latest_lock = threading.Lock()
+        self._init_database()
+
+    def _get_connection(self):
+        """获取数据库连接（线程本地长连接，close() 时归还连接池）"""
+        return self._pool.connection()
+
+    def _init_database(self):
+        """初始化数据库表"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workflow_versions (
+                    workflow_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    base_version INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    codec INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL,
+                    message TEXT,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (workflow_id, version)
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ========== 读取 ==========
+
+    def _reconstruct(self, conn, workflow_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """从所在快照开始依次应用增量，重建指定版本的内容"""
+        row = conn.execute(
+            "SELECT base_version FROM workflow_versions WHERE workflow_id = ? AND version = ?",
+            (workflow_id, version)
+        ).fetchone()
+        if not row:
+            return None
+        rows = conn.execute("""
+            SELECT kind, payload, codec FROM workflow_versions
+            WHERE workflow_id = ? AND version >= ? AND version <= ?
+            ORDER BY version
+        """, (workflow_id, row["base_version"], version)).fetchall()
+
+        content: Dict[str, Any] = {}
+        for item in rows:
+            data = codec.decode(item["payload"], item["codec"])
+            content = data if item["kind"] == "snapshot" else apply_delta(content, data)
+        return content
+
+    def _latest_version(self, conn, workflow_id: str) -> Optional[Tuple[int, int]]:
+        """最新版本的 (版本号, 所在快照版本号)"""
+        row = conn.execute("""
+            SELECT version, base_version FROM workflow_versions
+            WHERE workflow_id = ? ORDER BY version DESC LIMIT 1
+        """, (workflow_id,)).fetchone()
+        return (row["version"], row["base_version"]) if row else None
+
+    def latest_version(self, workflow_id: str) -> Optional[int]:
+        """最新版本号（没有版本时返回 None）"""
+        conn = self._get_connection()
+        try:
+            latest = self._latest_version(conn, workflow_id)
+            return latest[0] if latest else None
+        finally:
+            conn.close()
+
+    def load_version(self, workflow_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """加载指定版本的内容（name/description/nodes/edges）"""
+        conn = self._get_connection()
+        try:
+            return self._reconstruct(conn, workflow_id, version)
+        finally:
+            conn.close()
+
+    def list_versions(self, workflow_id: str, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出版本（新版本在前，不含内容）"""
+        conn = self._get_connection()
+        try:
+            rows = conn.execute("""
+                SELECT version, kind, size, message, created_at FROM workflow_versions
+                WHERE workflow_id = ? ORDER BY version DESC LIMIT ? OFFSET ?
+            """, (workflow_id, limit, offset)).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def count_versions(self, workflow_id: str) -> int:
+        """版本数量"""
+        conn = self._get_connection()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM workflow_versions WHERE workflow_id = ?", (workflow_id,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    # ========== 写入 ==========
+
+    def _cached_latest(self, workflow_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        with self._latest_lock:
+            return self._latest.get(workflow_id)
+
+    def _cache_latest(self, workflow_id: str, version: int, content: Dict[str, Any]):
+        with self._latest_lock:
+            self._latest[workflow_id] = (version, content)
+            self._latest.move_to_end(workflow_id)
+            while len(self._latest) > LATEST_CACHE_SIZE:
+                self._latest.popitem(last=False)
+
+    def record(self, workflow_id: str, workflow_data: Dict[str, Any],
+               message: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        记录一次保存
+
+        与上一版本内容相同时不产生新版本，返回 None；
+        否则返回 {"version", "kind", "size"}
+        """
+        # 经过一次序列化：与从数据库重建的内容一致，缓存也不受调用方后续修改影响
+        content = json.loads(json.dumps(version_content(workflow_data, workflow_id), ensure_ascii=False))
+        conn = self._get_connection()
+        try:
+            # 写锁：同一工作流并发保存时版本号不冲突
+            conn.execute("BEGIN IMMEDIATE")
+            latest = self._latest_version(conn, workflow_id)
+            if latest is None:
+                version, kind, base_version, data = 1, "snapshot", 1, content
+            else:
+                previous_version, base_version = latest
+                cached = self._cached_latest(workflow_id)
+                if cached and cached[0] == previous_version:
+                    previous = cached[1]
+                else:
+                    previous = self._reconstruct(conn, workflow_id, previous_version)
+                delta = diff_workflow(previous, content)
+                if not delta:
+                    conn.rollback()
+                    self._cache_latest(workflow_id, previous_version, previous)
+                    return None
+                version = previous_version + 1
+                kind, data = "delta", delta
+                if version - base_version >= self.snapshot_interval:
+                    kind, base_version, data = "snapshot", version, content
+
+            payload = codec.encode(data, self._codec)
+            if kind == "delta":
+                # 增量比快照还大时（如大部分节点都变了）直接保存快照
+                snapshot = codec.encode(content, self._codec)
+                if len(snapshot) <= len(payload):
+                    kind, base_version, payload = "snapshot", version, snapshot
+
+            conn.execute("""
+                INSERT INTO workflow_versions
+                (workflow_id, version, kind, base_version, payload, codec, size, message, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                workflow_id, version, kind, base_version, payload, self._codec,
+                len(payload), message, datetime.now().isoformat()
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._cache_latest(workflow_id, version, content)
+        logger.debug(f"工作流版本已记录: {workflow_id} v{version} ({kind}, {len(payload)} 字节)")
+        return {"version": version, "kind": kind, "size": len(payload)}
+
+    def delete_workflow(self, workflow_id: str):
+        """删除工作流的全部版本"""
+        with self._latest_lock:
+            self._latest.pop(workflow_id, None)
+        conn = self._get_connection()
+        try:
+            conn.execute("DELETE FROM workflow_versions WHERE workflow_id = ?", (workflow_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# 全局版本存储实例
+_version_store: Optional[WorkflowVersionStore] = None
+
+
+def get_version_store() -> Optional[WorkflowVersionStore]:
+    """获取版本存储实例（未启用版本历史时返回 None）"""
+    global _version_store
+    if not settings.WORKFLOW_VERSIONS_ENABLED:
+        return None
+    if _version_store is None:
+        _version_store = WorkflowVersionStore()
+        logger.info(f"工作流版本存储: {_version_store.db_path}")
+    return _version_store
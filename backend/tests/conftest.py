@@ -0,0 +1,9 @@
+"""
+测试配置 - 把 backend 目录加入导入路径（与 main.py 的运行方式一致）
+"""
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
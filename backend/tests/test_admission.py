@@ -0,0 +1,211 @@
+"""
+LLM调用准入控制测试 - 并发上限、优先级、队列满拒绝和让位、排队超时、取消
+"""
+import asyncio
+import json
+
+import pytest
+
+from ai_integration.admission import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController, LLMOverloadedError, llm_priority
+)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def error_type(error: LLMOverloadedError) -> str:
+    return json.loads(error.detail)["error_type"]
+
+
+async def hold(controller: AdmissionController, release: asyncio.Event, priority=None):
+    async with controller.slot(priority):
+        await release.wait()
+
+
+async def settle():
+    """让已创建的任务运行到各自的等待点"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_is_capped():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=2, max_queue=10, queue_timeout=None)
+        running, peak = 0, 0
+
+        async def call():
+            nonlocal running, peak
+            async with controller.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak, controller.stats()
+
+    peak, stats = run(scenario())
+    assert peak == 2
+    assert stats["admitted"] == 6
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_interactive_waiters_go_before_batch():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=10, queue_timeout=None)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        await settle()
+
+        order = []
+
+        async def call(name, priority):
+            async with controller.slot(priority):
+                order.append(name)
+
+        waiters = [
+            asyncio.create_task(call("batch-1", PRIORITY_BATCH)),
+            asyncio.create_task(call("batch-2", PRIORITY_BATCH)),
+        ]
+        await settle()
+        waiters.append(asyncio.create_task(call("interactive", PRIORITY_INTERACTIVE)))
+        await settle()
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return order
+
+    assert run(scenario()) == ["interactive", "batch-1", "batch-2"]
+
+
+def test_priority_defaults_to_context():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=10, queue_timeout=None)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        await settle()
+
+        order = []
+
+        async def call(name):
+            async with controller.slot():
+                order.append(name)
+
+        with llm_priority(PRIORITY_BATCH):
+            batch = asyncio.create_task(call("batch"))
+        await settle()
+        interactive = asyncio.create_task(call("interactive"))
+        await settle()
+        release.set()
+        await asyncio.gather(holder, batch, interactive)
+        return order
+
+    assert run(scenario()) == ["interactive", "batch"]
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=1, queue_timeout=None)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        queued = asyncio.create_task(hold(controller, release))
+        await settle()
+
+        with pytest.raises(LLMOverloadedError) as rejected:
+            async with controller.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, queued)
+        return rejected.value, controller.stats()
+
+    error, stats = run(scenario())
+    assert error.status_code == 429
+    assert error_type(error) == "QUEUE_FULL"
+    assert "Retry-After" in error.headers
+    assert stats["rejected"] == 1 and stats["admitted"] == 2
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_full_queue_sheds_lower_priority_waiter():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=1, queue_timeout=None)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        await settle()
+        batch = asyncio.create_task(hold(controller, release, PRIORITY_BATCH))
+        await settle()
+        interactive = asyncio.create_task(hold(controller, release, PRIORITY_INTERACTIVE))
+        await settle()
+        release.set()
+        results = await asyncio.gather(holder, batch, interactive, return_exceptions=True)
+        return results, controller.stats()
+
+    (_, batch, interactive), stats = run(scenario())
+    assert isinstance(batch, LLMOverloadedError) and error_type(batch) == "QUEUE_FULL"
+    assert interactive is None
+    assert stats["rejected"] == 1
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_queue_timeout():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=10, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        await settle()
+        with pytest.raises(LLMOverloadedError) as timed_out:
+            async with controller.slot():
+                pass
+        release.set()
+        await holder
+        return timed_out.value, controller.stats()
+
+    error, stats = run(scenario())
+    assert error_type(error) == "QUEUE_TIMEOUT"
+    assert stats["timeouts"] == 1
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=10, queue_timeout=None)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        await settle()
+        cancelled = asyncio.create_task(hold(controller, release))
+        await settle()
+        cancelled.cancel()
+        await settle()
+        release.set()
+        await holder
+        # 名额已归还，之后的调用可以直接进入
+        async with controller.slot():
+            pass
+        return cancelled.cancelled(), controller.stats()
+
+    cancelled, stats = run(scenario())
+    assert cancelled
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_waiter_cancelled_after_being_granted_hands_slot_on():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=10, queue_timeout=None)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(controller, release))
+        await settle()
+        granted = asyncio.create_task(hold(controller, asyncio.Event()))
+        await settle()
+        later = asyncio.create_task(hold(controller, release))
+        await settle()
+        release.set()
+        await holder
+        # 名额已转交给 granted，但它还没来得及运行就被取消：名额应继续转交给 later
+        granted.cancel()
+        await asyncio.wait_for(later, 1)
+        return granted.cancelled(), controller.stats()
+
+    cancelled, stats = run(scenario())
+    assert cancelled
+    assert stats["active"] == 0 and stats["queued"] == 0
@@ -0,0 +1,147 @@
+"""
+存储缓存包装器测试 - 命中、写入失效、读写并发时不缓存过期数据、多进程版本文件
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from storage.base import WorkflowStorage
+from storage.cached import CachedStorage
+
+
+class CountingStorage(WorkflowStorage):
+    """测试用的内存存储后端（记录读取次数，可以让读取停在中途）"""
+
+    def __init__(self):
+        self.workflows: Dict[str, Dict[str, Any]] = {}
+        self.loads = 0
+        self.gate: Optional[asyncio.Event] = None
+        self.reading = asyncio.Event()
+
+    async def _read(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        self.loads += 1
+        workflow = self.workflows.get(workflow_id)
+        snapshot = dict(workflow) if workflow is not None else None
+        if self.gate is not None:
+            # 先读出旧数据，再等待测试放行（模拟读取期间发生写入）
+            self.reading.set()
+            await self.gate.wait()
+        return snapshot
+
+    async def save(self, workflow_id: str, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.workflows[workflow_id] = dict(workflow_data)
+        return workflow_data
+
+    async def load(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read(workflow_id)
+
+    async def load_many(self, workflow_ids) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for workflow_id in workflow_ids:
+            workflow = await self._read(workflow_id)
+            if workflow is not None:
+                result[workflow_id] = workflow
+        return result
+
+    async def delete(self, workflow_id: str) -> bool:
+        return self.workflows.pop(workflow_id, None) is not None
+
+    async def list_all(self, offset=0, limit=None, sort=None, filters=None, fields=None) -> List[Dict[str, Any]]:
+        return [{"id": workflow_id} for workflow_id in self.workflows]
+
+    async def exists(self, workflow_id: str) -> bool:
+        return workflow_id in self.workflows
+
+    async def update_active(self, workflow_id: str, is_active: bool) -> bool:
+        self.workflows[workflow_id]["is_active"] = is_active
+        return True
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_load_hits_cache_and_returns_copies():
+    async def scenario():
+        backend = CountingStorage()
+        storage = CachedStorage(backend)
+        await storage.save("wf", {"name": "a"})
+        first = await storage.load("wf")
+        first["name"] = "changed"
+        second = await storage.load("wf")
+        return backend.loads, second, storage.stats()
+
+    loads, second, stats = run(scenario())
+    assert loads == 1
+    assert second == {"name": "a"}
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_save_and_delete_invalidate():
+    async def scenario():
+        storage = CachedStorage(CountingStorage())
+        await storage.save("wf", {"name": "a"})
+        await storage.load("wf")
+        assert await storage.count() == 1
+        await storage.save("wf", {"name": "b"})
+        after_save = await storage.load("wf")
+        await storage.delete("wf")
+        return after_save, await storage.load("wf"), await storage.count()
+
+    after_save, after_delete, count = run(scenario())
+    assert after_save == {"name": "b"}
+    assert after_delete is None
+    assert count == 0
+
+
+def test_write_during_load_is_not_cached_stale():
+    async def scenario():
+        backend = CountingStorage()
+        storage = CachedStorage(backend)
+        await storage.save("wf", {"name": "old"})
+
+        backend.gate = asyncio.Event()
+        reader = asyncio.create_task(storage.load("wf"))
+        await backend.reading.wait()
+        await storage.save("wf", {"name": "new"})
+        backend.gate.set()
+        backend.gate = None
+        stale = await reader
+        return stale, await storage.load("wf")
+
+    stale, fresh = run(scenario())
+    # 读取开始于写入之前，本次返回旧数据可以接受，但不能把旧数据放进缓存
+    assert stale == {"name": "old"}
+    assert fresh == {"name": "new"}
+
+
+def test_write_during_load_many_is_not_cached_stale():
+    async def scenario():
+        backend = CountingStorage()
+        storage = CachedStorage(backend)
+        await storage.save_many({"a": {"v": 1}, "b": {"v": 1}})
+
+        backend.gate = asyncio.Event()
+        reader = asyncio.create_task(storage.load_many(["a", "b"]))
+        await backend.reading.wait()
+        await storage.delete("a")
+        backend.gate.set()
+        backend.gate = None
+        await reader
+        return await storage.load_many(["a", "b"])
+
+    assert run(scenario()) == {"b": {"v": 1}}
+
+
+def test_version_file_invalidates_other_instances(tmp_path):
+    async def scenario():
+        backend = CountingStorage()
+        version_file = tmp_path / "storage.version"
+        reader = CachedStorage(backend, version_file=version_file)
+        writer = CachedStorage(backend, version_file=version_file)
+        await writer.save("wf", {"name": "a"})
+        assert await reader.load("wf") == {"name": "a"}
+        # 另一个实例（进程）写入后更新版本文件
+        await writer.save("wf", {"name": "b"})
+        return await reader.load("wf")
+
+    assert run(scenario()) == {"name": "b"}
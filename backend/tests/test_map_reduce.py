@@ -0,0 +1,123 @@
+"""
+分块分析测试 - 分块、并发执行和结果合并
+"""
+import asyncio
+import copy
+
+import pytest
+
+from ai_integration.map_reduce import estimate_tokens, map_concurrent, merge_results, split_chunks
+
+
+def test_split_chunks_respects_budget_and_order():
+    items = [{"id": i, "text": "x" * 40} for i in range(20)]
+    budget = estimate_tokens(items[0]) * 3
+    chunks = split_chunks(items, budget)
+    assert [item for chunk in chunks for item in chunk] == items
+    assert all(sum(estimate_tokens(item) for item in chunk) <= budget for chunk in chunks)
+    assert split_chunks(items, budget) == chunks
+
+
+def test_split_chunks_oversized_item_gets_its_own_chunk():
+    items = [{"id": 1}, {"id": 2, "text": "x" * 400}, {"id": 3}]
+    assert split_chunks(items, 20) == [[items[0]], [items[1]], [items[2]]]
+    assert split_chunks([], 20) == []
+
+
+def test_map_concurrent_keeps_order_and_limits_concurrency():
+    async def scenario():
+        from ai_integration.admission import get_admission
+        limit = get_admission("map_reduce_test").max_concurrency
+        running, peak = 0, 0
+
+        async def analyze(index, chunk):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            # 后面的块先完成，结果仍按输入顺序返回
+            await asyncio.sleep(0.01 * (10 - index))
+            running -= 1
+            return index, sum(chunk)
+
+        results = await map_concurrent([[i, i] for i in range(10)], analyze, "map_reduce_test")
+        return results, peak, limit
+
+    results, peak, limit = asyncio.run(scenario())
+    assert results == [(i, 2 * i) for i in range(10)]
+    assert peak <= limit
+
+
+def test_map_concurrent_cancels_remaining_chunks_on_failure():
+    async def scenario():
+        finished = []
+
+        async def analyze(index, chunk):
+            if index == 0:
+                raise ValueError("bad chunk")
+            await asyncio.sleep(1)
+            finished.append(index)
+
+        with pytest.raises(ValueError):
+            await map_concurrent([[0], [1], [2]], analyze, "map_reduce_test")
+        await asyncio.sleep(0)
+        return finished
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_merge_results_combines_fields_by_identity():
+    results = [
+        {
+            "description": "第一块的描述",
+            "fields": [
+                {"name": "level", "type": "integer", "min": 1, "max": 10, "values": [1, 2]},
+                {"name": "kind", "type": "enum", "values": ["sword"]},
+            ],
+            "required_fields": ["level", "kind"],
+        },
+        {
+            "description": "第二块的描述",
+            "fields": [
+                {"name": "kind", "type": "enum", "values": ["bow", "sword"]},
+                {"name": "level", "type": "integer", "min": 0, "max": 5, "values": [2, 3]},
+                {"name": "weight", "type": "number"},
+            ],
+            "required_fields": ["level", "weight"],
+            "optional_fields": ["note"],
+        },
+    ]
+    merged = merge_results(results)
+
+    assert merged["description"] == "第一块的描述"
+    assert [field["name"] for field in merged["fields"]] == ["level", "kind", "weight"]
+    level, kind, _ = merged["fields"]
+    assert (level["min"], level["max"]) == (0, 10)
+    assert level["values"] == [1, 2, 3]
+    assert kind["values"] == ["sword", "bow"]
+    # 只在部分块中必填的字段降为可选
+    assert merged["required_fields"] == ["level"]
+    assert merged["optional_fields"] == ["note", "kind", "weight"]
+
+
+def test_merge_results_is_deterministic_and_does_not_mutate_inputs():
+    results = [
+        {"enums": {"quality": ["common"]}, "tags": ["a"]},
+        {},
+        {"enums": {"quality": ["rare", "common"]}, "tags": ["b", "a"], "extra": {"k": 1}},
+    ]
+    snapshot = copy.deepcopy(results)
+    first = merge_results(results)
+    second = merge_results(results)
+    assert first == second == {
+        "enums": {"quality": ["common", "rare"]},
+        "tags": ["a", "b"],
+        "extra": {"k": 1},
+    }
+    assert results == snapshot
+
+
+def test_merge_results_edge_cases():
+    assert merge_results([]) is None
+    assert merge_results([None, {"a": 1}]) == {"a": 1}
+    # 布尔值不按 min/max 规则取最值
+    assert merge_results([{"min": True}, {"min": False}]) == {"min": True}
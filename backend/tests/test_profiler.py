@@ -0,0 +1,76 @@
+"""
+数据统计分析器测试 - 字段类型、必填/可选、条件字段
+"""
+from schema_learner.profiler import DataProfiler
+
+
+def profile_records(records):
+    collections = DataProfiler(enum_max_values=5, enum_max_ratio=0.5).profile(records)["collections"]
+    return collections[0]
+
+
+def test_field_types():
+    records = [
+        {"level": str(i % 3), "rarity": ["common", "rare"][i % 2], "flag": ["true", "false"][i % 2],
+         "weight": 0.5 + i, "name": f"item_{i}"}
+        for i in range(10)
+    ]
+    fields = profile_records(records)["fields"]
+    assert fields["rarity"]["type"] == "enum"
+    assert fields["rarity"]["values"] == {"common": 5, "rare": 5}
+    assert fields["flag"]["type"] == "boolean"
+    assert fields["weight"]["type"] == "number" and not fields["weight"]["integer"]
+    assert fields["weight"]["min"] == 0.5 and fields["weight"]["max"] == 9.5
+    assert fields["level"]["type"] == "number" and fields["level"]["integer"]
+    assert fields["name"]["type"] == "string" and fields["name"]["unique"]
+
+
+def test_integer_with_missing_values_stays_integer():
+    records = [{"id": i, "count": i} for i in range(4)] + [{"id": 4}]
+    stats = profile_records(records)["fields"]["count"]
+    # pandas 把含缺失值的整数列转成浮点数，取值仍按整数输出
+    assert stats["type"] == "number" and stats["integer"]
+    assert stats["values"] == {"0": 1, "1": 1, "2": 1, "3": 1}
+    assert stats["count"] == 4 and not stats["required"]
+
+
+def test_required_and_optional():
+    collection = profile_records([{"id": 1, "note": "a"}, {"id": 2}, {"id": 3, "note": "b"}])
+    assert collection["record_count"] == 3
+    assert collection["fields"]["id"]["required"]
+    assert not collection["fields"]["note"]["required"]
+
+
+def test_conditional_fields():
+    records = [
+        {"kind": "weapon", "damage": 5},
+        {"kind": "weapon", "damage": 7},
+        {"kind": "armor", "defense": 3},
+        {"kind": "armor", "defense": 4},
+        {"kind": "food"},
+        {"kind": "food"},
+    ]
+    conditional = profile_records(records)["conditional"]
+    assert {"fields": ["damage"], "when": {"field": "kind", "values": ["weapon"]}} in conditional
+    assert {"fields": ["defense"], "when": {"field": "kind", "values": ["armor"]}} in conditional
+
+
+def test_field_present_without_condition_value_is_not_conditional():
+    records = [
+        {"kind": "weapon", "damage": 5},
+        {"kind": "weapon", "damage": 7},
+        {"kind": "armor"},
+        {"kind": "armor"},
+        # 条件字段缺失的记录中也出现了 damage
+        {"damage": 1},
+    ]
+    assert profile_records(records)["conditional"] == []
+
+
+def test_empty_records_are_counted():
+    # 第一条记录只包含嵌套对象列表，展开后为空
+    collections = DataProfiler().profile([{"a": [{"x": 1}]}, {"a": "scalar"}])["collections"]
+    root = next(collection for collection in collections if collection["path"] == "")
+    assert root["record_count"] == 2
+    assert root["fields"]["a"]["count"] == 1
+    assert not root["fields"]["a"]["required"]
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+工作流存储基准测试 - 比较各存储后端的吞吐量和延迟
+
+生成指定节点数和负载大小的合成工作流，在不同并发数下依次测量
+save / load / list / update_active / delete 的吞吐量和 p50/p99 延迟，结果以JSON输出，
+便于在不同提交之间对比：
+
+    python tools/benchmark_storage.py --workflows 500 --nodes 50 --concurrency 1,8,32 -o bench.json
+
+PostgreSQL 只在可以连接时测量（--database-url 或环境变量 BENCHMARK_POSTGRES_URL），否则记录跳过原因。
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# 添加后端目录到路径（后端模块使用 storage.xxx / core.xxx 形式导入）
+backend_root = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_root))
+
+import asyncio
+from storage.base import WorkflowStorage
+from core.logging_config import logger
+
+
+BACKENDS = ("memory", "json", "sqlite", "postgresql")
+
+# list 操作每页条数
+LIST_PAGE_SIZE = 50
+
+
+def generate_workflow(rng: random.Random, index: int, nodes: int, payload_bytes: int) -> Dict[str, Any]:
+    """生成合成工作流：链式节点，每个节点带指定大小的配置负载"""
+    node_list = [
+        {
+            "id": f"node_{i}",
+            "type": rng.choice(["parse", "transform", "validate", "export"]),
+            "position": {"x": i * 120, "y": rng.randint(0, 600)},
+            "data": {"label": f"步骤 {i}", "config": "".join(rng.choices("abcdefghij", k=payload_bytes))},
+        }
+        for i in range(nodes)
+    ]
+    edges = [
+        {"id": f"edge_{i}", "source": f"node_{i}", "target": f"node_{i + 1}"}
+        for i in range(nodes - 1)
+    ]
+    return {
+        "name": f"基准工作流 {index}",
+        "description": "storage benchmark",
+        "nodes": node_list,
+        "edges": edges,
+        "is_active": False,
+    }
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """最近秩百分位数"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(0, min(len(values), rank) - 1)]
+
+
+async def measure(
+    operation: str,
+    calls: List[Callable[[], Awaitable[Any]]],
+    concurrency: int,
+    finish: Optional[Callable[[], Awaitable[Any]]] = None
+) -> Dict[str, Any]:
+    """
+    以指定并发数执行一组调用，统计吞吐量和延迟
+
+    finish 在全部调用完成后执行（如写缓冲的 flush），计入总耗时但不计入单次延迟。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def run(call):
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(call) for call in calls))
+    if finish is not None:
+        await finish()
+    seconds = time.perf_counter() - started
+
+    return {
+        "operation": operation,
+        "ops": len(calls),
+        "seconds": round(seconds, 4),
+        "throughput": round(len(calls) / seconds, 1) if seconds > 0 else None,
+        "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 3) if latencies else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+    }
+
+
+def create_backend(backend: str, work_dir: Path, database_url: Optional[str]) -> WorkflowStorage:
+    """创建存储后端（文件类后端使用临时目录；PostgreSQL 使用指定的数据库，基准数据在测试中删除）"""
+    if backend == "memory":
+        from storage.memory import MemoryStorage
+        return MemoryStorage()
+    if backend == "json":
+        from storage.json_storage import JSONStorage
+        return JSONStorage(work_dir / "workflows.json")
+    if backend == "sqlite":
+        from storage.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(work_dir / "workflows.db")
+    if backend == "postgresql":
+        from storage.sql_storage import SQLStorage
+        return SQLStorage(database_url)
+    raise ValueError(f"不支持的存储后端: {backend}（可选: {', '.join(BACKENDS)}）")
+
+
+async def check_postgresql(database_url: Optional[str]) -> Optional[str]:
+    """检查 PostgreSQL 是否可用，不可用时返回原因"""
+    if not database_url:
+        return "未指定 --database-url 或 BENCHMARK_POSTGRES_URL"
+    if not database_url.startswith("postgresql"):
+        return f"不是PostgreSQL连接URL: {database_url.split('@')[-1]}"
+    try:
+        from storage.sql_storage import SQLStorage
+        storage = SQLStorage(database_url)
+        try:
+            await asyncio.wait_for(storage.count(), timeout=5)
+        finally:
+            await storage.close()
+    except Exception as e:
+        return f"无法连接: {e}"
+    return None
+
+
+async def benchmark_backend(
+    backend: str,
+    workflows: Dict[str, Dict[str, Any]],
+    concurrency: int,
+    database_url: Optional[str]
+) -> List[Dict[str, Any]]:
+    """在一个全新的后端实例上依次测量各操作"""
+    with tempfile.TemporaryDirectory(prefix=f"bench_{backend}_") as work_dir:
+        storage = create_backend(backend, Path(work_dir), database_url)
+        workflow_ids = list(workflows)
+        try:
+            # PostgreSQL 使用共享数据库，先清理上次中断时残留的数据
+            existing = await storage.exists_many(workflow_ids)
+            for workflow_id in existing:
+                await storage.delete(workflow_id)
+            await storage.flush()
+
+            results = [
+                await measure("save", [
+                    lambda workflow_id=workflow_id: storage.save(workflow_id, workflows[workflow_id])
+                    for workflow_id in workflow_ids
+                ], concurrency, storage.flush),
+                await measure("load", [
+                    lambda workflow_id=workflow_id: storage.load(workflow_id)
+                    for workflow_id in workflow_ids
+                ], concurrency),
+                await measure("list", [
+                    lambda offset=offset: storage.list_all(offset=offset, limit=LIST_PAGE_SIZE, sort="-updated_at")
+                    for offset in range(0, len(workflow_ids), LIST_PAGE_SIZE)
+                ], concurrency),
+                await measure("update_active", [
+                    lambda workflow_id=workflow_id: storage.update_active(workflow_id, True)
+                    for workflow_id in workflow_ids
+                ], concurrency, storage.flush),
+                await measure("delete", [
+                    lambda workflow_id=workflow_id: storage.delete(workflow_id)
+                    for workflow_id in workflow_ids
+                ], concurrency, storage.flush),
+            ]
+        finally:
+            await storage.close()
+
+    for result in results:
+        result.update(backend=backend, concurrency=concurrency)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """当前提交（用于对比不同提交的结果）"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=backend_root,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    """执行基准测试，返回结果（JSON可序列化）"""
+    rng = random.Random(args.seed)
+    workflows = {
+        f"bench_{i:06d}": generate_workflow(rng, i, args.nodes, args.payload_bytes)
+        for i in range(args.workflows)
+    }
+    workflow_bytes = sum(len(json.dumps(workflow, ensure_ascii=False).encode("utf-8")) for workflow in workflows.values())
+
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    concurrency_levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    skipped = {}
+    if "postgresql" in backends:
+        reason = await check_postgresql(args.database_url)
+        if reason:
+            skipped["postgresql"] = reason
+            backends.remove("postgresql")
+            print(f"跳过 postgresql: {reason}", file=sys.stderr)
+
+    results = []
+    for backend in backends:
+        for concurrency in concurrency_levels:
+            print(f"测试 {backend}（并发 {concurrency}）...", file=sys.stderr)
+            results.extend(await benchmark_backend(backend, workflows, concurrency, args.database_url))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "workflows": args.workflows,
+            "nodes": args.nodes,
+            "payload_bytes": args.payload_bytes,
+            "avg_workflow_bytes": workflow_bytes // max(1, args.workflows),
+            "concurrency": concurrency_levels,
+            "seed": args.seed,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="工作流存储基准测试")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help=f"测试的存储后端，逗号分隔（默认 {','.join(BACKENDS)}）")
+    parser.add_argument("--workflows", type=int, default=200, help="工作流数量（默认 200）")
+    parser.add_argument("--nodes", type=int, default=20, help="每个工作流的节点数（默认 20）")
+    parser.add_argument("--payload-bytes", type=int, default=256, help="每个节点配置负载的字节数（默认 256）")
+    parser.add_argument("--concurrency", default="1,8,32", help="并发数，逗号分隔（默认 1,8,32）")
+    parser.add_argument("--database-url", default=os.environ.get("BENCHMARK_POSTGRES_URL"),
+                        help="PostgreSQL连接URL（默认读取环境变量 BENCHMARK_POSTGRES_URL）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子（默认 42）")
+    parser.add_argument("-o", "--output", help="结果JSON文件路径（默认输出到标准输出）")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="测试期间的日志级别（默认 WARNING，避免逐条操作日志影响测量）")
+    args = parser.parse_args()
+    logger.setLevel(getattr(logging, args.log_level.upper()))
+    # 控制台日志改为输出到标准错误，标准输出只包含结果JSON
+    for handler in logger.handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.setStream(sys.stderr)
+
+    try:
+        report = asyncio.run(run_benchmark(args))
+    except ValueError as e:
+        parser.error(str(e))
+        return
+    except Exception as e:
+        logger.error(f"基准测试失败: {e}", exc_info=True)
+        raise
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"结果已写入: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
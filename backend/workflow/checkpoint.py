@@ -0,0 +1,367 @@
+"""
+工作流检查点 - 将执行进度持久化到SQLite，支持中断后恢复
+
+记录三类数据：
+- executions: 执行记录（工作流ID、输入上下文、状态）
+- step_results: 已完成步骤的结果
+- item_progress: 步骤内逐项处理的进度（如批量处理中已完成的文件）
+
+检查点只为恢复中断的执行服务：执行成功完成后删除其步骤结果和逐项进度，
+已完成的执行记录保留 WORKFLOW_CHECKPOINT_RETENTION_DAYS 天；
+超过 WORKFLOW_CHECKPOINT_MAX_RESULT_BYTES 的结果不保存（恢复时重新执行该步骤或该项）。
+
+方法都是同步的SQLite操作，在事件循环中应通过 asyncio.to_thread 调用。
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import settings, PROJECT_ROOT
+from core.logging_config import logger
+from storage.sqlite_pool import get_sqlite_pool
+
+
+def _dumps(value: Any) -> str:
+    """序列化为JSON；不能序列化的值抛出 TypeError（不转换为字符串，否则恢复后得到的是错误类型的数据）"""
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _dumps_result(value: Any) -> str:
+    """序列化步骤/逐项结果；超过 WORKFLOW_CHECKPOINT_MAX_RESULT_BYTES 时抛出 ValueError"""
+    text = _dumps(value)
+    limit = settings.WORKFLOW_CHECKPOINT_MAX_RESULT_BYTES
+    # 按字符数粗判，超过一半上限时才计算UTF-8字节数
+    if limit and len(text) * 2 > limit and len(text.encode("utf-8")) > limit:
+        raise ValueError(f"结果大小超过检查点上限（{limit} 字节）")
+    return text
+
+
+class CheckpointStore:
+    """检查点存储（SQLite）"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        初始化检查点存储
+
+        Args:
+            db_path: 数据库文件路径，默认使用 data/workflow_checkpoints.db
+        """
+        if db_path is None:
+            db_path = settings.WORKFLOW_CHECKPOINT_PATH or PROJECT_ROOT / "data" / "workflow_checkpoints.db"
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path)
+        self._init_database()
+
+    def _get_connection(self):
+        """获取数据库连接（线程本地长连接，close() 时归还连接池）"""
+        return self._pool.connection()
+
+    def _init_database(self):
+        """初始化数据库表"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS executions (
+                    execution_id TEXT PRIMARY KEY,
+                    workflow_id TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    started_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    completed_at TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS step_results (
+                    execution_id TEXT NOT NULL,
+                    step_name TEXT NOT NULL,
+                    record TEXT NOT NULL,
+                    result TEXT,
+                    completed_at TEXT NOT NULL,
+                    PRIMARY KEY (execution_id, step_name)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS item_progress (
+                    execution_id TEXT NOT NULL,
+                    step_name TEXT NOT NULL,
+                    item_key TEXT NOT NULL,
+                    result TEXT,
+                    completed_at TEXT NOT NULL,
+                    PRIMARY KEY (execution_id, step_name, item_key)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_executions_status ON executions(status)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ========== 执行记录 ==========
+
+    def create_execution(self, execution_id: str, workflow_id: str, context: Dict[str, Any], started_at: str):
+        """创建执行记录（context 为调用方传入的输入上下文）"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO executions
+                (execution_id, workflow_id, context, status, error, started_at, updated_at, completed_at)
+                VALUES (?, ?, ?, 'running', NULL, ?, ?, NULL)
+            """, (execution_id, workflow_id, _dumps(context), started_at, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def update_status(self, execution_id: str, status: str, error: Optional[str] = None,
+                      completed_at: Optional[str] = None):
+        """更新执行状态"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                UPDATE executions SET status = ?, error = ?, updated_at = ?, completed_at = ?
+                WHERE execution_id = ?
+            """, (status, error, datetime.now().isoformat(), completed_at, execution_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def complete_execution(self, execution_id: str, completed_at: Optional[str] = None):
+        """
+        标记执行成功完成：删除其步骤结果和逐项进度（已无需恢复），
+        并清理超过保留期的已完成执行记录
+        """
+        now = datetime.now()
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                UPDATE executions SET status = 'completed', error = NULL, updated_at = ?, completed_at = ?
+                WHERE execution_id = ?
+            """, (now.isoformat(), completed_at or now.isoformat(), execution_id))
+            for table in ("step_results", "item_progress"):
+                conn.execute(f"DELETE FROM {table} WHERE execution_id = ?", (execution_id,))
+            retention = settings.WORKFLOW_CHECKPOINT_RETENTION_DAYS
+            if retention:
+                cutoff = (now - timedelta(days=retention)).isoformat()
+                conn.execute(
+                    "DELETE FROM executions WHERE status = 'completed' AND completed_at < ?", (cutoff,)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load_execution(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """加载执行记录（包含输入上下文）"""
+        conn = self._get_connection()
+        try:
+            row = conn.execute(
+                "SELECT * FROM executions WHERE execution_id = ?", (execution_id,)
+            ).fetchone()
+            if not row:
+                return None
+            record = dict(row)
+            record["context"] = json.loads(record["context"])
+            return record
+        finally:
+            conn.close()
+
+    def list_executions(self, workflow_id: Optional[str] = None, status: Optional[str] = None,
+                        limit: int = 50) -> List[Dict[str, Any]]:
+        """列出执行记录（不含输入上下文）"""
+        query = "SELECT execution_id, workflow_id, status, error, started_at, updated_at, completed_at FROM executions"
+        conditions, params = [], []
+        if workflow_id:
+            conditions.append("workflow_id = ?")
+            params.append(workflow_id)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY started_at DESC LIMIT ?"
+        params.append(limit)
+
+        conn = self._get_connection()
+        try:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+        finally:
+            conn.close()
+
+    def delete_execution(self, execution_id: str):
+        """删除执行记录及其全部进度"""
+        conn = self._get_connection()
+        try:
+            for table in ("executions", "step_results", "item_progress"):
+                conn.execute(f"DELETE FROM {table} WHERE execution_id = ?", (execution_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ========== 步骤结果 ==========
+
+    def save_step(self, execution_id: str, step_record: Dict[str, Any]) -> bool:
+        """
+        保存已完成步骤的记录和结果
+
+        结果不能序列化为JSON或超过大小上限时不保存该步骤（视为不可检查点的步骤，恢复执行时重新执行）。
+
+        Returns:
+            是否已保存
+        """
+        record = {key: value for key, value in step_record.items() if key != "result"}
+        try:
+            values = (
+                execution_id,
+                step_record["step"],
+                _dumps(record),
+                _dumps_result(step_record.get("result")),
+                step_record.get("completed_at") or datetime.now().isoformat()
+            )
+        except (TypeError, ValueError) as e:
+            logger.warning(f"步骤 {step_record['step']} 的结果不保存检查点（恢复时重新执行）: {e}")
+            values = None
+
+        conn = self._get_connection()
+        try:
+            if values is None:
+                conn.execute(
+                    "DELETE FROM step_results WHERE execution_id = ? AND step_name = ?",
+                    (execution_id, step_record["step"])
+                )
+            else:
+                conn.execute("""
+                    INSERT OR REPLACE INTO step_results (execution_id, step_name, record, result, completed_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, values)
+            conn.commit()
+        finally:
+            conn.close()
+        return values is not None
+
+    def load_steps(self, execution_id: str) -> List[Dict[str, Any]]:
+        """加载已完成步骤（按完成时间排序），每项为带 result 的步骤记录"""
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(
+                "SELECT record, result FROM step_results WHERE execution_id = ? ORDER BY completed_at",
+                (execution_id,)
+            ).fetchall()
+            steps = []
+            for row in rows:
+                record = json.loads(row["record"])
+                record["result"] = json.loads(row["result"]) if row["result"] is not None else None
+                steps.append(record)
+            return steps
+        finally:
+            conn.close()
+
+    # ========== 逐项进度 ==========
+
+    def save_item(self, execution_id: str, step_name: str, item_key: str, result: Any = None) -> bool:
+        """
+        记录单项完成
+
+        结果不能序列化为JSON或超过大小上限时不保存（恢复执行时重新处理该项）。
+
+        Returns:
+            是否已保存
+        """
+        try:
+            text = _dumps_result(result)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"步骤 {step_name} 中 {item_key} 的结果不保存检查点（恢复时重新处理）: {e}")
+            return False
+
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO item_progress (execution_id, step_name, item_key, result, completed_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (execution_id, step_name, item_key, text, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+        return True
+
+    def load_items(self, execution_id: str, step_name: str) -> Dict[str, Any]:
+        """加载步骤内已完成的项：item_key -> result"""
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(
+                "SELECT item_key, result FROM item_progress WHERE execution_id = ? AND step_name = ?",
+                (execution_id, step_name)
+            ).fetchall()
+            return {
+                row["item_key"]: json.loads(row["result"]) if row["result"] is not None else None
+                for row in rows
+            }
+        finally:
+            conn.close()
+
+
+class ItemProgress:
+    """
+    步骤内逐项进度
+
+    在步骤处理器中使用，记录已处理的项（如文件路径），恢复执行时跳过：
+
+        progress = await ItemProgress(context).load()
+        for file_path in files:
+            if progress.is_done(file_path):
+                continue
+            ...
+            await progress.mark_done(file_path, result)
+
+    未启用检查点时仅在内存中记录；检查点的读写在线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, context: Dict[str, Any], step_name: Optional[str] = None):
+        self.execution_id = context.get("execution_id")
+        self.step_name = step_name or context.get("current_step") or ""
+        self.store = get_checkpoint_store() if self.execution_id else None
+        self._done: Dict[str, Any] = {}
+
+    async def load(self) -> "ItemProgress":
+        """加载检查点中已完成的项（恢复执行时），返回自身"""
+        if self.store:
+            self._done = await asyncio.to_thread(self.store.load_items, self.execution_id, self.step_name)
+        return self
+
+    def is_done(self, item_key: Any) -> bool:
+        return str(item_key) in self._done
+
+    def get(self, item_key: Any) -> Any:
+        return self._done.get(str(item_key))
+
+    async def mark_done(self, item_key: Any, result: Any = None):
+        """记录单项完成（检查点只是为了恢复执行，结果无法保存时只记录日志，不影响步骤）"""
+        key = str(item_key)
+        self._done[key] = result
+        if self.store:
+            try:
+                await asyncio.to_thread(self.store.save_item, self.execution_id, self.step_name, key, result)
+            except Exception as e:
+                logger.warning(f"写入逐项检查点失败: {e}")
+
+    @property
+    def done_count(self) -> int:
+        return len(self._done)
+
+
+# 全局检查点存储实例
+_checkpoint_store: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """获取检查点存储实例（未启用检查点时返回 None）"""
+    global _checkpoint_store
+    if not settings.WORKFLOW_CHECKPOINT_ENABLED:
+        return None
+    if _checkpoint_store is None:
+        _checkpoint_store = CheckpointStore()
+        logger.info(f"工作流检查点存储: {_checkpoint_store.db_path}")
+    return _checkpoint_store
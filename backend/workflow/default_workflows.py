@@ -1,10 +1,16 @@
 """
 默认工作流定义
 """
+import asyncio
+import itertools
+import threading
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Iterator, List
 
 from workflow.workflow_engine import WorkflowEngine, WorkflowStep
+from workflow.streaming import RecordStream
+from workflow.process_runner import run_with_budget
+from workflow.map_step import map_step, gather_step
 from data_parser.parser_factory import ParserFactory
 from schema_learner.ai_learner import AISchemaLearner
 from schema_learner.rule_learner import RuleBasedSchemaLearner
@@ -20,7 +26,8 @@ async def parse_file_step(context: Dict[str, Any]) -> Dict[str, Any]:
     if not parser:
         raise ValueError(f"不支持的文件格式: {file_path.suffix}")
     
-    data = parser.parse(file_path)
+    # 解析可能很耗时：不在事件循环中执行；设置了超时或资源预算时在子进程中执行，超时或取消时终止解析
+    data = await run_with_budget(context, parser.parse, file_path)
     schema = parser.detect_schema(data)
     
     return {
@@ -45,12 +52,12 @@ async def analyze_schema_step(context: Dict[str, Any]) -> Dict[str, Any]:
         learner = RuleBasedSchemaLearner()
     
     # 学习Schema
-    learned_schema = learner.learn_schema(data, {
+    learned_schema = await learner.learn_schema(data, {
         "file_path": parse_result.get("file_path")
     })
     
     # 理解关系
-    relationships = learner.understand_relationships(
+    relationships = await learner.understand_relationships(
         learned_schema or schema
     )
     
@@ -76,7 +83,7 @@ async def process_natural_language_step(context: Dict[str, Any]) -> Dict[str, An
     else:
         learner = RuleBasedSchemaLearner()
     
-    intent = learner.infer_intent(instruction, schema)
+    intent = await learner.infer_intent(instruction, schema)
     
     return {
         "intent": intent,
@@ -146,6 +153,159 @@ async def export_file_step(context: Dict[str, Any]) -> Dict[str, Any]:
         raise ValueError(f"不支持的导出格式: {output_format}")
 
 
+def _batch_file_paths(context: Dict[str, Any]) -> List[str]:
+    """批量处理的文件列表（file_paths，兼容单个 file_path）"""
+    file_paths = context.get("file_paths")
+    if not file_paths:
+        file_path = context.get("file_path")
+        file_paths = [file_path] if file_path else []
+    return [str(path) for path in file_paths]
+
+
+def _batch_item_context(context: Dict[str, Any], file_path: str) -> Dict[str, Any]:
+    """批量处理中单个文件的输出路径"""
+    output_dir = Path(context.get("output_dir") or settings.EXPORT_DIR)
+    return {"output_path": str(output_dir / Path(file_path).stem)}
+
+
+# 流式解析每次在线程中读取的记录数
+STREAM_BATCH_SIZE = 256
+
+
+class _ThreadedIterator:
+    """在线程中按批读取同步迭代器（读取和关闭互斥：取消时线程中可能仍在读取）"""
+    
+    def __init__(self, iterator: Iterator[Any]):
+        self._iterator = iterator
+        self._lock = threading.Lock()
+    
+    def _next_batch(self, size: int) -> List[Any]:
+        with self._lock:
+            return list(itertools.islice(self._iterator, size))
+    
+    def _close(self):
+        with self._lock:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+    
+    async def next_batch(self, size: int) -> List[Any]:
+        """读取最多 size 条记录，读完时返回的记录数少于 size"""
+        return await asyncio.to_thread(self._next_batch, size)
+    
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+
+async def stream_parse_file_step(context: Dict[str, Any]) -> RecordStream:
+    """流式解析文件步骤：逐条产出记录，不在内存中保留整个数据集"""
+    file_path = Path(context.get("file_path"))
+    
+    parser = ParserFactory.create_parser(file_path)
+    if not parser:
+        raise ValueError(f"不支持的文件格式: {file_path.suffix}")
+    
+    metadata = {"file_path": str(file_path)}
+    
+    async def records() -> AsyncIterator[Any]:
+        # 文件读取和解析在线程中按批进行，单条记录很大或读取很慢时也不阻塞事件循环
+        iterator = _ThreadedIterator(parser.iter_records(file_path, metadata))
+        try:
+            while True:
+                batch = await iterator.next_batch(STREAM_BATCH_SIZE)
+                for record in batch:
+                    yield record
+                if len(batch) < STREAM_BATCH_SIZE:
+                    return
+        finally:
+            await iterator.close()
+    
+    return RecordStream(records(), metadata=metadata)
+
+
+def _apply_record_operation(record: Any, operation: Dict[str, Any]) -> Any:
+    """对单条记录应用操作（update/delete），返回 None 表示删除该记录"""
+    condition = operation.get("filter") or {}
+    if condition:
+        if not isinstance(record, dict):
+            return record
+        for key, expected in condition.items():
+            actual = record.get("@attributes", {}).get(key[1:]) if key.startswith("@") else record.get(key)
+            if actual != expected:
+                return record
+    
+    action = operation.get("action")
+    if action == "delete":
+        return None
+    
+    target = operation.get("target")
+    if action == "update" and target and isinstance(record, dict):
+        keys = target.split(".")
+        current = record
+        for key in keys[:-1]:
+            if not isinstance(current, dict):
+                return record
+            current = current.setdefault(key, {})
+        if isinstance(current, dict):
+            current[keys[-1]] = operation.get("value")
+    
+    return record
+
+
+async def stream_apply_operations_step(context: Dict[str, Any]) -> RecordStream:
+    """流式应用操作步骤：逐条变换上游记录"""
+    upstream: RecordStream = context["step_stream_parse_file"]
+    operations = context.get("operations") or []
+    
+    # 兼容单条意图（与 apply_operations_step 相同的格式）
+    intent = context.get("intent")
+    if intent:
+        operations = [intent, *operations]
+    
+    async def records() -> AsyncIterator[Any]:
+        async for record in upstream:
+            for operation in operations:
+                record = _apply_record_operation(record, operation)
+                if record is None:
+                    break
+            if record is not None:
+                yield record
+    
+    return RecordStream(records(), metadata=upstream.metadata)
+
+
+async def stream_export_file_step(context: Dict[str, Any]) -> Dict[str, Any]:
+    """流式导出文件步骤：边接收记录边写出，解析未结束时即开始写文件"""
+    upstream: RecordStream = (
+        context.get("step_stream_apply_operations") or context["step_stream_parse_file"]
+    )
+    
+    output_format = context.get("output_format", "json")
+    output_path = Path(context.get("output_path", "./exports/output")).with_suffix(f".{output_format}")
+    
+    parser = ParserFactory.create_parser(output_path)
+    if not parser:
+        raise ValueError(f"不支持的导出格式: {output_format}")
+    
+    writer = None
+    try:
+        async for record in upstream:
+            if writer is None:
+                # 延迟打开写入器：此时上游已写入表头、根标签等元数据
+                writer = parser.open_writer(output_path, upstream.metadata)
+            writer.write(record)
+        if writer is None:
+            writer = parser.open_writer(output_path, upstream.metadata)
+    finally:
+        success = writer.close() if writer is not None else False
+    
+    return {
+        "output_path": str(output_path),
+        "success": success,
+        "records": writer.count
+    }
+
+
 def register_default_workflows(engine: WorkflowEngine):
     """注册默认工作流"""
     
@@ -164,10 +324,28 @@ def register_default_workflows(engine: WorkflowEngine):
         WorkflowStep("analyze_schema", analyze_schema_step, ["parse_file"]),
     ])
     
-    # 批量处理工作流
+    # 批量处理工作流：对 file_paths 中每个文件并行执行 解析 → 分析 → 导出，
+    # 解析在进程池中执行以利用多核，已完成的文件在恢复执行时跳过
     engine.register_workflow("batch_process", [
-        WorkflowStep("parse_file", parse_file_step),
-        WorkflowStep("analyze_schema", analyze_schema_step, ["parse_file"]),
-        WorkflowStep("export_file", export_file_step, ["analyze_schema"]),
+        map_step(
+            "process_files",
+            items=_batch_file_paths,
+            item_key="file_path",
+            sub_steps=[
+                WorkflowStep("parse_file", parse_file_step),
+                WorkflowStep("analyze_schema", analyze_schema_step, ["parse_file"]),
+                WorkflowStep("export_file", export_file_step, ["analyze_schema"]),
+            ],
+            prepare=_batch_item_context,
+            retries=1,
+            use_processes=True,
+        ),
+        gather_step("gather_results", "process_files"),
+    ])
+    
+    # 流式处理工作流：解析 → 变换 → 导出 逐条传递，内存占用恒定
+    engine.register_workflow("stream_pipeline", [
+        WorkflowStep("stream_parse_file", stream_parse_file_step),
+        WorkflowStep("stream_apply_operations", stream_apply_operations_step, ["stream_parse_file"]),
+        WorkflowStep("stream_export_file", stream_export_file_step, ["stream_apply_operations"]),
     ])
-
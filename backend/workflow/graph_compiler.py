@@ -0,0 +1,194 @@
+"""
+工作流图编译器 - 将编辑器保存的节点/连线图编译为引擎执行计划
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+
+from ai_integration.admission import llm_priority, PRIORITY_BATCH
+from core.logging_config import logger
+from workflow.workflow_engine import WorkflowStep
+from workflow.node_handlers import (
+    NODE_HANDLERS,
+    NodeHandler,
+    CHAT_MODEL_NODE_TYPES,
+    CONFIG_ONLY_NODE_TYPES,
+)
+
+
+# 配置类连接使用的目标端口（不传递数据）
+CHAT_MODEL_HANDLE = "chat_model"
+CONFIG_HANDLES = {CHAT_MODEL_HANDLE, "memory", "tool"}
+
+
+class WorkflowCompileError(ValueError):
+    """工作流图编译错误"""
+    pass
+
+
+@dataclass
+class CompiledWorkflow:
+    """编译结果"""
+    steps: List[WorkflowStep]
+    outputs: List[str] = field(default_factory=list)  # 末端节点ID（没有下游数据连线）
+    skipped: List[str] = field(default_factory=list)  # 不生成步骤的节点ID（配置类节点）
+
+
+def _node_type(node: Dict[str, Any]) -> Optional[str]:
+    data = node.get("data") or {}
+    return data.get("type") or node.get("type")
+
+
+def _node_config(node: Dict[str, Any]) -> Dict[str, Any]:
+    """获取节点配置（展开表单中嵌套的 config 字段）"""
+    config = dict((node.get("data") or {}).get("config") or {})
+    nested = config.pop("config", None)
+    if isinstance(nested, dict):
+        config.update(nested)
+    return config
+
+
+def _chat_model_config(node: Dict[str, Any]) -> Dict[str, Any]:
+    """从Chat Model节点构建 AI Agent 使用的配置（与前端执行器一致）"""
+    node_type = _node_type(node)
+    config = _node_config(node)
+    model_type = (config.get("model_type") or "chatgpt") if node_type == "chat_model" else node_type
+    return {
+        "model_type": model_type,
+        "api_key": config.get("api_key") or "",
+        "api_url": config.get("api_url") or "",
+        "request_headers": config.get("request_headers") or "",
+        "request_body": config.get("request_body") or "{}",
+    }
+
+
+def _make_step_handler(node_id: str, node_type: str, handler: NodeHandler, config: Dict[str, Any], upstream_ids: List[str]):
+    """包装节点处理器：读取上游步骤结果，合并后传入处理器"""
+
+    async def step_handler(context: Dict[str, Any]) -> Dict[str, Any]:
+        upstream: Dict[str, Any] = {}
+        for upstream_id in upstream_ids:
+            result = context.get(f"step_{upstream_id}")
+            if isinstance(result, dict):
+                upstream.update(result)
+
+        try:
+            # 工作流步骤中的LLM调用按批量优先级排队，交互请求优先
+            with llm_priority(PRIORITY_BATCH):
+                return await handler(config, upstream, context)
+        except HTTPException as e:
+            # API函数抛出的HTTP异常转换为普通异常，保留错误详情
+            raise RuntimeError(f"节点 {node_id}（{node_type}）执行失败: {e.detail}") from e
+
+    return step_handler
+
+
+def compile_workflow(workflow_data: Dict[str, Any]) -> CompiledWorkflow:
+    """
+    编译工作流图
+
+    - 每个数据节点生成一个步骤，步骤名为节点ID，依赖为上游数据连线的源节点
+    - 通过 chat_model 端口连接的Chat Model节点作为配置注入到目标节点，不生成步骤
+    - 多个上游时按连线顺序合并上游结果（后者覆盖前者）
+
+    Args:
+        workflow_data: 存储的工作流数据（包含 nodes 和 edges）
+
+    Returns:
+        编译结果
+
+    Raises:
+        WorkflowCompileError: 存在不支持的节点类型、无效连线或循环依赖
+    """
+    nodes = workflow_data.get("nodes") or []
+    edges = workflow_data.get("edges") or []
+
+    if not nodes:
+        raise WorkflowCompileError("工作流没有节点")
+
+    nodes_by_id: Dict[str, Dict[str, Any]] = {}
+    for node in nodes:
+        node_id = node.get("id")
+        if not node_id:
+            raise WorkflowCompileError("存在缺少ID的节点")
+        nodes_by_id[node_id] = node
+
+    # 检查节点类型
+    unsupported = sorted({
+        f"{node_id}（{_node_type(node)}）"
+        for node_id, node in nodes_by_id.items()
+        if _node_type(node) not in NODE_HANDLERS and _node_type(node) not in CONFIG_ONLY_NODE_TYPES
+    })
+    if unsupported:
+        raise WorkflowCompileError(f"不支持在服务端执行的节点: {', '.join(unsupported)}")
+
+    # 拆分数据连线和配置连线
+    data_upstreams: Dict[str, List[str]] = {node_id: [] for node_id in nodes_by_id}
+    chat_models: Dict[str, Dict[str, Any]] = {}
+    has_downstream: Set[str] = set()
+
+    for edge in edges:
+        source, target = edge.get("source"), edge.get("target")
+        if source not in nodes_by_id or target not in nodes_by_id:
+            raise WorkflowCompileError(f"连线引用了不存在的节点: {source} -> {target}")
+
+        handle = edge.get("targetHandle")
+        source_type = _node_type(nodes_by_id[source])
+
+        if handle in CONFIG_HANDLES or source_type in CONFIG_ONLY_NODE_TYPES:
+            if source_type in CHAT_MODEL_NODE_TYPES:
+                chat_models[target] = _chat_model_config(nodes_by_id[source])
+            continue
+
+        if source not in data_upstreams[target]:
+            data_upstreams[target].append(source)
+        has_downstream.add(source)
+
+    # 生成步骤
+    steps: List[WorkflowStep] = []
+    skipped: List[str] = []
+    for node_id, node in nodes_by_id.items():
+        node_type = _node_type(node)
+        if node_type in CONFIG_ONLY_NODE_TYPES:
+            skipped.append(node_id)
+            continue
+
+        config = _node_config(node)
+        if node_id in chat_models:
+            config["chat_model_config"] = chat_models[node_id]
+
+        steps.append(WorkflowStep(
+            name=node_id,
+            handler=_make_step_handler(node_id, node_type, NODE_HANDLERS[node_type], config, data_upstreams[node_id]),
+            depends_on=list(data_upstreams[node_id]),
+            config={"node_type": node_type},
+        ))
+
+    _check_acyclic(steps)
+
+    outputs = [step.name for step in steps if step.name not in has_downstream]
+    logger.info(f"工作流图编译完成: {len(steps)} 个步骤, {len(skipped)} 个配置节点, 输出节点: {outputs}")
+
+    return CompiledWorkflow(steps=steps, outputs=outputs, skipped=skipped)
+
+
+def _check_acyclic(steps: List[WorkflowStep]):
+    """检查循环依赖（引擎的拓扑排序不检测环）"""
+    deps = {step.name: step.depends_on for step in steps}
+    visiting: Set[str] = set()
+    visited: Set[str] = set()
+
+    def visit(name: str):
+        if name in visited:
+            return
+        if name in visiting:
+            raise WorkflowCompileError(f"工作流存在循环依赖: {name}")
+        visiting.add(name)
+        for dep in deps.get(name, []):
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+
+    for name in deps:
+        visit(name)
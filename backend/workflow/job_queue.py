@@ -0,0 +1,326 @@
+"""
+工作流作业队列 - 基于SQLite的本地持久化队列
+
+API进程只负责入队，独立的工作进程（python -m workflow.worker）领取并执行作业：
+- 领取作业时获得租约（lease），执行期间通过心跳续约
+- 工作进程异常退出后租约过期，作业会被其他工作进程重新领取
+- 失败的作业按指数退避重试，超过最大尝试次数后标记为失败
+"""
+import json
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import settings, PROJECT_ROOT
+from core.logging_config import logger
+from storage.sqlite_pool import get_sqlite_pool
+
+
+class JobStatus:
+    """作业状态"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+# 重试退避的基础时间和上限（秒）
+RETRY_BACKOFF_BASE = 2.0
+RETRY_BACKOFF_MAX = 300.0
+
+
+class JobQueue:
+    """作业队列（SQLite）"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        初始化作业队列
+
+        Args:
+            db_path: 数据库文件路径，默认使用 data/workflow_jobs.db
+        """
+        if db_path is None:
+            db_path = settings.WORKFLOW_QUEUE_PATH or PROJECT_ROOT / "data" / "workflow_jobs.db"
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path, isolation_level=None)
+        self._init_database()
+
+    def _get_connection(self):
+        """获取数据库连接（自动提交，事务由 claim 手动管理；多进程并发时等待写锁）"""
+        return self._pool.connection()
+
+    def _init_database(self):
+        """初始化数据库表"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    workflow_id TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER DEFAULT 0,
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    timeout REAL,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    heartbeat_at REAL,
+                    cancel_requested INTEGER DEFAULT 0,
+                    execution_id TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, available_at, priority)")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["context"] = json.loads(job["context"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(
+        self,
+        workflow_id: str,
+        context: Dict[str, Any],
+        priority: int = 0,
+        max_attempts: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        作业入队
+
+        Args:
+            workflow_id: 工作流ID
+            context: 执行上下文
+            priority: 优先级（越大越先执行）
+            max_attempts: 最大尝试次数（默认使用配置）
+            timeout: 工作流超时时间（秒）
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                INSERT INTO jobs (job_id, workflow_id, context, status, priority, attempts, max_attempts,
+                                  timeout, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)
+            """, (
+                job_id, workflow_id, json.dumps(context, ensure_ascii=False, default=str),
+                JobStatus.QUEUED, priority, max_attempts or settings.WORKFLOW_JOB_MAX_ATTEMPTS,
+                timeout, time.time(), now, now
+            ))
+        finally:
+            conn.close()
+        logger.info(f"工作流作业已入队: {job_id} ({workflow_id})")
+        return self.get(job_id)
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        领取一个作业（排队中的作业，或租约已过期的运行中作业）
+
+        Returns:
+            领取到的作业，没有可执行的作业时返回 None
+        """
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            # 租约过期且已用完尝试次数的作业直接标记失败
+            conn.execute("""
+                UPDATE jobs SET status = ?, error = '工作进程失联，超过最大尝试次数',
+                                lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts
+            """, (JobStatus.FAILED, datetime.now().isoformat(), JobStatus.RUNNING, now))
+
+            row = conn.execute("""
+                SELECT job_id, status, lease_owner FROM jobs
+                WHERE (status = ? AND available_at <= ?)
+                   OR (status = ? AND lease_expires_at < ?)
+                ORDER BY priority DESC, available_at, created_at
+                LIMIT 1
+            """, (JobStatus.QUEUED, now, JobStatus.RUNNING, now)).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            if row["status"] == JobStatus.RUNNING:
+                logger.warning(f"作业租约过期，重新领取: {row['job_id']}（原工作进程: {row['lease_owner']}）")
+
+            conn.execute("""
+                UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?, heartbeat_at = ?,
+                                attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ?
+            """, (JobStatus.RUNNING, worker_id, now + lease_seconds, now, datetime.now().isoformat(), row["job_id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return self.get(row["job_id"])
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """
+        续约
+
+        Returns:
+            是否仍持有租约且未被请求取消（False 时工作进程应停止执行）
+        """
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute("""
+                UPDATE jobs SET lease_expires_at = ?, heartbeat_at = ?
+                WHERE job_id = ? AND lease_owner = ? AND status = ? AND cancel_requested = 0
+            """, (now + lease_seconds, now, job_id, worker_id, JobStatus.RUNNING))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def set_execution(self, job_id: str, execution_id: str):
+        """记录作业对应的执行ID（重新领取时用于从检查点恢复）"""
+        self._update(job_id, execution_id=execution_id)
+
+    def complete(self, job_id: str, worker_id: str, result: Any = None):
+        """标记作业完成"""
+        self._finish(job_id, worker_id, JobStatus.COMPLETED, result=result)
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True):
+        """
+        标记作业失败（还有尝试次数时按指数退避重新排队）
+        """
+        job = self.get(job_id)
+        if job is None or job["lease_owner"] != worker_id:
+            return
+        if retry and job["attempts"] < job["max_attempts"] and not job["cancel_requested"]:
+            delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE ** job["attempts"])
+            self._update(
+                job_id,
+                status=JobStatus.QUEUED,
+                error=error,
+                available_at=time.time() + delay,
+                lease_owner=None,
+                lease_expires_at=None
+            )
+            logger.warning(f"作业失败，{delay:.0f}秒后重试（第 {job['attempts']}/{job['max_attempts']} 次）: {job_id}: {error}")
+            return
+        self._finish(job_id, worker_id, JobStatus.FAILED, error=error)
+
+    def mark_cancelled(self, job_id: str, worker_id: Optional[str] = None):
+        """标记作业已取消"""
+        self._finish(job_id, worker_id, JobStatus.CANCELLED, error="作业已取消")
+
+    def request_cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        请求取消作业：排队中的作业直接取消，运行中的作业在下一次心跳时由工作进程取消
+        """
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                UPDATE jobs SET status = ?, error = '作业已取消', updated_at = ?
+                WHERE job_id = ? AND status = ?
+            """, (JobStatus.CANCELLED, datetime.now().isoformat(), job_id, JobStatus.QUEUED))
+            conn.execute("""
+                UPDATE jobs SET cancel_requested = 1, updated_at = ?
+                WHERE job_id = ? AND status = ?
+            """, (datetime.now().isoformat(), job_id, JobStatus.RUNNING))
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取作业"""
+        conn = self._get_connection()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return self._row_to_job(row) if row else None
+        finally:
+            conn.close()
+
+    def list_jobs(self, status: Optional[str] = None, workflow_id: Optional[str] = None,
+                  limit: int = 50) -> List[Dict[str, Any]]:
+        """列出作业（不含上下文和结果）"""
+        query = """
+            SELECT job_id, workflow_id, status, priority, attempts, max_attempts, lease_owner,
+                   heartbeat_at, execution_id, error, created_at, updated_at
+            FROM jobs
+        """
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if workflow_id:
+            conditions.append("workflow_id = ?")
+            params.append(workflow_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        conn = self._get_connection()
+        try:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+        finally:
+            conn.close()
+
+    def _finish(self, job_id: str, worker_id: Optional[str], status: str,
+                result: Any = None, error: Optional[str] = None):
+        """结束作业（只有持有租约的工作进程可以结束运行中的作业）"""
+        conn = self._get_connection()
+        try:
+            query = """
+                UPDATE jobs SET status = ?, result = ?, error = ?, lease_owner = NULL,
+                                lease_expires_at = NULL, updated_at = ?
+                WHERE job_id = ?
+            """
+            params = [
+                status,
+                json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                error, datetime.now().isoformat(), job_id
+            ]
+            if worker_id is not None:
+                query += " AND lease_owner = ?"
+                params.append(worker_id)
+            conn.execute(query, params)
+        finally:
+            conn.close()
+
+    def _update(self, job_id: str, **fields):
+        """更新作业字段"""
+        fields["updated_at"] = datetime.now().isoformat()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        conn = self._get_connection()
+        try:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", [*fields.values(), job_id])
+        finally:
+            conn.close()
+
+
+# 全局作业队列实例
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """获取作业队列实例"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,182 @@
+"""
+扇出步骤 - 对集合中的每个元素并行执行子流程
+
+map_step 从上下文取出集合，对每个元素在有界并发下执行一组子步骤（支持逐项重试），
+已完成的元素通过 ItemProgress 记录，恢复执行时跳过；
+gather_step 汇总 map_step 的结果。
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from core.config import settings
+from core.logging_config import logger
+from workflow.workflow_engine import WorkflowEngine, WorkflowStep
+from workflow.checkpoint import ItemProgress
+from workflow.process_runner import deadline_scope
+
+
+ItemsSource = Union[str, Callable[[Dict[str, Any]], List[Any]]]
+
+
+def default_concurrency() -> int:
+    """默认并发数（配置值或CPU核数）"""
+    return settings.WORKFLOW_MAP_CONCURRENCY or os.cpu_count() or 1
+
+
+async def _run_sub_steps(sub_steps: List[WorkflowStep], item_context: Dict[str, Any]) -> Any:
+    """按依赖顺序执行子步骤，返回最后一个子步骤的结果"""
+    result = None
+    for step in WorkflowEngine.get_execution_order(sub_steps):
+        if callable(step.handler):
+            with deadline_scope(step.timeout):
+                coro = step.handler(item_context)
+                result = await (asyncio.wait_for(coro, step.timeout) if step.timeout else coro)
+        else:
+            result = step.handler
+        item_context[f"step_{step.name}"] = result
+    return result
+
+
+def map_step(
+    name: str,
+    items: ItemsSource,
+    sub_steps: List[WorkflowStep],
+    item_key: str = "item",
+    depends_on: Optional[List[str]] = None,
+    concurrency: Optional[int] = None,
+    retries: int = 0,
+    retry_delay: float = 1.0,
+    prepare: Optional[Callable[[Dict[str, Any], Any], Dict[str, Any]]] = None,
+    use_processes: bool = False,
+    allow_partial: bool = False
+) -> WorkflowStep:
+    """
+    创建扇出步骤
+
+    Args:
+        name: 步骤名
+        items: 集合来源（上下文键名，或从上下文计算集合的函数）
+        sub_steps: 对每个元素执行的子步骤（子步骤之间通过 step_xxx 传递结果，与普通步骤相同）
+        item_key: 元素在子上下文中的键名（如 "file_path"）
+        depends_on: 依赖的步骤
+        concurrency: 最大并发数（默认配置值或CPU核数）
+        retries: 每个元素失败后的重试次数
+        retry_delay: 首次重试等待时间（秒），之后指数增长
+        prepare: 构建子上下文的附加字段（接收上下文和元素，返回要合并的字典）
+        use_processes: 子步骤中的阻塞任务（如文件解析）是否在进程池中执行，以利用多核
+        allow_partial: 部分元素失败时是否仍然视为步骤成功
+
+    Returns:
+        工作流步骤（结果包含每个元素的状态和结果，按输入顺序排列）
+    """
+    limit = max(1, concurrency or default_concurrency())
+
+    async def handler(context: Dict[str, Any]) -> Dict[str, Any]:
+        collection = items(context) if callable(items) else context.get(items)
+        if collection is None:
+            raise ValueError(f"扇出步骤 {name} 缺少集合: {items}")
+        collection = list(collection)
+
+        progress = await ItemProgress(context, name).load()
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run_item(index: int, item: Any) -> Dict[str, Any]:
+            key = str(item)
+            if progress.is_done(key):
+                return {"index": index, "item": item, "status": "completed", "result": progress.get(key), "restored": True}
+
+            async with semaphore:
+                item_context = {
+                    **context,
+                    item_key: item,
+                    "item_index": index,
+                    "use_process_pool": use_processes,
+                    **(prepare(context, item) if prepare else {})
+                }
+                started_at = datetime.now().isoformat()
+                attempt = 0
+                while True:
+                    attempt += 1
+                    try:
+                        result = await _run_sub_steps(sub_steps, item_context)
+                        break
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        if attempt > retries:
+                            logger.error(f"扇出步骤 {name} 处理失败: {key}: {e}")
+                            return {
+                                "index": index, "item": item, "status": "failed",
+                                "error": str(e), "attempts": attempt, "started_at": started_at,
+                            }
+                        logger.warning(f"扇出步骤 {name} 处理失败，第 {attempt} 次重试: {key}: {e}")
+                        await asyncio.sleep(retry_delay * (2 ** (attempt - 1)))
+
+            await progress.mark_done(key, result)
+            return {
+                "index": index, "item": item, "status": "completed", "result": result,
+                "attempts": attempt, "started_at": started_at, "completed_at": datetime.now().isoformat(),
+            }
+
+        outcomes = await asyncio.gather(*(run_item(i, item) for i, item in enumerate(collection)))
+
+        failed = [outcome for outcome in outcomes if outcome["status"] == "failed"]
+        restored = sum(1 for outcome in outcomes if outcome.get("restored"))
+        logger.info(
+            f"扇出步骤 {name} 完成: {len(outcomes) - len(failed)}/{len(outcomes)} 成功, "
+            f"{restored} 个从检查点恢复, 并发数 {limit}"
+        )
+
+        if failed and not allow_partial:
+            raise RuntimeError(
+                f"{len(failed)}/{len(outcomes)} 个元素处理失败: "
+                + "; ".join(f"{outcome['item']}: {outcome['error']}" for outcome in failed)
+            )
+
+        return {
+            "items": outcomes,
+            "total": len(outcomes),
+            "completed": len(outcomes) - len(failed),
+            "failed": len(failed),
+            "restored": restored,
+        }
+
+    return WorkflowStep(name, handler, depends_on, config={"type": "map", "concurrency": limit})
+
+
+def gather_step(
+    name: str,
+    map_step_name: str,
+    reducer: Optional[Callable[[List[Any]], Any]] = None
+) -> WorkflowStep:
+    """
+    创建汇总步骤
+
+    Args:
+        name: 步骤名
+        map_step_name: 要汇总的扇出步骤名
+        reducer: 对成功结果列表做进一步合并的函数（可选）
+
+    Returns:
+        工作流步骤（结果包含成功元素的结果列表和失败元素）
+    """
+
+    async def handler(context: Dict[str, Any]) -> Dict[str, Any]:
+        map_result = context.get(f"step_{map_step_name}") or {}
+        outcomes = map_result.get("items", [])
+        results = [outcome["result"] for outcome in outcomes if outcome["status"] == "completed"]
+        gathered = {
+            "results": results,
+            "failed": [
+                {"item": outcome["item"], "error": outcome.get("error")}
+                for outcome in outcomes if outcome["status"] == "failed"
+            ],
+            "total": len(outcomes),
+        }
+        if reducer is not None:
+            gathered["reduced"] = reducer(results)
+        return gathered
+
+    return WorkflowStep(name, handler, [map_step_name], config={"type": "gather"})
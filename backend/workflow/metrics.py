@@ -0,0 +1,372 @@
+"""
+工作流指标 - 记录每个步骤的耗时、CPU时间、内存、数据量和缓存命中情况
+
+- StepMeter: 在引擎中包裹单个步骤的执行，采集指标
+- record_cache_event: 缓存读取处调用，计入当前步骤（通过 contextvar 关联，线程池中也有效）
+- MetricsStore: 指标持久化（SQLite），支持按执行查询和按工作流聚合（p50/p95）
+"""
+import itertools
+import json
+import math
+import sys
+import time
+import tracemalloc
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import settings, PROJECT_ROOT
+from core.logging_config import logger
+from storage.sqlite_pool import get_sqlite_pool
+
+try:
+    import resource
+except ImportError:  # Windows 不支持 getrusage
+    resource = None
+
+
+# 当前步骤的缓存统计（由 StepMeter 设置）
+_cache_stats: ContextVar[Optional[Dict[str, Any]]] = ContextVar("workflow_cache_stats", default=None)
+
+
+def record_cache_event(cache_name: str, hit: bool):
+    """记录一次缓存读取（不在工作流步骤中时忽略）"""
+    stats = _cache_stats.get()
+    if stats is None:
+        return
+    stats["hits" if hit else "misses"] += 1
+    by_cache = stats["by_cache"].setdefault(cache_name, {"hits": 0, "misses": 0})
+    by_cache["hits" if hit else "misses"] += 1
+
+
+def payload_size(value: Any) -> Optional[int]:
+    """估算数据量（JSON序列化后的字节数），无法序列化时返回 None"""
+    if value is None:
+        return 0
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return None
+
+
+# 估算数据量时每个列表/字典抽样的元素数，以及递归的最大深度
+ESTIMATE_SAMPLE = 32
+ESTIMATE_MAX_DEPTH = 8
+
+
+def estimate_payload_size(value: Any, depth: int = 0) -> int:
+    """
+    快速估算数据量（近似JSON序列化后的字节数）
+
+    大列表/字典只抽样前 ESTIMATE_SAMPLE 个元素按平均大小外推，耗时与数据总量无关，默认始终统计；
+    需要精确值时开启 WORKFLOW_METRICS_PAYLOAD_SIZES（完整序列化，见 payload_size）。
+    """
+    if value is None:
+        return 0 if depth == 0 else 4
+    if isinstance(value, bool):
+        return 5
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if depth >= ESTIMATE_MAX_DEPTH:
+        return 8
+    if isinstance(value, dict):
+        items = list(itertools.islice(value.items(), ESTIMATE_SAMPLE))
+        sampled = sum(len(str(key)) + 4 + estimate_payload_size(item, depth + 1) for key, item in items)
+    elif isinstance(value, (list, tuple, set)):
+        items = list(itertools.islice(value, ESTIMATE_SAMPLE))
+        sampled = sum(estimate_payload_size(item, depth + 1) + 1 for item in items)
+    else:
+        return len(str(value))
+    if not items:
+        return 2
+    return 2 + sampled * len(value) // len(items)
+
+
+def _peak_rss_kb() -> Optional[int]:
+    """进程启动以来的峰值常驻内存（KB，只增不减）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上 ru_maxrss 的单位是字节
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class StepMeter:
+    """
+    步骤计量器
+
+    注意：CPU时间和内存是进程级数据，多个工作流并发执行时会相互叠加；
+    peak_rss_kb 是步骤结束时的进程峰值内存（只增不减，不是该步骤自身的内存增量）。
+    """
+
+    def __init__(self):
+        self._wall_start = 0.0
+        self._cpu_start = 0.0
+        self._token = None
+        self.cache_stats = {"hits": 0, "misses": 0, "by_cache": {}}
+
+    def start(self):
+        if settings.WORKFLOW_METRICS_TRACEMALLOC:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._token = _cache_stats.set(self.cache_stats)
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+
+    def stop(self, inputs: Any = None, output: Any = None, streaming: bool = False) -> Dict[str, Any]:
+        """结束计量并返回指标"""
+        wall_ms = (time.perf_counter() - self._wall_start) * 1000
+        cpu_ms = (time.process_time() - self._cpu_start) * 1000
+
+        if self._token is not None:
+            _cache_stats.reset(self._token)
+            self._token = None
+
+        metrics = {
+            "wall_ms": round(wall_ms, 3),
+            "cpu_ms": round(cpu_ms, 3),
+            "peak_rss_kb": _peak_rss_kb(),
+            "peak_alloc_kb": None,
+            "input_bytes": None,
+            "output_bytes": None,
+            "cache_hits": self.cache_stats["hits"],
+            "cache_misses": self.cache_stats["misses"],
+            "cache": self.cache_stats["by_cache"],
+            "streaming": streaming,
+        }
+
+        if settings.WORKFLOW_METRICS_TRACEMALLOC and tracemalloc.is_tracing():
+            metrics["peak_alloc_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+
+        # 默认抽样估算（开销很小），开启 WORKFLOW_METRICS_PAYLOAD_SIZES 时完整序列化得到精确值
+        measure = payload_size if settings.WORKFLOW_METRICS_PAYLOAD_SIZES else estimate_payload_size
+        metrics["input_bytes"] = measure(inputs)
+        if not streaming:
+            metrics["output_bytes"] = measure(output)
+
+        return metrics
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """最近秩百分位数"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(0, min(len(values), rank) - 1)]
+
+
+# 参与聚合的步骤指标
+_AGGREGATED_FIELDS = ("wall_ms", "cpu_ms", "peak_rss_kb", "peak_alloc_kb", "input_bytes", "output_bytes")
+
+
+class MetricsStore:
+    """指标存储（SQLite）"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        初始化指标存储
+
+        Args:
+            db_path: 数据库文件路径，默认使用 data/workflow_metrics.db
+        """
+        if db_path is None:
+            db_path = settings.WORKFLOW_METRICS_PATH or PROJECT_ROOT / "data" / "workflow_metrics.db"
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = get_sqlite_pool(self.db_path)
+        self._init_database()
+
+    def _get_connection(self):
+        """获取数据库连接（线程本地长连接，close() 时归还连接池）"""
+        return self._pool.connection()
+
+    def _init_database(self):
+        """初始化数据库表"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS step_metrics (
+                    execution_id TEXT NOT NULL,
+                    workflow_id TEXT NOT NULL,
+                    step_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    wall_ms REAL,
+                    cpu_ms REAL,
+                    peak_rss_kb INTEGER,
+                    peak_alloc_kb INTEGER,
+                    input_bytes INTEGER,
+                    output_bytes INTEGER,
+                    cache_hits INTEGER DEFAULT 0,
+                    cache_misses INTEGER DEFAULT 0,
+                    cache TEXT,
+                    recorded_at TEXT NOT NULL
+                )
+            """)
+            # 旧版数据库记录的是 rss_delta_kb（峰值内存之差，没有意义）：补充 peak_rss_kb 列，旧列不再写入
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(step_metrics)")}
+            if "peak_rss_kb" not in columns:
+                cursor.execute("ALTER TABLE step_metrics ADD COLUMN peak_rss_kb INTEGER")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS run_metrics (
+                    execution_id TEXT PRIMARY KEY,
+                    workflow_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    wall_ms REAL,
+                    cpu_ms REAL,
+                    recorded_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_step_metrics_execution ON step_metrics(execution_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_step_metrics_workflow ON step_metrics(workflow_id, recorded_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_run_metrics_workflow ON run_metrics(workflow_id, recorded_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_step(self, execution_id: str, workflow_id: str, step_name: str, status: str, metrics: Dict[str, Any]):
+        """记录步骤指标"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                INSERT INTO step_metrics
+                (execution_id, workflow_id, step_name, status, wall_ms, cpu_ms, peak_rss_kb, peak_alloc_kb,
+                 input_bytes, output_bytes, cache_hits, cache_misses, cache, recorded_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                execution_id, workflow_id, step_name, status,
+                metrics.get("wall_ms"), metrics.get("cpu_ms"),
+                metrics.get("peak_rss_kb"), metrics.get("peak_alloc_kb"),
+                metrics.get("input_bytes"), metrics.get("output_bytes"),
+                metrics.get("cache_hits", 0), metrics.get("cache_misses", 0),
+                json.dumps(metrics.get("cache") or {}, ensure_ascii=False),
+                datetime.now().isoformat()
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_run(self, execution_id: str, workflow_id: str, status: str, wall_ms: float, cpu_ms: float):
+        """记录整次执行的指标（恢复执行时覆盖）"""
+        conn = self._get_connection()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO run_metrics (execution_id, workflow_id, status, wall_ms, cpu_ms, recorded_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (execution_id, workflow_id, status, wall_ms, cpu_ms, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_execution_metrics(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """获取单次执行的指标"""
+        conn = self._get_connection()
+        try:
+            run = conn.execute("SELECT * FROM run_metrics WHERE execution_id = ?", (execution_id,)).fetchone()
+            rows = conn.execute(
+                "SELECT * FROM step_metrics WHERE execution_id = ? ORDER BY recorded_at", (execution_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        if not run and not rows:
+            return None
+
+        steps = []
+        for row in rows:
+            step = dict(row)
+            step["cache"] = json.loads(step["cache"]) if step["cache"] else {}
+            step.pop("execution_id", None)
+            step.pop("rss_delta_kb", None)
+            steps.append(step)
+
+        return {
+            "execution_id": execution_id,
+            "run": dict(run) if run else None,
+            "steps": steps,
+        }
+
+    def get_workflow_summary(self, workflow_id: str, limit: int = 100) -> Dict[str, Any]:
+        """
+        按工作流聚合最近 limit 次执行的指标
+
+        Returns:
+            整体耗时和每个步骤各指标的 p50/p95，以及缓存命中率
+        """
+        conn = self._get_connection()
+        try:
+            runs = [dict(row) for row in conn.execute("""
+                SELECT * FROM run_metrics WHERE workflow_id = ?
+                ORDER BY recorded_at DESC LIMIT ?
+            """, (workflow_id, limit)).fetchall()]
+            execution_ids = [run["execution_id"] for run in runs]
+            rows = []
+            if execution_ids:
+                placeholders = ",".join("?" * len(execution_ids))
+                rows = [dict(row) for row in conn.execute(
+                    f"SELECT * FROM step_metrics WHERE execution_id IN ({placeholders})",
+                    execution_ids
+                ).fetchall()]
+        finally:
+            conn.close()
+
+        by_step: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_step.setdefault(row["step_name"], []).append(row)
+
+        steps = {}
+        for step_name, step_rows in by_step.items():
+            summary = {"count": len(step_rows)}
+            for field in _AGGREGATED_FIELDS:
+                values = [row[field] for row in step_rows]
+                summary[field] = {"p50": _percentile(values, 50), "p95": _percentile(values, 95)}
+            hits = sum(row["cache_hits"] or 0 for row in step_rows)
+            misses = sum(row["cache_misses"] or 0 for row in step_rows)
+            summary["cache_hits"] = hits
+            summary["cache_misses"] = misses
+            summary["cache_hit_rate"] = hits / (hits + misses) if hits + misses else None
+            summary["failed"] = sum(1 for row in step_rows if row["status"] == "failed")
+            steps[step_name] = summary
+
+        statuses: Dict[str, int] = {}
+        for run in runs:
+            statuses[run["status"]] = statuses.get(run["status"], 0) + 1
+
+        return {
+            "workflow_id": workflow_id,
+            "runs": len(runs),
+            "statuses": statuses,
+            "wall_ms": {
+                "p50": _percentile([run["wall_ms"] for run in runs], 50),
+                "p95": _percentile([run["wall_ms"] for run in runs], 95),
+            },
+            "cpu_ms": {
+                "p50": _percentile([run["cpu_ms"] for run in runs], 50),
+                "p95": _percentile([run["cpu_ms"] for run in runs], 95),
+            },
+            "steps": steps,
+        }
+
+
+# 全局指标存储实例
+_metrics_store: Optional[MetricsStore] = None
+
+
+def get_metrics_store() -> Optional[MetricsStore]:
+    """获取指标存储实例（未启用指标持久化时返回 None）"""
+    global _metrics_store
+    if not settings.WORKFLOW_METRICS_ENABLED:
+        return None
+    if _metrics_store is None:
+        _metrics_store = MetricsStore()
+        logger.info(f"工作流指标存储: {_metrics_store.db_path}")
+    return _metrics_store
@@ -0,0 +1,306 @@
+"""
+节点处理器 - 在服务端执行编辑器节点
+
+每个处理器对应前端的一个节点执行器，在进程内直接调用对应的API函数，
+并按前端执行器相同的方式把结果合并到上游结果上，中间数据不再经过网络。
+
+处理器签名：async handler(config, upstream, context) -> Dict
+- config: 节点配置（node.data.config，已展开嵌套的 config 字段）
+- upstream: 上游节点的合并结果（没有上游时为空字典）
+- context: 工作流执行上下文
+"""
+import json
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.config import settings
+from core.logging_config import logger
+
+
+NodeHandler = Callable[[Dict[str, Any], Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _parse_json_field(value: Any, field_name: str) -> Any:
+    """解析表单中以JSON字符串保存的字段"""
+    if value is None or isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, str):
+        if not value.strip():
+            return None
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{field_name} 格式错误，请检查JSON格式: {e}")
+    return value
+
+
+def _parse_list_field(value: Any) -> Optional[List[str]]:
+    """解析列表字段（JSON数组、逗号或换行分隔的字符串）"""
+    if value is None or isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        if text.startswith("["):
+            return _parse_json_field(text, "列表字段")
+        return [item.strip() for item in text.replace(",", "\n").splitlines() if item.strip()]
+    return None
+
+
+def _require_upstream_data(upstream: Dict[str, Any], node_label: str) -> Any:
+    """获取上游数据，缺失时报错"""
+    data = upstream.get("data")
+    if data is None:
+        raise ValueError(f"{node_label}缺少上游数据：请先连接解析文件节点")
+    return data
+
+
+def _unwrap_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """提取 create_success_response 包装的 data 字段"""
+    if isinstance(response, dict) and "data" in response and response.get("success") is not None:
+        return response.get("data") or {}
+    return response
+
+
+# ========== 文件节点 ==========
+
+async def handle_parse_file(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """解析文件节点"""
+    from api.files import parse_file, ParseFileRequest
+
+    file_path = config.get("file_path") or context.get("file_path")
+    if not file_path:
+        raise ValueError("解析文件节点未设置文件路径")
+
+    return await parse_file(ParseFileRequest(
+        file_path=file_path,
+        output_format=config.get("output_format"),
+        convert_format=bool(config.get("convert_format", False)),
+        skip_schema=bool(config.get("skip_schema", False)),
+    ))
+
+
+async def handle_export_file(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """导出文件节点（在服务端写入导出目录）"""
+    from data_parser.parser_factory import ParserFactory
+
+    data = _require_upstream_data(upstream, "导出文件节点")
+    output_format = config.get("output_format") or "xml"
+    pretty_print = config.get("pretty_print") is not False
+    sort_by = config.get("sort_by")
+
+    # 与前端一致：只取输出路径中的文件名，写入导出目录
+    output_path = config.get("output_path")
+    if output_path:
+        filename = Path(str(output_path).replace("\\", "/")).stem
+    else:
+        filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    export_dir = Path(settings.EXPORT_DIR)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    export_path = export_dir / f"{filename}.{output_format}"
+
+    parser = ParserFactory.create_parser(Path(f"temp.{output_format}"))
+    if not parser:
+        raise ValueError(f"不支持的导出格式: {output_format}")
+
+    if output_format == "xml":
+        success = parser.export(data, export_path, pretty_print=pretty_print, sort_by=sort_by)
+    else:
+        success = parser.export(data, export_path)
+
+    if not success:
+        raise RuntimeError(f"文件导出失败: {export_path}")
+
+    logger.info(f"工作流导出文件: {export_path}")
+    return {
+        "hasData": True,
+        "data": data,
+        "file_path": str(export_path),
+        "output_format": output_format,
+        "exported": True,
+        "export_path": str(export_path),
+    }
+
+
+# ========== 数据操作节点 ==========
+
+async def handle_edit_data(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """编辑数据节点"""
+    from api.data_operations import edit_data, EditDataRequest
+
+    if not config.get("operation") or not config.get("path"):
+        raise ValueError("编辑数据节点未设置操作类型和数据路径")
+
+    result = await edit_data(EditDataRequest(
+        data=_require_upstream_data(upstream, "编辑数据节点"),
+        operation=config["operation"],
+        path=config["path"],
+        item_data=_parse_json_field(config.get("item_data"), "条目数据"),
+        filter_condition=_parse_json_field(config.get("filter_condition"), "过滤条件"),
+    ))
+    return {**upstream, "data": result["data"]}
+
+
+async def handle_filter_data(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """过滤数据节点"""
+    from api.data_operations import filter_data, FilterDataRequest
+
+    filter_condition = _parse_json_field(config.get("filter_condition"), "过滤条件")
+    if not filter_condition:
+        raise ValueError("过滤数据节点未设置过滤条件")
+
+    result = await filter_data(FilterDataRequest(
+        data=_require_upstream_data(upstream, "过滤数据节点"),
+        filter_condition=filter_condition,
+        path=config.get("path"),
+    ))
+    return {**upstream, "data": result["filtered_data"]}
+
+
+async def handle_validate_data(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """验证数据节点"""
+    from api.data_operations import validate_data, ValidateDataRequest
+
+    result = await validate_data(ValidateDataRequest(
+        data=_require_upstream_data(upstream, "验证数据节点"),
+        schema=_parse_json_field(config.get("schema"), "Schema"),
+        required_fields=_parse_list_field(config.get("required_fields")),
+    ))
+    return {**upstream, "validation": result}
+
+
+# ========== AI 节点 ==========
+
+async def handle_analyze_xml_structure(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """AI分析XML结构节点"""
+    from api.ai_workflow import analyze_xml_structure, AnalyzeXMLStructureRequest
+
+    response = await analyze_xml_structure(AnalyzeXMLStructureRequest(
+        xml_data=_require_upstream_data(upstream, "分析XML结构节点"),
+        xml_schema=upstream.get("schema"),
+        sample_content=config.get("sample_content"),
+        additional_context=config.get("additional_context"),
+    ))
+    return {**upstream, "analysis": _unwrap_response(response).get("analysis")}
+
+
+async def handle_generate_editor_config(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """生成编辑器配置节点"""
+    from api.ai_workflow import generate_editor_config, GenerateEditorConfigRequest
+
+    analysis = upstream.get("analysis")
+    if not analysis:
+        raise ValueError("生成编辑器配置节点缺少上游分析结果：请先连接AI分析XML结构节点")
+
+    response = await generate_editor_config(GenerateEditorConfigRequest(
+        xml_structure=analysis,
+        editor_type=config.get("editor_type") or "form",
+        custom_fields=_parse_list_field(config.get("custom_fields")),
+    ))
+    return {**upstream, "editor_config": _unwrap_response(response).get("editor_config")}
+
+
+async def handle_smart_edit(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """智能编辑节点"""
+    from api.ai_workflow import smart_edit, SmartEditRequest
+
+    instruction = config.get("instruction")
+    if not instruction:
+        raise ValueError("智能编辑节点未设置编辑指令")
+
+    response = await smart_edit(SmartEditRequest(
+        data=_require_upstream_data(upstream, "智能编辑节点"),
+        instruction=instruction,
+        xml_structure=upstream.get("analysis"),
+        editor_config=upstream.get("editor_config"),
+    ))
+    edit_result = _unwrap_response(response).get("result") or {}
+    return {
+        **upstream,
+        "data": edit_result.get("edited_data", upstream.get("data")),
+        "smart_edit_result": edit_result,
+    }
+
+
+async def handle_ai_agent(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """AI Agent 节点（Chat Model 配置由编译器从连接的节点注入）"""
+    from api.ai_workflow import execute_ai_agent, AIAgentRequest
+
+    chat_model_config = config.get("chat_model_config")
+    if not chat_model_config:
+        raise ValueError("AI Agent 节点缺少Chat Model连接：请从Chat Model端口连接ChatGPT、Gemini或DeepSeek节点")
+    if not config.get("system_prompt"):
+        raise ValueError("AI Agent 节点未设置系统提示词")
+
+    use_memory = config.get("use_memory") is True
+    memory_config = {
+        "memory_type": config.get("memory_type") or "workflow",
+        "memory_strategy": config.get("memory_strategy") or "auto",
+        "memory_ttl": config.get("memory_ttl") or 0,
+    } if use_memory else None
+
+    response = await execute_ai_agent(AIAgentRequest(
+        input_data=upstream,
+        system_prompt=config["system_prompt"],
+        goal=config.get("goal"),
+        temperature=config.get("temperature") or 0.7,
+        max_tokens=config.get("max_tokens") or 2000,
+        output_format=config.get("output_format") or "json",
+        data_processing_mode=config.get("data_processing_mode") or "smart",
+        data_limit_count=config.get("data_limit_count"),
+        max_data_tokens=config.get("max_data_tokens"),
+        sample_strategy=config.get("sample_strategy") or "head_tail",
+        chat_model_config=chat_model_config,
+        use_memory=use_memory,
+        memory_config=memory_config,
+    ))
+    return _unwrap_response(response)
+
+
+def _agent_request_fields(request_cls, config: Dict[str, Any], upstream: Dict[str, Any]) -> Dict[str, Any]:
+    """从节点配置中提取请求模型声明的字段"""
+    fields = {
+        key: value for key, value in config.items()
+        if key in request_cls.model_fields and value is not None
+    }
+    fields["input_data"] = upstream or None
+    return fields
+
+
+async def handle_gpt_agent(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """GPT Agent 节点"""
+    from api.gpt_agent import execute_gpt_agent, GPTAgentRequest
+
+    response = await execute_gpt_agent(GPTAgentRequest(**_agent_request_fields(GPTAgentRequest, config, upstream)))
+    return _unwrap_response(response)
+
+
+async def handle_gemini_agent(config: Dict[str, Any], upstream: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Gemini Agent 节点"""
+    from api.gemini_agent import execute_gemini_agent, GeminiAgentRequest
+
+    response = await execute_gemini_agent(GeminiAgentRequest(**_agent_request_fields(GeminiAgentRequest, config, upstream)))
+    return _unwrap_response(response)
+
+
+# 节点类型 -> 处理器
+NODE_HANDLERS: Dict[str, NodeHandler] = {
+    "parse_file": handle_parse_file,
+    "export_file": handle_export_file,
+    "edit_data": handle_edit_data,
+    "filter_data": handle_filter_data,
+    "validate_data": handle_validate_data,
+    "analyze_xml_structure": handle_analyze_xml_structure,
+    "generate_editor_config": handle_generate_editor_config,
+    "smart_edit": handle_smart_edit,
+    "ai_agent": handle_ai_agent,
+    "gpt_agent": handle_gpt_agent,
+    "gemini_agent": handle_gemini_agent,
+}
+
+# 只作为配置提供者连接到其他节点的节点类型（不生成步骤）
+CHAT_MODEL_NODE_TYPES = {"chatgpt", "gemini", "deepseek", "chat_model"}
+CONFIG_ONLY_NODE_TYPES = CHAT_MODEL_NODE_TYPES | {"memory"}
@@ -0,0 +1,253 @@
+"""
+进程执行器 - 在独立工作进程中运行耗时任务，支持取消和资源预算
+
+线程池中的任务无法被取消；在子进程中执行时，取消或超时会直接终止进程，
+内存/CPU时间预算通过 setrlimit 在子进程内生效（仅 POSIX 系统）。
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional
+
+from core.config import settings
+from core.logging_config import logger
+
+try:
+    import resource
+except ImportError:  # Windows 不支持 setrlimit
+    resource = None
+
+
+# 轮询子进程结果的间隔（秒）
+POLL_INTERVAL = 0.05
+
+# 终止子进程时等待退出的时间（秒）
+TERMINATE_GRACE = 1.0
+
+
+# 当前执行是否受超时限制（工作流或步骤设置了超时，见 deadline_scope）
+_has_deadline: ContextVar[bool] = ContextVar("workflow_has_deadline", default=False)
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]):
+    """在上下文中标记执行受超时限制（timeout 为空时不改变），其中的阻塞任务在可终止的子进程中执行"""
+    if not timeout:
+        yield
+        return
+    token = _has_deadline.set(True)
+    try:
+        yield
+    finally:
+        _has_deadline.reset(token)
+
+
+class ResourceBudgetExceeded(RuntimeError):
+    """子进程超出资源预算（内存或CPU时间）"""
+    pass
+
+
+@dataclass
+class ResourceBudget:
+    """
+    资源预算
+
+    Attributes:
+        memory_mb: 子进程地址空间上限（MB）
+        cpu_seconds: 子进程CPU时间上限（秒）
+    """
+    memory_mb: Optional[int] = None
+    cpu_seconds: Optional[int] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.memory_mb and not self.cpu_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_value(cls, value: Any) -> Optional["ResourceBudget"]:
+        """从字典或已有预算构建（None 表示不限制）"""
+        if value is None or isinstance(value, ResourceBudget):
+            return value
+        if isinstance(value, dict):
+            return cls(memory_mb=value.get("memory_mb"), cpu_seconds=value.get("cpu_seconds"))
+        raise ValueError(f"无效的资源预算: {value}")
+
+    @classmethod
+    def from_settings(cls) -> Optional["ResourceBudget"]:
+        """使用配置中的默认预算"""
+        budget = cls(
+            memory_mb=settings.WORKFLOW_MEMORY_LIMIT_MB,
+            cpu_seconds=settings.WORKFLOW_CPU_TIME_LIMIT
+        )
+        return None if budget.is_empty else budget
+
+
+def _apply_budget(budget: Optional[ResourceBudget]):
+    """在子进程内设置资源限制"""
+    if budget is None or resource is None:
+        return
+    if budget.memory_mb:
+        limit = int(budget.memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if budget.cpu_seconds:
+        limit = int(budget.cpu_seconds)
+        # 软限制触发 SIGXCPU，硬限制多留1秒后强制终止
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+
+
+def _worker_main(conn, func: Callable, args: tuple, kwargs: dict, budget: Optional[ResourceBudget]):
+    """子进程入口：执行任务并通过管道返回结果"""
+    try:
+        _apply_budget(budget)
+        result = func(*args, **kwargs)
+        conn.send(("ok", result))
+    except MemoryError:
+        conn.send(("budget", "超出内存预算"))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def _exit_error(process: multiprocessing.Process, budget: Optional[ResourceBudget]) -> Exception:
+    """根据子进程退出码构建异常"""
+    exitcode = process.exitcode
+    if budget is not None and exitcode is not None and exitcode < 0:
+        return ResourceBudgetExceeded(f"子进程被终止（信号 {-exitcode}），可能超出CPU时间预算")
+    return RuntimeError(f"子进程异常退出（退出码 {exitcode}）")
+
+
+def _terminate(process: multiprocessing.Process):
+    """终止子进程（先 terminate，超时后 kill）"""
+    if not process.is_alive():
+        return
+    process.terminate()
+    process.join(TERMINATE_GRACE)
+    if process.is_alive():
+        process.kill()
+        process.join(TERMINATE_GRACE)
+
+
+async def run_in_process(
+    func: Callable,
+    *args,
+    budget: Optional[ResourceBudget] = None,
+    timeout: Optional[float] = None,
+    **kwargs
+) -> Any:
+    """
+    在独立子进程中执行函数
+
+    Args:
+        func: 可被 pickle 的函数（模块级函数或可 pickle 对象的方法）
+        budget: 资源预算（可选）
+        timeout: 超时时间（秒，可选）
+
+    Returns:
+        函数返回值（必须可 pickle）
+
+    Raises:
+        asyncio.TimeoutError: 超时（子进程已终止）
+        asyncio.CancelledError: 被取消（子进程已终止）
+        ResourceBudgetExceeded: 超出内存/CPU时间预算
+        RuntimeError: 函数执行失败
+    """
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(
+        target=_worker_main,
+        args=(child_conn, func, args, kwargs, budget),
+        daemon=True
+    )
+    process.start()
+    child_conn.close()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+
+    try:
+        while not parent_conn.poll():
+            if not process.is_alive():
+                # 进程已退出但管道中可能还有最后的数据
+                if parent_conn.poll():
+                    break
+                raise _exit_error(process, budget)
+            if deadline is not None and loop.time() >= deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(POLL_INTERVAL)
+
+        try:
+            status, payload = parent_conn.recv()
+        except EOFError:
+            # 子进程未返回结果就退出（如超出CPU时间预算被信号终止）
+            await asyncio.to_thread(process.join, TERMINATE_GRACE)
+            raise _exit_error(process, budget)
+
+        if status == "ok":
+            return payload
+        if status == "budget":
+            raise ResourceBudgetExceeded(payload)
+        raise RuntimeError(payload)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        logger.info(f"终止工作进程: pid={process.pid}")
+        raise
+    finally:
+        try:
+            # terminate/kill 后的 join 会阻塞，放到线程中执行
+            await asyncio.to_thread(_terminate, process)
+        finally:
+            parent_conn.close()
+
+
+# 共享进程池（扇出步骤中的并行解析等）
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取共享进程池（延迟创建）"""
+    global _process_pool
+    if _process_pool is None:
+        workers = settings.WORKFLOW_PROCESS_POOL_SIZE or os.cpu_count() or 1
+        _process_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"工作流进程池已创建: {workers} 个进程")
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """关闭共享进程池"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def run_with_budget(context: Dict[str, Any], func: Callable, *args, **kwargs) -> Any:
+    """
+    按执行上下文运行阻塞任务
+    
+    - 上下文包含 resource_budget：在独立子进程中执行并限制内存/CPU时间
+    - 上下文设置了 use_process_pool（扇出步骤）：在共享进程池中执行，利用多核
+    - 工作流或步骤设置了超时（见 deadline_scope）：在独立子进程中执行，超时或取消时直接终止子进程，
+      不会在后台继续运行
+    - 否则在线程池中执行，不付出启动子进程和传回结果的开销（取消时线程中的任务会继续运行到结束）
+    """
+    budget = ResourceBudget.from_value(context.get("resource_budget"))
+    if budget is not None and not budget.is_empty:
+        return await run_in_process(func, *args, budget=budget, **kwargs)
+    if context.get("use_process_pool"):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_process_pool(), functools.partial(func, *args, **kwargs))
+    if _has_deadline.get():
+        return await run_in_process(func, *args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
@@ -0,0 +1,134 @@
+"""
+工作流流式管道 - 在步骤之间以异步迭代器逐条传递记录
+"""
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional
+
+
+# 队列结束标记
+_END = object()
+
+# 默认缓冲区大小（生产者最多领先消费者的记录数）
+DEFAULT_BUFFER_SIZE = 256
+
+
+class RecordStream:
+    """
+    记录流
+
+    包装一个异步迭代器，通过有界队列在生产者和消费者之间传递记录：
+    - 生产者在后台任务中运行，最多领先 buffer_size 条记录（背压）
+    - 只允许被消费一次
+    - 生产者抛出的异常会在消费者一侧重新抛出
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[Any],
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """
+        初始化记录流
+
+        Args:
+            source: 记录来源（异步迭代器/异步生成器）
+            buffer_size: 缓冲区大小
+            metadata: 流的元数据（如源文件格式、XML根标签、CSV表头），由生产者在迭代过程中补充
+        """
+        self._source = source
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer_size))
+        self._pump_task: Optional[asyncio.Task] = None
+        self._consumed = False
+        self.metadata: Dict[str, Any] = metadata if metadata is not None else {}
+        self.produced = 0
+        self.consumed = 0
+        self.finished = False
+        self.error: Optional[str] = None
+
+    async def _pump(self):
+        """后台任务：从来源读取记录并写入队列"""
+        try:
+            async for record in self._source:
+                await self._queue.put(record)
+                self.produced += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = str(e)
+            await self._queue.put(_StreamError(e))
+            return
+        await self._queue.put(_END)
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        if self._consumed:
+            raise RuntimeError("记录流只能被消费一次")
+        self._consumed = True
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        self._pump_task = asyncio.ensure_future(self._pump())
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    self.finished = True
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.error
+                self.consumed += 1
+                yield item
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """停止生产者（消费者提前退出或出错时调用）"""
+        if self._pump_task is not None and not self._pump_task.done():
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        aclose = getattr(self._source, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
+
+    async def drain(self) -> int:
+        """消费并丢弃剩余记录（用于末端没有消费者的流），返回记录数"""
+        if self._consumed:
+            return self.consumed
+        async for _ in self:
+            pass
+        return self.consumed
+
+    def summary(self) -> Dict[str, Any]:
+        """流的摘要（用于执行记录，替代无法序列化的流对象）"""
+        return {
+            "stream": True,
+            "records": self.consumed,
+            "finished": self.finished,
+            "error": self.error,
+            "metadata": self.metadata,
+        }
+
+
+class _StreamError:
+    """队列中传递的生产者异常"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def is_stream_result(result: Any) -> bool:
+    """判断步骤结果是否为流（RecordStream 或异步迭代器）"""
+    return isinstance(result, RecordStream) or hasattr(result, "__aiter__")
+
+
+def as_record_stream(result: Any, buffer_size: int = DEFAULT_BUFFER_SIZE) -> RecordStream:
+    """将步骤返回的异步迭代器包装为 RecordStream"""
+    if isinstance(result, RecordStream):
+        return result
+    return RecordStream(result, buffer_size=buffer_size)
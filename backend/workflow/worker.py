@@ -0,0 +1,227 @@
+"""
+工作流工作进程 - 从作业队列领取并执行工作流
+
+用法：
+    python -m workflow.worker --processes 4
+
+主进程只负责启动和看护 N 个工作进程（异常退出时自动重启），
+每个工作进程独立运行一个工作流引擎，一次执行一个作业。
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from core.logging_config import logger
+from workflow.job_queue import JobQueue, get_job_queue
+from workflow.workflow_engine import WorkflowEngine, WorkflowStatus
+
+
+# 看护进程检查工作进程存活的间隔（秒）
+SUPERVISE_INTERVAL = 1.0
+
+
+def build_engine() -> WorkflowEngine:
+    """创建工作流引擎并注册默认工作流"""
+    from workflow.default_workflows import register_default_workflows
+
+    engine = WorkflowEngine()
+    register_default_workflows(engine)
+    return engine
+
+
+async def resolve_plan(engine: WorkflowEngine, workflow_id: str):
+    """
+    获取执行计划
+
+    Returns:
+        (steps, outputs)：默认工作流 steps 为 None，outputs 为最后一个步骤；
+        自定义工作流返回编译后的步骤和输出节点
+    """
+    if workflow_id in engine.workflows:
+        order = engine.get_execution_order(engine.workflows[workflow_id])
+        return None, [order[-1].name] if order else []
+
+    from storage import get_storage
+    from workflow.graph_compiler import compile_workflow, WorkflowCompileError
+
+    workflow = await get_storage().load(workflow_id)
+    if not workflow:
+        raise WorkflowCompileError(f"工作流不存在: {workflow_id}")
+    compiled = compile_workflow(workflow)
+    return compiled.steps, compiled.outputs
+
+
+def _job_result(execution: Dict[str, Any], outputs: List[str]) -> Dict[str, Any]:
+    """作业结果：执行状态、步骤摘要和输出步骤的结果（完整结果保存在检查点中）"""
+    return {
+        "execution_id": execution["execution_id"],
+        "status": execution["status"],
+        "error": execution.get("error"),
+        "steps": [
+            {key: value for key, value in step.items() if key != "result"}
+            for step in execution.get("steps", [])
+        ],
+        "outputs": {
+            name: execution.get(f"step_{name}")
+            for name in outputs
+            if f"step_{name}" in execution
+        },
+    }
+
+
+async def process_job(engine: WorkflowEngine, queue: JobQueue, job: Dict[str, Any],
+                      worker_id: str, lease_seconds: float):
+    """执行单个作业（期间定期续约，失去租约或被请求取消时取消执行）"""
+    job_id = job["job_id"]
+
+    try:
+        steps, outputs = await resolve_plan(engine, job["workflow_id"])
+    except ValueError as e:
+        # 工作流不存在或编译失败，重试没有意义
+        queue.fail(job_id, worker_id, str(e), retry=False)
+        return
+
+    # 之前的工作进程已开始执行：从检查点恢复，跳过已完成的步骤和文件
+    execution = None
+    previous = job.get("execution_id")
+    if previous and engine.checkpoints is not None:
+        record = await asyncio.to_thread(engine.checkpoints.load_execution, previous)
+        if record and record["status"] != WorkflowStatus.COMPLETED.value:
+            logger.info(f"作业 {job_id} 从检查点恢复执行: {previous}")
+            execution = await engine.resume(previous, steps=steps, timeout=job.get("timeout"))
+
+    if execution is None:
+        execution = await engine.start(job["workflow_id"], job["context"], steps=steps, timeout=job.get("timeout"))
+        queue.set_execution(job_id, execution["execution_id"])
+
+    execution_id = execution["execution_id"]
+    lease_lost = False
+
+    async def keep_alive():
+        nonlocal lease_lost
+        while engine.is_running(execution_id):
+            await asyncio.sleep(max(0.1, lease_seconds / 3))
+            if not queue.heartbeat(job_id, worker_id, lease_seconds):
+                lease_lost = True
+                engine.cancel(execution_id)
+                return
+
+    heartbeat_task = asyncio.ensure_future(keep_alive())
+    try:
+        result = await engine.wait(execution_id)
+    finally:
+        heartbeat_task.cancel()
+
+    status = result["status"]
+    if status == WorkflowStatus.COMPLETED.value:
+        queue.complete(job_id, worker_id, _job_result(result, outputs))
+    elif status == WorkflowStatus.CANCELLED.value:
+        current = queue.get(job_id)
+        if current and current["cancel_requested"]:
+            queue.mark_cancelled(job_id, worker_id)
+        elif lease_lost:
+            logger.warning(f"作业租约已失效，停止执行: {job_id}")
+    else:
+        queue.fail(job_id, worker_id, result.get("error") or "工作流执行失败")
+
+
+async def run_worker(worker_id: str, poll_interval: float, lease_seconds: float,
+                     max_jobs: Optional[int] = None):
+    """工作进程主循环"""
+    queue = get_job_queue()
+    engine = build_engine()
+    processed = 0
+    logger.info(f"工作进程已启动: {worker_id}")
+
+    try:
+        while max_jobs is None or processed < max_jobs:
+            job = queue.claim(worker_id, lease_seconds)
+            if job is None:
+                await asyncio.sleep(poll_interval)
+                continue
+
+            logger.info(f"[{worker_id}] 执行作业 {job['job_id']}（{job['workflow_id']}，第 {job['attempts']} 次）")
+            try:
+                await process_job(engine, queue, job, worker_id, lease_seconds)
+            except Exception as e:
+                logger.error(f"[{worker_id}] 作业执行异常: {job['job_id']}: {e}", exc_info=True)
+                queue.fail(job["job_id"], worker_id, str(e))
+            processed += 1
+    finally:
+        from storage import close_storage
+        await close_storage()
+
+
+def _worker_process_main(worker_id: str, poll_interval: float, lease_seconds: float):
+    """工作进程入口"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # 由看护进程统一处理 Ctrl+C
+    try:
+        asyncio.run(run_worker(worker_id, poll_interval, lease_seconds))
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise(processes: int, poll_interval: float, lease_seconds: float):
+    """启动并看护工作进程"""
+    ctx = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    workers: Dict[int, Any] = {}
+    stopping = False
+
+    def spawn(index: int):
+        worker_id = f"{host}-{os.getpid()}-{index}-{int(time.time())}"
+        process = ctx.Process(
+            target=_worker_process_main,
+            args=(worker_id, poll_interval, lease_seconds),
+            name=f"workflow-worker-{index}"
+        )
+        process.start()
+        workers[index] = process
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(processes):
+        spawn(index)
+    logger.info(f"已启动 {processes} 个工作流工作进程（租约 {lease_seconds} 秒）")
+
+    try:
+        while not stopping:
+            time.sleep(SUPERVISE_INTERVAL)
+            for index, process in list(workers.items()):
+                if not process.is_alive() and not stopping:
+                    logger.warning(f"工作进程异常退出（退出码 {process.exitcode}），重新启动: {process.name}")
+                    spawn(index)
+    finally:
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in workers.values():
+            process.join(5)
+        logger.info("工作流工作进程已全部退出")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="StructForge AI 工作流工作进程")
+    parser.add_argument("--processes", type=int, default=settings.WORKFLOW_WORKER_PROCESSES or os.cpu_count() or 1,
+                        help="工作进程数（默认CPU核数）")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="队列为空时的轮询间隔（秒）")
+    parser.add_argument("--lease", type=float, default=settings.WORKFLOW_WORKER_LEASE_SECONDS,
+                        help="作业租约时长（秒），工作进程失联超过该时间后作业会被重新领取")
+    args = parser.parse_args(argv)
+
+    supervise(max(1, args.processes), args.poll_interval, args.lease)
+
+
+if __name__ == "__main__":
+    main()
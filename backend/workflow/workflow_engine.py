@@ -1,14 +1,22 @@
 """
 工作流引擎 - 编排数据处理流程
 """
-from typing import Dict, Any, List, Optional, Callable
+import asyncio
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Callable, Set
 from enum import Enum
 from dataclasses import dataclass
 from pathlib import Path
 import json
 from datetime import datetime
 
+from core.config import settings
 from core.logging_config import logger
+from workflow.process_runner import ResourceBudget, deadline_scope
+from workflow.checkpoint import get_checkpoint_store
+from workflow.metrics import StepMeter, get_metrics_store
+from workflow.streaming import is_stream_result, as_record_stream, DEFAULT_BUFFER_SIZE
 
 
 class WorkflowStatus(Enum):
@@ -20,6 +28,11 @@ class WorkflowStatus(Enum):
     CANCELLED = "cancelled"
 
 
+class StepTimeoutError(RuntimeError):
+    """步骤执行超时"""
+    pass
+
+
 @dataclass
 class WorkflowStep:
     """工作流步骤"""
@@ -27,6 +40,7 @@ class WorkflowStep:
     handler: Callable
     depends_on: List[str] = None
     config: Dict[str, Any] = None
+    timeout: Optional[float] = None  # 步骤超时（秒），None 时使用配置的默认值
     
     def __post_init__(self):
         if self.depends_on is None:
@@ -41,27 +55,61 @@ class WorkflowEngine:
     def __init__(self):
         self.workflows: Dict[str, List[WorkflowStep]] = {}
         self.execution_history: List[Dict[str, Any]] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self.checkpoints = get_checkpoint_store()
+        self.metrics = get_metrics_store()
     
     def register_workflow(self, workflow_id: str, steps: List[WorkflowStep]):
         """注册工作流"""
         self.workflows[workflow_id] = steps
     
-    async def execute(self, workflow_id: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute(
+        self,
+        workflow_id: str,
+        context: Dict[str, Any],
+        steps: Optional[List[WorkflowStep]] = None,
+        timeout: Optional[float] = None,
+        budget: Optional[ResourceBudget] = None
+    ) -> Dict[str, Any]:
         """
-        执行工作流
+        执行工作流（等待执行结束）
         
         Args:
             workflow_id: 工作流ID
             context: 执行上下文（包含输入数据等）
+            steps: 执行计划（可选，如编译后的自定义工作流；不指定时使用已注册的工作流）
+            timeout: 整个工作流的超时时间（秒，可选，默认使用配置）
+            budget: 工作进程资源预算（可选，默认使用配置）
             
         Returns:
             执行结果
         """
-        if workflow_id not in self.workflows:
-            raise ValueError(f"工作流不存在: {workflow_id}")
+        execution_context = await self.start(workflow_id, context, steps, timeout, budget)
+        return await self.wait(execution_context["execution_id"])
+    
+    async def start(
+        self,
+        workflow_id: str,
+        context: Dict[str, Any],
+        steps: Optional[List[WorkflowStep]] = None,
+        timeout: Optional[float] = None,
+        budget: Optional[ResourceBudget] = None
+    ) -> Dict[str, Any]:
+        """
+        在后台启动工作流，立即返回执行上下文（可通过 execution_id 查询状态或取消）
+        
+        参数同 execute
+        """
+        if steps is None:
+            if workflow_id not in self.workflows:
+                raise ValueError(f"工作流不存在: {workflow_id}")
+            steps = self.workflows[workflow_id]
         
-        steps = self.workflows[workflow_id]
-        execution_id = f"{workflow_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if timeout is None:
+            timeout = settings.WORKFLOW_TIMEOUT
+        budget = ResourceBudget.from_value(budget) or ResourceBudget.from_settings()
+        
+        execution_id = f"{workflow_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
         
         execution_context = {
             "execution_id": execution_id,
@@ -71,52 +119,178 @@ class WorkflowEngine:
             "steps": [],
             **context
         }
+        if budget is not None:
+            execution_context["resource_budget"] = budget.to_dict()
+        
+        if self.checkpoints is not None:
+            input_context = dict(context)
+            if budget is not None:
+                input_context["resource_budget"] = budget.to_dict()
+            try:
+                await asyncio.to_thread(
+                    self.checkpoints.create_execution,
+                    execution_id, workflow_id, input_context, execution_context["started_at"]
+                )
+            except TypeError as e:
+                raise ValueError(f"输入上下文无法序列化为JSON，不能保存检查点: {e}")
+        
+        self._launch(steps, execution_context, timeout)
+        return execution_context
+    
+    async def resume(
+        self,
+        execution_id: str,
+        steps: Optional[List[WorkflowStep]] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        从检查点恢复中断的执行（在后台运行，立即返回执行上下文）
+        
+        已完成的步骤直接使用检查点中的结果，不再执行；
+        步骤内通过 ItemProgress 记录的已完成项也会被跳过。
+        
+        Args:
+            execution_id: 要恢复的执行ID
+            steps: 执行计划（可选，自定义工作流需传入编译后的步骤）
+            timeout: 恢复后剩余执行的超时时间（秒，可选）
+        """
+        if self.checkpoints is None:
+            raise ValueError("未启用工作流检查点，无法恢复执行")
+        if self.is_running(execution_id):
+            raise ValueError(f"工作流正在执行中: {execution_id}")
+        
+        record = await asyncio.to_thread(self.checkpoints.load_execution, execution_id)
+        if record is None:
+            raise ValueError(f"检查点不存在: {execution_id}")
+        if record["status"] == WorkflowStatus.COMPLETED.value:
+            raise ValueError(f"工作流已完成，无需恢复: {execution_id}")
+        
+        workflow_id = record["workflow_id"]
+        if steps is None:
+            if workflow_id not in self.workflows:
+                raise ValueError(f"工作流不存在: {workflow_id}")
+            steps = self.workflows[workflow_id]
+        if timeout is None:
+            timeout = settings.WORKFLOW_TIMEOUT
+        
+        execution_context = {
+            "execution_id": execution_id,
+            "workflow_id": workflow_id,
+            "status": WorkflowStatus.RUNNING.value,
+            "started_at": record["started_at"],
+            "resumed_at": datetime.now().isoformat(),
+            "steps": [],
+            **record["context"]
+        }
+        
+        # 恢复已完成步骤的结果
+        step_names = {step.name for step in steps}
+        completed = set()
+        for step_record in await asyncio.to_thread(self.checkpoints.load_steps, execution_id):
+            name = step_record["step"]
+            if name not in step_names:
+                continue
+            step_record["restored"] = True
+            execution_context[f"step_{name}"] = step_record.get("result")
+            execution_context["steps"].append(step_record)
+            completed.add(name)
+        
+        await asyncio.to_thread(self.checkpoints.update_status, execution_id, WorkflowStatus.RUNNING.value)
+        if self.is_running(execution_id):
+            raise ValueError(f"工作流正在执行中: {execution_id}")
+        self.execution_history = [
+            h for h in self.execution_history if h.get("execution_id") != execution_id
+        ]
+        logger.info(f"恢复工作流执行: {execution_id}，跳过已完成步骤: {sorted(completed)}")
+        
+        self._launch(steps, execution_context, timeout, completed)
+        return execution_context
+    
+    async def wait(self, execution_id: str) -> Dict[str, Any]:
+        """等待后台执行结束并返回执行上下文"""
+        task = self._running.get(execution_id)
+        if task is not None:
+            return await task
+        status = await self.get_workflow_status(execution_id)
+        if status is None:
+            raise ValueError(f"执行记录不存在: {execution_id}")
+        return status
+    
+    def _launch(
+        self,
+        steps: List[WorkflowStep],
+        execution_context: Dict[str, Any],
+        timeout: Optional[float],
+        completed: Optional[Set[str]] = None
+    ):
+        """创建执行任务"""
+        execution_id = execution_context["execution_id"]
+        
+        # 执行开始即记录历史，运行中也可以查询状态
+        self.execution_history.append(execution_context)
+        
+        task = asyncio.ensure_future(self._run(steps, execution_context, timeout, completed or set()))
+        self._running[execution_id] = task
+        task.add_done_callback(lambda _: self._running.pop(execution_id, None))
+    
+    def cancel(self, execution_id: str) -> bool:
+        """
+        取消正在执行的工作流
+        
+        取消会传播到当前步骤的处理器（asyncio.CancelledError），
+        在子进程中运行的任务会被终止。
+        
+        Returns:
+            是否找到并取消了正在执行的工作流
+        """
+        task = self._running.get(execution_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        logger.info(f"取消工作流执行: {execution_id}")
+        return True
+    
+    def is_running(self, execution_id: str) -> bool:
+        """工作流是否正在执行"""
+        task = self._running.get(execution_id)
+        return task is not None and not task.done()
+    
+    async def _run(
+        self,
+        steps: List[WorkflowStep],
+        execution_context: Dict[str, Any],
+        timeout: Optional[float],
+        completed: Set[str]
+    ) -> Dict[str, Any]:
+        """执行工作流主体（处理超时、取消和失败）"""
+        # 流式步骤：(步骤记录, 记录流)，执行结束后替换为摘要
+        streams: List[tuple] = []
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
         
         try:
-            # 执行步骤（按依赖顺序）
-            executed_steps = set()
-            
-            for step in self._get_execution_order(steps):
-                if step.name in executed_steps:
-                    continue
-                
-                step_result = {
-                    "step": step.name,
-                    "status": "running",
-                    "started_at": datetime.now().isoformat()
-                }
-                
-                try:
-                    # 执行步骤
-                    if callable(step.handler):
-                        result = await step.handler(execution_context)
-                    else:
-                        result = step.handler
-                    
-                    step_result.update({
-                        "status": "completed",
-                        "result": result,
-                        "completed_at": datetime.now().isoformat()
-                    })
-                    
-                    # 更新上下文
-                    execution_context[f"step_{step.name}"] = result
-                    execution_context["steps"].append(step_result)
-                    
-                except Exception as e:
-                    step_result.update({
-                        "status": "failed",
-                        "error": str(e),
-                        "completed_at": datetime.now().isoformat()
-                    })
-                    execution_context["steps"].append(step_result)
-                    raise
+            with deadline_scope(timeout):
+                await asyncio.wait_for(self._run_steps(steps, execution_context, streams, completed), timeout)
             
             execution_context.update({
                 "status": WorkflowStatus.COMPLETED.value,
                 "completed_at": datetime.now().isoformat()
             })
             
+        except asyncio.TimeoutError:
+            execution_context.update({
+                "status": WorkflowStatus.FAILED.value,
+                "error": f"工作流执行超时（{timeout}秒）",
+                "completed_at": datetime.now().isoformat()
+            })
+            logger.error(f"工作流执行超时: {execution_context['execution_id']}")
+        except asyncio.CancelledError:
+            execution_context.update({
+                "status": WorkflowStatus.CANCELLED.value,
+                "error": "工作流已取消",
+                "completed_at": datetime.now().isoformat()
+            })
+            logger.info(f"工作流已取消: {execution_context['execution_id']}")
         except Exception as e:
             execution_context.update({
                 "status": WorkflowStatus.FAILED.value,
@@ -124,13 +298,176 @@ class WorkflowEngine:
                 "completed_at": datetime.now().isoformat()
             })
             logger.error(f"工作流执行失败: {e}")
-        
-        # 保存执行历史
-        self.execution_history.append(execution_context)
+        finally:
+            await self._finalize_streams(execution_context, streams)
+            if self.checkpoints is not None:
+                if execution_context["status"] == WorkflowStatus.COMPLETED.value:
+                    # 成功完成后不再需要恢复，删除步骤结果（只保留执行记录）
+                    await self._checkpoint(
+                        self.checkpoints.complete_execution,
+                        execution_context["execution_id"],
+                        execution_context.get("completed_at")
+                    )
+                else:
+                    await self._checkpoint(
+                        self.checkpoints.update_status,
+                        execution_context["execution_id"],
+                        execution_context["status"],
+                        execution_context.get("error"),
+                        execution_context.get("completed_at")
+                    )
+            if self.metrics is not None:
+                await self._checkpoint(
+                    self.metrics.record_run,
+                    execution_context["execution_id"],
+                    execution_context["workflow_id"],
+                    execution_context["status"],
+                    round((time.perf_counter() - wall_start) * 1000, 3),
+                    round((time.process_time() - cpu_start) * 1000, 3)
+                )
         
         return execution_context
     
-    def _get_execution_order(self, steps: List[WorkflowStep]) -> List[WorkflowStep]:
+    async def _checkpoint(self, func: Callable, *args):
+        """在线程中写入检查点或指标（SQLite写入和结果序列化不阻塞事件循环；失败只记录日志，不影响执行）"""
+        try:
+            await asyncio.to_thread(func, *args)
+        except Exception as e:
+            logger.warning(f"写入工作流检查点失败: {e}")
+    
+    async def _record_step_metrics(self, execution_context: Dict[str, Any], step_result: Dict[str, Any]):
+        """持久化步骤指标"""
+        if self.metrics is None or "metrics" not in step_result:
+            return
+        await self._checkpoint(
+            self.metrics.record_step,
+            execution_context["execution_id"],
+            execution_context["workflow_id"],
+            step_result["step"],
+            step_result["status"],
+            step_result["metrics"]
+        )
+    
+    async def _run_steps(
+        self,
+        steps: List[WorkflowStep],
+        execution_context: Dict[str, Any],
+        streams: List[tuple],
+        completed: Set[str]
+    ):
+        """按依赖顺序执行步骤（跳过 completed 中已从检查点恢复的步骤）"""
+        executed_steps = set(completed)
+        
+        for step in self.get_execution_order(steps):
+            if step.name in executed_steps:
+                continue
+            
+            step_result = {
+                "step": step.name,
+                "status": "running",
+                "started_at": datetime.now().isoformat()
+            }
+            execution_context["current_step"] = step.name
+            
+            # 步骤指标：输入为依赖步骤的结果
+            inputs = {dep: execution_context.get(f"step_{dep}") for dep in step.depends_on} or None
+            meter = StepMeter()
+            meter.start()
+            
+            try:
+                # 执行步骤
+                if callable(step.handler):
+                    step_timeout = step.timeout if step.timeout is not None else settings.WORKFLOW_STEP_TIMEOUT
+                    try:
+                        with deadline_scope(step_timeout):
+                            result = await asyncio.wait_for(step.handler(execution_context), step_timeout)
+                    except asyncio.TimeoutError:
+                        raise StepTimeoutError(f"步骤 {step.name} 执行超时（{step_timeout}秒）")
+                else:
+                    result = step.handler
+                
+                step_result["metrics"] = meter.stop(inputs, result, streaming=is_stream_result(result))
+                
+                if is_stream_result(result):
+                    # 流式步骤：下游步骤增量消费，结束后再记录摘要
+                    result = as_record_stream(
+                        result,
+                        buffer_size=step.config.get("buffer_size", DEFAULT_BUFFER_SIZE)
+                    )
+                    streams.append((step_result, result))
+                    step_result["status"] = "streaming"
+                else:
+                    step_result.update({
+                        "status": "completed",
+                        "result": result,
+                        "completed_at": datetime.now().isoformat()
+                    })
+                    if self.checkpoints is not None:
+                        await self._checkpoint(self.checkpoints.save_step, execution_context["execution_id"], step_result)
+                    # 流式步骤的指标在流结束后记录（见 _finalize_streams）
+                    await self._record_step_metrics(execution_context, step_result)
+                
+                # 更新上下文
+                execution_context[f"step_{step.name}"] = result
+                execution_context["steps"].append(step_result)
+                executed_steps.add(step.name)
+                
+            except asyncio.CancelledError:
+                step_result.update({
+                    "status": "cancelled",
+                    "completed_at": datetime.now().isoformat()
+                })
+                step_result.setdefault("metrics", meter.stop(inputs))
+                await self._record_step_metrics(execution_context, step_result)
+                execution_context["steps"].append(step_result)
+                raise
+            except Exception as e:
+                step_result.update({
+                    "status": "failed",
+                    "error": str(e),
+                    "completed_at": datetime.now().isoformat()
+                })
+                step_result.setdefault("metrics", meter.stop(inputs))
+                await self._record_step_metrics(execution_context, step_result)
+                execution_context["steps"].append(step_result)
+                raise
+        
+        execution_context.pop("current_step", None)
+        
+        # 没有下游消费者的流在此处耗尽，保证生产者执行完毕
+        for _, stream in streams:
+            await stream.drain()
+    
+    async def _finalize_streams(self, execution_context: Dict[str, Any], streams: List[tuple]):
+        """关闭流，将步骤结果替换为可序列化的摘要，并记录流式步骤的最终指标"""
+        for step_result, stream in streams:
+            await stream.aclose()
+            summary = stream.summary()
+            if stream.error:
+                status = "failed"
+            elif stream.finished:
+                status = "completed"
+            else:
+                status = "cancelled"
+            completed_at = datetime.now()
+            step_result.update({
+                "status": status,
+                "result": summary,
+                "completed_at": completed_at.isoformat()
+            })
+            execution_context[f"step_{step_result['step']}"] = summary
+            
+            # 处理器返回时只创建了流：耗时改为到流结束为止，另记处理器本身的耗时和输出记录数
+            metrics = step_result.get("metrics")
+            if metrics is not None:
+                started_at = datetime.fromisoformat(step_result["started_at"])
+                metrics["handler_wall_ms"] = metrics["wall_ms"]
+                metrics["wall_ms"] = round((completed_at - started_at).total_seconds() * 1000, 3)
+                metrics["output_records"] = stream.consumed
+                await self._record_step_metrics(execution_context, step_result)
+    
+    @staticmethod
+    def get_execution_order(steps: List[WorkflowStep]) -> List[WorkflowStep]:
         """获取执行顺序（考虑依赖关系）"""
         # 简单的拓扑排序
         executed = set()
@@ -163,10 +500,21 @@ class WorkflowEngine:
         
         return history[-limit:]
     
-    def get_workflow_status(self, execution_id: str) -> Optional[Dict]:
-        """获取工作流执行状态"""
+    async def get_workflow_status(self, execution_id: str) -> Optional[Dict]:
+        """获取工作流执行状态（内存中没有时从检查点读取，如服务重启前的执行）"""
         for execution in self.execution_history:
             if execution.get("execution_id") == execution_id:
                 return execution
+        
+        if self.checkpoints is not None:
+            record = await asyncio.to_thread(self.checkpoints.load_execution, execution_id)
+            if record:
+                record.pop("context", None)
+                record["steps"] = [
+                    {key: value for key, value in step.items() if key != "result"}
+                    for step in await asyncio.to_thread(self.checkpoints.load_steps, execution_id)
+                ]
+                record["from_checkpoint"] = True
+                return record
         return None
 
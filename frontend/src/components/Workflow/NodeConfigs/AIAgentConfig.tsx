@@ -283,6 +283,7 @@ const AIAgentConfig: React.FC<NodeConfigProps> = ({
               <Option value="smart">智能采样 - 自动选择代表性数据（推荐）</Option>
               <Option value="limit">限制数量 - 只传递前N条记录</Option>
               <Option value="summary">摘要模式 - 生成数据摘要后传递</Option>
+              <Option value="map_reduce">分块处理 - 全部数据按Token限制分块并发处理后合并（数据量大时）</Option>
             </Select>
           </Form.Item>
 
@@ -307,6 +308,19 @@ const AIAgentConfig: React.FC<NodeConfigProps> = ({
                   </Form.Item>
                 )
               }
+              if (mode === 'map_reduce') {
+                return (
+                  <Form.Item
+                    name={['config', 'max_data_tokens']}
+                    label="每块数据Token限制"
+                    tooltip="每块输入数据的最大Token数量，数据越多分块越多（建议：2000-8000）"
+                    rules={[{ type: 'number', min: 500, max: 50000 }]}
+                    initialValue={4000}
+                  >
+                    <Input type="number" min={500} max={50000} onChange={onConfigChange} />
+                  </Form.Item>
+                )
+              }
               if (mode === 'smart') {
                 return (
                   <>
@@ -96,6 +96,59 @@ api.interceptors.response.use(
   }
 )
 
+// SSE 流式请求：模型每输出一段就回调 onToken，返回 done 事件中的完整结果（与对应的非流式接口相同）
+// axios 在浏览器中无法逐段读取响应，这里直接使用 fetch
+const postStream = async <T = any>(
+  url: string,
+  body: any,
+  onToken: (content: string) => void
+): Promise<T> => {
+  const response = await fetch(`${API_BASE_URL}${url}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  })
+  if (!response.ok || !response.body) {
+    const data = await response.json().catch(() => null)
+    const detail = data?.detail
+    throw new Error(typeof detail === 'string' ? detail : `请求失败: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    let index
+    while ((index = buffer.indexOf('\n\n')) >= 0) {
+      const frame = buffer.slice(0, index)
+      buffer = buffer.slice(index + 2)
+
+      let event = 'message'
+      let data = ''
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+
+      const payload = JSON.parse(data)
+      if (event === 'token') {
+        onToken(payload.content)
+      } else if (event === 'done') {
+        await reader.cancel()
+        return payload
+      } else if (event === 'error') {
+        throw new Error(typeof payload.detail === 'string' ? payload.detail : JSON.stringify(payload.detail))
+      }
+    }
+  }
+  throw new Error('流式响应意外结束')
+}
+
 // 文件管理API
 export const fileApi = {
   // 上传文件
@@ -371,18 +424,41 @@ export const aiWorkflowApi = {
   }): Promise<any> => {
     return api.post('/ai-workflow/ai-agent', request)
   },
+  // AI Agent 执行（流式：onToken 逐段接收模型输出，返回值与 executeAIAgent 相同）
+  executeAIAgentStream: async (
+    request: {
+      input_data: any
+      system_prompt: string
+      goal?: string
+      temperature?: number
+      max_tokens?: number
+      output_format?: string
+      data_processing_mode?: string
+      data_limit_count?: number
+      max_data_tokens?: number
+      sample_strategy?: string
+      chat_model_config: any
+      use_memory?: boolean
+      memory_config?: any
+    },
+    onToken: (content: string) => void
+  ): Promise<any> => {
+    return postStream('/ai-workflow/ai-agent/stream', request, onToken)
+  },
   // 分析XML结构
   analyzeXMLStructure: async (
     xmlData: any,
     xmlSchema?: any,
     sampleContent?: string,
-    additionalContext?: string
+    additionalContext?: string,
+    mapReduce: boolean = false  // 分块分析全部记录（数据超过模型上下文时）
   ): Promise<{ success: boolean; analysis: any; message: string }> => {
     const response: any = await api.post('/ai-workflow/analyze-xml-structure', {
       xml_data: xmlData,
       xml_schema: xmlSchema,
       sample_content: sampleContent,
       additional_context: additionalContext,
+      map_reduce: mapReduce,
     })
     // 适配后端新的响应格式：response 已经是响应体，不是 AxiosResponse
     return {
@@ -461,6 +537,14 @@ export const aiApi = {
     return api.post('/ai/chat', { messages })
   },
 
+  // 聊天（流式：onToken 逐段接收模型输出，返回完整响应）
+  chatStream: async (
+    messages: Array<{ role: string; content: string }>,
+    onToken: (content: string) => void
+  ): Promise<any> => {
+    return postStream('/ai/chat/stream', messages, onToken)
+  },
+
   // 列出可用模型
   listModels: async (): Promise<{ models: AIModel[] }> => {
     return api.get('/ai/models')
@@ -494,6 +578,28 @@ export const chatModelApi = {
     }
   },
 
+  // 使用自定义 Chat Model 进行对话（流式：onToken 逐段接收模型输出，返回值与 chat 相同）
+  chatStream: async (
+    config: {
+      model_type: string
+      api_key: string
+      api_url: string
+      request_headers?: string
+      request_body: string
+      prompt: string
+      timeout?: number
+      max_retries?: number
+    },
+    onToken: (content: string) => void
+  ): Promise<{
+    content: string
+    model: string
+    usage?: any
+    raw_response?: any
+  }> => {
+    return postStream('/chat-model/chat/stream', config, onToken)
+  },
+
   // 测试连接
   testConnection: async (config: {
     model_type: string